@@ -0,0 +1,212 @@
+"""Decoding of A2DP codec capabilities and negotiated configurations.
+
+BlueZ exposes the stream end points of a remote device as MediaEndpoint1
+objects (Codec and Capabilities properties) and the configuration selected
+for a stream as the Codec and Configuration properties of MediaTransport1:
+the codec id from the A2DP specification and the raw codec information
+elements. Vendor codecs (aptX, aptX HD, LDAC) carry a vendor and codec id
+in the first six bytes of those elements.
+"""
+import math
+
+media_endpoint_interface = "org.bluez.MediaEndpoint1"
+a2dp_source_uuid = "0000110a-0000-1000-8000-00805f9b34fb"
+a2dp_sink_uuid = "0000110b-0000-1000-8000-00805f9b34fb"
+
+codec_sbc = 0x00
+codec_mpeg12 = 0x01
+codec_aac = 0x02
+codec_vendor = 0xFF
+codec_names = {codec_sbc: "SBC", codec_mpeg12: "MPEG-1,2", codec_aac: "AAC", codec_vendor: "Vendor"}
+
+vendor_codecs = {(0x0000004F, 0x0001): "aptX", (0x000000D7, 0x0024): "aptX HD", (0x0000012D, 0x00AA): "LDAC"}
+
+sbc_rates = {0x80: 16000, 0x40: 32000, 0x20: 44100, 0x10: 48000}
+sbc_channel_modes = {0x08: "mono", 0x04: "dual channel", 0x02: "stereo", 0x01: "joint stereo"}
+aac_rates = {0x800: 8000, 0x400: 11025, 0x200: 12000, 0x100: 16000, 0x080: 22050, 0x040: 24000,
+             0x020: 32000, 0x010: 44100, 0x008: 48000, 0x004: 64000, 0x002: 88200, 0x001: 96000}
+aac_object_types = {0x80: "MPEG-2 AAC LC", 0x40: "MPEG-4 AAC LC", 0x20: "MPEG-4 AAC LTP", 0x10: "MPEG-4 AAC scalable"}
+aptx_rates = {0x80: 16000, 0x40: 32000, 0x20: 44100, 0x10: 48000}
+aptx_channel_modes = {0x01: "mono", 0x02: "stereo"}
+ldac_rates = {0x20: 44100, 0x10: 48000, 0x08: 88200, 0x04: 96000, 0x02: 176400, 0x01: 192000}
+ldac_channel_modes = {0x04: "mono", 0x02: "dual channel", 0x01: "stereo"}
+ldac_bitrates = (330000, 660000, 990000)
+
+
+def first_flag(value, table):
+    """Returns the table entry of the highest bit set in value that the table knows, or None."""
+    for flag in sorted(table, reverse=True):
+        if value & flag:
+            return table[flag]
+    return None
+
+
+def all_flags(value, table):
+    """Returns the table entries of every bit set in value, highest bit first."""
+    return [table[flag] for flag in sorted(table, reverse=True) if value & flag]
+
+
+def parse_sbc_configuration(configuration):
+    """Decodes an SBC codec information element.
+
+    Args:
+        configuration: The 4 configuration bytes.
+
+    Returns:
+        A dictionary with rate, channels, channel_mode, block_length, subbands,
+        allocation and min/max bitpool.
+    """
+    channel_mode = first_flag(configuration[0] & 0x0F, sbc_channel_modes)
+    return {
+        "rate": first_flag(configuration[0] & 0xF0, sbc_rates),
+        "channels": 1 if channel_mode == "mono" else 2,
+        "channel_mode": channel_mode,
+        "block_length": first_flag(configuration[1] & 0xF0, {0x80: 4, 0x40: 8, 0x20: 12, 0x10: 16}),
+        "subbands": first_flag(configuration[1] & 0x0C, {0x08: 4, 0x04: 8}),
+        "allocation": first_flag(configuration[1] & 0x03, {0x02: "SNR", 0x01: "loudness"}),
+        "min_bitpool": configuration[2],
+        "max_bitpool": configuration[3],
+    }
+
+
+def parse_aac_configuration(configuration):
+    """Decodes an MPEG-2,4 AAC codec information element.
+
+    Args:
+        configuration: The 6 configuration bytes.
+
+    Returns:
+        A dictionary with rate, channels, object_type, vbr and bitrate (bits per second).
+    """
+    rate_flags = (configuration[1] << 4) | (configuration[2] >> 4)
+    return {
+        "rate": first_flag(rate_flags, aac_rates),
+        "channels": first_flag(configuration[2] & 0x0C, {0x08: 1, 0x04: 2}),
+        "object_type": first_flag(configuration[0], aac_object_types),
+        "vbr": bool(configuration[3] & 0x80),
+        "bitrate": ((configuration[3] & 0x7F) << 16) | (configuration[4] << 8) | configuration[5],
+    }
+
+
+def parse_aptx_configuration(configuration):
+    """Decodes the codec-specific byte of an aptX or aptX HD information element."""
+    channel_mode = first_flag(configuration[6] & 0x0F, aptx_channel_modes)
+    return {
+        "rate": first_flag(configuration[6] & 0xF0, aptx_rates),
+        "channels": 1 if channel_mode == "mono" else 2,
+        "channel_mode": channel_mode,
+    }
+
+
+def parse_ldac_configuration(configuration):
+    """Decodes the codec-specific bytes of an LDAC information element."""
+    channel_mode = first_flag(configuration[7] & 0x07, ldac_channel_modes)
+    return {
+        "rate": first_flag(configuration[6] & 0x3F, ldac_rates),
+        "channels": 1 if channel_mode == "mono" else 2,
+        "channel_mode": channel_mode,
+    }
+
+
+codec_parsers = {codec_sbc: (4, parse_sbc_configuration), codec_aac: (6, parse_aac_configuration),
+                 "aptX": (7, parse_aptx_configuration), "aptX HD": (7, parse_aptx_configuration),
+                 "LDAC": (8, parse_ldac_configuration)}
+
+
+def codec_name(codec, data):
+    """Returns the name of a codec, resolving vendor codecs from the vendor and codec ids in data."""
+    if codec == codec_vendor and len(data) >= 6:
+        vendor_id = int.from_bytes(data[0:4], "little")
+        vendor_codec_id = int.from_bytes(data[4:6], "little")
+        return vendor_codecs.get((vendor_id, vendor_codec_id), f"Vendor {vendor_id:#010x}/{vendor_codec_id:#06x}")
+    return codec_names.get(codec, f"{codec:#04x}")
+
+
+def decode_configuration(codec, configuration):
+    """Decodes the codec configuration of an A2DP transport.
+
+    Args:
+        codec: Codec id (the MediaTransport1 Codec property).
+        configuration: Codec information elements (the MediaTransport1 Configuration property).
+
+    Returns:
+        A dictionary with at least codec, rate, channels and bitrate (estimated, bits per
+        second); values are None when they cannot be decoded.
+    """
+    codec = int(codec)
+    configuration = bytes(int(value) for value in configuration)
+    name = codec_name(codec, configuration)
+    details = {"codec": name, "rate": None, "channels": None}
+    minimum_length, parser = codec_parsers.get(codec if codec != codec_vendor else name, (0, None))
+    if parser and len(configuration) >= minimum_length:
+        details.update(parser(configuration))
+    details["bitrate"] = estimate_bitrate(details)
+    return details
+
+
+def decode_capabilities(codec, capabilities):
+    """Decodes the capabilities of a stream end point, listing every supported option.
+
+    Args:
+        codec: Codec id (the MediaEndpoint1 Codec property).
+        capabilities: Codec information elements (the MediaEndpoint1 Capabilities property).
+
+    Returns:
+        A dictionary with codec, rates and channel_modes, plus codec-specific ranges.
+    """
+    codec = int(codec)
+    capabilities = bytes(int(value) for value in capabilities)
+    name = codec_name(codec, capabilities)
+    details = {"codec": name, "rates": [], "channel_modes": []}
+    if codec == codec_sbc and len(capabilities) >= 4:
+        details.update(rates=all_flags(capabilities[0] & 0xF0, sbc_rates),
+                       channel_modes=all_flags(capabilities[0] & 0x0F, sbc_channel_modes),
+                       block_lengths=all_flags(capabilities[1] & 0xF0, {0x80: 4, 0x40: 8, 0x20: 12, 0x10: 16}),
+                       subbands=all_flags(capabilities[1] & 0x0C, {0x08: 4, 0x04: 8}),
+                       min_bitpool=capabilities[2], max_bitpool=capabilities[3])
+    elif codec == codec_aac and len(capabilities) >= 6:
+        rate_flags = (capabilities[1] << 4) | (capabilities[2] >> 4)
+        details.update(rates=all_flags(rate_flags, aac_rates),
+                       channel_modes=all_flags(capabilities[2] & 0x0C, {0x08: "mono", 0x04: "stereo"}),
+                       object_types=all_flags(capabilities[0], aac_object_types),
+                       vbr=bool(capabilities[3] & 0x80),
+                       max_bitrate=((capabilities[3] & 0x7F) << 16) | (capabilities[4] << 8) | capabilities[5])
+    elif name in ("aptX", "aptX HD") and len(capabilities) >= 7:
+        details.update(rates=all_flags(capabilities[6] & 0xF0, aptx_rates),
+                       channel_modes=all_flags(capabilities[6] & 0x0F, aptx_channel_modes))
+    elif name == "LDAC" and len(capabilities) >= 8:
+        details.update(rates=all_flags(capabilities[6] & 0x3F, ldac_rates),
+                       channel_modes=all_flags(capabilities[7] & 0x07, ldac_channel_modes))
+    return details
+
+
+def estimate_bitrate(details):
+    """Estimates the bitrate in bits per second that a decoded configuration delivers.
+
+    SBC uses the frame length formula of the A2DP specification at the maximum bitpool,
+    AAC its signalled bitrate, and aptX/aptX HD their fixed 4 and 6 bits per sample. LDAC adapts its bitrate at run time, so its highest mode is returned.
+
+    Returns:
+        The bitrate, or None if it cannot be derived from the configuration.
+    """
+    codec, rate, channels = details["codec"], details["rate"], details["channels"]
+    if not rate:
+        return None
+    if codec == "SBC" and details.get("subbands") and details.get("block_length"):
+        subbands, blocks, bitpool = details["subbands"], details["block_length"], details["max_bitpool"]
+        frame_length = 4 + 4 * subbands * channels // 8
+        if details["channel_mode"] in ("mono", "dual channel"):
+            frame_length += math.ceil(blocks * channels * bitpool / 8)
+        else:
+            join = 1 if details["channel_mode"] == "joint stereo" else 0
+            frame_length += math.ceil((join * subbands + blocks * bitpool) / 8)
+        return int(8 * frame_length * rate / (subbands * blocks))
+    if codec == "AAC":
+        return details.get("bitrate") or None
+    if codec == "aptX":
+        return rate * channels * 4
+    if codec == "aptX HD":
+        return rate * channels * 6
+    if codec == "LDAC":
+        return ldac_bitrates[-1]
+    return None
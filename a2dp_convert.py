@@ -0,0 +1,212 @@
+"""Streaming sample-format conversion for the A2DP source.
+
+Converts PCM block by block to the sample rate, channel count and sample
+format that a sink has negotiated, so test content prepared once can be
+played to any sink without offline transcoding. Memory use is bounded by
+the block size whatever the length of the file.
+"""
+import numpy as np
+
+from libraries.bluetooth.a2dp_stream import sample_widths
+
+full_scale = {"u8": 128.0, "s16le": 32768.0, "s24le": 8388608.0, "s32le": 2147483648.0}
+integer_types = {"u8": np.uint8, "s16le": "<i2", "s32le": "<i4"}
+anti_alias_taps = 127
+# Passband edge of the anti-aliasing filter, as a fraction of the output Nyquist frequency.
+anti_alias_passband = 0.92
+
+
+def decode_samples(data, spec):
+    """Converts interleaved PCM to a float32 array of shape (frames, channels) in [-1, 1).
+
+    Args:
+        data: Buffer of whole frames.
+        spec: Sample spec of the data.
+    """
+    sample_format = spec["format"]
+    if sample_format == "float32le":
+        samples = np.frombuffer(data, dtype="<f4")
+    elif sample_format == "s24le":
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = (raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)) << 8 >> 8
+        samples = samples.astype(np.float32) / full_scale["s24le"]
+    else:
+        samples = np.frombuffer(data, dtype=integer_types[sample_format]).astype(np.float32)
+        if sample_format == "u8":
+            samples -= 128.0
+        samples /= full_scale[sample_format]
+    return samples.reshape(-1, spec["channels"])
+
+
+def encode_samples(samples, spec):
+    """Converts a float32 array of shape (frames, channels) to interleaved PCM bytes, with clipping.
+
+    Args:
+        samples: Samples in [-1, 1).
+        spec: Sample spec of the output.
+    """
+    sample_format = spec["format"]
+    samples = samples.reshape(-1)
+    if sample_format == "float32le":
+        return np.clip(samples, -1.0, 1.0).astype("<f4").tobytes()
+    scale = full_scale[sample_format]
+    values = np.clip(np.rint(samples * scale), -scale, scale - 1).astype(np.int32)
+    if sample_format == "u8":
+        return (values + 128).astype(np.uint8).tobytes()
+    if sample_format == "s24le":
+        return values.astype("<i4").view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    return values.astype(integer_types[sample_format]).tobytes()
+
+
+def mixing_matrix(input_channels, output_channels, channel_map=None):
+    """Returns the (input_channels, output_channels) matrix mapping input to output channels.
+
+    Mono is copied to every output channel, several channels are averaged down to mono,
+    and otherwise output channel n takes input channel n (wrapping around).
+
+    Args:
+        input_channels: Number of input channels.
+        output_channels: Number of output channels.
+        channel_map: Optional list giving, for each output channel, the input channel it takes.
+    """
+    matrix = np.zeros((input_channels, output_channels), dtype=np.float32)
+    if channel_map is not None:
+        for output_channel, input_channel in enumerate(channel_map):
+            matrix[input_channel, output_channel] = 1.0
+    elif output_channels == 1:
+        matrix[:, 0] = 1.0 / input_channels
+    else:
+        for output_channel in range(output_channels):
+            matrix[output_channel % input_channels, output_channel] = 1.0
+    return matrix
+
+
+def lowpass_taps(cutoff, count=anti_alias_taps):
+    """Returns the taps of a Blackman-windowed sinc low-pass FIR filter with unity gain at DC.
+
+    Args:
+        cutoff: Cutoff frequency as a fraction of the sample rate (below 0.5).
+        count: Number of taps; odd, so that the delay is a whole number of samples.
+    """
+    offsets = np.arange(count) - (count - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * offsets) * np.blackman(count)
+    return (taps / taps.sum()).astype(np.float32)
+
+
+class LinearResampler:
+    """Sample-rate converter working on consecutive blocks.
+
+    Output samples are interpolated linearly between neighbouring input samples. When
+    downsampling, the input first goes through a low-pass FIR filter below the output
+    Nyquist frequency, so content above it does not alias into the audio band. The
+    filter history, the last input sample and the fractional read position are carried
+    from block to block, so block boundaries are seamless.
+    """
+
+    def __init__(self, input_rate, output_rate):
+        self.step = input_rate / output_rate
+        self.passthrough = input_rate == output_rate
+        self.position = 0.0
+        self.previous = None
+        self.taps = None
+        self.history = None
+        if output_rate < input_rate:
+            self.taps = lowpass_taps(0.5 * anti_alias_passband * output_rate / input_rate)
+
+    def filter(self, samples):
+        """Low-pass filters a block of shape (frames, channels), delaying it by half the filter length."""
+        if self.history is None:
+            self.history = np.zeros((len(self.taps) - 1, samples.shape[1]), dtype=np.float32)
+        data = np.concatenate((self.history, samples.astype(np.float32, copy=False)))
+        self.history = data[len(data) - len(self.taps) + 1:].copy()
+        return np.stack([np.convolve(data[:, channel], self.taps, mode="valid")
+                         for channel in range(data.shape[1])], axis=1)
+
+    def process(self, samples):
+        """Resamples a block of shape (frames, channels).
+
+        Returns:
+            The resampled frames available so far.
+        """
+        if self.passthrough or not len(samples):
+            return samples
+        if self.taps is not None:
+            samples = self.filter(samples)
+        data = samples if self.previous is None else np.concatenate((self.previous, samples))
+        last = len(data) - 1
+        count = int((last - self.position) // self.step) + 1 if last >= self.position else 0
+        positions = self.position + np.arange(count) * self.step
+        indices = positions.astype(np.int64)
+        fractions = (positions - indices).astype(np.float32)[:, None]
+        following = np.minimum(indices + 1, last)
+        output = data[indices] * (1.0 - fractions) + data[following] * fractions
+        self.position += count * self.step - last
+        self.previous = data[last:].copy()
+        return output
+
+
+class ConvertingSource:
+    """Wraps a PCM source and converts its audio to another sample spec on the fly.
+
+    Provides the same interface as the source (spec, read_into, prefetch, close), so it
+    can be handed to the streaming engines or used as a playlist track.
+    """
+
+    def __init__(self, source, spec, block_frames=4096, channel_map=None):
+        """Initialize the converter.
+
+        Args:
+            source: PCM source with a spec attribute and a read_into(buffer) method.
+            spec: Sample spec to convert to.
+            block_frames: Number of source frames converted at a time.
+            channel_map: Optional list giving, for each output channel, the source channel it takes.
+        """
+        self.source = source
+        self.spec = dict(spec)
+        source_spec = source.spec
+        self.input_frame_size = sample_widths[source_spec["format"]] * source_spec["channels"]
+        self.output_frame_size = sample_widths[self.spec["format"]] * self.spec["channels"]
+        self.input_buffer = bytearray(block_frames * self.input_frame_size)
+        self.matrix = None
+        if channel_map is not None or source_spec["channels"] != self.spec["channels"]:
+            self.matrix = mixing_matrix(source_spec["channels"], self.spec["channels"], channel_map)
+        self.resampler = LinearResampler(source_spec["rate"], self.spec["rate"])
+        self.pending = bytearray()
+        self.finished = False
+
+    def convert_block(self):
+        """Reads and converts one block of the source into the pending output.
+
+        Returns:
+            False once the source is exhausted.
+        """
+        size = self.source.read_into(memoryview(self.input_buffer))
+        if not size:
+            return False
+        samples = decode_samples(memoryview(self.input_buffer)[:size], self.source.spec)
+        if self.matrix is not None:
+            samples = samples @ self.matrix
+        samples = self.resampler.process(samples)
+        self.pending += encode_samples(samples, self.spec)
+        return True
+
+    def read_into(self, buffer):
+        """Fills buffer with whole frames of converted audio.
+
+        Returns:
+            The number of bytes copied, 0 at the end of the source.
+        """
+        wanted = len(buffer) - len(buffer) % self.output_frame_size
+        while len(self.pending) < wanted and not self.finished:
+            self.finished = not self.convert_block()
+        size = min(wanted, len(self.pending))
+        buffer[:size] = self.pending[:size]
+        del self.pending[:size]
+        return size
+
+    def prefetch(self, size):
+        if hasattr(self.source, "prefetch"):
+            self.source.prefetch(size)
+
+    def close(self):
+        self.source.close()
@@ -0,0 +1,869 @@
+"""In-process A2DP source streaming.
+
+PCM is written straight to the Bluetooth sink through the PulseAudio simple
+API (also served by pipewire-pulse), replacing the paplay subprocess.
+FanOutStreamEngine reads the source, such as a memory-mapped WAV file, into
+a small pool of preallocated buffers on a reader thread while writer
+threads, one per sink, write the filled ones; a single sink is the
+one-writer case. StreamManager runs any number of such streams side by side.
+
+A sample spec is a dictionary such as {"format": "s16le", "rate": 44100, "channels": 2}.
+"""
+import ctypes
+import ctypes.util
+import mmap
+import queue
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sample_formats = {"u8": 0, "s16le": 3, "float32le": 5, "s32le": 7, "s24le": 9}
+sample_widths = {"u8": 1, "s16le": 2, "float32le": 4, "s32le": 4, "s24le": 3}
+stream_playback = 1
+stream_record = 2
+wave_format_pcm = 0x0001
+wave_format_float = 0x0003
+wave_format_extensible = 0xFFFE
+pulse_libraries = None
+
+
+class PulseAudioError(RuntimeError):
+    """Raised when a PulseAudio simple API call fails."""
+
+
+class PaSampleSpec(ctypes.Structure):
+    _fields_ = [("format", ctypes.c_int), ("rate", ctypes.c_uint32), ("channels", ctypes.c_uint8)]
+
+
+class PaBufferAttr(ctypes.Structure):
+    _fields_ = [("maxlength", ctypes.c_uint32), ("tlength", ctypes.c_uint32), ("prebuf", ctypes.c_uint32),
+                ("minreq", ctypes.c_uint32), ("fragsize", ctypes.c_uint32)]
+
+
+def load_pulse_libraries():
+    """Loads libpulse-simple and libpulse once and declares the functions used by the sinks.
+
+    Returns:
+        A tuple of the libpulse-simple and libpulse libraries.
+    """
+    global pulse_libraries
+    if pulse_libraries is None:
+        simple = ctypes.CDLL(ctypes.util.find_library("pulse-simple") or "libpulse-simple.so.0")
+        pulse = ctypes.CDLL(ctypes.util.find_library("pulse") or "libpulse.so.0")
+        error_pointer = ctypes.POINTER(ctypes.c_int)
+        simple.pa_simple_new.restype = ctypes.c_void_p
+        simple.pa_simple_new.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p,
+                                         ctypes.c_char_p, ctypes.POINTER(PaSampleSpec), ctypes.c_void_p,
+                                         ctypes.POINTER(PaBufferAttr), error_pointer]
+        for name in ("pa_simple_write", "pa_simple_read"):
+            getattr(simple, name).argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t, error_pointer]
+        for name in ("pa_simple_drain", "pa_simple_flush"):
+            getattr(simple, name).argtypes = [ctypes.c_void_p, error_pointer]
+        simple.pa_simple_get_latency.restype = ctypes.c_uint64
+        simple.pa_simple_get_latency.argtypes = [ctypes.c_void_p, error_pointer]
+        simple.pa_simple_free.argtypes = [ctypes.c_void_p]
+        pulse.pa_strerror.restype = ctypes.c_char_p
+        pulse.pa_strerror.argtypes = [ctypes.c_int]
+        pulse_libraries = (simple, pulse)
+    return pulse_libraries
+
+
+def bytes_per_frame(spec):
+    """Returns the size in bytes of one frame (one sample for every channel) of a sample spec."""
+    return sample_widths[spec["format"]] * spec["channels"]
+
+
+def bluetooth_sink_name(address, server="pulseaudio"):
+    """Returns the name of the sink that PulseAudio or PipeWire creates for a connected A2DP sink.
+
+    Args:
+        address: Bluetooth address of remote device.
+        server: 'pulseaudio' or 'pipewire'.
+    """
+    formatted_address = address.replace(":", "_").upper()
+    if server == "pipewire":
+        return f"bluez_output.{formatted_address}.1"
+    return f"bluez_sink.{formatted_address}.a2dp_sink"
+
+
+class PulseSimpleSink:
+    """Playback (or record) stream on a PulseAudio/PipeWire device through the simple API."""
+
+    def __init__(self, spec, device=None, name="bluetooth-test-host", stream_name="A2DP source",
+                 target_latency_ms=100, direction=stream_playback):
+        """Opens the stream.
+
+        Args:
+            spec: Sample spec of the PCM written to the stream.
+            device: Sink (or source) name, None for the server default.
+            name: Application name shown by the sound server.
+            stream_name: Stream description shown by the sound server.
+            target_latency_ms: Target server-side buffer length in milliseconds.
+            direction: stream_playback or stream_record.
+        """
+        self.simple, self.pulse = load_pulse_libraries()
+        self.spec = spec
+        sample_spec = PaSampleSpec(sample_formats[spec["format"]], spec["rate"], spec["channels"])
+        target_bytes = int(spec["rate"] * bytes_per_frame(spec) * target_latency_ms / 1000)
+        unset = 0xFFFFFFFF
+        if direction == stream_playback:
+            attributes = PaBufferAttr(unset, target_bytes, unset, unset, unset)
+        else:
+            attributes = PaBufferAttr(unset, unset, unset, unset, target_bytes)
+        error = ctypes.c_int(0)
+        self.handle = self.simple.pa_simple_new(None, name.encode(), direction,
+                                                device.encode() if device else None, stream_name.encode(),
+                                                ctypes.byref(sample_spec), None, ctypes.byref(attributes),
+                                                ctypes.byref(error))
+        if not self.handle:
+            raise PulseAudioError(f"Cannot open {device or 'default device'}: {self.error_text(error)}")
+
+    def error_text(self, error):
+        return self.pulse.pa_strerror(error.value).decode()
+
+    def buffer_pointer(self, data):
+        view = memoryview(data)
+        if view.readonly:
+            return bytes(view)
+        return (ctypes.c_char * view.nbytes).from_buffer(view)
+
+    def write(self, data):
+        """Writes PCM to the stream, blocking while the server-side buffer is full."""
+        error = ctypes.c_int(0)
+        if self.simple.pa_simple_write(self.handle, self.buffer_pointer(data), len(data), ctypes.byref(error)) < 0:
+            raise PulseAudioError(f"Write failed: {self.error_text(error)}")
+
+    def read_into(self, buffer):
+        """Fills a writable buffer with captured PCM (record streams only)."""
+        error = ctypes.c_int(0)
+        if self.simple.pa_simple_read(self.handle, self.buffer_pointer(buffer), len(buffer), ctypes.byref(error)) < 0:
+            raise PulseAudioError(f"Read failed: {self.error_text(error)}")
+        return len(buffer)
+
+    def get_latency(self):
+        """Returns the current playback latency in seconds."""
+        error = ctypes.c_int(0)
+        latency_us = self.simple.pa_simple_get_latency(self.handle, ctypes.byref(error))
+        return latency_us / 1e6
+
+    def drain(self):
+        """Waits until all written data has been played."""
+        error = ctypes.c_int(0)
+        self.simple.pa_simple_drain(self.handle, ctypes.byref(error))
+
+    def flush(self):
+        """Drops data that has been written but not played yet."""
+        error = ctypes.c_int(0)
+        self.simple.pa_simple_flush(self.handle, ctypes.byref(error))
+
+    def close(self):
+        if self.handle:
+            self.simple.pa_simple_free(self.handle)
+            self.handle = None
+
+
+class NullSink:
+    """Stand-in sink for tests: consumes PCM at the rate a real device would and records counters."""
+
+    def __init__(self, spec, realtime=True, latency_ms=50):
+        """Initialize the sink.
+
+        Args:
+            spec: Sample spec of the PCM written to the sink.
+            realtime: If True, writes block like a real device playing at the sample rate.
+            latency_ms: Amount of audio the simulated device buffers ahead, in milliseconds.
+        """
+        self.spec = spec
+        self.realtime = realtime
+        self.latency = latency_ms / 1000
+        self.byte_rate = spec["rate"] * bytes_per_frame(spec)
+        self.bytes_written = 0
+        self.started = None
+
+    def write(self, data):
+        if self.started is None:
+            self.started = time.monotonic()
+        self.bytes_written += len(data)
+        if self.realtime:
+            ahead = self.started + self.bytes_written / self.byte_rate - time.monotonic()
+            if ahead > self.latency:
+                time.sleep(ahead - self.latency)
+
+    def get_latency(self):
+        if self.started is None:
+            return 0.0
+        return max(0.0, self.started + self.bytes_written / self.byte_rate - time.monotonic())
+
+    def drain(self):
+        if self.realtime:
+            time.sleep(self.get_latency())
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class WavFile:
+    """Memory-mapped reader of a RIFF/WAVE file that hands out PCM sequentially."""
+
+    def __init__(self, file_path):
+        """Opens and maps the file and parses its fmt and data chunks.
+
+        Args:
+            file_path: Path to the WAV file.
+        """
+        self.file_path = file_path
+        self.file = open(file_path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError(f"{file_path} is empty")
+        self.view = memoryview(self.map)
+        try:
+            self.parse_chunks()
+        except Exception:
+            self.close()
+            raise
+        self.position = self.data_offset
+
+    def parse_chunks(self):
+        if self.map[0:4] != b"RIFF" or self.map[8:12] != b"WAVE":
+            raise ValueError(f"{self.file_path} is not a RIFF/WAVE file")
+        offset = 12
+        fmt = None
+        while offset + 8 <= len(self.map):
+            chunk_id, chunk_size = struct.unpack_from("<4sI", self.map, offset)
+            body = offset + 8
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack_from("<HHIIHH", self.map, body)
+                if fmt[0] == wave_format_extensible and chunk_size >= 26:
+                    fmt = (struct.unpack_from("<H", self.map, body + 24)[0],) + fmt[1:]
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"{self.file_path} has no fmt chunk before its data")
+                self.data_offset = body
+                self.data_end = min(body + chunk_size, len(self.map))
+                break
+            offset = body + chunk_size + (chunk_size & 1)
+        else:
+            raise ValueError(f"{self.file_path} has no data chunk")
+        format_tag, channels, rate, _, block_align, bits = fmt
+        sample_format = {(wave_format_pcm, 8): "u8", (wave_format_pcm, 16): "s16le", (wave_format_pcm, 24): "s24le",
+                         (wave_format_pcm, 32): "s32le", (wave_format_float, 32): "float32le"}.get((format_tag, bits))
+        if sample_format is None:
+            raise ValueError(f"{self.file_path}: unsupported WAV encoding {format_tag:#x}/{bits} bit")
+        self.spec = {"format": sample_format, "rate": rate, "channels": channels}
+        self.block_align = block_align
+        self.data_end -= (self.data_end - self.data_offset) % block_align
+
+    @property
+    def duration(self):
+        """Length of the audio in seconds."""
+        return (self.data_end - self.data_offset) / (self.block_align * self.spec["rate"])
+
+    def prefetch(self, size):
+        """Asks the kernel to read ahead the next size bytes of audio."""
+        if hasattr(self.map, "madvise") and self.position < self.data_end:
+            page = mmap.PAGESIZE
+            start = self.position - self.position % page
+            self.map.madvise(mmap.MADV_WILLNEED, start, min(size + page, len(self.map) - start))
+
+    def read_into(self, buffer):
+        """Copies the next whole frames of audio into buffer.
+
+        Args:
+            buffer: Writable buffer (e.g. a bytearray or memoryview).
+
+        Returns:
+            The number of bytes copied, 0 at the end of the file.
+        """
+        size = min(len(buffer), self.data_end - self.position)
+        size -= size % self.block_align
+        buffer[:size] = self.view[self.position:self.position + size]
+        self.position += size
+        return size
+
+    def rewind(self):
+        self.position = self.data_offset
+
+    def close(self):
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+            self.map.close()
+        self.file.close()
+
+
+class PlaylistSource:
+    """Gapless source that plays several WAV files back to back.
+
+    While a track plays, the next one is opened, parsed and read ahead on a background
+    thread, and read_into() continues into it within the same buffer, so the sink never
+    sees a gap at a track boundary and the A2DP transport stays in the streaming state.
+    Tracks whose sample spec differs from the playlist's spec are converted on the fly
+    (which needs NumPy), or skipped if they cannot be converted.
+    """
+
+    def __init__(self, file_paths, log=None, on_track_changed=None, loop=False, spec=None):
+        """Opens the first track and starts prefetching the second.
+
+        Args:
+            file_paths: Paths to the WAV files, in playback order.
+            log: Logger instance.
+            on_track_changed: Optional callable invoked with (index, file_path) when a track starts being sent.
+            loop: If True, starts again from the first track after the last one.
+            spec: Sample spec to stream in, such as the sink's negotiated configuration.
+                The first track's spec is used if None.
+        """
+        if not file_paths:
+            raise ValueError("Playlist is empty")
+        self.file_paths = list(file_paths)
+        self.log = log
+        self.on_track_changed = on_track_changed
+        self.loop = loop
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="a2dp-prefetch")
+        self.index = 0
+        self.spec = spec
+        self.current = self.open_track(0, 0)
+        self.spec = self.current.spec
+        self.skipped_tracks = []
+        self.next_track = None
+        self.prefetch_next(1)
+        self.notify_track_changed()
+
+    def open_track(self, index, read_ahead):
+        track = WavFile(self.file_paths[index])
+        track.prefetch(read_ahead)
+        if self.spec is None or track.spec == self.spec:
+            return track
+        try:
+            from libraries.bluetooth.a2dp_convert import ConvertingSource
+            if self.log:
+                self.log.info("Converting %s from %s to %s", self.file_paths[index], track.spec, self.spec)
+            return ConvertingSource(track, self.spec)
+        except Exception:
+            track.close()
+            raise
+
+    def prefetch_next(self, index, read_ahead=262144):
+        """Starts opening the track at index in the background.
+
+        Args:
+            index: Position of the track in the playlist.
+            read_ahead: Number of bytes of the track to read ahead.
+        """
+        if index >= len(self.file_paths):
+            if not self.loop:
+                self.next_track = None
+                return
+            index = 0
+        self.next_track = (index, self.executor.submit(self.open_track, index, read_ahead))
+
+    def advance(self):
+        """Switches to the prefetched track.
+
+        Returns:
+            True if a new track is current, False at the end of the playlist.
+        """
+        attempts = 0
+        while self.next_track is not None and attempts < len(self.file_paths):
+            attempts += 1
+            index, future = self.next_track
+            try:
+                track = future.result()
+            except Exception as error:
+                track = None
+                reason = str(error)
+            if track is not None:
+                self.current.close()
+                self.current = track
+                self.index = index
+                self.prefetch_next(index + 1)
+                self.notify_track_changed()
+                return True
+            self.skipped_tracks.append(self.file_paths[index])
+            if self.log:
+                self.log.warning("Skipping %s: %s", self.file_paths[index], reason)
+            self.prefetch_next(index + 1)
+        return False
+
+    def notify_track_changed(self):
+        if self.log:
+            self.log.info("Streaming track %d: %s", self.index, self.file_paths[self.index])
+        if self.on_track_changed:
+            self.on_track_changed(self.index, self.file_paths[self.index])
+
+    def read_into(self, buffer):
+        """Fills buffer with audio, continuing into the next track at a track boundary.
+
+        Returns:
+            The number of bytes copied, 0 at the end of the playlist.
+        """
+        view = memoryview(buffer)
+        filled = 0
+        while filled < len(view):
+            size = self.current.read_into(view[filled:])
+            filled += size
+            if not size and not self.advance():
+                break
+        return filled
+
+    def prefetch(self, size):
+        self.current.prefetch(size)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        if self.next_track is not None:
+            _, future = self.next_track
+            if future.exception() is None:
+                future.result().close()
+            self.next_track = None
+        self.current.close()
+
+
+class SinkWriter:
+    """One sink of a FanOutStreamEngine, written by its own thread from its own block queue."""
+
+    def __init__(self, name, sink_factory, engine):
+        """Initialize the writer.
+
+        Args:
+            name: Name identifying the sink within the stream (e.g. the device address).
+            sink_factory: Callable returning a sink for a sample spec.
+            engine: FanOutStreamEngine feeding the writer.
+        """
+        self.name = name
+        self.sink_factory = sink_factory
+        self.engine = engine
+        self.blocks = queue.Queue()
+        self.sink = None
+        self.thread = None
+        self.detached = threading.Event()
+        self.state = "idle"
+        self.error = None
+        self.started = None
+        self.stopped = None
+        self.bytes_written = 0
+        self.blocks_written = 0
+        self.underruns = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.max_write_time = 0.0
+
+    def start(self):
+        self.sink = self.sink_factory(self.engine.source.spec)
+        self.state = "streaming"
+        self.started = time.monotonic()
+        self.thread = threading.Thread(target=self.write_loop, name=f"a2dp-writer-{self.name}", daemon=True)
+        self.thread.start()
+
+    def write_loop(self):
+        try:
+            while True:
+                try:
+                    item = self.blocks.get_nowait()
+                except queue.Empty:
+                    if self.blocks_written:
+                        self.underruns += 1
+                    item = self.blocks.get()
+                if item is None or self.detached.is_set() or self.engine.stop_event.is_set():
+                    if item is not None:
+                        self.engine.release(item[0])
+                    break
+                index, size = item
+                try:
+                    write_started = time.monotonic()
+                    self.sink.write(memoryview(self.engine.buffers[index])[:size])
+                    self.max_write_time = max(self.max_write_time, time.monotonic() - write_started)
+                    self.bytes_written += size
+                    self.blocks_written += 1
+                    self.latency = self.sink.get_latency()
+                    self.max_latency = max(self.max_latency, self.latency)
+                finally:
+                    self.engine.release(index)
+            if self.detached.is_set() or self.engine.stop_event.is_set():
+                self.sink.flush()
+            elif self.engine.error is None:
+                self.sink.drain()
+        except Exception as error:
+            self.error = error
+        finally:
+            removed = self.detached.is_set()
+            self.detached.set()
+            self.release_pending()
+            self.sink.close()
+            self.stopped = time.monotonic()
+            if self.error is not None:
+                self.state = "error"
+                if self.engine.log:
+                    self.engine.log.error("A2DP stream error on %s: %s", self.name, self.error)
+            elif removed or self.engine.stop_event.is_set() or self.engine.error is not None:
+                self.state = "stopped"
+            else:
+                self.state = "finished" if self.engine.source_finished else "stopped"
+            self.engine.writer_finished()
+
+    def release_pending(self):
+        """Hands back blocks queued for a writer that stopped early, so the other sinks keep going."""
+        while True:
+            try:
+                item = self.blocks.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                self.engine.release(item[0])
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def get_stats(self):
+        end = self.stopped or time.monotonic()
+        elapsed = end - self.started if self.started else 0.0
+        byte_rate = self.engine.source.spec["rate"] * bytes_per_frame(self.engine.source.spec)
+        return {
+            "state": self.state,
+            "bytes_written": self.bytes_written,
+            "blocks_written": self.blocks_written,
+            "underruns": self.underruns,
+            "latency_ms": self.latency * 1000,
+            "max_latency_ms": self.max_latency * 1000,
+            "max_write_ms": self.max_write_time * 1000,
+            "elapsed_s": elapsed,
+            "throughput_kbps": self.bytes_written * 8 / elapsed / 1000 if elapsed else 0.0,
+            "realtime_factor": self.bytes_written / byte_rate / elapsed if elapsed else 0.0,
+            "error": str(self.error) if self.error is not None else None,
+        }
+
+
+class FanOutStreamEngine:
+    """Reads (decodes) a source once and writes every block to several sinks.
+
+    Each sink has its own writer thread and block queue, and the sound server encodes
+    the PCM separately for every Bluetooth sink. Blocks come from a small shared pool
+    and return to it once every sink has written them, so memory stays bounded and a
+    sink that falls behind holds the reader back instead of dropping audio for the
+    others. A sink that fails or is removed stops on its own; the rest keep playing.
+    """
+
+    def __init__(self, source, sink_factories, buffer_size=16384, buffer_count=4, log=None, on_finished=None):
+        """Initialize the engine.
+
+        Args:
+            source: PCM source, such as a WavFile or PlaylistSource.
+            sink_factories: Dictionary of sink name to callable returning a sink for a sample spec.
+            buffer_size: Size in bytes of each transfer buffer.
+            buffer_count: Number of transfer buffers shared by the sinks.
+            log: Logger instance.
+            on_finished: Optional callable invoked with the final statistics once every sink has stopped.
+        """
+        if not sink_factories:
+            raise ValueError("At least one sink is required")
+        self.source = source
+        frame_size = bytes_per_frame(source.spec)
+        self.buffer_size = max(frame_size, buffer_size - buffer_size % frame_size)
+        self.buffers = [bytearray(self.buffer_size) for _ in range(max(2, buffer_count))]
+        self.references = [0] * len(self.buffers)
+        self.reference_lock = threading.Lock()
+        self.free_buffers = queue.Queue()
+        self.writers = {name: SinkWriter(name, factory, self) for name, factory in sink_factories.items()}
+        self.log = log
+        self.on_finished = on_finished
+        self.stop_event = threading.Event()
+        self.reader_thread = None
+        self.state = "idle"
+        self.error = None
+        self.source_finished = False
+        self.running_writers = 0
+        self.reader_done = False
+        self.source_close_pending = False
+        self.started = None
+        self.stopped = None
+        self.bytes_read = 0
+
+    def start(self):
+        """Opens every sink and starts the reader and writer threads.
+
+        A sink that cannot be opened is reported in its statistics; the engine fails only
+        if no sink could be opened.
+        """
+        for writer in self.writers.values():
+            try:
+                with self.reference_lock:
+                    self.running_writers += 1
+                writer.start()
+            except Exception as error:
+                with self.reference_lock:
+                    self.running_writers -= 1
+                writer.error = error
+                writer.state = "error"
+                writer.detached.set()
+                if self.log:
+                    self.log.error("Cannot open sink %s: %s", writer.name, error)
+        if not self.active_writers():
+            raise PulseAudioError("No sink could be opened")
+        for index in range(len(self.buffers)):
+            self.free_buffers.put(index)
+        self.state = "streaming"
+        self.started = time.monotonic()
+        self.reader_thread = threading.Thread(target=self.read_loop, name="a2dp-reader", daemon=True)
+        self.reader_thread.start()
+
+    def active_writers(self):
+        return [writer for writer in self.writers.values() if writer.is_running() and not writer.detached.is_set()]
+
+    def read_loop(self):
+        try:
+            while not self.stop_event.is_set():
+                index = self.free_buffers.get()
+                if index is None:
+                    break
+                writers = self.active_writers()
+                if not writers:
+                    break
+                size = self.source.read_into(memoryview(self.buffers[index]))
+                if not size:
+                    self.source_finished = True
+                    break
+                if hasattr(self.source, "prefetch"):
+                    self.source.prefetch(self.buffer_size)
+                self.bytes_read += size
+                with self.reference_lock:
+                    self.references[index] = len(writers)
+                for writer in writers:
+                    writer.blocks.put((index, size))
+                    if writer.detached.is_set():
+                        writer.release_pending()
+        except Exception as error:
+            self.error = error
+            if self.log:
+                self.log.error("A2DP source error: %s", error)
+        for writer in self.writers.values():
+            writer.blocks.put(None)
+        with self.reference_lock:
+            self.reader_done = True
+            close_source = self.source_close_pending
+        if close_source:
+            self.source.close()
+
+    def release(self, index):
+        """Called by a writer once it is done with a block."""
+        with self.reference_lock:
+            self.references[index] -= 1
+            free = self.references[index] == 0
+        if free:
+            self.free_buffers.put(index)
+
+    def writer_finished(self):
+        with self.reference_lock:
+            self.running_writers -= 1
+            if self.running_writers:
+                return
+            self.stopped = time.monotonic()
+        self.free_buffers.put(None)
+        if self.error is not None:
+            self.state = "error"
+        elif self.stop_event.is_set() or not self.source_finished:
+            self.state = "stopped"
+        else:
+            self.state = "finished"
+        if self.on_finished:
+            self.on_finished(self.get_stats())
+
+    def remove_sink(self, name, timeout=2):
+        """Stops writing to one sink while the others keep streaming.
+
+        Args:
+            name: Name of the sink.
+            timeout: Time in seconds to wait for its writer thread.
+
+        Returns:
+            True if the sink's writer has stopped, False otherwise.
+        """
+        writer = self.writers.get(name)
+        if writer is None:
+            return False
+        writer.detached.set()
+        writer.blocks.put(None)
+        if writer.thread is not None and writer.thread is not threading.current_thread():
+            writer.thread.join(timeout)
+        return not writer.is_running()
+
+    def stop(self, timeout=2):
+        """Stops streaming to every sink and waits for the threads to exit.
+
+        Args:
+            timeout: Time in seconds to wait for each thread.
+        """
+        self.stop_event.set()
+        self.free_buffers.put(None)
+        for writer in self.writers.values():
+            writer.blocks.put(None)
+        threads = [self.reader_thread] + [writer.thread for writer in self.writers.values()]
+        for thread in threads:
+            if thread is not None and thread is not threading.current_thread():
+                thread.join(timeout)
+
+    def is_running(self):
+        return any(writer.is_running() for writer in self.writers.values())
+
+    def close_source(self):
+        """Closes the source, or leaves it to the reader thread if that is still reading from it.
+
+        Returns:
+            True if the source was closed, False if closing was deferred to the reader thread.
+        """
+        with self.reference_lock:
+            if self.reader_thread is not None and not self.reader_done:
+                self.source_close_pending = True
+                return False
+        self.source.close()
+        return True
+
+    def get_stats(self):
+        """Returns the statistics of the stream and of each of its sinks.
+
+        Returns:
+            A dictionary of stream statistics, with per-sink counters under 'sinks'.
+        """
+        end = self.stopped or time.monotonic()
+        elapsed = end - self.started if self.started else 0.0
+        return {
+            "state": self.state,
+            "spec": dict(self.source.spec),
+            "buffer_size": self.buffer_size,
+            "buffer_count": len(self.buffers),
+            "bytes_read": self.bytes_read,
+            "elapsed_s": elapsed,
+            "error": str(self.error) if self.error is not None else None,
+            "sinks": {name: writer.get_stats() for name, writer in self.writers.items()},
+        }
+
+
+class StreamManager:
+    """Runs independent streams to several sinks at the same time.
+
+    Streams are identified by a caller-chosen id. Each stream owns its source, which is
+    closed when the stream ends, is stopped or is replaced. A stream that ends on its own
+    is dropped at once, and only its final statistics are kept until it is stopped or
+    replaced.
+    """
+
+    def __init__(self, log=None, on_finished=None):
+        """Initialize the manager.
+
+        Args:
+            log: Logger instance.
+            on_finished: Optional callable invoked with (stream_id, stats) when a stream ends.
+        """
+        self.log = log
+        self.on_finished = on_finished
+        self.streams = {}
+        self.finished_stats = {}
+        self.lock = threading.Lock()
+
+    def start(self, stream_id, source, sink_factories, buffer_size=16384, buffer_count=4):
+        """Starts streaming a source to one or more sinks, replacing any stream with the same id.
+
+        Args:
+            stream_id: Identifier of the stream.
+            source: PCM source; the manager takes ownership of it.
+            sink_factories: Dictionary of sink name to callable returning a sink for a sample spec.
+            buffer_size: Size in bytes of each transfer buffer.
+            buffer_count: Number of transfer buffers shared by the sinks.
+
+        Returns:
+            The started FanOutStreamEngine.
+        """
+        self.stop(stream_id)
+        engine = FanOutStreamEngine(source, sink_factories, buffer_size=buffer_size, buffer_count=buffer_count,
+                                    log=self.log,
+                                    on_finished=lambda stats: self.stream_finished(stream_id, engine, stats))
+        with self.lock:
+            self.streams[stream_id] = engine
+        try:
+            engine.start()
+        except Exception:
+            with self.lock:
+                self.streams.pop(stream_id, None)
+            raise
+        return engine
+
+    def stream_finished(self, stream_id, engine, stats):
+        """Drops a stream that has ended, closing its source and keeping its final statistics."""
+        with self.lock:
+            current = self.streams.get(stream_id) is engine
+            if current:
+                del self.streams[stream_id]
+                self.finished_stats[stream_id] = stats
+        # A stream that was stopped or replaced has its source closed by stop().
+        if current and not engine.close_source() and self.log:
+            self.log.debug("Reader of stream %s is still running, its source is closed once it exits", stream_id)
+        if self.on_finished:
+            self.on_finished(stream_id, stats)
+
+    def find_streams(self, sink_name):
+        """Returns the ids of the running streams that write to a sink."""
+        with self.lock:
+            return [stream_id for stream_id, engine in self.streams.items()
+                    if sink_name in engine.writers and engine.writers[sink_name].is_running()]
+
+    def remove_sink(self, sink_name, timeout=2):
+        """Stops writing to a sink, stopping the streams for which it was the only running sink.
+
+        Returns:
+            True if every writer to the sink has stopped, False otherwise.
+        """
+        stopped = True
+        for stream_id in self.find_streams(sink_name):
+            engine = self.streams.get(stream_id)
+            if engine is None:
+                continue
+            if len(engine.active_writers()) > 1:
+                stopped = engine.remove_sink(sink_name, timeout) and stopped
+            else:
+                stopped = self.stop(stream_id, timeout) and stopped
+        return stopped
+
+    def stop(self, stream_id, timeout=2):
+        """Stops a stream, closes its source and forgets it, along with the statistics of a finished one.
+
+        Returns:
+            True if the stream existed and its threads have exited, False otherwise.
+        """
+        with self.lock:
+            engine = self.streams.pop(stream_id, None)
+            finished = self.finished_stats.pop(stream_id, None)
+        if engine is None:
+            return finished is not None
+        engine.stop(timeout)
+        if not engine.close_source() and self.log:
+            self.log.warning("Reader of stream %s is still running, its source is closed once it exits", stream_id)
+        return not engine.is_running()
+
+    def stop_all(self, timeout=2):
+        stopped = True
+        with self.lock:
+            stream_ids = list(self.streams) + [stream_id for stream_id in self.finished_stats
+                                               if stream_id not in self.streams]
+        for stream_id in stream_ids:
+            stopped = self.stop(stream_id, timeout) and stopped
+        return stopped
+
+    def get_stats(self, stream_id=None):
+        """Returns the statistics of one stream, or of every stream by id if stream_id is None.
+
+        A stream that has ended reports its final statistics.
+        """
+        with self.lock:
+            streams = dict(self.streams)
+            finished = dict(self.finished_stats)
+        if stream_id is not None:
+            engine = streams.get(stream_id)
+            return engine.get_stats() if engine else finished.get(stream_id)
+        stats = dict(finished)
+        stats.update({stream_id: engine.get_stats() for stream_id, engine in streams.items()})
+        return stats
@@ -0,0 +1,222 @@
+"""Non-blocking logging backend for BluetoothDeviceManager and TestApplication.
+
+AsyncLogPipeline moves the handlers of a logger behind a queue: the calling
+thread only builds the LogRecord and puts it on the queue, without
+formatting the message or touching a file, and a background thread takes
+the records off in batches, formats them and hands them to the original
+handlers. Records can also be written as JSON lines, one object per record
+with the time, level, thread and message plus the structured fields passed
+with extra= (operation, address, duration_ms and any other):
+
+    self.log.info("Paired %s", address, extra={"operation": "pair", "address": address, "duration_ms": 812.0})
+
+When the queue is full, records are dropped and counted rather than
+blocking the caller. As messages are formatted later, pass values rather
+than objects that change right after the call. Setting BLUETOOTH_LOG_JSON
+to a file path turns the pipeline on for the manager's logger.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+
+json_environment_variable = "BLUETOOTH_LOG_JSON"
+structured_fields = ("operation", "address", "duration_ms")
+
+# Attributes every LogRecord has; anything else on a record came in through extra=.
+record_attributes = set(vars(logging.LogRecord("", logging.INFO, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a single-line JSON object."""
+
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for name in structured_fields:
+            entry[name] = getattr(record, name, None)
+        for name, value in vars(record).items():
+            if name not in record_attributes and name not in entry:
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class JsonLinesHandler(logging.Handler):
+    """Appends records to a file as JSON lines; emit_batch() writes a whole batch at once."""
+
+    def __init__(self, file_path):
+        super().__init__()
+        self.file_path = file_path
+        self.stream = open(file_path, "a", encoding="utf-8")
+        self.setFormatter(JsonFormatter())
+
+    def emit(self, record):
+        self.emit_batch([record])
+
+    def emit_batch(self, records):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record) + "\n")
+            except Exception:
+                self.handleError(record)
+        self.stream.write("".join(lines))
+        self.stream.flush()
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            super().close()
+
+
+class QueueingHandler(logging.Handler):
+    """Puts records on a queue without formatting them; drops them when the queue is full."""
+
+    def __init__(self, record_queue):
+        super().__init__()
+        self.queue = record_queue
+        self.dropped = 0
+
+    def handle(self, record):
+        # No handler lock: the queue is thread-safe and nothing else is shared.
+        if self.filter(record):
+            self.emit(record)
+        return record
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class AsyncLogPipeline:
+    """Delivers the records of a logger to its handlers from a background thread, in batches."""
+
+    def __init__(self, json_path=None, batch_size=256, flush_interval=0.2, max_queue=100000):
+        """Initialize the pipeline.
+
+        Args:
+            json_path: Optional file the records are also written to as JSON lines.
+            batch_size: Maximum number of records delivered per batch.
+            flush_interval: Maximum time in seconds a record waits for its batch to fill.
+            max_queue: Number of pending records after which new ones are dropped.
+        """
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.queue_handler = QueueingHandler(self.queue)
+        self.json_handler = JsonLinesHandler(json_path) if json_path else None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.logger = None
+        self.handlers = []
+        self.own_handlers = []
+        self.propagate = True
+        self.thread = None
+        self.batches = 0
+        self.delivered = 0
+
+    def install(self, logger):
+        """Moves the handlers of a logger, or the ones it propagates to, behind the queue and starts delivery.
+
+        Args:
+            logger: logging.Logger to make non-blocking.
+        """
+        if self.logger is not None:
+            return
+        handlers = []
+        current = logger
+        while current is not None:
+            handlers.extend(handler for handler in current.handlers if handler not in handlers)
+            if not current.propagate:
+                break
+            current = current.parent
+        self.logger = logger
+        self.handlers = handlers
+        self.own_handlers = list(logger.handlers)
+        self.propagate = logger.propagate
+        for handler in self.own_handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(self.queue_handler)
+        logger.propagate = False
+        self.thread = threading.Thread(target=self.run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def uninstall(self):
+        """Delivers the pending records and gives the logger its handlers back."""
+        logger = self.logger
+        if logger is None:
+            return
+        logger.removeHandler(self.queue_handler)
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        for handler in self.own_handlers:
+            logger.addHandler(handler)
+        logger.propagate = self.propagate
+        if self.json_handler is not None:
+            self.json_handler.close()
+        self.logger = None
+
+    def next_batch(self):
+        """Waits for a record, then collects more until the batch is full or the flush interval passed.
+
+        Returns:
+            The records, and whether the pipeline was asked to stop.
+        """
+        record = self.queue.get()
+        if record is None:
+            return [], True
+        batch = [record]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                record = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is None:
+                return batch, True
+            batch.append(record)
+        return batch, False
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self.next_batch()
+            if batch:
+                self.deliver(batch)
+        # Records queued after the stop request, by threads that were still logging.
+        remaining = []
+        while True:
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is not None:
+                remaining.append(record)
+        if remaining:
+            self.deliver(remaining)
+
+    def deliver(self, batch):
+        for handler in self.handlers:
+            for record in batch:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+        if self.json_handler is not None:
+            self.json_handler.emit_batch(batch)
+        self.batches += 1
+        self.delivered += len(batch)
+
+    def get_stats(self):
+        """Returns the number of delivered, pending and dropped records and of batches written."""
+        return {"delivered": self.delivered, "pending": self.queue.qsize(), "dropped": self.queue_handler.dropped,
+                "batches": self.batches}
@@ -0,0 +1,427 @@
+"""Loopback audio quality and latency measurement.
+
+A known stimulus (logarithmic chirp, maximum length sequence or sine tone)
+is played through an audio path while the output is captured back, from
+the sink's monitor source, an external loopback or a PulseAudio null-sink
+for offline runs. The capture is compared with the reference to report
+end-to-end latency (cross-correlation), dropouts, THD and level.
+
+A periodic tone correlates with itself at every period, so its lag is
+ambiguous: prepare_stimulus() puts a short chirp before a tone, and the
+latency of a tone measurement is taken from that preamble alone.
+
+Playback and capture objects follow the a2dp_stream interfaces: a sink
+has write(data) and drain(), a capture stream has read_into(buffer). A
+capture stream that buffers audio until it is read (such as an SCO stream)
+may also have discard_captured(), which measure_loopback() calls right
+before the first write so that the capture starts with the playback.
+"""
+import threading
+import time
+
+import numpy as np
+
+mls_taps = {10: (10, 7), 11: (11, 9), 12: (12, 11, 10, 4), 13: (13, 12, 11, 8), 14: (14, 13, 12, 2),
+            15: (15, 14), 16: (16, 15, 13, 4), 17: (17, 14), 18: (18, 11)}
+stimulus_types = ("chirp", "mls", "tone")
+tone_preamble_s = 0.05
+tone_preamble_gap_s = 0.05
+tone_preamble_start_frequency = 200.0
+
+
+def generate_chirp(rate, duration=1.0, start_frequency=20.0, end_frequency=None, level_db=-6.0):
+    """Returns an exponential sine sweep.
+
+    Args:
+        rate: Sample rate in Hz.
+        duration: Length in seconds.
+        start_frequency: Frequency at the start of the sweep in Hz.
+        end_frequency: Frequency at the end of the sweep in Hz, 90% of Nyquist if None.
+        level_db: Peak level in dBFS.
+    """
+    end_frequency = end_frequency or rate * 0.45
+    times = np.arange(int(rate * duration)) / rate
+    ratio = np.log(end_frequency / start_frequency)
+    phase = 2 * np.pi * start_frequency * duration / ratio * (np.exp(times * ratio / duration) - 1)
+    return (10 ** (level_db / 20) * np.sin(phase)).astype(np.float32)
+
+
+def generate_mls(rate, order=15, level_db=-6.0):
+    """Returns one period of a maximum length sequence as +/- level samples.
+
+    Args:
+        rate: Sample rate in Hz (unused, for a signature common to every stimulus).
+        order: Register length; the sequence has 2**order - 1 samples.
+        level_db: Peak level in dBFS.
+    """
+    taps = mls_taps[order]
+    state = 1
+    length = (1 << order) - 1
+    bits = np.empty(length, dtype=np.float32)
+    for index in range(length):
+        feedback = 0
+        for tap in taps:
+            feedback ^= (state >> (tap - 1)) & 1
+        bits[index] = state & 1
+        state = ((state << 1) | feedback) & length
+    return (10 ** (level_db / 20) * (2 * bits - 1)).astype(np.float32)
+
+
+def generate_tone(rate, duration=1.0, frequency=1000.0, level_db=-6.0):
+    """Returns a sine tone with 5 ms raised-cosine fades at both ends.
+
+    Args:
+        rate: Sample rate in Hz.
+        duration: Length in seconds.
+        frequency: Tone frequency in Hz.
+        level_db: Peak level in dBFS.
+    """
+    times = np.arange(int(rate * duration)) / rate
+    tone = 10 ** (level_db / 20) * np.sin(2 * np.pi * frequency * times)
+    fade = min(len(tone) // 2, int(rate * 0.005))
+    if fade:
+        ramp = 0.5 - 0.5 * np.cos(np.linspace(0, np.pi, fade))
+        tone[:fade] *= ramp
+        tone[-fade:] *= ramp[::-1]
+    return tone.astype(np.float32)
+
+
+def generate_stimulus(stimulus, rate, duration=1.0, level_db=-6.0, frequency=1000.0):
+    """Returns the samples of a stimulus by name ('chirp', 'mls' or 'tone')."""
+    if stimulus == "chirp":
+        return generate_chirp(rate, duration, level_db=level_db)
+    if stimulus == "mls":
+        order = min(18, max(10, int(np.ceil(np.log2(rate * duration + 1)))))
+        return generate_mls(rate, order, level_db=level_db)
+    if stimulus == "tone":
+        return generate_tone(rate, duration, frequency, level_db=level_db)
+    raise ValueError(f"Unknown stimulus {stimulus}, expected one of {', '.join(stimulus_types)}")
+
+
+def to_pcm(samples, spec):
+    """Converts mono float samples to interleaved PCM bytes of a sample spec (every channel identical)."""
+    from libraries.bluetooth.a2dp_convert import encode_samples
+    return encode_samples(np.repeat(samples[:, None], spec["channels"], axis=1), spec)
+
+
+def from_pcm(data, spec):
+    """Converts interleaved PCM bytes to mono float samples (first channel)."""
+    from libraries.bluetooth.a2dp_convert import decode_samples
+    return decode_samples(data, spec)[:, 0].copy()
+
+
+class ArraySource:
+    """PCM source serving prepared audio from memory, for the streaming engines."""
+
+    def __init__(self, samples, spec):
+        """Initialize the source.
+
+        Args:
+            samples: Mono float samples, copied to every channel.
+            spec: Sample spec to serve the audio in.
+        """
+        self.spec = dict(spec)
+        self.data = memoryview(to_pcm(samples, spec))
+        self.position = 0
+
+    def read_into(self, buffer):
+        size = min(len(buffer), len(self.data) - self.position)
+        buffer[:size] = self.data[self.position:self.position + size]
+        self.position += size
+        return size
+
+    def close(self):
+        self.data.release()
+
+
+class Recorder:
+    """Captures a fixed amount of audio from a capture stream on a background thread."""
+
+    def __init__(self, capture, spec, frames, block_frames=1024):
+        """Initialize the recorder.
+
+        Args:
+            capture: Capture stream with a read_into(buffer) method.
+            spec: Sample spec of the capture stream.
+            frames: Number of frames to capture.
+            block_frames: Number of frames read at a time.
+        """
+        from libraries.bluetooth.a2dp_stream import bytes_per_frame
+        self.capture = capture
+        self.spec = spec
+        frame_size = bytes_per_frame(spec)
+        self.data = bytearray(frames * frame_size)
+        self.block_size = block_frames * frame_size
+        self.captured = 0
+        self.started = None
+        self.error = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.finished = False
+        self.close_pending = False
+        self.thread = threading.Thread(target=self.record, name="audio-recorder", daemon=True)
+
+    def start(self):
+        self.started = time.monotonic()
+        self.thread.start()
+
+    def record(self):
+        view = memoryview(self.data)
+        try:
+            while self.captured < len(self.data) and not self.stop_event.is_set():
+                end = min(len(self.data), self.captured + self.block_size)
+                self.captured += self.capture.read_into(view[self.captured:end])
+        except Exception as error:
+            self.error = error
+        finally:
+            with self.lock:
+                self.finished = True
+                close_capture = self.close_pending
+            if close_capture:
+                self.capture.close()
+
+    def wait(self, timeout=None):
+        """Waits for the capture to complete.
+
+        If the timeout expires first, the recording thread is told to stop after the read
+        it is blocked in.
+
+        Returns:
+            Mono float samples of what was captured.
+        """
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            self.stop_event.set()
+        return from_pcm(bytes(self.data[:self.captured]), self.spec)
+
+    def is_running(self):
+        return self.thread.is_alive()
+
+    def close_capture(self):
+        """Closes the capture stream, or leaves it to the recording thread if that is still reading.
+
+        Returns:
+            True if the stream was closed, False if closing was deferred to the recording thread.
+        """
+        with self.lock:
+            if self.thread.ident is not None and not self.finished:
+                self.close_pending = True
+                return False
+        self.capture.close()
+        return True
+
+
+def frame_rms(samples, window):
+    """Returns the RMS of consecutive windows of samples."""
+    count = len(samples) // window
+    frames = samples[:count * window].reshape(count, window)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+def measure_latency(reference, captured, rate):
+    """Finds the delay of the reference within the capture by FFT cross-correlation.
+
+    Args:
+        reference: Played samples, aligned with the start of the capture.
+        captured: Captured samples.
+        rate: Sample rate in Hz.
+
+    Returns:
+        A tuple of (latency in ms, lag in samples, normalized correlation peak in [0, 1]).
+    """
+    size = 1 << int(np.ceil(np.log2(len(reference) + len(captured))))
+    spectrum = np.fft.rfft(captured, size) * np.conj(np.fft.rfft(reference, size))
+    correlation = np.fft.irfft(spectrum, size)[:len(captured)]
+    lag = int(np.argmax(np.abs(correlation)))
+    norm = np.sqrt(np.sum(reference * reference) * np.sum(captured * captured))
+    peak = float(np.abs(correlation[lag]) / norm) if norm else 0.0
+    return lag * 1000.0 / rate, lag, peak
+
+
+def count_dropouts(reference, aligned, rate, window_ms=1.0, threshold_db=-20.0, min_level_db=-50.0):
+    """Counts the gaps in a capture aligned with its reference.
+
+    A window is missing when the reference is audible there but the capture is more than
+    threshold_db below it; consecutive missing windows count as one dropout.
+
+    Args:
+        reference: Played samples.
+        aligned: Captured samples shifted by the measured latency, same length as reference.
+        rate: Sample rate in Hz.
+        window_ms: Analysis window length in milliseconds.
+        threshold_db: Level drop relative to the reference that counts as missing audio.
+        min_level_db: Reference windows quieter than this (dBFS) are ignored.
+
+    Returns:
+        A tuple of (number of dropouts, total missing time in ms).
+    """
+    window = max(1, int(rate * window_ms / 1000))
+    reference_rms = frame_rms(reference, window)
+    captured_rms = frame_rms(aligned, window)
+    audible = reference_rms > 10 ** (min_level_db / 20)
+    gain = np.median(captured_rms[audible] / reference_rms[audible]) if audible.any() else 1.0
+    missing = audible & (captured_rms < reference_rms * gain * 10 ** (threshold_db / 20))
+    starts = np.count_nonzero(missing[1:] & ~missing[:-1]) + int(missing[:1].sum())
+    return int(starts), float(np.count_nonzero(missing) * window_ms)
+
+
+def measure_thd(samples, rate, frequency, harmonics=5):
+    """Returns the total harmonic distortion of a captured tone, in percent.
+
+    Args:
+        samples: Captured samples of the tone (steady part).
+        rate: Sample rate in Hz.
+        frequency: Tone frequency in Hz.
+        harmonics: Number of harmonics above the fundamental taken into account.
+    """
+    spectrum = np.abs(np.fft.rfft(samples * np.hanning(len(samples))))
+    resolution = rate / len(samples)
+
+    def amplitude(target):
+        center = int(round(target / resolution))
+        return float(np.max(spectrum[max(0, center - 2):center + 3]))
+
+    fundamental = amplitude(frequency)
+    if not fundamental:
+        return None
+    overtones = [amplitude(frequency * order) for order in range(2, harmonics + 2) if frequency * order < rate / 2]
+    return 100.0 * np.sqrt(np.sum(np.square(overtones))) / fundamental
+
+
+def measure_level(samples):
+    """Returns the RMS and peak level of samples in dBFS."""
+    rms = float(np.sqrt(np.mean(samples * samples))) if len(samples) else 0.0
+    peak = float(np.max(np.abs(samples))) if len(samples) else 0.0
+    return tuple(20 * np.log10(value) if value > 0 else float("-inf") for value in (rms, peak))
+
+
+def sync_reference(reference, rate, stimulus, stimulus_range):
+    """Returns the part of a reference its latency can be measured with, None if there is none.
+
+    That is the whole reference, except for a tone, where only its chirp preamble (see
+    prepare_stimulus()) is kept.
+    """
+    if stimulus != "tone":
+        return reference
+    preamble, gap = int(rate * tone_preamble_s), int(rate * tone_preamble_gap_s)
+    sync_start = stimulus_range[0] - gap - preamble
+    if sync_start < 0:
+        return None
+    sync = np.zeros_like(reference)
+    sync[sync_start:sync_start + preamble] = reference[sync_start:sync_start + preamble]
+    return sync if np.any(sync) else None
+
+
+def analyse(reference, captured, rate, stimulus="chirp", stimulus_range=None, frequency=1000.0):
+    """Compares a capture with the played reference.
+
+    A tone reference without the chirp preamble of prepare_stimulus() has no reliable lag: its
+    latency, correlation, dropouts and gain are None, and the level and THD are those of the
+    whole capture.
+
+    Args:
+        reference: Played samples, including any leading and trailing silence.
+        captured: Captured samples, recorded from the moment playback started.
+        rate: Sample rate in Hz.
+        stimulus: Name of the stimulus, THD is only computed for 'tone'.
+        stimulus_range: (start, end) sample indices of the stimulus within reference.
+        frequency: Tone frequency in Hz.
+
+    Returns:
+        A dictionary with latency_ms, correlation, dropouts, dropout_ms, level_dbfs,
+        peak_dbfs, gain_db and thd_percent.
+    """
+    start, end = stimulus_range or (0, len(reference))
+    sync = sync_reference(reference, rate, stimulus, (start, end))
+    if sync is None:
+        level, peak = measure_level(captured)
+        thd = measure_thd(captured, rate, frequency) if len(captured) > rate // 10 else None
+        return {
+            "stimulus": stimulus,
+            "latency_ms": None,
+            "correlation": None,
+            "dropouts": None,
+            "dropout_ms": None,
+            "level_dbfs": float(level),
+            "peak_dbfs": float(peak),
+            "gain_db": None,
+            "thd_percent": float(thd) if thd is not None else None,
+        }
+    latency_ms, lag, correlation = measure_latency(sync, captured, rate)
+    aligned = captured[lag + start:lag + end]
+    played = reference[start:start + len(aligned)]
+    dropouts, dropout_ms = count_dropouts(played, aligned, rate)
+    if len(aligned) < end - start:
+        dropout_ms += (end - start - len(aligned)) * 1000.0 / rate
+        dropouts += 1
+    level, peak = measure_level(aligned)
+    reference_level, _ = measure_level(played)
+    thd = None
+    if stimulus == "tone" and len(aligned) > rate // 10:
+        steady = aligned[len(aligned) // 10:len(aligned) - len(aligned) // 10]
+        thd = measure_thd(steady, rate, frequency)
+    return {
+        "stimulus": stimulus,
+        "latency_ms": latency_ms,
+        "correlation": correlation,
+        "dropouts": dropouts,
+        "dropout_ms": dropout_ms,
+        "level_dbfs": float(level),
+        "peak_dbfs": float(peak),
+        "gain_db": float(level - reference_level),
+        "thd_percent": float(thd) if thd is not None else None,
+    }
+
+
+def prepare_stimulus(stimulus, rate, duration=1.0, level_db=-6.0, frequency=1000.0, lead_s=0.1, tail_s=0.5):
+    """Returns the reference to play, stimulus padded with silence, and the stimulus range within it.
+
+    A tone is preceded by a chirp preamble and a gap, which analyse() measures its latency with.
+    """
+    samples = generate_stimulus(stimulus, rate, duration, level_db, frequency)
+    lead, tail = int(rate * lead_s), int(rate * tail_s)
+    parts = [np.zeros(lead, np.float32)]
+    if stimulus == "tone":
+        parts.append(generate_chirp(rate, tone_preamble_s, tone_preamble_start_frequency, level_db=level_db))
+        parts.append(np.zeros(int(rate * tone_preamble_gap_s), np.float32))
+    start = sum(len(part) for part in parts)
+    reference = np.concatenate(parts + [samples, np.zeros(tail, np.float32)])
+    return reference, (start, start + len(samples))
+
+
+def measure_loopback(sink, capture, spec, stimulus="chirp", duration=1.0, level_db=-6.0, frequency=1000.0,
+                     block_frames=1024):
+    """Plays a stimulus on a sink while recording a capture stream, and analyses the result.
+
+    The sink may be a PulseAudio null-sink with the capture on its monitor source, for
+    offline runs without any Bluetooth device.
+
+    Args:
+        sink: Playback stream with write(data) and drain().
+        capture: Capture stream with read_into(buffer), opened before playback starts, and
+            optionally discard_captured().
+        spec: Sample spec of both streams.
+        stimulus: 'chirp', 'mls' or 'tone'.
+        duration: Length of the stimulus in seconds.
+        level_db: Peak level of the stimulus in dBFS.
+        frequency: Tone frequency in Hz.
+        block_frames: Number of frames written at a time.
+
+    Returns:
+        The measurement results, see analyse().
+    """
+    reference, stimulus_range = prepare_stimulus(stimulus, spec["rate"], duration, level_db, frequency)
+    recorder = Recorder(capture, spec, len(reference))
+    data = to_pcm(reference, spec)
+    block_size = block_frames * (len(data) // len(reference))
+    discard_captured = getattr(capture, "discard_captured", None)
+    if discard_captured is not None:
+        discard_captured()
+    recorder.start()
+    for offset in range(0, len(data), block_size):
+        sink.write(data[offset:offset + block_size])
+    sink.drain()
+    captured = recorder.wait(timeout=duration + 5)
+    if recorder.error is not None:
+        raise recorder.error
+    return analyse(reference, captured, spec["rate"], stimulus, stimulus_range, frequency)
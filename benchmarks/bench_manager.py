@@ -0,0 +1,265 @@
+"""BluetoothDeviceManager operation benchmark.
+
+Runs the manager's device-query, connection, media, OBEX and oFono helpers
+against the simulator (see libraries.bluetooth.simulator) with a growing
+number of known devices, and reports latency percentiles and throughput of
+every operation at every size. Results are compared with the baselines in
+benchmarks/baselines/bench_manager.json: an operation whose p50 or p95 grew
+by more than the threshold is a regression and makes the run fail, and so
+does a measurement without a baseline unless --allow-missing-baselines is given.
+
+The simulator's scripted delays default to zero, so the numbers show the
+cost of the manager's D-Bus access patterns rather than of the radio; use
+--latency to add them back.
+
+Usage:
+    python benchmarks/bench_manager.py --sizes 10 100 1000 10000
+    python benchmarks/bench_manager.py --sizes 10 1000 --update-baselines
+    python benchmarks/bench_manager.py --operations get_paired_devices is_device_connected --threshold 0.5
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+default_baselines = os.path.join(repo_root, "benchmarks", "baselines", "bench_manager.json")
+phone_address = "00:11:22:33:44:55"
+a2dp_sink_uuid = "0000110b-0000-1000-8000-00805f9b34fb"
+default_sizes = [10, 100, 1000, 10000]
+operation_names = ["get_paired_devices", "get_discovered_devices", "is_device_connected", "connect_profile",
+                   "get_media_playback_info", "set_media_volume", "send_file", "get_ofono_modem_path",
+                   "get_voice_call_manager"]
+simulator_latency = ["pair_ms=0", "connect_ms=0", "resolve_ms=0", "profile_ms=0", "disconnect_ms=0",
+                     "remove_ms=0", "transport_ms=0", "avrcp_ms=0", "obex_session_ms=0", "obex_chunk_ms=0",
+                     "response_ms=0"]
+
+
+def operations(manager, target_address, file_path):
+    """Returns the benchmarked operations.
+
+    Args:
+        manager: BluetoothDeviceManager connected to the simulator.
+        target_address: Address of a paired headset among the synthetic devices.
+        file_path: File pushed by the send_file operation.
+
+    Returns:
+        A dictionary of operation names to (run, reset) tuples: run performs the operation and
+        returns a false value on failure, reset (or None) restores the state between runs and is
+        not timed.
+    """
+    return {
+        "get_paired_devices": (lambda: bool(manager.get_paired_devices()), None),
+        "get_discovered_devices": (lambda: bool(manager.get_discovered_devices()), None),
+        "is_device_connected": (lambda: manager.is_device_connected(phone_address) is not False, None),
+        "connect_profile": (lambda: manager.connect_profile(target_address, a2dp_sink_uuid, timeout=10),
+                            lambda: manager.disconnect(target_address)),
+        "get_media_playback_info": (lambda: manager.get_media_playback_info(phone_address) is not None, None),
+        "set_media_volume": (lambda: manager.set_media_volume(phone_address, 64), None),
+        "send_file": (lambda: manager.send_file(phone_address, file_path) == "complete", None),
+        "get_ofono_modem_path": (lambda: manager.get_ofono_modem_path(phone_address), None),
+        "get_voice_call_manager": (lambda: manager.get_voice_call_manager(phone_address) is not None, None),
+    }
+
+
+def measure(run, reset, iterations, min_time):
+    """Times an operation.
+
+    Args:
+        run: Callable performing the operation once.
+        reset: Optional callable run, untimed, after every call.
+        iterations: Minimum number of calls.
+        min_time: Minimum total time in seconds spent calling the operation.
+
+    Returns:
+        A dictionary with the number of samples and failures, p50/p95/max/mean latency in
+        milliseconds and the throughput in operations per second.
+    """
+    from libraries.bluetooth.transport_monitor import percentile
+
+    values = []
+    failures = 0
+    busy = 0.0
+    while len(values) < iterations or busy < min_time:
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - start
+        busy += elapsed
+        values.append(elapsed * 1000)
+        if not result:
+            failures += 1
+        if reset:
+            reset()
+    return {
+        "samples": len(values),
+        "failures": failures,
+        "p50_ms": percentile(values, 0.5),
+        "p95_ms": percentile(values, 0.95),
+        "max_ms": max(values),
+        "mean_ms": sum(values) / len(values),
+        "ops_per_s": len(values) / busy if busy else None,
+    }
+
+
+def run_size(size, args, file_path, log):
+    """Starts a simulator with the given number of paired devices and measures every selected operation.
+
+    Runs in a child process of its own (see measure_size()), as dbus-python keeps the first
+    system bus connection of a process for its lifetime.
+    """
+    from libraries.bluetooth.simulator.bus import PrivateBus, SimulatorProcess
+
+    simulator_arguments = ["--adapter", args.interface, "--phone", phone_address, "--devices", str(size),
+                           "--paired", str(size), "--seed", "1", "--jitter", "0",
+                           "--latency", *simulator_latency, *args.latency]
+    with PrivateBus() as private_bus:
+        simulator = SimulatorProcess(private_bus.address, simulator_arguments)
+        simulator.start(timeout=args.startup_timeout)
+        try:
+            from libraries.bluetooth.bluez import BluetoothDeviceManager
+            from libraries.bluetooth.simulator.bluez import synthetic_address
+
+            manager = BluetoothDeviceManager(log=log, interface=args.interface)
+            # Device 0 is a headset, see simulator.bluez.device_kinds.
+            selected = operations(manager, synthetic_address(0), file_path)
+            results = {}
+            for name in args.operations:
+                run, reset = selected[name]
+                results[name] = measure(run, reset, args.iterations, args.min_time)
+                log.info("%d devices, %s: %s", size, name, results[name])
+            return results
+        finally:
+            simulator.stop()
+
+
+def measure_size(size, args, file_path):
+    """Runs run_size() in a fresh interpreter and returns its results."""
+    command = [sys.executable, os.path.abspath(__file__), "--run-size", str(size), "--push-file", file_path,
+               "--interface", args.interface, "--iterations", str(args.iterations), "--min-time", str(args.min_time),
+               "--startup-timeout", str(args.startup_timeout), "--operations", *args.operations]
+    if args.latency:
+        command += ["--latency", *args.latency]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines() or ["no output"]
+        raise RuntimeError(f"Benchmark with {size} devices failed: {lines[-1]}")
+    return json.loads(result.stdout)
+
+
+def compare(report, baselines, threshold):
+    """Compares a report with the baselines.
+
+    Returns:
+        A tuple of the regressions, each a dictionary with the size, operation, metric, baseline
+        and measured value, for every p50/p95 latency that grew by more than the threshold, and
+        of the measurements without a baseline, each a dictionary with the size and operation.
+    """
+    regressions = []
+    missing = []
+    for size, results in report.items():
+        for name, result in results.items():
+            baseline = baselines.get(size, {}).get(name)
+            if not baseline:
+                missing.append({"size": size, "operation": name})
+                continue
+            for metric in ("p50_ms", "p95_ms"):
+                if baseline.get(metric) and result[metric] > baseline[metric] * (1 + threshold):
+                    regressions.append({"size": size, "operation": name, "metric": metric,
+                                        "baseline": baseline[metric], "value": result[metric]})
+    return regressions, missing
+
+
+def load_baselines(path):
+    try:
+        with open(path) as baselines_file:
+            return json.load(baselines_file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(path, baselines, report):
+    for size, results in report.items():
+        baselines.setdefault(size, {}).update({name: {metric: result[metric] for metric in
+                                                      ("p50_ms", "p95_ms", "ops_per_s")}
+                                               for name, result in results.items()})
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as baselines_file:
+        json.dump(baselines, baselines_file, indent=2, sort_keys=True)
+        baselines_file.write("\n")
+
+
+def format_report(report, baselines):
+    """Formats the report as a text table, with the change against the baseline p50."""
+    lines = [f"{'devices':>7} {'operation':<24} {'n':>5} {'fail':>4} {'p50':>9} {'p95':>9} {'max':>9} "
+             f"{'ops/s':>9} {'vs p50':>8}"]
+    for size, results in report.items():
+        for name, result in results.items():
+            baseline = baselines.get(size, {}).get(name, {}).get("p50_ms")
+            change = f"{(result['p50_ms'] / baseline - 1) * 100:+.0f}%" if baseline else "-"
+            lines.append(f"{size:>7} {name:<24} {result['samples']:>5} {result['failures']:>4} "
+                         f"{result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['max_ms']:>9.2f} "
+                         f"{result['ops_per_s']:>9.1f} {change:>8}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="*", default=default_sizes, help="Numbers of known devices.")
+    parser.add_argument("--operations", nargs="*", default=operation_names, choices=operation_names,
+                        help="Operations to measure.")
+    parser.add_argument("--iterations", type=int, default=20, help="Minimum number of calls per operation.")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Minimum time in seconds per operation.")
+    parser.add_argument("--interface", default="hci0", help="Name of the simulated adapter.")
+    parser.add_argument("--latency", nargs="*", default=[], metavar="NAME=MS",
+                        help="Scripted delays of the simulator, e.g. profile_ms=200.")
+    parser.add_argument("--file-size", type=int, default=65536, help="Size in bytes of the file pushed by send_file.")
+    parser.add_argument("--startup-timeout", type=float, default=120.0,
+                        help="Maximum time in seconds the simulator may take to export its devices.")
+    parser.add_argument("--baselines", default=default_baselines, help="Baselines JSON file.")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Relative growth of p50/p95 over the baseline that counts as a regression.")
+    parser.add_argument("--update-baselines", action="store_true", help="Store the results as the new baselines.")
+    parser.add_argument("--allow-missing-baselines", action="store_true",
+                        help="Do not fail when a measured operation or size has no baseline.")
+    parser.add_argument("--json", action="store_true", help="Print a machine-readable report.")
+    parser.add_argument("--run-size", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--push-file", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    log = logging.getLogger("bench_manager")
+    if args.run_size is not None:
+        print(json.dumps(run_size(args.run_size, args, args.push_file, log)))
+        return
+    baselines = load_baselines(args.baselines)
+    report = {}
+    with tempfile.NamedTemporaryFile(suffix=".bin") as push_file:
+        push_file.write(os.urandom(args.file_size))
+        push_file.flush()
+        for size in args.sizes:
+            report[str(size)] = measure_size(size, args, push_file.name)
+
+    regressions, missing = compare(report, baselines, args.threshold)
+    if args.json:
+        print(json.dumps({"results": report, "regressions": regressions, "missing_baselines": missing}, indent=2))
+    else:
+        print(format_report(report, baselines))
+        for regression in regressions:
+            print(f"Regression: {regression['operation']} with {regression['size']} devices, "
+                  f"{regression['metric']} {regression['value']:.2f} ms vs baseline {regression['baseline']:.2f} ms",
+                  file=sys.stderr)
+        for entry in missing:
+            print(f"No baseline: {entry['operation']} with {entry['size']} devices", file=sys.stderr)
+    if args.update_baselines:
+        save_baselines(args.baselines, baselines, report)
+        print(f"Baselines written to {args.baselines}")
+    elif regressions or (missing and not args.allow_missing_baselines):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
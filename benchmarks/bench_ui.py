@@ -0,0 +1,307 @@
+"""Offscreen rendering benchmark of the TestApplication panels.
+
+Builds the GAP, A2DP, A2DP sink, OPP and HFP panels of host_test.TestApplication
+on Qt's offscreen platform, with a stub in place of BluetoothDeviceManager so
+no D-Bus call is made, and times for each panel:
+
+    build   constructing the widgets,
+    polish  applying the style sheets (ensurePolished()),
+    paint   laying out and rendering the first frame (grab()).
+
+It also times tab-switch round trips (selecting the tab, which rebuilds its
+panel, until the tab widget has been repainted) and the population of the
+discovery table with a number of rows. The report is JSON so it can be
+tracked across releases.
+
+Usage:
+    python benchmarks/bench_ui.py --iterations 20 --rows 100 1000 5000
+    python benchmarks/bench_ui.py --output ui_report.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+device_address = "00:11:22:33:44:55"
+panels = ["gap", "a2dp", "a2dp_sink", "opp", "hfp"]
+default_rows = [100, 1000, 5000]
+
+
+class StubDeviceManager:
+    """Stands in for BluetoothDeviceManager with canned answers; any other method returns None."""
+
+    def __init__(self, log=None, interface=None):
+        self.log = log
+        self.interface = interface
+        self.discovered_devices = []
+        self.active_call_path = None
+        self.on_connection_timing = None
+        self.on_transport_update = None
+        self.on_dtmf_finished = None
+        self.dbus_tracer = None
+        self.metrics = None
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: None
+
+    def get_adapter_details(self):
+        return {"Name": "bench", "BD_ADDR": "00:1A:7D:DA:71:00", "Class": "0x6c010c", "Discoverable": False,
+                "Pairable": True, "HCI Version": "5.3", "Manufacturer": "Simulated"}
+
+    def get_paired_devices(self):
+        return {device_address: "Phone 1"}
+
+    def get_discovered_devices(self):
+        return self.discovered_devices
+
+    def is_device_connected(self, address):
+        return True
+
+    def is_device_paired(self, address):
+        return True
+
+    def get_a2dp_role_for_device(self, address):
+        return "source"
+
+    def inspect_a2dp_endpoints(self, address):
+        configuration = {"codec": "SBC", "rate": 44100, "bitrate": 328000}
+        return {"endpoints": [{"capabilities": {"codec": "SBC"}}],
+                "transports": [{"configuration": configuration}]}
+
+    def get_media_playback_info(self, address):
+        return {"status": "playing", "track": {"title": "Track", "artist": "Artist", "album": "Album"},
+                "position": 1000, "duration": 180000}
+
+    def get_media_volume(self, address):
+        return 64
+
+    def get_connected_profile_uuids(self, address):
+        return []
+
+    def get_call_states(self, device_address=None):
+        return {}
+
+    def get_hfp_audio_stats(self, address):
+        return {}
+
+    def get_dtmf_stats(self):
+        return {}
+
+
+def discovered_devices(rows):
+    """Returns rows synthetic entries in the format of BluetoothDeviceManager.get_discovered_devices()."""
+    devices = []
+    for index in range(rows):
+        address = "10:00:00:{:02X}:{:02X}:{:02X}".format((index >> 16) & 0xFF, (index >> 8) & 0xFF, index & 0xFF)
+        devices.append({"path": f"/org/bluez/hci0/dev_{address.replace(':', '_')}", "address": address,
+                        "alias": f"Device {index + 1}"})
+    return devices
+
+
+def timed(function, *args):
+    """Calls a function and returns its result and the elapsed time in milliseconds."""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def summary(values):
+    from libraries.bluetooth.transport_monitor import percentile
+
+    return {"samples": len(values), "p50_ms": percentile(values, 0.5), "p95_ms": percentile(values, 0.95),
+            "max_ms": max(values) if values else None,
+            "mean_ms": sum(values) / len(values) if values else None}
+
+
+class UiBenchmark:
+    """Drives a TestApplication built on the stub manager and times its panels."""
+
+    def __init__(self, application, log):
+        self.application = application
+        self.log = log
+        self.app = None
+
+    def start(self, log_directory):
+        import host_test
+        from PyQt6.QtCore import QTimer
+
+        host_test.BluetoothDeviceManager = StubDeviceManager
+        log_files = {}
+        for name in ("bluetoothd", "pulseaudio", "obexd", "ofonod", "hcidump"):
+            log_files[name] = os.path.join(log_directory, f"{name}.log")
+            with open(log_files[name], "w") as log_file:
+                log_file.write(f"{name} log\n")
+        self.log.log_path = log_directory
+        self.app = host_test.TestApplication(
+            interface="hci0", back_callback=lambda: None, log=self.log,
+            bluetoothd_log_file_path=log_files["bluetoothd"], pulseaudio_log_file_path=log_files["pulseaudio"],
+            obexd_log_file_path=log_files["obexd"], ofonod_log_file_path=log_files["ofonod"],
+            hcidump_log_name=log_files["hcidump"])
+        self.app.resize(1280, 800)
+        self.app.show()
+        self.settle()
+        deadline = time.monotonic() + 10
+        while self.app.pending_startup_stages and time.monotonic() < deadline:
+            self.application.processEvents()
+            time.sleep(0.001)
+        self.app.timer = QTimer()
+        self.app.device_states[device_address] = {"session_path": "/org/bluez/obex/client/session0"}
+
+    def settle(self):
+        """Processes pending events, including deferred deletions, so runs do not interfere."""
+        from PyQt6.QtCore import QCoreApplication, QEvent
+
+        QCoreApplication.sendPostedEvents(None, QEvent.Type.DeferredDelete.value)
+        self.application.processEvents()
+
+    def build_panel(self, panel):
+        """Builds one panel and returns the widget holding it."""
+        from PyQt6.QtGui import QFont
+        from PyQt6.QtWidgets import QVBoxLayout, QWidget
+
+        app = self.app
+        if panel == "gap":
+            app.create_gap_profile_ui()
+            return app.profile_methods_widget
+        if panel == "a2dp":
+            return app.create_a2dp_profile_ui(device_address)
+        if panel == "a2dp_sink":
+            app.device_address_sink = device_address
+            layout = QVBoxLayout()
+            app.create_a2dp_sink_ui(layout, QFont("Segoe UI", 10, QFont.Weight.Bold))
+            widget = QWidget()
+            widget.setLayout(layout)
+            return widget
+        if panel == "opp":
+            return app.create_opp_profile_ui(device_address)
+        return app.create_hfp_profile_ui(device_address)
+
+    def measure_panel(self, panel, iterations):
+        """Times building, polishing and painting a panel.
+
+        Returns:
+            A dictionary of the build, polish, paint and total timings.
+        """
+        timings = {"build": [], "polish": [], "paint": [], "total": []}
+        for _ in range(iterations):
+            self.app.clear_profile_ui()
+            self.settle()
+            widget, build_ms = timed(self.build_panel, panel)
+            _, polish_ms = timed(widget.ensurePolished)
+            if widget is not self.app.profile_methods_widget:
+                widget.resize(500, 700)
+            _, paint_ms = timed(widget.grab)
+            timings["build"].append(build_ms)
+            timings["polish"].append(polish_ms)
+            timings["paint"].append(paint_ms)
+            timings["total"].append(build_ms + polish_ms + paint_ms)
+            self.app.stop_media_playback_timer()
+            if widget is not self.app.profile_methods_widget:
+                widget.deleteLater()
+        return {name: summary(values) for name, values in timings.items()}
+
+    def measure_tab_switches(self, iterations):
+        """Times switching between the A2DP, OPP and HFP tabs of a device until the tab widget is repainted.
+
+        Returns:
+            A dictionary of tab names to the timing of switching to them.
+        """
+        self.app.clear_profile_ui()
+        self.settle()
+        self.app.load_device_profile_tabs(device_address, ["all"])
+        tab_widget = self.app.device_tab_widget
+        tabs = [tab_widget.tabText(index) for index in range(tab_widget.count())]
+        timings = {tab: [] for tab in tabs}
+        for iteration in range(iterations):
+            for index, tab in enumerate(tabs):
+                if index == tab_widget.currentIndex():
+                    continue
+                start = time.perf_counter()
+                tab_widget.setCurrentIndex(index)
+                self.application.processEvents()
+                tab_widget.grab()
+                timings[tab].append((time.perf_counter() - start) * 1000)
+            self.settle()
+        self.app.stop_media_playback_timer()
+        return {tab: summary(values) for tab, values in timings.items()}
+
+    def measure_discovery_table(self, rows, iterations):
+        """Times display_discovered_devices() filling the table with a number of rows, and its first paint."""
+        self.app.clear_profile_ui()
+        self.settle()
+        self.app.create_gap_profile_ui()
+        self.app.bluetooth_device_manager.discovered_devices = discovered_devices(rows)
+        timings = {"populate": [], "paint": []}
+        for _ in range(iterations):
+            _, populate_ms = timed(self.app.display_discovered_devices)
+            _, paint_ms = timed(self.app.table_widget.grab)
+            timings["populate"].append(populate_ms)
+            timings["paint"].append(paint_ms)
+            self.app.clear_device_discovery_results()
+            self.settle()
+        return {name: summary(values) for name, values in timings.items()}
+
+    def stop(self):
+        if self.app is not None:
+            self.app.clear_profile_ui()
+            self.app.close()
+            self.settle()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--panels", nargs="*", default=panels, choices=panels, help="Panels to measure.")
+    parser.add_argument("--iterations", type=int, default=10, help="Number of runs per measurement.")
+    parser.add_argument("--rows", type=int, nargs="*", default=default_rows,
+                        help="Discovery table sizes to measure.")
+    parser.add_argument("--table-iterations", type=int, default=3, help="Number of runs per discovery table size.")
+    parser.add_argument("--output", default=None, help="Also write the report to this file.")
+    args = parser.parse_args()
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    sys.path.insert(0, repo_root)
+    from PyQt6.QtCore import QT_VERSION_STR
+    from PyQt6.QtWidgets import QApplication
+
+    from libraries.bluetooth.dbus_thread import prepare_qt_environment
+
+    prepare_qt_environment()
+    logging.basicConfig(level=logging.WARNING)
+    log = logging.getLogger("bench_ui")
+    application = QApplication(sys.argv[:1])
+    benchmark = UiBenchmark(application, log)
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as log_directory:
+        _, startup_ms = timed(benchmark.start, log_directory)
+        try:
+            report = {
+                "platform": os.environ["QT_QPA_PLATFORM"],
+                "qt_version": QT_VERSION_STR,
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "iterations": args.iterations,
+                "startup_ms": startup_ms,
+                "panels": {panel: benchmark.measure_panel(panel, args.iterations) for panel in args.panels},
+                "tab_switch": benchmark.measure_tab_switches(args.iterations),
+                "discovery_table": {str(rows): benchmark.measure_discovery_table(rows, args.table_iterations)
+                                    for rows in args.rows},
+            }
+        finally:
+            benchmark.stop()
+    report["elapsed_s"] = time.perf_counter() - started
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
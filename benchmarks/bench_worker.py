@@ -0,0 +1,206 @@
+"""UI event-loop latency with the Bluetooth backend under load, in-process and in a worker.
+
+Runs a Qt event loop with an EventLoopWatchdog heartbeat (see ui_watchdog)
+while a timer on that loop keeps calling BluetoothDeviceManager operations
+against the simulator, the way the UI's handlers do. In the "inprocess" mode
+the manager runs on the GUI thread, as TestApplication does by default; in
+the "worker" mode it is a RemoteDeviceManager backed by a worker process
+(see bt_worker). The simulator's scripted delays stand in for slow devices.
+
+The report gives, for every mode, the event-loop latency percentiles and
+stalls seen by the watchdog, and the latency and throughput of every
+operation. Each mode runs in a fresh interpreter, as dbus-python keeps the
+first system bus connection of a process for its lifetime.
+
+Usage:
+    python benchmarks/bench_worker.py --duration 20
+    python benchmarks/bench_worker.py --modes worker --latency profile_ms=500 obex_chunk_ms=20 --json
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_manager import operation_names, operations, phone_address, simulator_latency
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+modes = ["inprocess", "worker"]
+default_latency = ["connect_ms=50", "resolve_ms=50", "profile_ms=200", "disconnect_ms=50", "avrcp_ms=20",
+                   "obex_session_ms=100", "obex_chunk_ms=10", "response_ms=20"]
+default_devices = 50
+
+
+def summary(values):
+    from libraries.bluetooth.transport_monitor import percentile
+
+    return {"samples": len(values), "p50_ms": percentile(values, 0.5), "p95_ms": percentile(values, 0.95),
+            "max_ms": max(values) if values else None}
+
+
+class LoadDriver:
+    """Calls the operations round-robin from a zero-interval timer on the event loop, one at a time."""
+
+    def __init__(self, selected, names):
+        from PyQt6.QtCore import QTimer
+
+        self.selected = selected
+        self.names = names
+        self.index = 0
+        self.busy = False
+        self.latencies = {name: [] for name in names}
+        self.failures = {name: 0 for name in names}
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.step)
+
+    def step(self):
+        # A worker call waits in a nested event loop, where this timer keeps firing.
+        if self.busy:
+            return
+        self.busy = True
+        name = self.names[self.index % len(self.names)]
+        self.index += 1
+        run, reset = self.selected[name]
+        start = time.perf_counter()
+        try:
+            result = run()
+        except Exception:
+            result = False
+        self.latencies[name].append((time.perf_counter() - start) * 1000)
+        if not result:
+            self.failures[name] += 1
+        try:
+            if reset:
+                reset()
+        finally:
+            self.busy = False
+
+    def get_stats(self, elapsed):
+        return {name: dict(summary(values), failures=self.failures[name],
+                           ops_per_s=len(values) / elapsed if elapsed else None)
+                for name, values in self.latencies.items()}
+
+
+def run_mode(mode, args, file_path, log):
+    """Starts a simulator, runs the load for args.duration seconds and returns the mode's report."""
+    from PyQt6.QtCore import QCoreApplication, QTimer
+
+    from libraries.bluetooth.simulator.bus import PrivateBus, SimulatorProcess
+
+    simulator_arguments = ["--adapter", args.interface, "--phone", phone_address, "--devices", str(args.devices),
+                           "--paired", str(args.devices), "--seed", "1", "--jitter", "0",
+                           "--latency", *simulator_latency, *args.latency]
+    with PrivateBus() as private_bus:
+        simulator = SimulatorProcess(private_bus.address, simulator_arguments)
+        simulator.start(timeout=args.startup_timeout)
+        try:
+            from libraries.bluetooth.simulator.bluez import synthetic_address
+            from libraries.bluetooth.ui_watchdog import EventLoopWatchdog
+
+            application = QCoreApplication(sys.argv[:1])
+            if mode == "worker":
+                from libraries.bluetooth.bt_worker import RemoteDeviceManager
+
+                manager = RemoteDeviceManager(log=log, interface=args.interface)
+            else:
+                from libraries.bluetooth.bluez import BluetoothDeviceManager
+
+                manager = BluetoothDeviceManager(log=log, interface=args.interface)
+            try:
+                watchdog_log = logging.getLogger("bench_worker.watchdog")
+                watchdog_log.setLevel(logging.ERROR)
+                watchdog = EventLoopWatchdog(watchdog_log, interval_ms=args.interval,
+                                             stall_threshold_ms=args.stall_threshold, history=1 << 20)
+                driver = LoadDriver(operations(manager, synthetic_address(0), file_path), args.operations)
+                watchdog.start()
+                driver.timer.start(0)
+                QTimer.singleShot(int(args.duration * 1000), application.quit)
+                started = time.monotonic()
+                application.exec()
+                elapsed = time.monotonic() - started
+                driver.timer.stop()
+                watchdog.stop()
+                return {"event_loop": watchdog.get_stats(), "operations": driver.get_stats(elapsed),
+                        "elapsed_s": elapsed}
+            finally:
+                if mode == "worker":
+                    manager.close()
+        finally:
+            simulator.stop()
+
+
+def measure_mode(mode, args, file_path):
+    """Runs run_mode() in a fresh interpreter and returns its results."""
+    command = [sys.executable, os.path.abspath(__file__), "--run-mode", mode, "--push-file", file_path,
+               "--interface", args.interface, "--devices", str(args.devices), "--duration", str(args.duration),
+               "--interval", str(args.interval), "--stall-threshold", str(args.stall_threshold),
+               "--startup-timeout", str(args.startup_timeout), "--operations", *args.operations,
+               "--latency", *args.latency]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines() or ["no output"]
+        raise RuntimeError(f"Benchmark in {mode} mode failed: {lines[-1]}")
+    return json.loads(result.stdout)
+
+
+def format_report(report):
+    """Formats the report as text: event-loop latency per mode, then operation latency per mode."""
+    lines = [f"{'mode':<10} {'beats':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>9} {'stalls':>6}"]
+    for mode, result in report.items():
+        loop = result["event_loop"]
+        lines.append(f"{mode:<10} {loop['samples']:>7} {loop['latency_p50_ms'] or 0:>8.2f} "
+                     f"{loop['latency_p95_ms'] or 0:>8.2f} {loop['latency_p99_ms'] or 0:>8.2f} "
+                     f"{loop['latency_max_ms'] or 0:>9.2f} {loop['stalls']:>6}")
+    lines.append("")
+    lines.append(f"{'mode':<10} {'operation':<24} {'n':>5} {'fail':>4} {'p50':>9} {'p95':>9} {'ops/s':>8}")
+    for mode, result in report.items():
+        for name, stats in result["operations"].items():
+            lines.append(f"{mode:<10} {name:<24} {stats['samples']:>5} {stats['failures']:>4} "
+                         f"{stats['p50_ms'] or 0:>9.2f} {stats['p95_ms'] or 0:>9.2f} {stats['ops_per_s'] or 0:>8.1f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="*", default=modes, choices=modes, help="Backends to measure.")
+    parser.add_argument("--operations", nargs="*", default=operation_names, choices=operation_names,
+                        help="Operations making up the load.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Time in seconds the load runs per mode.")
+    parser.add_argument("--devices", type=int, default=default_devices, help="Number of simulated paired devices.")
+    parser.add_argument("--interval", type=int, default=10, help="Heartbeat interval in milliseconds.")
+    parser.add_argument("--stall-threshold", type=int, default=100,
+                        help="Time in milliseconds without a heartbeat that counts as a stall.")
+    parser.add_argument("--interface", default="hci0", help="Name of the simulated adapter.")
+    parser.add_argument("--latency", nargs="*", default=default_latency, metavar="NAME=MS",
+                        help="Scripted delays of the simulator.")
+    parser.add_argument("--file-size", type=int, default=262144, help="Size in bytes of the file pushed by send_file.")
+    parser.add_argument("--startup-timeout", type=float, default=60.0,
+                        help="Maximum time in seconds the simulator may take to export its devices.")
+    parser.add_argument("--json", action="store_true", help="Print a machine-readable report.")
+    parser.add_argument("--run-mode", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--push-file", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    sys.path.insert(0, repo_root)
+    logging.basicConfig(level=logging.WARNING)
+    log = logging.getLogger("bench_worker")
+    if args.run_mode is not None:
+        print(json.dumps(run_mode(args.run_mode, args, args.push_file, log)))
+        return
+    report = {}
+    with tempfile.NamedTemporaryFile(suffix=".bin") as push_file:
+        push_file.write(os.urandom(args.file_size))
+        push_file.flush()
+        for mode in args.modes:
+            report[mode] = measure_mode(mode, args, push_file.name)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
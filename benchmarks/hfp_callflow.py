@@ -0,0 +1,87 @@
+"""HFP call-flow latency benchmark.
+
+Runs a scripted call flow (see hfp_callflow) through BluetoothDeviceManager
+for a number of iterations and reports, for every step, latency percentiles
+from issuing the call-control request to oFono reporting the expected call
+states. With --simulate the flow runs against the fake BlueZ and oFono
+services on a private bus, so it needs neither an adapter nor a phone;
+incoming calls are then made by the simulator.
+
+Usage:
+    python benchmarks/hfp_callflow.py --simulate --flow three_way --iterations 500
+    python benchmarks/hfp_callflow.py --address 00:11:22:33:44:55 --flow outgoing --iterations 20
+"""
+import argparse
+import json
+import logging
+import sys
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--flow", default="three_way", help="Built-in flow name or path of a JSON flow file.")
+    parser.add_argument("--iterations", type=int, default=200, help="Number of times the flow is run.")
+    parser.add_argument("--address", default="00:11:22:33:44:55", help="Bluetooth address of the phone.")
+    parser.add_argument("--interface", default="hci0", help="Bluetooth adapter interface.")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Maximum time in seconds per step.")
+    parser.add_argument("--simulate", action="store_true", help="Run against the fake BlueZ and oFono services.")
+    parser.add_argument("--latency", nargs="*", default=[], metavar="NAME=MS",
+                        help="Scripted delays of the simulator, e.g. hold_ms=50.")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the simulator's jitter.")
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="Fail if any step's p95 exceeds this.")
+    parser.add_argument("--json", action="store_true", help="Print a machine-readable report.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    log = logging.getLogger("hfp_callflow")
+    private_bus = simulator = None
+    if args.simulate:
+        from libraries.bluetooth.simulator.bus import PrivateBus, SimulatorProcess
+        private_bus = PrivateBus()
+        address = private_bus.start()
+        simulator_arguments = ["--adapter", args.interface, "--phone", args.address, "--seed", str(args.seed)]
+        if args.latency:
+            simulator_arguments += ["--latency", *args.latency]
+        simulator = SimulatorProcess(address, simulator_arguments)
+    try:
+        if simulator:
+            simulator.start()
+        report = run(args, log)
+    finally:
+        if simulator:
+            simulator.stop()
+        if private_bus:
+            private_bus.stop()
+
+    from libraries.bluetooth.hfp_callflow import format_report
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(format_report(report))
+    over_budget = [step["name"] for step in report["steps"]
+                   if args.max_p95_ms is not None and (step["p95_ms"] or 0) > args.max_p95_ms]
+    if over_budget:
+        print("Over the p95 budget: " + ", ".join(over_budget), file=sys.stderr)
+    if report["failure_count"] or over_budget:
+        sys.exit(1)
+
+
+def run(args, log):
+    import dbus
+    from libraries.bluetooth.bluez import BluetoothDeviceManager
+    from libraries.bluetooth.simulator.ofono import simulator_interface, simulator_path
+
+    manager = BluetoothDeviceManager(log=log, interface=args.interface)
+    incoming_call = None
+    if args.simulate:
+        modem_path = manager.get_ofono_modem_path(args.address)
+        control = dbus.Interface(manager.bus.get_object("org.ofono", simulator_path), simulator_interface)
+
+        def incoming_call(number):
+            control.IncomingCall(modem_path, number)
+
+    return manager.run_hfp_call_flow(args.address, args.flow, args.iterations, args.timeout, incoming_call)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Import-time regression benchmark based on `python -X importtime`.
+
+Imports a module in a fresh interpreter, reports its cumulative import time
+and the slowest dependencies, and fails if the time exceeds the budget or if
+any forbidden module (PyQt6, GLib, ...) was pulled in. Imports triggered by
+the optional statement count towards the total; by default it touches
+bluetooth_api.BluetoothDeviceManager, so the lazy facade's backend is measured.
+
+Usage:
+    python benchmarks/import_time.py --budget-ms 50
+    python benchmarks/import_time.py --module bluetooth_api --statement "bluetooth_api.constants"
+    python benchmarks/import_time.py --module libraries.bluetooth.bluez --forbid PyQt6 gi
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+default_forbidden = ["PyQt6", "gi", "style_sheet", "host_test"]
+default_module = "bluetooth_api"
+default_statement = "bluetooth_api.BluetoothDeviceManager"
+
+
+def measure_import(module, statement=None, runs=5):
+    """Measures the import of a module in fresh interpreters.
+
+    Args:
+        module: Name of the module to import.
+        statement: Optional statement run after the import (e.g. attribute access).
+        runs: Number of interpreter runs; the fastest one is reported.
+
+    Returns:
+        A tuple of the cumulative import time in microseconds of the fastest run, including the
+        imports the statement triggered, and a dictionary of every imported module to its
+        cumulative time in that run.
+    """
+    code = f"import {module}"
+    if statement:
+        code += f"; {statement}"
+    best = None
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=repo_root,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        modules = {}
+        total = 0
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative_us, name = line.split(":", 1)[1].split("|")
+            # Top-level entries follow their dependencies: the module itself, then the statement's imports.
+            if name.strip() == module or (module in modules and not name[1:].startswith(" ")):
+                total += int(cumulative_us)
+            modules[name.strip()] = int(cumulative_us)
+        if best is None or total < best[0]:
+            best = (total, modules)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default=default_module, help="Module to import.")
+    parser.add_argument("--statement", default=None,
+                        help=f"Statement executed after the import (default for {default_module}: {default_statement}).")
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="Maximum allowed cumulative import time.")
+    parser.add_argument("--forbid", nargs="*", default=default_forbidden, help="Modules that must not be imported.")
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh interpreter runs.")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to report.")
+    parser.add_argument("--json", action="store_true", help="Print a machine-readable report.")
+    args = parser.parse_args()
+
+    if args.statement is None and args.module == default_module:
+        args.statement = default_statement
+    total_us, modules = measure_import(args.module, args.statement, args.runs)
+    forbidden = sorted(name for name in modules if name.split(".")[0] in args.forbid)
+    slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:args.top]
+    report = {
+        "module": args.module,
+        "cumulative_ms": total_us / 1000,
+        "budget_ms": args.budget_ms,
+        "forbidden_imports": forbidden,
+        "slowest": [{"module": name, "cumulative_ms": us / 1000} for name, us in slowest],
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{args.module}: {report['cumulative_ms']:.1f} ms (budget {args.budget_ms:.1f} ms)")
+        for entry in report["slowest"]:
+            print(f"  {entry['cumulative_ms']:8.1f} ms  {entry['module']}")
+        if forbidden:
+            print("Forbidden imports: " + ", ".join(forbidden))
+    if forbidden or report["cumulative_ms"] > args.budget_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Headless entry point to the Bluetooth test host.
+
+Nothing heavy is imported up front: the BlueZ backend, PyQt6, GLib and the
+OBEX helpers are only loaded the first time one of the names below is used,
+so scripts that only drive BluetoothDeviceManager never pay for the UI.
+
+Example:
+    import bluetooth_api
+    manager = bluetooth_api.BluetoothDeviceManager(log=log, interface="hci0")
+"""
+import importlib
+
+lazy_attributes = {
+    "BluetoothDeviceManager": ("libraries.bluetooth.bluez", "BluetoothDeviceManager"),
+    "constants": ("libraries.bluetooth", "constants"),
+    "TestApplication": ("host_test", "TestApplication"),
+    "styles": ("style_sheet", None),
+}
+
+__all__ = list(lazy_attributes)
+
+
+def __getattr__(name):
+    """Imports the module that provides name on first access and caches the result.
+
+    Args:
+        name: Attribute requested from this module.
+
+    Returns:
+        The lazily imported object.
+    """
+    if name not in lazy_attributes:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, attribute = lazy_attributes[name]
+    module = importlib.import_module(module_name)
+    value = getattr(module, attribute) if attribute else module
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
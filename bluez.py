@@ -2,16 +2,16 @@ def swap_calls(self, device_address):
     """Swap Active and Held calls on the device."""
     path = self.get_ofono_modem_path(device_address)
     if not path:
-        self.log.warning(f"No ofono modem path for {device_address}")
+        self.log.warning("No ofono modem path for %s", device_address)
         return False
     try:
         voice_call_manager = dbus.Interface(self.bus.get_object("org.ofono", path),
                                             "org.ofono.VoiceCallManager")
         voice_call_manager.SwapCalls()
-        self.log.info(f"Swapped calls on {device_address}")
+        self.log.info("Swapped calls on %s", device_address)
         return True
     except Exception as error:
-        self.log.error(f"Failed to swap calls on {device_address}: {error}")
+        self.log.error("Failed to swap calls on %s: %s", device_address, error)
         return False
 
 def dial_memory(self, device_address, memory_position, hide_callerid="default"):
@@ -24,16 +24,16 @@ def dial_memory(self, device_address, memory_position, hide_callerid="default"):
     """
     path = self.get_ofono_modem_path(device_address)
     if not path:
-        self.log.warning(f"No ofono modem path for {device_address}")
+        self.log.warning("No ofono modem path for %s", device_address)
         return False
     try:
         voice_call_manager = dbus.Interface(self.bus.get_object("org.ofono", path),
                                             "org.ofono.VoiceCallManager")
         call_path = voice_call_manager.DialMemory(memory_position, hide_callerid)
-        self.log.info(f"Dialed memory position {memory_position} on {device_address}, call path: {call_path}")
+        self.log.info("Dialed memory position %s on %s, call path: %s", memory_position, device_address, call_path)
         return call_path
     except Exception as error:
-        self.log.error(f"Failed to dial memory on {device_address}: {error}")
+        self.log.error("Failed to dial memory on %s: %s", device_address, error)
         return False
 
 
@@ -41,16 +41,16 @@ def transfer_calls(self, device_address):
     """Transfer active and held calls."""
     path = self.get_ofono_modem_path(device_address)
     if not path:
-        self.log.warning(f"No ofono modem path for {device_address}")
+        self.log.warning("No ofono modem path for %s", device_address)
         return False
     try:
         voice_call_manager = dbus.Interface(self.bus.get_object("org.ofono", path),
                                             "org.ofono.VoiceCallManager")
         voice_call_manager.Transfer()
-        self.log.info(f"Transferred calls on {device_address}")
+        self.log.info("Transferred calls on %s", device_address)
         return True
     except Exception as error:
-        self.log.error(f"Failed to transfer calls on {device_address}: {error}")
+        self.log.error("Failed to transfer calls on %s: %s", device_address, error)
         return False
 
 
@@ -58,16 +58,16 @@ def release_and_answer(self, device_address):
     """Release active call(s) and answer waiting call."""
     path = self.get_ofono_modem_path(device_address)
     if not path:
-        self.log.warning(f"No ofono modem path for {device_address}")
+        self.log.warning("No ofono modem path for %s", device_address)
         return False
     try:
         voice_call_manager = dbus.Interface(self.bus.get_object("org.ofono", path),
                                             "org.ofono.VoiceCallManager")
         voice_call_manager.ReleaseAndAnswer()
-        self.log.info(f"Released active calls and answered waiting call on {device_address}")
+        self.log.info("Released active calls and answered waiting call on %s", device_address)
         return True
     except Exception as error:
-        self.log.error(f"Failed to release and answer call on {device_address}: {error}")
+        self.log.error("Failed to release and answer call on %s: %s", device_address, error)
         return False
 
 
@@ -75,16 +75,16 @@ def release_and_swap(self, device_address):
     """Release active call(s) and activate held call(s)."""
     path = self.get_ofono_modem_path(device_address)
     if not path:
-        self.log.warning(f"No ofono modem path for {device_address}")
+        self.log.warning("No ofono modem path for %s", device_address)
         return False
     try:
         voice_call_manager = dbus.Interface(self.bus.get_object("org.ofono", path),
                                             "org.ofono.VoiceCallManager")
         voice_call_manager.ReleaseAndSwap()
-        self.log.info(f"Released active calls and swapped held calls on {device_address}")
+        self.log.info("Released active calls and swapped held calls on %s", device_address)
         return True
     except Exception as error:
-        self.log.error(f"Failed to release and swap calls on {device_address}: {error}")
+        self.log.error("Failed to release and swap calls on %s: %s", device_address, error)
         return False
 
 
@@ -92,16 +92,16 @@ def hold_and_answer(self, device_address):
     """Hold active call(s) and answer waiting call."""
     path = self.get_ofono_modem_path(device_address)
     if not path:
-        self.log.warning(f"No ofono modem path for {device_address}")
+        self.log.warning("No ofono modem path for %s", device_address)
         return False
     try:
         voice_call_manager = dbus.Interface(self.bus.get_object("org.ofono", path),
                                             "org.ofono.VoiceCallManager")
         voice_call_manager.HoldAndAnswer()
-        self.log.info(f"Held active calls and answered waiting call on {device_address}")
+        self.log.info("Held active calls and answered waiting call on %s", device_address)
         return True
     except Exception as error:
-        self.log.error(f"Failed to hold and answer call on {device_address}: {error}")
+        self.log.error("Failed to hold and answer call on %s: %s", device_address, error)
         return False
 
 
@@ -116,16 +116,16 @@ def private_chat(self, device_address, call_path):
     """
     path = self.get_ofono_modem_path(device_address)
     if not path:
-        self.log.warning(f"No ofono modem path for {device_address}")
+        self.log.warning("No ofono modem path for %s", device_address)
         return []
     try:
         voice_call_manager = dbus.Interface(self.bus.get_object("org.ofono", path),
                                             "org.ofono.VoiceCallManager")
         new_call_list = voice_call_manager.PrivateChat(call_path)
-        self.log.info(f"Private chat activated for call {call_path} on {device_address}")
+        self.log.info("Private chat activated for call %s on %s", call_path, device_address)
         return new_call_list
     except Exception as error:
-        self.log.error(f"Failed to start private chat on {device_address}: {error}")
+        self.log.error("Failed to start private chat on %s: %s", device_address, error)
         return []
 
 
@@ -133,16 +133,16 @@ def create_multiparty(self, device_address):
     """Join active and held calls into a multiparty call."""
     path = self.get_ofono_modem_path(device_address)
     if not path:
-        self.log.warning(f"No ofono modem path for {device_address}")
+        self.log.warning("No ofono modem path for %s", device_address)
         return []
     try:
         voice_call_manager = dbus.Interface(self.bus.get_object("org.ofono", path),
                                             "org.ofono.VoiceCallManager")
         multiparty_calls = voice_call_manager.CreateMultiparty()
-        self.log.info(f"Multiparty call created on {device_address}, calls: {multiparty_calls}")
+        self.log.info("Multiparty call created on %s, calls: %s", device_address, multiparty_calls)
         return multiparty_calls
     except Exception as error:
-        self.log.error(f"Failed to create multiparty call on {device_address}: {error}")
+        self.log.error("Failed to create multiparty call on %s: %s", device_address, error)
         return []
 
 
@@ -150,16 +150,16 @@ def hangup_multiparty(self, device_address):
     """Hang up the multiparty call."""
     path = self.get_ofono_modem_path(device_address)
     if not path:
-        self.log.warning(f"No ofono modem path for {device_address}")
+        self.log.warning("No ofono modem path for %s", device_address)
         return False
     try:
         voice_call_manager = dbus.Interface(self.bus.get_object("org.ofono", path),
                                             "org.ofono.VoiceCallManager")
         voice_call_manager.HangupMultiparty()
-        self.log.info(f"Multiparty call hung up on {device_address}")
+        self.log.info("Multiparty call hung up on %s", device_address)
         return True
     except Exception as error:
-        self.log.error(f"Failed to hang up multiparty call on {device_address}: {error}")
+        self.log.error("Failed to hang up multiparty call on %s: %s", device_address, error)
         return False
 
 
@@ -172,14 +172,14 @@ def send_tones(self, device_address, tones):
     """
     path = self.get_ofono_modem_path(device_address)
     if not path:
-        self.log.warning(f"No ofono modem path for {device_address}")
+        self.log.warning("No ofono modem path for %s", device_address)
         return False
     try:
         voice_call_manager = dbus.Interface(self.bus.get_object("org.ofono", path),
                                             "org.ofono.VoiceCallManager")
         voice_call_manager.SendTones(tones)
-        self.log.info(f"Sent tones '{tones}' on {device_address}")
+        self.log.info("Sent tones '%s' on %s", tones, device_address)
         return True
     except Exception as error:
-        self.log.error(f"Failed to send tones on {device_address}: {error}")
+        self.log.error("Failed to send tones on %s: %s", device_address, error)
         return False
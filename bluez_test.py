@@ -1,19 +1,32 @@
+import atexit
 import dbus
-import dbus.mainloop.glib
-import dbus.service
+import logging
 import os
 import subprocess
 import time
 
-from dbus.mainloop.glib import DBusGMainLoop
-from gi.repository import GLib
+from libraries.bluetooth import constants
 
-DBusGMainLoop(set_as_default=True)
+hci_versions = {6: "4.0", 7: "4.1", 8: "4.2", 9: "5.0", 10: "5.1", 11: "5.2", 12: "5.3", 13: "5.4", 14: "6.0"}
+dbus_mainloop = None
+# Share of pair()'s timeout given to the Pair() call, leaving the rest to await Paired after a NoReply.
+pair_reply_fraction = 0.75
 
-from libraries.bluetooth import constants
-from libraries.bluetooth.agent import Agent
-from Utils.utils import run
 
+def setup_dbus_mainloop():
+    """Installs the GLib main loop as the default D-Bus main loop, once per process.
+
+    This used to happen at import time; it is now deferred until the first
+    BluetoothDeviceManager is created so that importing this module stays cheap.
+
+    Returns:
+        The default D-Bus main loop.
+    """
+    global dbus_mainloop
+    if dbus_mainloop is None:
+        from dbus.mainloop.glib import DBusGMainLoop
+        dbus_mainloop = DBusGMainLoop(set_as_default=True)
+    return dbus_mainloop
 
 class BluetoothDeviceManager:
     """A class for managing Bluetooth devices using the BlueZ D-Bus API."""
@@ -26,17 +39,476 @@ class BluetoothDeviceManager:
             interface: Bluetooth adapter interface (e.g., hci0).
         """
         self.agent = None
-        self.bus = dbus.SystemBus()
+        setup_dbus_mainloop()
+        # Objects exported to BlueZ/oFono use system_bus; self.bus may be wrapped for tracing.
+        self.system_bus = self.bus = dbus.SystemBus()
         self.interface = interface
         self.log = log
         self.adapter_path = f'{constants.bluez_path}/{self.interface}'
+        self.session_bus = None
+        self.dbus_tracer = None
+        self.metrics = None
+        self.metrics_tracer = None
+        self.metrics_exporters = []
+        self.call_setup_started = {}
+        self.log_pipeline = None
+        self.dbus_thread = None
+        self.create_adapter_proxies()
+        self.opp_process = None
+        self.pulseaudio_process = None
+        self.stream_manager = None
+        self.sink_factory = None
+        self.object_tree = {}
+        self.device_paths = {}
+        self.object_tree_loaded = False
+        self.pending_waits = []
+        self.connection_timings = {}
+        self.active_timings = {}
+        self.on_connection_timing = None
+        self.on_transport_update = None
+        self.on_device_update = None
+        self.transport_monitor = None
+        self.a2dp_inspections = {}
+        self.hfp_audio_agent = None
+        self.hfp_audio_cards = {}
+        self.sco_streams = {}
+        self.on_hfp_audio_connection = None
+        self.active_call_path = None
+        self.voice_call_managers = {}
+        self.modem_paths = {}
+        self.calls = {}
+        self.call_signal_matches = {}
+        self.call_property_match = None
+        self.dtmf_scheduler = None
+        self.on_dtmf_sent = None
+        self.on_dtmf_finished = None
+        from libraries.bluetooth.async_logging import json_environment_variable
+
+        log_json_path = os.environ.get(json_environment_variable)
+        if log_json_path:
+            self.enable_async_logging(log_json_path)
+        from libraries.bluetooth.dbus_thread import thread_environment_variable
+
+        if os.environ.get(thread_environment_variable):
+            self.start_dbus_thread()
+        self.setup_object_tree_listener()
+        from libraries.bluetooth.dbus_trace import trace_environment_variable
+
+        trace_path = os.environ.get(trace_environment_variable)
+        if trace_path:
+            self.enable_dbus_tracing()
+            atexit.register(self.export_dbus_trace, trace_path)
+        from libraries.bluetooth.metrics import file_environment_variable, port_environment_variable
+
+        metrics_port = os.environ.get(port_environment_variable)
+        metrics_file = os.environ.get(file_environment_variable)
+        if metrics_port or metrics_file:
+            self.enable_metrics(port=int(metrics_port) if metrics_port else None, file_path=metrics_file)
+
+    def create_adapter_proxies(self):
+        """Creates the adapter and object manager proxies on the current bus connection."""
         self.adapter_proxy = self.bus.get_object(constants.bluez_service, self.adapter_path)
         self.adapter = dbus.Interface(self.adapter_proxy, constants.adapter_interface)
         self.adapter_properties = dbus.Interface(self.adapter_proxy, constants.properties_interface)
         self.object_manager = dbus.Interface(self.bus.get_object(constants.bluez_service, "/"), constants.object_manager_interface)
-        self.opp_process = None
-        self.pulseaudio_process = None
-        self.stream_process = None
+
+    def enable_dbus_tracing(self, tracer=None):
+        """Records every D-Bus call made through the manager's connections from now on.
+
+        Args:
+            tracer: DBusTracer to record into; a new one is created if None.
+
+        Returns:
+            The tracer.
+        """
+        from libraries.bluetooth.dbus_trace import DBusTracer
+
+        if self.dbus_tracer is not None:
+            self.disable_dbus_tracing()
+        self.dbus_tracer = tracer or DBusTracer()
+        if self.metrics is not None:
+            self.dbus_tracer.on_record = self.metrics.observe_dbus_call
+        self.install_bus_tracer(self.dbus_tracer)
+        self.log.info("D-Bus tracing enabled")
+        return self.dbus_tracer
+
+    def disable_dbus_tracing(self):
+        """Stops recording D-Bus calls and goes back to the plain connections.
+
+        Returns:
+            The tracer that was in use, or None.
+        """
+        tracer = self.dbus_tracer
+        if tracer is None:
+            return None
+        self.dbus_tracer = None
+        # D-Bus calls keep being counted for the metrics, through their own tracer.
+        self.install_bus_tracer(self.metrics_tracer)
+        return tracer
+
+    def install_bus_tracer(self, tracer):
+        """Routes the manager's D-Bus calls through a tracer, or through the plain connections if None."""
+        from libraries.bluetooth.dbus_trace import TracingBus
+
+        self.bus = self.system_bus if tracer is None else TracingBus(self.system_bus, tracer)
+        if self.session_bus is not None:
+            session_bus = self.session_bus.bus if hasattr(self.session_bus, "tracer") else self.session_bus
+            self.session_bus = session_bus if tracer is None else TracingBus(session_bus, tracer)
+        self.create_adapter_proxies()
+        self.voice_call_managers = {}
+
+    def trace_session_bus(self, bus):
+        """Returns the session bus connection, wrapped for tracing if tracing or metrics are on."""
+        tracer = self.dbus_tracer or self.metrics_tracer
+        if tracer is None:
+            return bus
+        from libraries.bluetooth.dbus_trace import TracingBus
+
+        return TracingBus(bus, tracer)
+
+    def export_dbus_trace(self, file_path):
+        """Writes the recorded D-Bus calls as a Chrome trace-event JSON file.
+
+        Args:
+            file_path: Path of the trace file.
+
+        Returns:
+            True if the trace was written, False otherwise.
+        """
+        if self.dbus_tracer is None:
+            self.log.warning("D-Bus tracing is not enabled")
+            return False
+        try:
+            count = self.dbus_tracer.export_chrome_trace(file_path)
+        except OSError as error:
+            self.log.error("Failed to write D-Bus trace %s: %s", file_path, error)
+            return False
+        self.log.info("Wrote %d D-Bus trace events to %s", count, file_path)
+        return True
+
+    def enable_metrics(self, metrics=None, port=None, file_path=None):
+        """Starts recording latency, throughput and D-Bus call metrics and optionally exports them.
+
+        D-Bus calls are counted through the tracer of enable_dbus_tracing() while tracing is on,
+        and otherwise through a tracer of their own that keeps no records; dbus_tracer stays None.
+
+        Args:
+            metrics: BluetoothMetrics to record into; a new one is created if None.
+            port: Local TCP port serving the metrics as OpenMetrics text at /metrics.
+            file_path: File rewritten with the metrics every 15 seconds.
+
+        Returns:
+            The BluetoothMetrics instance.
+        """
+        from libraries.bluetooth.dbus_trace import DBusTracer
+        from libraries.bluetooth.metrics import BluetoothMetrics, MetricsFileExporter, MetricsServer
+
+        self.metrics = metrics or BluetoothMetrics()
+        self.metrics_tracer = DBusTracer(max_events=0)
+        self.metrics_tracer.on_record = self.metrics.observe_dbus_call
+        if self.dbus_tracer is not None:
+            self.dbus_tracer.on_record = self.metrics.observe_dbus_call
+        else:
+            self.install_bus_tracer(self.metrics_tracer)
+        if port:
+            server = MetricsServer(self.metrics.registry, port)
+            server.start()
+            self.metrics_exporters.append(server)
+            self.log.info("Serving metrics on http://%s:%d/metrics", *server.address)
+        if file_path:
+            exporter = MetricsFileExporter(self.metrics.registry, file_path)
+            exporter.start()
+            self.metrics_exporters.append(exporter)
+            atexit.register(exporter.stop)
+            self.log.info("Writing metrics to %s", file_path)
+        return self.metrics
+
+    def enable_async_logging(self, json_path=None):
+        """Moves the handlers of the manager's logger to a background thread, so logging never blocks.
+
+        The logger is shared with TestApplication, which therefore logs through the same pipeline.
+
+        Args:
+            json_path: Optional file the records are also written to as JSON lines.
+
+        Returns:
+            The AsyncLogPipeline, or None if the manager has no logging.Logger.
+        """
+        from libraries.bluetooth.async_logging import AsyncLogPipeline
+
+        if self.log_pipeline is not None:
+            return self.log_pipeline
+        if not isinstance(self.log, logging.Logger):
+            return None
+        self.log_pipeline = AsyncLogPipeline(json_path)
+        self.log_pipeline.install(self.log)
+        atexit.register(self.disable_async_logging)
+        self.log.info("Asynchronous logging enabled (JSON records: %s)", json_path)
+        return self.log_pipeline
+
+    def disable_async_logging(self):
+        """Delivers the pending records and goes back to logging synchronously."""
+        if self.log_pipeline is None:
+            return
+        self.log_pipeline.uninstall()
+        self.log_pipeline = None
+
+    def start_dbus_thread(self):
+        """Moves D-Bus dispatch, and with it the signal handlers, to a dedicated thread.
+
+        Callbacks for the UI are then delivered on the GUI thread in batches, and waits for BlueZ
+        run a nested Qt event loop instead of a nested GLib loop. See dbus_thread for the
+        requirements on the Qt event dispatcher.
+
+        Returns:
+            True if the thread is running, False otherwise.
+        """
+        from libraries.bluetooth.dbus_thread import DBusDispatchThread
+
+        if self.dbus_thread is not None:
+            return True
+        dbus_thread = DBusDispatchThread(self.log)
+        if not dbus_thread.start():
+            return False
+        self.dbus_thread = dbus_thread
+        return True
+
+    def stop_dbus_thread(self):
+        """Brings D-Bus dispatch back to the GUI thread's main loop."""
+        if self.dbus_thread is None:
+            return
+        dbus_thread, self.dbus_thread = self.dbus_thread, None
+        dbus_thread.stop()
+
+    def gui_callback(self, function):
+        """Wraps a callback that must run on the GUI thread and return a value, such as the agent's ui_callback."""
+        if function is None:
+            return None
+
+        def call(*args, **kwargs):
+            if self.dbus_thread is not None:
+                return self.dbus_thread.call_in_gui(lambda: function(*args, **kwargs))
+            return function(*args, **kwargs)
+        return call
+
+    def emit_callback(self, callback, *args, key=None, merge=None):
+        """Invoke an optional event callback, logging instead of raising if it fails.
+
+        With a D-Bus thread the callback is queued for the GUI thread instead; key and merge
+        coalesce queued calls (see DBusDispatchThread.post()).
+        """
+        if self.dbus_thread is not None:
+            self.dbus_thread.post(callback, *args, key=key, merge=merge)
+            return
+        if callable(callback):
+            try:
+                callback(*args)
+            except Exception as error:
+                self.log.error("Callback %s failed: %s", getattr(callback, "__name__", callback), error)
+
+    def setup_object_tree_listener(self):
+        """Subscribe to the ObjectManager signals that keep the object-tree index in sync with BlueZ."""
+        self.bus.add_signal_receiver(
+            self.on_interfaces_added,
+            dbus_interface=constants.object_manager_interface,
+            signal_name="InterfacesAdded",
+            bus_name=constants.bluez_service)
+        self.bus.add_signal_receiver(
+            self.on_interfaces_removed,
+            dbus_interface=constants.object_manager_interface,
+            signal_name="InterfacesRemoved",
+            bus_name=constants.bluez_service)
+        self.bus.add_signal_receiver(
+            self.on_properties_changed,
+            dbus_interface=constants.properties_interface,
+            signal_name="PropertiesChanged",
+            bus_name=constants.bluez_service,
+            path_keyword="path")
+
+    def load_object_tree(self):
+        """Builds the object-tree index from a single GetManagedObjects() call.
+
+        The index is kept up to date afterwards by the InterfacesAdded and InterfacesRemoved signals.
+        """
+        self.object_tree = {}
+        self.device_paths = {}
+        for path, interfaces in self.object_manager.GetManagedObjects().items():
+            self.index_object(path, interfaces)
+            if self.transport_monitor and constants.media_transport_interface in interfaces:
+                self.transport_monitor.transport_added(path, interfaces[constants.media_transport_interface])
+        self.object_tree_loaded = True
+
+    def index_object(self, path, interfaces):
+        """Adds or updates the interfaces of an object in the object-tree index.
+
+        Args:
+            path: The D-Bus object path.
+            interfaces: A dictionary of interface names to their properties.
+        """
+        path = str(path)
+        entry = self.object_tree.setdefault(path, {})
+        for interface, properties in interfaces.items():
+            entry[str(interface)] = dict(properties)
+        device = entry.get(constants.device_interface)
+        if device and device.get("Adapter") == self.adapter_path and device.get("Address"):
+            self.device_paths[str(device["Address"])] = path
+
+    def on_interfaces_added(self, path, interfaces):
+        """Handle the InterfacesAdded signal from the BlueZ object manager.
+
+        Args:
+            path: The D-Bus object path of the new object.
+            interfaces: A dictionary of interface names to their properties.
+        """
+        if not self.object_tree_loaded:
+            return
+        self.index_object(path, interfaces)
+        if self.transport_monitor and constants.media_transport_interface in interfaces:
+            self.transport_monitor.transport_added(path, interfaces[constants.media_transport_interface])
+        self.invalidate_a2dp_inspection(str(path))
+        self.notify_waiters()
+
+    def on_interfaces_removed(self, path, interfaces):
+        """Handle the InterfacesRemoved signal from the BlueZ object manager.
+
+        Args:
+            path: The D-Bus object path of the object.
+            interfaces: List of interface names that were removed.
+        """
+        if not self.object_tree_loaded:
+            return
+        path = str(path)
+        entry = self.object_tree.get(path, {})
+        device = entry.get(constants.device_interface)
+        for interface in interfaces:
+            entry.pop(str(interface), None)
+        if self.transport_monitor and constants.media_transport_interface in interfaces:
+            self.transport_monitor.transport_removed(path)
+        self.invalidate_a2dp_inspection(path)
+        if device and constants.device_interface not in entry:
+            self.device_paths.pop(str(device.get("Address")), None)
+        if not entry:
+            self.object_tree.pop(path, None)
+        self.notify_waiters()
+
+    def on_properties_changed(self, interface, changed, invalidated, path):
+        """Handle PropertiesChanged for any BlueZ object and keep the object-tree index current.
+
+        Args:
+            interface: The D-Bus interface name where the property change occurred.
+            changed: A dictionary containing the properties that changed and their new values.
+            invalidated: A list of properties that are no longer valid.
+            path: The D-Bus object path for the signal.
+        """
+        if not self.object_tree_loaded:
+            return
+        path = str(path)
+        interface = str(interface)
+        properties = self.object_tree.get(path, {}).get(interface)
+        if properties is None:
+            return
+        properties.update(changed)
+        for name in invalidated:
+            properties.pop(str(name), None)
+        if interface == constants.device_interface and path in self.active_timings:
+            self.record_connection_milestones(path, changed)
+        if interface == constants.media_transport_interface and self.transport_monitor:
+            self.transport_monitor.transport_changed(path, changed)
+        if self.a2dp_inspections and ("Configuration" in changed or "UUIDs" in changed or "Connected" in changed):
+            self.invalidate_a2dp_inspection(path)
+        if interface == constants.device_interface and self.on_device_update:
+            self.emit_callback(self.on_device_update, str(properties.get("Address", "")), dict(changed), key=path,
+                               merge=lambda pending, new: (new[0], {**pending[1], **new[1]}))
+        self.notify_waiters()
+
+    def get_indexed_property(self, path, interface, name, default=None):
+        """Reads a property value from the object-tree index without a D-Bus round trip.
+
+        Args:
+            path: The D-Bus object path.
+            interface: The D-Bus interface name.
+            name: The property name.
+            default: Value returned if the object or property is not indexed.
+
+        Returns:
+            The indexed property value, or default.
+        """
+        return self.object_tree.get(path, {}).get(interface, {}).get(name, default)
+
+    def find_device_path(self, device_address):
+        """Resolves the D-Bus object path of a known device from the object-tree index.
+
+        Args:
+            device_address: Bluetooth address of the remote device.
+
+        Returns:
+            device_path: D-Bus object path, or None if the device is not known on this adapter.
+        """
+        if not self.object_tree_loaded:
+            self.load_object_tree()
+        return self.device_paths.get(device_address.upper())
+
+    def find_device_path_on_any_adapter(self, device_address):
+        """Resolves the D-Bus object path of a known device on whichever adapter it belongs to.
+
+        Args:
+            device_address: Bluetooth address of the remote device.
+
+        Returns:
+            device_path: D-Bus object path, or None if no adapter knows the device.
+        """
+        device_path = self.find_device_path(device_address)
+        if device_path:
+            return device_path
+        for path, interfaces in list(self.object_tree.items()):
+            device = interfaces.get(constants.device_interface)
+            if device and str(device.get("Address", "")).upper() == device_address.upper():
+                return path
+        return None
+
+    def wait_for_condition(self, condition, timeout):
+        """Runs a GLib main loop until a condition holds or the timeout expires.
+
+        The condition is re-evaluated every time a tracked D-Bus signal updates the object-tree index.
+
+        Args:
+            condition: Callable returning True once the awaited state has been reached.
+            timeout: Maximum time to wait, in seconds.
+
+        Returns:
+            True if the condition was met, False on timeout.
+        """
+        if condition():
+            return True
+        if self.dbus_thread is not None and not self.dbus_thread.is_current():
+            return self.dbus_thread.wait(condition, timeout)
+        from gi.repository import GLib
+        loop = GLib.MainLoop()
+        waiter = (condition, loop)
+        timed_out = []
+
+        def on_timeout():
+            timed_out.append(True)
+            loop.quit()
+            return False
+
+        timeout_id = GLib.timeout_add(int(timeout * 1000), on_timeout)
+        self.pending_waits.append(waiter)
+        try:
+            loop.run()
+        finally:
+            self.pending_waits.remove(waiter)
+            if not timed_out:
+                GLib.source_remove(timeout_id)
+        return bool(condition())
+
+    def notify_waiters(self):
+        """Wakes up every pending wait_for_condition() call whose condition now holds."""
+        for condition, loop in list(self.pending_waits):
+            if loop.is_running() and condition():
+                loop.quit()
+        if self.dbus_thread is not None:
+            self.dbus_thread.wake()
 
     def get_paired_devices(self):
         """Retrieves all Bluetooth devices that are currently paired with the adapter.
@@ -114,7 +586,8 @@ class BluetoothDeviceManager:
 
     def setup_agent(self, ui_callback):
         """Ensures the Bluetooth agent object is created and ready."""
-        self.agent = Agent(self.bus, constants.agent_path, ui_callback, self.log)
+        from libraries.bluetooth.agent import Agent
+        self.agent = Agent(self.system_bus, constants.agent_path, self.gui_callback(ui_callback), self.log)
 
     def register_agent(self, capability=None, ui_callback=None):
         """Register the Bluetooth agent with BlueZ to handle pairing requests."""
@@ -139,58 +612,201 @@ class BluetoothDeviceManager:
         except dbus.exceptions.DBusException as error:
             self.log.error("Failed to unregister agent: %s", error)
 
-    def pair(self, address):
+    def start_connection_timing(self, operation, address, device_path):
+        """Starts a timing breakdown for a pair or connect operation.
+
+        Args:
+            operation: Name of the operation ('pair', 'connect' or 'connect_profile').
+            address: Bluetooth address of remote device.
+            device_path: D-Bus object path of the remote device.
+
+        Returns:
+            The timing dictionary that is filled in as the operation progresses.
+        """
+        timing = {
+            "operation": operation,
+            "address": address,
+            "adapter": self.interface,
+            "modalias": str(self.get_indexed_property(device_path, constants.device_interface, "Modalias", "")),
+            "started": time.monotonic(),
+            "acl_up_ms": None,
+            "authenticated_ms": None,
+            "services_resolved_ms": None,
+            "profiles_connected_ms": None,
+            "total_ms": None,
+            "result": None,
+            "error": None,
+        }
+        self.active_timings[device_path] = timing
+        return timing
+
+    def record_connection_milestones(self, device_path, changed):
+        """Records ACL, authentication and service resolution milestones from Device1 property changes.
+
+        Args:
+            device_path: D-Bus object path of the remote device.
+            changed: A dictionary containing the properties that changed and their new values.
+        """
+        timing = self.active_timings[device_path]
+        elapsed_ms = (time.monotonic() - timing["started"]) * 1000
+        if changed.get("Connected") and timing["acl_up_ms"] is None:
+            timing["acl_up_ms"] = elapsed_ms
+        if (changed.get("Paired") or changed.get("Bonded")) and timing["authenticated_ms"] is None:
+            timing["authenticated_ms"] = elapsed_ms
+        if changed.get("ServicesResolved") and timing["services_resolved_ms"] is None:
+            timing["services_resolved_ms"] = elapsed_ms
+
+    def finish_connection_timing(self, device_path, result, error=None):
+        """Completes a timing breakdown and reports it through the on_connection_timing callback.
+
+        Args:
+            device_path: D-Bus object path of the remote device.
+            result: True if the operation succeeded, False otherwise.
+            error: Optional error description.
+
+        Returns:
+            The completed timing dictionary.
+        """
+        timing = self.active_timings.pop(device_path)
+        timing["total_ms"] = (time.monotonic() - timing["started"]) * 1000
+        timing["result"] = result
+        timing["error"] = error
+        self.connection_timings[timing["address"]] = timing
+        self.log.info("%s %s on %s took %.1f ms (acl=%s auth=%s services=%s profiles=%s)",
+                      timing["operation"], timing["address"], self.interface, timing["total_ms"],
+                      timing["acl_up_ms"], timing["authenticated_ms"], timing["services_resolved_ms"],
+                      timing["profiles_connected_ms"],
+                      extra={"operation": timing["operation"], "address": timing["address"],
+                             "duration_ms": timing["total_ms"]})
+        if self.metrics:
+            self.metrics.observe_connection(timing)
+        self.emit_callback(self.on_connection_timing, timing)
+        return timing
+
+    def get_connection_timing(self, address):
+        """Returns the timing breakdown of the last pair or connect operation with a device.
+
+        Args:
+            address: Bluetooth address of remote device.
+
+        Returns:
+            The timing dictionary, or None if no operation has completed yet.
+        """
+        return self.connection_timings.get(address)
+
+    def call_device_method(self, device_path, method, timing, *args, timeout=30):
+        """Invokes a Device1 method asynchronously and tracks its reply in a dictionary.
+
+        Args:
+            device_path: D-Bus object path of the remote device.
+            method: Name of the Device1 method to invoke.
+            timing: Timing dictionary whose profiles_connected_ms is set when the reply arrives.
+            *args: Arguments passed to the method.
+            timeout: D-Bus reply timeout, in seconds.
+
+        Returns:
+            A dictionary that receives 'done' on reply or 'error' on failure.
+        """
+        reply = {}
+
+        def on_reply(*_):
+            reply["done"] = True
+            if method != "Pair" and timing["result"] is None:
+                timing["profiles_connected_ms"] = (time.monotonic() - timing["started"]) * 1000
+            self.notify_waiters()
+
+        def on_error(error):
+            reply["error"] = error
+            self.notify_waiters()
+
+        device = dbus.Interface(self.bus.get_object(constants.bluez_service, device_path), constants.device_interface)
+        getattr(device, method)(*args, reply_handler=on_reply, error_handler=on_error, timeout=timeout)
+        return reply
+
+    def pair(self, address, timeout=30):
         """Pairs with a Bluetooth device using the given controller interface.
 
+        Completes when BlueZ reports Paired or Bonded through PropertiesChanged. Pair() itself is
+        given pair_reply_fraction of the timeout; a NoReply from it does not abort the operation,
+        the Paired property is then awaited for the rest of the timeout.
+
         Args:
             address: Bluetooth address of remote device.
+            timeout: Time in seconds to wait for pairing to complete.
 
         Returns:
             True if successfully paired, False otherwise.
         """
-        device_path = self.get_device_path(address)
+        device_path = self.find_device_path(address) or self.get_device_path(address)
+
+        def is_paired():
+            return bool(self.get_indexed_property(device_path, constants.device_interface, "Paired") or
+                        self.get_indexed_property(device_path, constants.device_interface, "Bonded"))
+
+        if is_paired():
+            self.log.info("Device %s is already paired.", address)
+            return True
+        self.log.info("Initiating pairing with %s", address)
+        timing = self.start_connection_timing("pair", address, device_path)
         try:
-            device_proxy = self.bus.get_object(constants.bluez_service, device_path)
-            device = dbus.Interface(device_proxy, constants.device_interface)
-            properties = dbus.Interface(device_proxy, constants.properties_interface)
-            paired = properties.Get(constants.device_interface, "Paired")
-            if paired:
-                self.log.info("Device %s is already paired.", address)
-                return True
-            self.log.info("Initiating pairing with %s", address)
-            device.Pair()
-            paired = properties.Get(constants.device_interface, "Paired")
-            if paired:
-                self.log.info("Successfully paired with %s", address)
-                return True
+            reply = self.call_device_method(device_path, "Pair", timing, timeout=timeout * pair_reply_fraction)
         except dbus.exceptions.DBusException as error:
-            if "NoReply" in error.get_dbus_name():
-                self.log.info("Pair() timed out for %s, ignoring as pairing may still succeed.", address)
-            else:
-                self.log.error("Pairing failed with %s: %s", address, str(error))
-                return False
+            self.log.error("Pairing failed with %s: %s", address, str(error))
+            self.finish_connection_timing(device_path, False, error.get_dbus_name())
+            return False
+
+        def failed():
+            error = reply.get("error")
+            return error is not None and "NoReply" not in error.get_dbus_name()
+
+        self.wait_for_condition(lambda: failed() or is_paired(), timeout)
+        if is_paired():
+            self.log.info("Successfully paired with %s", address)
+            self.finish_connection_timing(device_path, True)
+            return True
+        error = reply.get("error")
+        error_name = error.get_dbus_name() if error is not None else "Timeout"
+        self.log.error("Pairing failed with %s: %s", address, error if error is not None else error_name)
+        self.finish_connection_timing(device_path, False, error_name)
+        return False
 
-    def connect(self, address):
+    def connect(self, address, timeout=30):
         """Establish a  connection to the specified Bluetooth device.
 
+        Completes when Connect() has replied and BlueZ reports both Connected and ServicesResolved.
+
         Args:
             address: Bluetooth device address of remote device.
+            timeout: Time in seconds to wait for the connection to complete.
 
         Returns:
             True if connected, False otherwise.
         """
-        device_path = self.get_device_path(address)
+        device_path = self.find_device_path(address) or self.get_device_path(address)
+
+        def is_connected():
+            return bool(self.get_indexed_property(device_path, constants.device_interface, "Connected"))
+
+        def is_resolved():
+            return bool(self.get_indexed_property(device_path, constants.device_interface, "ServicesResolved"))
+
+        timing = self.start_connection_timing("connect", address, device_path)
         try:
-            device = dbus.Interface(self.bus.get_object(constants.bluez_service, device_path), constants.device_interface)
-            device.Connect()
-            properties = dbus.Interface(self.bus.get_object(constants.bluez_service, device_path), constants.properties_interface)
-            connected = properties.Get(constants.device_interface, "Connected")
-            if connected:
-                self.log.info("Connection successful to %s", address)
-                return True
-        except Exception as error:
+            reply = self.call_device_method(device_path, "Connect", timing, timeout=timeout)
+        except dbus.exceptions.DBusException as error:
             self.log.info("Connection failed:%s", error)
+            self.finish_connection_timing(device_path, False, error.get_dbus_name())
             return False
+        self.wait_for_condition(
+            lambda: "error" in reply or ("done" in reply and is_connected() and is_resolved()), timeout)
+        if "done" in reply and is_connected():
+            self.log.info("Connection successful to %s", address)
+            self.finish_connection_timing(device_path, True)
+            return True
+        error = reply.get("error")
+        self.log.info("Connection failed:%s", error if error is not None else "Timeout")
+        self.finish_connection_timing(device_path, False, error.get_dbus_name() if error is not None else "Timeout")
+        return False
 
     def disconnect(self, address):
         """Disconnect a Bluetooth  device from the specified adapter.
@@ -215,38 +831,84 @@ class BluetoothDeviceManager:
             self.log.info("Error disconnecting device %s:%s", address, error)
             return False
 
-    def unpair_device(self, address):
+    def unpair_device(self, address, timeout=5):
         """Unpairs a paired or known Bluetooth device from the system using BlueZ D-Bus.
 
+        Completes when BlueZ emits InterfacesRemoved for the device object.
+
         Args:
             address: The Bluetooth address of the remote device.
+            timeout: Time in seconds to wait for the device object to be removed.
 
         Returns:
             True if the device was unpaired successfully or already not present,
             False if the unpairing failed or the device still exists afterward.
         """
+        target_path = None
         try:
-            target_path = None
-            for path, interfaces in self.object_manager.GetManagedObjects().items():
-                if constants.device_interface in interfaces and interfaces[constants.device_interface].get("Address") == address and path.startswith(self.adapter_path):
-                    target_path = path
-                    break
+            target_path = self.find_device_path(address)
             if not target_path:
                 self.log.info("Device with address %s not found on %s", address, self.interface)
                 return True
             self.adapter.RemoveDevice(target_path)
             self.log.info("Requested unpair of device %s at path %s", address, target_path)
-            time.sleep(0.5)
-            for path, interfaces in self.object_manager.GetManagedObjects().items():
-                if constants.device_interface in interfaces and interfaces[constants.device_interface].get("Address") == address:
-                        self.log.warning("Device %s still exists after attempted unpair", address)
-                        return False
+            if not self.wait_for_condition(lambda: target_path not in self.object_tree, timeout):
+                self.log.warning("Device %s still exists after attempted unpair", address)
+                return False
             self.log.info("Device %s unpaired successfully", address)
             return True
         except dbus.exceptions.DBusException as error:
+            if target_path and error.get_dbus_name() == "org.bluez.Error.DoesNotExist":
+                self.log.info("Device %s was already removed", address)
+                self.on_interfaces_removed(target_path, [constants.device_interface])
+                return True
             self.log.error("DBusException while unpairing device %s: %s", address, str(error))
             return False
 
+    def unpair_devices(self, addresses, timeout=10):
+        """Unpairs several devices at once and waits for all of them to be removed.
+
+        All RemoveDevice calls are issued asynchronously, so the total cost is bounded by the
+        slowest removal rather than the sum of all of them.
+
+        Args:
+            addresses: Bluetooth addresses of the remote devices.
+            timeout: Time in seconds to wait for all device objects to be removed.
+
+        Returns:
+            A dictionary mapping each address to True if it was unpaired, False otherwise.
+        """
+        results = {}
+        pending = {}
+        for address in addresses:
+            target_path = self.find_device_path(address)
+            if not target_path:
+                results[address] = True
+                continue
+            pending[address] = target_path
+
+            def on_error(error, address=address, target_path=target_path):
+                if error.get_dbus_name() == "org.bluez.Error.DoesNotExist":
+                    self.on_interfaces_removed(target_path, [constants.device_interface])
+                    return
+                self.log.error("DBusException while unpairing device %s: %s", address, str(error))
+                results[address] = False
+                self.notify_waiters()
+
+            self.adapter.RemoveDevice(target_path, reply_handler=lambda: None, error_handler=on_error)
+        self.log.info("Requested unpair of %d devices", len(pending))
+
+        def all_done():
+            return all(address in results or path not in self.object_tree for address, path in pending.items())
+
+        self.wait_for_condition(all_done, timeout)
+        for address, target_path in pending.items():
+            if address not in results:
+                results[address] = target_path not in self.object_tree
+            if not results[address]:
+                self.log.warning("Device %s still exists after attempted unpair", address)
+        return results
+
     def is_device_paired(self, device_address):
         """Checks if the specified device is paired.
 
@@ -285,42 +947,399 @@ class BluetoothDeviceManager:
             self.log.debug("D-BusException while checking connection:%s", str(error))
             return False
 
-    def start_a2dp_stream(self, address, filepath=None):
-        """Initiates an A2DP audio stream to a Bluetooth device using PulseAudio.
+    def start_a2dp_stream(self, address, filepath=None, sink_name=None, buffer_size=16384, target_latency_ms=100):
+        """Initiates an A2DP audio stream to a Bluetooth device through the PulseAudio simple API.
+
+        PCM from the WAV file is written in-process to the device's Bluetooth sink on a
+        background thread; counters are available through get_a2dp_stream_stats().
 
         Args:
             address: Bluetooth address of remote device.
             filepath: Path to the audio file.
+            sink_name: Name of the PulseAudio/PipeWire sink, derived from the address if None.
+            buffer_size: Size in bytes of each transfer buffer.
+            target_latency_ms: Target server-side buffer length in milliseconds.
 
         Returns:
             True if the stream was started, False otherwise.
         """
-        device_path = self.find_device_path(address)
-        self.log.info("Device path: %s", device_path)
-        if not device_path:
-            return None
+        return self.start_a2dp_playlist(address, [filepath], sink_name=sink_name, buffer_size=buffer_size,
+                                        target_latency_ms=target_latency_ms)
+
+    def start_a2dp_playlist(self, address, filepaths, sink_name=None, buffer_size=16384, target_latency_ms=100,
+                            loop=False, target_format=None):
+        """Streams several audio files back to back without gaps to a Bluetooth device.
+
+        The next file is opened and read ahead while the current one plays, and samples
+        continue across track boundaries on the same sink stream, so the A2DP transport is
+        not suspended and resumed between tracks. Streams to other devices are left running.
+
+        Args:
+            address: Bluetooth address of remote device.
+            filepaths: Paths to the audio files, in playback order.
+            sink_name: Name of the PulseAudio/PipeWire sink, derived from the address if None.
+            buffer_size: Size in bytes of each transfer buffer.
+            target_latency_ms: Target server-side buffer length in milliseconds.
+            loop: If True, starts again from the first file after the last one.
+            target_format: Sample spec to convert the files to, 'sink' for the device's negotiated
+                configuration, or None to stream in the first file's format.
+
+        Returns:
+            True if the stream was started, False otherwise.
+        """
+        return self.start_a2dp_fanout([address], filepaths, sink_names={address: sink_name} if sink_name else None,
+                                      buffer_size=buffer_size, target_latency_ms=target_latency_ms, loop=loop,
+                                      stream_id=address, target_format=target_format)
+
+    def start_a2dp_fanout(self, addresses, filepaths, sink_names=None, buffer_size=16384, target_latency_ms=100,
+                          loop=False, stream_id=None, target_format=None):
+        """Streams the same audio to several Bluetooth sinks at once.
+
+        The files are read once and every block is written to each device's sink on its own
+        thread; the sound server encodes the audio separately for each sink. The devices may
+        be connected through different adapters. Any other stream to one of the devices is
+        stopped first, while streams to other devices keep running.
+
+        Args:
+            addresses: Bluetooth addresses of the remote devices.
+            filepaths: Paths to the audio files, in playback order.
+            sink_names: Optional dictionary of address to PulseAudio/PipeWire sink name.
+            buffer_size: Size in bytes of each transfer buffer.
+            target_latency_ms: Target server-side buffer length in milliseconds.
+            loop: If True, starts again from the first file after the last one.
+            stream_id: Identifier of the stream, the addresses joined by ',' if None.
+            target_format: Sample spec to convert the files to, 'sink' for the first device's
+                negotiated configuration, or None to stream in the first file's format. Files in
+                another format are converted block by block while streaming.
+
+        Returns:
+            True if the stream was started to at least one device, False otherwise.
+        """
+        from libraries.bluetooth.a2dp_stream import PlaylistSource, StreamManager
+        for address in addresses:
+            device_path = self.find_device_path_on_any_adapter(address)
+            self.log.info("Device path: %s", device_path)
+            if not device_path:
+                return False
+        missing = [filepath for filepath in filepaths if not filepath or not os.path.exists(filepath)]
+        if missing or not filepaths:
+            self.log.warning("File path %s does not exist", ", ".join(map(str, missing)))
+            return False
+        if target_format == "sink":
+            sink_format = self.get_sink_audio_format(addresses[0])
+            if not sink_format or not sink_format["rate"]:
+                self.log.warning("No negotiated audio configuration for %s, streaming files unconverted", addresses[0])
+                target_format = None
+            else:
+                target_format = {"format": "s16le", "rate": sink_format["rate"], "channels": sink_format["channels"]}
+        if self.stream_manager is None:
+            self.stream_manager = StreamManager(log=self.log, on_finished=self.on_a2dp_stream_finished)
+        self.start_transport_monitor()
+        for address in addresses:
+            self.transport_monitor.expect_state(self.find_device_path_on_any_adapter(address), "active",
+                                                "start_a2dp_stream")
+        stream_id = stream_id or ",".join(addresses)
+        sink_factories = {}
+        for address in addresses:
+            self.stream_manager.remove_sink(address)
+            sink_factories[address] = self.get_a2dp_sink_factory(address, (sink_names or {}).get(address),
+                                                                 target_latency_ms)
+        source = None
         try:
-            if not filepath or not os.path.exists(filepath):
-                self.log.warning("File path %s does not exist", filepath)
-            self.log.info("Starting stream with %s", filepath)
-            self.stream_process = subprocess.Popen(["paplay", filepath], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self.log.info("Starting stream %s with %s to %s", stream_id, ", ".join(filepaths), ", ".join(addresses))
+            source = PlaylistSource(filepaths, log=self.log, loop=loop, spec=target_format)
+            self.stream_manager.start(stream_id, source, sink_factories, buffer_size=buffer_size)
             return True
         except Exception as error:
             self.log.error("Stream error: %s", error)
+            if source:
+                source.close()
             return False
 
-    def stop_a2dp_stream(self):
-        """Stop the current A2DP audio stream
+    def get_a2dp_sink_factory(self, address, sink_name=None, target_latency_ms=100):
+        """Returns the callable that opens the playback stream to a device's Bluetooth sink.
+
+        Args:
+            address: Bluetooth address of remote device.
+            sink_name: Name of the PulseAudio/PipeWire sink, derived from the address if None.
+            target_latency_ms: Target server-side buffer length in milliseconds.
+        """
+        from libraries.bluetooth.a2dp_stream import PulseSimpleSink, bluetooth_sink_name
+        if self.sink_factory:
+            return self.sink_factory
+        sink_name = sink_name or bluetooth_sink_name(address)
+        return lambda spec: PulseSimpleSink(spec, device=sink_name, target_latency_ms=target_latency_ms)
+
+    def measure_a2dp_audio(self, address, stimulus="chirp", capture_device=None, duration=1.0, level_db=-6.0,
+                           frequency=1000.0, sink_name=None):
+        """Measures latency, dropouts, THD and level of the A2DP path to a device.
+
+        A stimulus is streamed to the device through the streaming engine while the audio is
+        recorded from capture_device and compared with what was played. With the default
+        capture device (the sink's monitor) only the host side of the path is covered; an
+        external loopback from the device's output to a capture device covers it end to end.
+
+        Args:
+            address: Bluetooth address of remote device.
+            stimulus: 'chirp', 'mls' or 'tone'.
+            capture_device: PulseAudio/PipeWire source to record from, the sink's monitor if None.
+            duration: Length of the stimulus in seconds.
+            level_db: Peak level of the stimulus in dBFS.
+            frequency: Tone frequency in Hz.
+            sink_name: Name of the PulseAudio/PipeWire sink, derived from the address if None.
 
         Returns:
-            True if the stream was stopped, False otherwise.
+            A dictionary of measurement results, or None if the measurement failed.
         """
-        if hasattr(self, 'stream_process') and self.stream_process:
-            self.stream_process.terminate()
-            self.stream_process = None
-            self.log.info("Stream stopped")
-            return True
-        return False
+        from libraries.bluetooth.a2dp_stream import PulseSimpleSink, StreamManager, bluetooth_sink_name, stream_record
+        from libraries.bluetooth.audio_measure import ArraySource, Recorder, analyse, prepare_stimulus
+        if not self.find_device_path_on_any_adapter(address):
+            return None
+        sink_format = self.get_sink_audio_format(address) or {}
+        spec = {"format": "s16le", "rate": sink_format.get("rate") or 48000, "channels": sink_format.get("channels") or 2}
+        sink_name = sink_name or bluetooth_sink_name(address)
+        capture_device = capture_device or f"{sink_name}.monitor"
+        if self.stream_manager is None:
+            self.stream_manager = StreamManager(log=self.log, on_finished=self.on_a2dp_stream_finished)
+        stream_id = f"measure:{address}"
+        capture = None
+        recorder = None
+        try:
+            reference, stimulus_range = prepare_stimulus(stimulus, spec["rate"], duration, level_db, frequency)
+            capture = PulseSimpleSink(spec, device=capture_device, stream_name="A2DP measurement",
+                                      target_latency_ms=20, direction=stream_record)
+            recorder = Recorder(capture, spec, len(reference))
+            self.stream_manager.remove_sink(address)
+            recorder.start()
+            self.stream_manager.start(stream_id, ArraySource(reference, spec),
+                                      {address: self.get_a2dp_sink_factory(address, sink_name)})
+            captured = recorder.wait(timeout=len(reference) / spec["rate"] + 5)
+            if recorder.error is not None:
+                raise recorder.error
+            results = analyse(reference, captured, spec["rate"], stimulus, stimulus_range, frequency)
+            self.log.info("A2DP measurement on %s: latency %.1f ms, %d dropouts, level %.1f dBFS, THD %s",
+                          address, results["latency_ms"], results["dropouts"], results["level_dbfs"],
+                          results["thd_percent"])
+            return results
+        except Exception as error:
+            self.log.error("A2DP measurement failed on %s: %s", address, error)
+            return None
+        finally:
+            self.stream_manager.stop(stream_id)
+            if recorder is not None:
+                if not recorder.close_capture():
+                    self.log.warning("Capture of %s is still blocked, it is closed once the read returns", address)
+            elif capture:
+                capture.close()
+
+    def start_transport_monitor(self, window_s=60.0):
+        """Starts tracking the state, codec and delay of every media transport.
+
+        Transport changes are reported through the on_transport_update callback with a
+        snapshot that includes rolling health metrics. Calling it again has no effect.
+
+        Args:
+            window_s: Length in seconds of the window the health metrics are computed over.
+        """
+        from libraries.bluetooth.a2dp_codecs import decode_configuration
+        from libraries.bluetooth.transport_monitor import TransportMonitor
+        if self.transport_monitor:
+            return
+        self.transport_monitor = TransportMonitor(window_s=window_s, on_update=self.on_transport_changed,
+                                                  describe_configuration=decode_configuration)
+        if not self.object_tree_loaded:
+            self.load_object_tree()
+            return
+        for path, interfaces in list(self.object_tree.items()):
+            if constants.media_transport_interface in interfaces:
+                self.transport_monitor.transport_added(path, interfaces[constants.media_transport_interface])
+
+    def on_transport_changed(self, snapshot):
+        """Logs state transitions of a media transport and forwards its snapshot to on_transport_update.
+
+        The device's Bluetooth address is added to the snapshot, from the object-tree index, so
+        receivers need no D-Bus call to tell whose transport it is.
+
+        Args:
+            snapshot: Transport snapshot reported by the transport monitor.
+        """
+        device_path = snapshot["device"]
+        address = device_path.split("dev_")[-1].replace("_", ":")
+        snapshot["address"] = str(self.get_indexed_property(device_path, constants.device_interface, "Address", address))
+        if "State" in snapshot["changed"]:
+            self.log.info("Transport %s is %s", snapshot["path"], snapshot["state"])
+        self.emit_callback(self.on_transport_update, snapshot, key=snapshot["path"])
+
+    def get_transport_health(self, address=None):
+        """Returns the state and rolling health metrics of media transports.
+
+        Args:
+            address: Bluetooth address of remote device, or None for every transport.
+
+        Returns:
+            A list of transport snapshots.
+        """
+        self.start_transport_monitor()
+        if address is None:
+            return self.transport_monitor.get_transports()
+        device_path = self.find_device_path_on_any_adapter(address)
+        return self.transport_monitor.get_transports(device_path) if device_path else []
+
+    def get_sink_audio_format(self, address):
+        """Returns the audio configuration negotiated with an A2DP sink.
+
+        Args:
+            address: Bluetooth address of remote device.
+
+        Returns:
+            A dictionary with the codec name, rate, channels and estimated bitrate (plus
+            codec-specific fields), or None if the device has no A2DP transport.
+        """
+        inspection = self.inspect_a2dp_endpoints(address)
+        if not inspection or not inspection["transports"]:
+            return None
+        audio_format = inspection["transports"][0]["configuration"]
+        self.log.info("Negotiated audio format of %s: %s", address, audio_format)
+        return audio_format
+
+    def inspect_a2dp_endpoints(self, address, refresh=False):
+        """Lists and decodes the A2DP stream end points and transports of a device.
+
+        Remote MediaEndpoint1 objects give the codecs and options the device supports, and
+        MediaTransport1 objects the configuration negotiated for each stream. The result is
+        cached per device and dropped when one of its endpoints or transports changes.
+
+        Args:
+            address: Bluetooth address of remote device.
+            refresh: If True, ignores the cached result.
+
+        Returns:
+            A dictionary with role ('sink', 'source' or None), endpoints and transports (each
+            with its path, uuid and decoded capabilities or configuration), and the negotiated
+            codec and estimated bitrate; None if the device is unknown.
+        """
+        from libraries.bluetooth.a2dp_codecs import (a2dp_sink_uuid, a2dp_source_uuid, decode_capabilities,
+                                                     decode_configuration, media_endpoint_interface)
+        device_path = self.find_device_path_on_any_adapter(address)
+        if not device_path:
+            return None
+        if not refresh and device_path in self.a2dp_inspections:
+            return self.a2dp_inspections[device_path]
+        endpoints = []
+        transports = []
+        for path, interfaces in sorted(list(self.object_tree.items())):
+            if not path.startswith(device_path + "/"):
+                continue
+            try:
+                for interface, results in ((media_endpoint_interface, endpoints),
+                                           (constants.media_transport_interface, transports)):
+                    properties = interfaces.get(interface)
+                    if properties is None:
+                        continue
+                    blob = "Capabilities" if interface == media_endpoint_interface else "Configuration"
+                    if "Codec" not in properties or blob not in properties:
+                        proxy = dbus.Interface(self.bus.get_object(constants.bluez_service, path),
+                                               constants.properties_interface)
+                        properties.update(proxy.GetAll(interface))
+                    decode = decode_capabilities if interface == media_endpoint_interface else decode_configuration
+                    entry = {"path": path, "uuid": str(properties.get("UUID", "")).lower()}
+                    entry["capabilities" if interface == media_endpoint_interface else "configuration"] = decode(
+                        properties["Codec"], properties[blob])
+                    if interface == constants.media_transport_interface:
+                        entry["state"] = str(properties.get("State", ""))
+                    results.append(entry)
+            except dbus.exceptions.DBusException as error:
+                self.log.error("Failed to read A2DP endpoint %s: %s", path, error)
+        uuids = {entry["uuid"] for entry in endpoints}
+        if not uuids:
+            uuids = {str(uuid).lower() for uuid in self.get_indexed_property(device_path, constants.device_interface,
+                                                                            "UUIDs", [])}
+        # Same priority as before the inspection existed: a device advertising both roles is a source.
+        role = "source" if a2dp_source_uuid in uuids else "sink" if a2dp_sink_uuid in uuids else None
+        negotiated = transports[0]["configuration"] if transports else {}
+        inspection = {
+            "address": address,
+            "role": role,
+            "endpoints": endpoints,
+            "transports": transports,
+            "codec": negotiated.get("codec"),
+            "bitrate": negotiated.get("bitrate"),
+        }
+        self.a2dp_inspections[device_path] = inspection
+        self.log.info("A2DP endpoints of %s: role %s, %d endpoints (%s), negotiated %s", address, role, len(endpoints),
+                      ", ".join(entry["capabilities"]["codec"] for entry in endpoints), inspection["codec"])
+        return inspection
+
+    def invalidate_a2dp_inspection(self, path):
+        """Drops the cached endpoint inspection of the device an object path belongs to."""
+        for device_path in list(self.a2dp_inspections):
+            if path == device_path or path.startswith(device_path + "/"):
+                del self.a2dp_inspections[device_path]
+
+    def on_a2dp_stream_finished(self, stream_id, stats):
+        """Logs the statistics of an A2DP stream once it has ended.
+
+        Args:
+            stream_id: Identifier of the stream.
+            stats: Stream statistics reported by the streaming engine.
+        """
+        for address, sink_stats in stats["sinks"].items():
+            self.log.info("A2DP stream %s to %s %s: %d bytes, %d underruns, max latency %.1f ms, %.1f kbps",
+                          stream_id, address, sink_stats["state"], sink_stats["bytes_written"],
+                          sink_stats["underruns"], sink_stats["max_latency_ms"], sink_stats["throughput_kbps"])
+
+    def get_a2dp_stream_stats(self, address=None):
+        """Returns underrun, latency and throughput counters of A2DP streams.
+
+        Args:
+            address: Bluetooth address of remote device, or None for every stream.
+
+        Returns:
+            The counters of the device's sink merged with those of its stream if address is
+            given, otherwise a dictionary of stream id to stream statistics with per-device
+            counters under 'sinks'. None if there is no matching stream.
+        """
+        if not self.stream_manager:
+            return None
+        all_stats = self.stream_manager.get_stats()
+        if address is None:
+            return all_stats
+        for stream_id, stats in all_stats.items():
+            if address in stats["sinks"]:
+                device_stats = {key: value for key, value in stats.items() if key != "sinks"}
+                device_stats.update(stats["sinks"][address])
+                device_stats["stream_id"] = stream_id
+                device_stats["adapter"] = self.get_indexed_property(self.find_device_path_on_any_adapter(address),
+                                                                    constants.device_interface, "Adapter")
+                return device_stats
+        return None
+
+    def stop_a2dp_stream(self, address=None):
+        """Stop A2DP audio streaming to a device, or every A2DP stream.
+
+        A device that shares a fan-out stream with other devices is removed from it while
+        the others keep playing.
+
+        Args:
+            address: Bluetooth address of remote device, or None to stop every stream.
+
+        Returns:
+            True if streaming was stopped, False otherwise.
+        """
+        if not self.stream_manager or not self.stream_manager.streams:
+            return False
+        if address is None:
+            stopped = self.stream_manager.stop_all()
+        else:
+            if not self.stream_manager.find_streams(address) and address not in self.stream_manager.streams:
+                return False
+            stopped = self.stream_manager.remove_sink(address)
+            self.stream_manager.stop(address)
+        if not stopped:
+            self.log.warning("Stream did not stop in time")
+            return False
+        self.log.info("Stream stopped")
+        return True
 
     def media_control(self, command, address=None):
         """Sends AVRCP (Audio/Video Remote Control Profile) media control commands to a connected Bluetooth device.
@@ -336,11 +1355,19 @@ class BluetoothDeviceManager:
         if not media_control_interface:
             self.log.info(" MediaControl1 interface NOT FOUND")
         self.log.info(" MediaControl1 interface FOUND")
+        started = time.monotonic()
+        result = "failure"
+        fields = {"operation": f"avrcp_{command}", "address": address}
         try:
             getattr(media_control_interface, valid[command])()
-            self.log.info("AVRCP %s sent successfully to %s", command, address)
+            result = "success"
+            fields["duration_ms"] = (time.monotonic() - started) * 1000
+            self.log.info("AVRCP %s sent successfully to %s", command, address, extra=fields)
         except Exception as error:
-            self.log.warning("AVRCP command %s failed with exception : %s", command, error)
+            fields["duration_ms"] = (time.monotonic() - started) * 1000
+            self.log.warning("AVRCP command %s failed with exception : %s", command, error, extra=fields)
+        if self.metrics:
+            self.metrics.avrcp_seconds.observe(time.monotonic() - started, command=command, result=result)
 
     def get_media_control_interface(self, address):
         """Retrieve the `org.bluez.MediaControl1` D-Bus interface for a given Bluetooth device.
@@ -366,24 +1393,23 @@ class BluetoothDeviceManager:
     def get_a2dp_role_for_device(self, device_address):
         """Get the A2DP role (sink or source) for a specific connected Bluetooth device.
 
+        The role comes from the cached endpoint inspection, so repeated calls do not rescan
+        the object tree.
+
         Args:
             device_address: Bluetooth address of remote device.
 
         Returns:
             str: "sink", "source", or None
         """
-        uuid_map = {"source": "110a", "sink": "110b"}
-        for path, interfaces in self.object_manager.GetManagedObjects().items():
-            if constants.device_interface in interfaces:
-                properties = interfaces[constants.device_interface]
-                if properties.get("Address") == device_address and properties.get("Connected") and properties.get("Adapter") == self.adapter_path:
-                    uuids = properties.get("UUIDs", [])
-                    for role, uuid_role in uuid_map.items():
-                        if any(uuid_role in uuid.lower() for uuid in uuids):
-                            return role
+        device_path = self.find_device_path(device_address)
+        if device_path and self.get_indexed_property(device_path, constants.device_interface, "Connected"):
+            role = self.inspect_a2dp_endpoints(device_address)["role"]
+            if role:
+                return role
         self.log.warning("Unknown A2DP role %s", device_address)
 
-    def send_file(self, device_address, file_path, session_path=None, profile=None):
+    def send_file(self, device_address, file_path, session_path=None, profile=None, timeout=300):
         """Send a file via OBEX OPP and wait for real-time transfer status.
 
         Args:
@@ -391,9 +1417,11 @@ class BluetoothDeviceManager:
             file_path: Path to the file to be sent.
             session_path: Existing OBEX session path. If None, a new session is created.
             profile: Bluetooth profile to use for the file transfer.
+            timeout: Maximum time in seconds to wait for the transfer to finish; a transfer still
+                running then is cancelled.
 
         Returns:
-            Transfer status ("completed", "error", etc.).
+            Transfer status ("completed", "error", etc.), "error" if the transfer timed out.
         """
         if not os.path.exists(file_path):
             self.log.info("File does not exist: %s", file_path)
@@ -407,23 +1435,50 @@ class BluetoothDeviceManager:
                 self.session_bus.get_object(constants.obex_service, session_path),
                 constants.obex_object_push
             )
-            transfer_path, _ = opp_interface.SendFile(file_path)
-            self.log.info("Started transfer: %s", transfer_path)
-
-            self.transfer_status = {"status": "unknown"}
-            self.session_bus.add_signal_receiver(
+            # Subscribe before SendFile(): a short transfer can finish before its path is known.
+            self.transfer_status = {"status": "unknown", "path": None}
+            match = self.session_bus.add_signal_receiver(
                 self.obex_properties_changed,
                 dbus_interface=constants.properties_interface,
                 signal_name="PropertiesChanged",
                 arg0=constants.obex_object_transfer,
-                path=transfer_path,
                 path_keyword="path"
             )
-
-            self.transfer_loop = GLib.MainLoop()
-            self.transfer_loop.run()
+            try:
+                transfer_started = time.monotonic()
+                transfer_path, _ = opp_interface.SendFile(file_path)
+                self.transfer_status["path"] = str(transfer_path)
+                self.log.info("Started transfer: %s", transfer_path)
+
+                def finished():
+                    return self.transfer_status["status"] in ("complete", "error", "cancelled")
+
+                if self.dbus_thread is not None:
+                    self.dbus_thread.wait(finished, timeout)
+                elif not finished():
+                    from gi.repository import GLib
+                    self.transfer_loop = GLib.MainLoop()
+                    timeout_id = GLib.timeout_add(int(timeout * 1000), lambda: self.transfer_loop.quit() or False)
+                    self.transfer_loop.run()
+                    if finished():
+                        GLib.source_remove(timeout_id)
+                if not finished():
+                    self.log.warning("Transfer %s did not finish in %d s, cancelling it", transfer_path, timeout)
+                    self.cancel_transfer(transfer_path)
+                    self.transfer_status["status"] = "error"
+            finally:
+                match.remove()
 
             status = self.transfer_status["status"]
+            self.log.info("Transfer %s finished: %s", transfer_path, status,
+                          extra={"operation": "opp_send", "address": device_address,
+                                 "duration_ms": (time.monotonic() - transfer_started) * 1000})
+            if self.metrics:
+                size = os.path.getsize(file_path)
+                self.metrics.obex_bytes.inc(size if status == "complete" else 0, status=status)
+                elapsed = time.monotonic() - transfer_started
+                if status == "complete" and elapsed > 0:
+                    self.metrics.obex_throughput.observe(size / elapsed)
             self.remove_obex_session(session_path)
             return status
 
@@ -431,6 +1486,24 @@ class BluetoothDeviceManager:
             self.log.info("OBEX send failed: %s", error)
             return "error"
 
+    def cancel_transfer(self, transfer_path):
+        """Cancels an OBEX transfer.
+
+        Args:
+            transfer_path: D-Bus object path of the transfer.
+
+        Returns:
+            True if the transfer was cancelled, False otherwise.
+        """
+        try:
+            transfer = dbus.Interface(self.session_bus.get_object(constants.obex_service, transfer_path),
+                                      constants.obex_object_transfer)
+            transfer.Cancel()
+            return True
+        except Exception as error:
+            self.log.warning("Failed to cancel transfer %s: %s", transfer_path, error)
+            return False
+
     def receive_file(self, save_directory="/tmp", timeout=20, user_confirm_callback=None):
         """Start an OBEX Object Push server and wait for a file to be received.
 
@@ -445,6 +1518,7 @@ class BluetoothDeviceManager:
         try:
             if not os.path.exists(save_directory):
                 os.makedirs(save_directory)
+            from Utils.utils import run
             run(self.log, "killall -9 obexpushd")
             self.log.info("Killed existing obexpushd processes..")
             existing_files = set(os.listdir(save_directory))
@@ -491,6 +1565,8 @@ class BluetoothDeviceManager:
             invalidated: A list of properties that are no longer valid.
             path: The D-Bus object path for the signal.
         """
+        if self.transfer_status.get("path") not in (None, str(path)):
+            return
         if "Status" in changed:
             status = str(changed["Status"])
             self.log.info("Signal: Transfer status changed to:%s", status)
@@ -498,26 +1574,92 @@ class BluetoothDeviceManager:
             if status in ["complete", "error", "cancelled"]:
                 if hasattr(self, "transfer_loop") and self.transfer_loop.is_running():
                     self.transfer_loop.quit()
-            else:
-                self.log.warning("PropertiesChanged received without 'Status': %s", changed)
+                if self.dbus_thread is not None:
+                    self.dbus_thread.wake()
+        else:
+            self.log.debug("PropertiesChanged received without 'Status': %s", changed)
+
+    def set_discoverable_mode(self, enable, timeout=0):
+        """
+        Makes the Bluetooth device discoverable through the Adapter1 Discoverable property.
+
+        Args:
+            enable: True to enable, False to disable.
+            timeout: Discoverable timeout in seconds passed to BlueZ, 0 for no timeout.
 
-    def set_discoverable_mode(self, enable):
+        Returns:
+            True if the adapter properties were set, False otherwise.
         """
-        Makes the Bluetooth device discoverable.
+        try:
+            if enable:
+                self.log.info("Setting Bluetooth device to be discoverable...")
+                self.adapter_properties.Set(constants.adapter_interface, "DiscoverableTimeout", dbus.UInt32(timeout))
+                self.adapter_properties.Set(constants.adapter_interface, "Discoverable", dbus.Boolean(True))
+                self.log.info("Bluetooth device is now discoverable.")
+            else:
+                self.log.info("Setting Bluetooth device to be non-discoverable...")
+                self.adapter_properties.Set(constants.adapter_interface, "Discoverable", dbus.Boolean(False))
+                self.log.info("Bluetooth device is now non-discoverable.")
+            return True
+        except dbus.exceptions.DBusException as error:
+            self.log.error("Failed to set discoverable mode: %s", error)
+            return False
+
+    def set_pairable_mode(self, enable, timeout=0):
+        """Allows or refuses incoming pairing requests through the Adapter1 Pairable property.
 
         Args:
             enable: True to enable, False to disable.
+            timeout: Pairable timeout in seconds passed to BlueZ, 0 for no timeout.
+
+        Returns:
+            True if the adapter properties were set, False otherwise.
+        """
+        try:
+            self.adapter_properties.Set(constants.adapter_interface, "PairableTimeout", dbus.UInt32(timeout))
+            self.adapter_properties.Set(constants.adapter_interface, "Pairable", dbus.Boolean(enable))
+            self.log.info("Pairable mode set to %s", enable)
+            return True
+        except dbus.exceptions.DBusException as error:
+            self.log.error("Failed to set pairable mode: %s", error)
+            return False
+
+    def get_adapter_details(self):
+        """Retrieves controller details in-process from the Adapter1 properties.
+
+        The HCI version and manufacturer are not exposed by Adapter1 and are read from the
+        kernel debugfs entries of the controller when they are accessible.
+
+        Returns:
+            details: A dictionary of controller details, empty if the adapter is unavailable.
         """
-        self.log.info("Setting Bluetooth device to be discoverable...")
-        if enable:
-            command = f"hciconfig {self.interface} piscan"
-            subprocess.run(command, shell=True)
-            self.log.info("Bluetooth device is now discoverable.")
-        elif not enable:
-            self.log.info("Setting Bluetooth device to be non-discoverable...")
-            command = f"hciconfig {self.interface} noscan"
-            subprocess.run(command, shell=True)
-            self.log.info("Bluetooth device is now non-discoverable.")
+        try:
+            properties = self.adapter_properties.GetAll(constants.adapter_interface)
+        except dbus.exceptions.DBusException as error:
+            self.log.error("Failed to read adapter properties: %s", error)
+            return {}
+        details = {
+            "Name": str(properties.get("Name", "N/A")),
+            "Alias": str(properties.get("Alias", "N/A")),
+            "BD_ADDR": str(properties.get("Address", "N/A")),
+            "Class": f"0x{int(properties.get('Class', 0)):06x}",
+            "Powered": bool(properties.get("Powered", False)),
+            "Discoverable": bool(properties.get("Discoverable", False)),
+            "DiscoverableTimeout": int(properties.get("DiscoverableTimeout", 0)),
+            "Pairable": bool(properties.get("Pairable", False)),
+        }
+        debugfs_path = f"/sys/kernel/debug/bluetooth/{self.interface}"
+        for key, entry in (("HCI Version", "hci_version"), ("HCI Revision", "hci_revision"), ("Manufacturer", "manufacturer")):
+            try:
+                with open(os.path.join(debugfs_path, entry)) as debugfs_file:
+                    value = int(debugfs_file.read().strip(), 0)
+            except (OSError, ValueError):
+                continue
+            if key == "HCI Version":
+                details[key] = f"{hci_versions.get(value, 'Unknown')} (0x{value:x})"
+            else:
+                details[key] = f"0x{value:04x}"
+        return details
 
     def create_obex_session(self, device_address, profile):
         """Creates an OBEX Object Push (OPP) session.
@@ -530,7 +1672,7 @@ class BluetoothDeviceManager:
             session_path: The OBEX session path if successful.
         """
         try:
-            self.session_bus = dbus.SessionBus()
+            self.session_bus = self.trace_session_bus(dbus.SessionBus())
             self.obex_manager = dbus.Interface(self.session_bus.get_object(constants.obex_service, constants.obex_path), constants.obex_client)
             session_path = self.obex_manager.CreateSession(device_address, {"Target": dbus.String(profile)})
             self.log.info("Created OBEX OPP session: %s", session_path)
@@ -648,30 +1790,38 @@ class BluetoothDeviceManager:
             uuids = properties.Get(constants.device_interface, 'UUIDs')
             return uuids
         except Exception as error:
-            self.log.info(f"Failed to get UUIDs for {device_address}: {error}")
+            self.log.info("Failed to get UUIDs for %s: %s", device_address, error)
             return []
 
-    def connect_profile(self, address, profile_uuid):
+    def connect_profile(self, address, profile_uuid, timeout=30):
         """
         Connect to a specific Bluetooth profile (e.g., A2DP Sink) on the remote device.
 
         Args:
             address: Bluetooth address of remote device.
             profile_uuid: UUID of the Bluetooth profile to connect.
+            timeout: Time in seconds to wait for the profile to connect.
 
         Returns:
             True if the profile was connected, False otherwise.
         """
-        device_path = self.get_device_path(address)
+        device_path = self.find_device_path(address) or self.get_device_path(address)
+        timing = self.start_connection_timing("connect_profile", address, device_path)
         try:
-            device = dbus.Interface(self.bus.get_object(constants.bluez_service, device_path),
-                                    constants.device_interface)
-            device.ConnectProfile(profile_uuid)
-            self.log.info("Profile %s successfully connected to %s", profile_uuid, address)
-            return True
+            reply = self.call_device_method(device_path, "ConnectProfile", timing, profile_uuid, timeout=timeout)
         except Exception as error:
             self.log.error("Failed to connect profile %s: %s", profile_uuid, error)
+            self.finish_connection_timing(device_path, False, str(error))
             return False
+        self.wait_for_condition(lambda: "done" in reply or "error" in reply, timeout)
+        if "done" in reply:
+            self.log.info("Profile %s successfully connected to %s", profile_uuid, address)
+            self.finish_connection_timing(device_path, True)
+            return True
+        error = reply.get("error")
+        self.log.error("Failed to connect profile %s: %s", profile_uuid, error if error is not None else "Timeout")
+        self.finish_connection_timing(device_path, False, error.get_dbus_name() if error is not None else "Timeout")
+        return False
 
     def setup_pairing_signal_listener(self, status_update_handler):
         """Setup D-Bus signal listener for pairing status changes.
@@ -701,7 +1851,7 @@ class BluetoothDeviceManager:
         paired = changed["Paired"]
         device_address = path.split("dev_")[-1].replace("_", ":")
         if hasattr(self, "pairing_status_callback"):
-            self.pairing_status_callback(device_address, paired)
+            self.emit_callback(self.pairing_status_callback, device_address, paired)
 
     def get_ofono_modem_path(self, device_address):
         """Gets the ofono modem path.
@@ -724,12 +1874,18 @@ class BluetoothDeviceManager:
         Args:
             device_address: Bluetooth address of remote device.
         """
-        path = self.get_ofono_modem_path(device_address)
+        path = self.find_modem_path(device_address)
         if not path:
             self.log.warning("No oFono modem path for %s", device_address)
             return False
+        call_path = self.find_call_path("incoming", path)
+        if not call_path and self.active_call_path and self.active_call_path.startswith(f"{path}/"):
+            call_path = self.active_call_path
+        if not call_path:
+            self.log.warning("No incoming call to answer on %s", device_address)
+            return False
         try:
-            call_interface = dbus.Interface(self.bus.get_object("org.ofono", self.active_call_path), "org.ofono.VoiceCall")
+            call_interface = dbus.Interface(self.bus.get_object("org.ofono", call_path), "org.ofono.VoiceCall")
             call_interface.Answer()
             return True
         except Exception as error:
@@ -742,12 +1898,11 @@ class BluetoothDeviceManager:
         Args:
             device_address: Bluetooth address of remote device.
         """
-        path = self.get_ofono_modem_path(device_address)
-        if not path:
-            self.log.warning("No oFono modem path for %s", device_address)
+        voice_call_manager = self.get_voice_call_manager(device_address)
+        if not voice_call_manager:
             return False
         try:
-            self.voice_call_manager.HangupAll()
+            voice_call_manager.HangupAll()
             return True
         except Exception as error:
             self.log.error("Failed to hangup call on %s: %s", device_address, error)
@@ -761,12 +1916,11 @@ class BluetoothDeviceManager:
             number: Number typed by user.
             hide_callerid: whether to hide caller id or not.
         """
-        path = self.get_ofono_modem_path(device_address)
-        if not path:
-            self.log.warning("No oFono modem path for %s", device_address)
+        voice_call_manager = self.get_voice_call_manager(device_address)
+        if not voice_call_manager:
             return False
         try:
-            call_path = self.voice_call_manager.Dial(number, hide_callerid)
+            call_path = voice_call_manager.Dial(number, hide_callerid)
             self.log.info("Dialed number %s on %s, call path: %s", number, device_address, call_path)
             return call_path
         except Exception as error:
@@ -779,12 +1933,11 @@ class BluetoothDeviceManager:
         Args:
             device_address: Bluetooth address of remote device.
         """
-        path = self.get_ofono_modem_path(device_address)
-        if not path:
-            self.log.warning("No oFono modem path for %s", device_address)
+        voice_call_manager = self.get_voice_call_manager(device_address)
+        if not voice_call_manager:
             return False
         try:
-            call_path = self.voice_call_manager.DialLast()
+            call_path = voice_call_manager.DialLast()
             self.log.info("Dialed number, call path: %s", call_path)
             return call_path
         except Exception as error:
@@ -800,14 +1953,14 @@ class BluetoothDeviceManager:
         """
         path = self.get_ofono_modem_path(device_address)
         if not path:
-            self.log.warning(f"No ofono path for {device_address}")
+            self.log.warning("No ofono path for %s", device_address)
             return False
         try:
             call_volume = dbus.Interface(self.bus.get_object("org.ofono", path), "org.ofono.CallVolume")
             call_volume.SetVolume(volume)
             return True
         except Exception as error:
-            self.log.error(f"Failed to set volume on {device_address}: {error}")
+            self.log.error("Failed to set volume on %s: %s", device_address, error)
             return False
 
     def hangup_active_call(self):
@@ -818,17 +1971,16 @@ class BluetoothDeviceManager:
         try:
             call_interface = dbus.Interface(self.bus.get_object("org.ofono", self.active_call_path), "org.ofono.VoiceCall")
             call_interface.Hangup()
-            self.log.info(f"Hung up call: {self.active_call_path}")
+            self.log.info("Hung up call: %s", self.active_call_path)
         except Exception as error:
-            self.log.error(f"Failed to hang up: {error}")
+            self.log.error("Failed to hang up: %s", error)
 
     def get_calls(self, device_address):
-        path = self.get_ofono_modem_path(device_address)
-        if not path:
-            self.log.warning("No oFono modem path for %s", device_address)
+        voice_call_manager = self.get_voice_call_manager(device_address)
+        if not voice_call_manager:
             return False
         try:
-            call_path = self.voice_call_manager.GetCalls()
+            call_path = voice_call_manager.GetCalls()
             return call_path
         except Exception as error:
             return False
@@ -836,32 +1988,561 @@ class BluetoothDeviceManager:
     def on_call_added(self, call_path, properties):
         """Triggered when a new call starts or incoming call detected."""
         self.active_call_path = call_path
+        self.calls.setdefault(self.call_modem_path(call_path), {})[str(call_path)] = dict(properties)
         number = properties.get("LineIdentification", "Unknown")
         state = properties.get("State", "unknown")
-        self.log.info(f"New call: {call_path}, Number={number}, State={state}")
+        self.log.info("New call: %s, Number=%s, State=%s", call_path, number, state)
+        if self.metrics:
+            direction = "incoming" if state in ("incoming", "waiting") else "outgoing"
+            self.call_setup_started[str(call_path)] = (time.monotonic(), direction)
+        self.notify_waiters()
 
     def on_call_removed(self, call_path):
         """Triggered when a call ends."""
+        self.calls.get(self.call_modem_path(call_path), {}).pop(str(call_path), None)
+        self.call_setup_started.pop(str(call_path), None)
+        if self.dtmf_scheduler:
+            self.dtmf_scheduler.cancel(str(call_path))
         if self.active_call_path == call_path:
-            self.log.info(f"Call ended: {call_path}")
+            self.log.info("Call ended: %s", call_path)
             self.active_call_path = None
+        self.notify_waiters()
+
+    def on_call_property_changed(self, name, value, path):
+        """Handle PropertyChanged of a VoiceCall and keep the call table current.
+
+        Args:
+            name: Name of the changed property, e.g. State or Multiparty.
+            value: New value of the property.
+            path: The D-Bus object path of the call.
+        """
+        call = self.calls.get(self.call_modem_path(path), {}).get(str(path))
+        if call is None:
+            return
+        call[str(name)] = value
+        if name == "State":
+            started = self.call_setup_started.pop(str(path), None) if value == "active" else None
+            fields = {"operation": "call_state", "call": str(path)}
+            if started:
+                fields["duration_ms"] = (time.monotonic() - started[0]) * 1000
+            self.log.info("Call %s is now %s", path, value, extra=fields)
+            if started and self.metrics:
+                self.metrics.call_setup_seconds.observe(time.monotonic() - started[0], direction=started[1])
+        self.notify_waiters()
 
     def setup_hfp_manager(self, device_address):
         """Initialize oFono VoiceCallManager and connect to call signals.
 
+        The calls of the modem are loaded into its part of the call table, which CallAdded,
+        CallRemoved and the PropertyChanged signals of every VoiceCall keep up to date from then
+        on. Every modem set up keeps its calls and signal matches, keyed by modem path, so the
+        calls of several phones are tracked at the same time.
+
         Args:
             device_address: Bluetooth address of remote device.
         """
-        path = self.get_ofono_modem_path(device_address)
+        path = self.find_modem_path(device_address)
         if not path:
-            self.log.warning(f"No ofono path for {device_address}")
+            self.log.warning("No ofono path for %s", device_address)
             return
         try:
-            self.voice_call_manager = dbus.Interface(self.bus.get_object("org.ofono", path),
-                                                     "org.ofono.VoiceCallManager")
-            self.voice_call_manager.connect_to_signal("CallAdded", self.on_call_added)
-            self.voice_call_manager.connect_to_signal("CallRemoved", self.on_call_removed)
+            for match in self.call_signal_matches.pop(path, []):
+                match.remove()
+            voice_call_manager = dbus.Interface(self.bus.get_object("org.ofono", path),
+                                                "org.ofono.VoiceCallManager")
+            self.voice_call_managers[device_address] = voice_call_manager
+            self.call_signal_matches[path] = [
+                voice_call_manager.connect_to_signal("CallAdded", self.on_call_added),
+                voice_call_manager.connect_to_signal("CallRemoved", self.on_call_removed),
+            ]
+            if self.call_property_match is None:
+                self.call_property_match = self.bus.add_signal_receiver(self.on_call_property_changed,
+                                                                        dbus_interface="org.ofono.VoiceCall",
+                                                                        signal_name="PropertyChanged",
+                                                                        bus_name=constants.ofono_bus,
+                                                                        path_keyword="path")
+            self.calls[path] = {str(call_path): dict(properties)
+                                for call_path, properties in voice_call_manager.GetCalls()}
+
+            self.log.info("VoiceCallManager initialized for %s", device_address)
+        except Exception as error:
+            self.log.error("Failed to setup VoiceCallManager for %s: %s", device_address, error)
+
+    def get_voice_call_manager(self, device_address):
+        """Returns the oFono VoiceCallManager interface of a device, or None if it has no modem.
+
+        Args:
+            device_address: Bluetooth address of remote device.
+        """
+        voice_call_manager = self.voice_call_managers.get(device_address)
+        if voice_call_manager is None:
+            path = self.find_modem_path(device_address)
+            if not path:
+                self.log.warning("No oFono modem path for %s", device_address)
+                return None
+            voice_call_manager = dbus.Interface(self.bus.get_object(constants.ofono_bus, path),
+                                                "org.ofono.VoiceCallManager")
+            self.voice_call_managers[device_address] = voice_call_manager
+        return voice_call_manager
+
+    def find_modem_path(self, device_address):
+        """Returns the oFono modem path of a device, looked up once and then cached, or None.
+
+        Args:
+            device_address: Bluetooth address of remote device.
+        """
+        path = self.modem_paths.get(device_address)
+        if path is None:
+            path = self.get_ofono_modem_path(device_address)
+            if not path:
+                return None
+            path = self.modem_paths[device_address] = str(path)
+        return path
+
+    def call_modem_path(self, call_path):
+        """Returns the path of the modem a call belongs to; oFono creates calls below their modem."""
+        return str(call_path).rsplit("/", 1)[0]
+
+    def modem_calls(self, modem_path=None):
+        """Returns (call path, properties) of the calls in the call table, of one modem or of all."""
+        if modem_path is not None:
+            return list(self.calls.get(str(modem_path), {}).items())
+        return [item for calls in list(self.calls.values()) for item in list(calls.items())]
+
+    def find_call_path(self, state, modem_path=None):
+        """Returns the path of a call in the given state from the call table, or None.
+
+        Args:
+            state: oFono call state, e.g. incoming, waiting, active or held.
+            modem_path: oFono modem path the call must belong to, or None for any modem.
+        """
+        for call_path, properties in self.modem_calls(modem_path):
+            if properties.get("State") == state:
+                return call_path
+        return None
+
+    def get_call_states(self, device_address=None):
+        """Returns a dictionary of the call path to the state of every call in the call table.
+
+        Args:
+            device_address: Bluetooth address of the device whose calls are returned, or None for
+                the calls of every modem set up.
+        """
+        modem_path = None
+        if device_address is not None:
+            modem_path = self.find_modem_path(device_address)
+            if not modem_path:
+                return {}
+        return {call_path: str(properties.get("State", "")) for call_path, properties in self.modem_calls(modem_path)}
+
+    def swap_calls(self, device_address):
+        """Swap Active and Held calls on the device.
+
+        Args:
+            device_address: Bluetooth address of remote device.
+        """
+        voice_call_manager = self.get_voice_call_manager(device_address)
+        if not voice_call_manager:
+            return False
+        try:
+            voice_call_manager.SwapCalls()
+            self.log.info("Swapped calls on %s", device_address)
+            return True
+        except Exception as error:
+            self.log.error("Failed to swap calls on %s: %s", device_address, error)
+            return False
+
+    def dial_memory(self, device_address, memory_position, hide_callerid="default"):
+        """Initiates a call to a number stored in memory/favorite.
+
+        Args:
+            device_address: Bluetooth address of remote device.
+            memory_position: Memory position/favorite to dial.
+            hide_callerid: whether to hide caller ID or not.
+        """
+        voice_call_manager = self.get_voice_call_manager(device_address)
+        if not voice_call_manager:
+            return False
+        try:
+            call_path = voice_call_manager.DialMemory(dbus.UInt32(memory_position), hide_callerid)
+            self.log.info("Dialed memory position %s on %s, call path: %s", memory_position, device_address, call_path)
+            return call_path
+        except Exception as error:
+            self.log.error("Failed to dial memory on %s: %s", device_address, error)
+            return False
+
+    def transfer_calls(self, device_address):
+        """Transfer active and held calls.
+
+        Args:
+            device_address: Bluetooth address of remote device.
+        """
+        voice_call_manager = self.get_voice_call_manager(device_address)
+        if not voice_call_manager:
+            return False
+        try:
+            voice_call_manager.Transfer()
+            self.log.info("Transferred calls on %s", device_address)
+            return True
+        except Exception as error:
+            self.log.error("Failed to transfer calls on %s: %s", device_address, error)
+            return False
+
+    def release_and_answer(self, device_address):
+        """Release active call(s) and answer waiting call.
+
+        Args:
+            device_address: Bluetooth address of remote device.
+        """
+        voice_call_manager = self.get_voice_call_manager(device_address)
+        if not voice_call_manager:
+            return False
+        try:
+            voice_call_manager.ReleaseAndAnswer()
+            self.log.info("Released active calls and answered waiting call on %s", device_address)
+            return True
+        except Exception as error:
+            self.log.error("Failed to release and answer call on %s: %s", device_address, error)
+            return False
+
+    def release_and_swap(self, device_address):
+        """Release active call(s) and activate held call(s).
+
+        Args:
+            device_address: Bluetooth address of remote device.
+        """
+        voice_call_manager = self.get_voice_call_manager(device_address)
+        if not voice_call_manager:
+            return False
+        try:
+            voice_call_manager.ReleaseAndSwap()
+            self.log.info("Released active calls and swapped held calls on %s", device_address)
+            return True
+        except Exception as error:
+            self.log.error("Failed to release and swap calls on %s: %s", device_address, error)
+            return False
+
+    def hold_and_answer(self, device_address):
+        """Hold active call(s) and answer waiting call.
+
+        Args:
+            device_address: Bluetooth address of remote device.
+        """
+        voice_call_manager = self.get_voice_call_manager(device_address)
+        if not voice_call_manager:
+            return False
+        try:
+            voice_call_manager.HoldAndAnswer()
+            self.log.info("Held active calls and answered waiting call on %s", device_address)
+            return True
+        except Exception as error:
+            self.log.error("Failed to hold and answer call on %s: %s", device_address, error)
+            return False
+
+    def private_chat(self, device_address, call_path):
+        """Place multiparty call on hold and activate selected call.
+
+        Args:
+            device_address: Bluetooth address of remote device.
+            call_path: Path of the call to make active.
+
+        Returns:
+            List of call paths participating in multiparty call.
+        """
+        voice_call_manager = self.get_voice_call_manager(device_address)
+        if not voice_call_manager:
+            return []
+        try:
+            new_call_list = voice_call_manager.PrivateChat(dbus.ObjectPath(call_path))
+            self.log.info("Private chat activated for call %s on %s", call_path, device_address)
+            return new_call_list
+        except Exception as error:
+            self.log.error("Failed to start private chat on %s: %s", device_address, error)
+            return []
+
+    def create_multiparty(self, device_address):
+        """Join active and held calls into a multiparty call.
+
+        Args:
+            device_address: Bluetooth address of remote device.
+
+        Returns:
+            List of call paths participating in multiparty call.
+        """
+        voice_call_manager = self.get_voice_call_manager(device_address)
+        if not voice_call_manager:
+            return []
+        try:
+            multiparty_calls = voice_call_manager.CreateMultiparty()
+            self.log.info("Multiparty call created on %s, calls: %s", device_address, multiparty_calls)
+            return multiparty_calls
+        except Exception as error:
+            self.log.error("Failed to create multiparty call on %s: %s", device_address, error)
+            return []
+
+    def hangup_multiparty(self, device_address):
+        """Hang up the multiparty call.
+
+        Args:
+            device_address: Bluetooth address of remote device.
+        """
+        voice_call_manager = self.get_voice_call_manager(device_address)
+        if not voice_call_manager:
+            return False
+        try:
+            voice_call_manager.HangupMultiparty()
+            self.log.info("Multiparty call hung up on %s", device_address)
+            return True
+        except Exception as error:
+            self.log.error("Failed to hang up multiparty call on %s: %s", device_address, error)
+            return False
+
+    def get_dtmf_scheduler(self):
+        """Returns the DTMF scheduler, creating it on first use.
+
+        Its timers run on the GLib main loop, like the D-Bus signal handlers.
+        """
+        if self.dtmf_scheduler is None:
+            from gi.repository import GLib
+            from libraries.bluetooth.dtmf import DtmfScheduler
+
+            def schedule(delay, callback):
+                def run():
+                    callback()
+                    return False
+
+                GLib.timeout_add(max(0, round(delay * 1000)), run)
+
+            self.dtmf_scheduler = DtmfScheduler(
+                self.send_tones_now, schedule, log=self.log,
+                on_sent=lambda record: self.emit_callback(self.on_dtmf_sent, record),
+                on_finished=lambda sequence_id, success, records: self.emit_callback(
+                    self.on_dtmf_finished, sequence_id, success, records))
+        return self.dtmf_scheduler
+
+    def send_tones(self, device_address, tones, tone_ms=None, gap_ms=None):
+        """Queue DTMF tones for the active call; they are sent paced, in as few requests as timing allows.
+
+        Args:
+            device_address: Bluetooth address of remote device.
+            tones: String of DTMF tones (0-9, *, #, A-D), with "," for a pause.
+            tone_ms: Tone duration; None leaves the pacing to the audio gateway.
+            gap_ms: Silence after each tone; None leaves the pacing to the audio gateway.
+
+        Returns:
+            The id of the queued sequence, or False if there is no active call or the tones are invalid.
+        """
+        modem_path = self.find_modem_path(device_address)
+        if not modem_path:
+            self.log.warning("No oFono modem path for %s", device_address)
+            return False
+        call_path = self.find_call_path("active", modem_path)
+        if not call_path:
+            self.log.warning("No active call on %s to send tones to", device_address)
+            return False
+        try:
+            return self.get_dtmf_scheduler().queue(call_path, device_address, tones, tone_ms, gap_ms)
+        except ValueError as error:
+            self.log.error("Failed to send tones on %s: %s", device_address, error)
+            return False
+
+    def send_tones_now(self, device_address, tones):
+        """Send DTMF tones over the active call in a single SendTones request.
+
+        Args:
+            device_address: Bluetooth address of remote device.
+            tones: String of DTMF tones (0-9, *, #, A-D)
+        """
+        voice_call_manager = self.get_voice_call_manager(device_address)
+        if not voice_call_manager:
+            return False
+        try:
+            voice_call_manager.SendTones(tones)
+            self.log.info("Sent tones '%s' on %s", tones, device_address)
+            return True
+        except Exception as error:
+            self.log.error("Failed to send tones on %s: %s", device_address, error)
+            return False
+
+    def get_dtmf_stats(self):
+        """Returns the request counts and gateway response latency of the DTMF tones sent so far."""
+        if self.dtmf_scheduler is None:
+            return None
+        return self.dtmf_scheduler.get_stats()
+
+    def run_hfp_call_flow(self, device_address, flow, iterations=1, timeout=10.0, incoming_call=None):
+        """Runs a scripted call flow and reports the latency of every step.
+
+        Args:
+            device_address: Bluetooth address of remote device.
+            flow: Name of a built-in flow or a list of step dictionaries (see hfp_callflow).
+            iterations: Number of times the flow is run.
+            timeout: Maximum time in seconds each step may take to reach its expected call states.
+            incoming_call: Optional callable (number) that makes the phone side ring, for flows with
+                incoming calls; without it those steps wait for a real call to come in.
+
+        Returns:
+            The latency report of the run.
+        """
+        from libraries.bluetooth.hfp_callflow import CallFlowRunner
+        self.setup_hfp_manager(device_address)
+        runner = CallFlowRunner(self, device_address, flow, timeout=timeout, incoming_call=incoming_call, log=self.log)
+        return runner.run(iterations)
+
+    def setup_hfp_audio(self):
+        """Registers the hands-free audio agent with oFono and starts tracking audio cards.
+
+        oFono then hands over the SCO socket of every audio connection, whichever side
+        initiated it, together with the negotiated codec (CVSD or mSBC).
+
+        Returns:
+            True if the agent is registered, False otherwise.
+        """
+        from libraries.bluetooth.hfp_audio import (HandsfreeAudioAgent, audio_manager_interface, codec_cvsd,
+                                                   codec_msbc, hfp_audio_agent_path)
+        if self.hfp_audio_agent:
+            return True
+        try:
+            audio_manager = dbus.Interface(self.bus.get_object(constants.ofono_bus, "/"), audio_manager_interface)
+            self.hfp_audio_agent = HandsfreeAudioAgent(self.system_bus, hfp_audio_agent_path, self.on_sco_connection, self.log)
+            audio_manager.Register(hfp_audio_agent_path, dbus.Array([codec_cvsd, codec_msbc], signature="y"))
+            audio_manager.connect_to_signal("CardAdded", self.on_hfp_audio_card_added)
+            audio_manager.connect_to_signal("CardRemoved", self.on_hfp_audio_card_removed)
+            for path, properties in audio_manager.GetCards():
+                self.on_hfp_audio_card_added(path, properties)
+            self.log.info("Hands-free audio agent registered at %s", hfp_audio_agent_path)
+            return True
+        except dbus.exceptions.DBusException as error:
+            self.log.error("Failed to register hands-free audio agent: %s", error)
+            if self.hfp_audio_agent:
+                self.hfp_audio_agent.remove_from_connection()
+                self.hfp_audio_agent = None
+            return False
+
+    def on_hfp_audio_card_added(self, path, properties):
+        """Handle the CardAdded signal of the oFono hands-free audio manager."""
+        address = str(properties.get("RemoteAddress", "")).upper()
+        self.hfp_audio_cards[address] = str(path)
+        self.log.info("Hands-free audio card %s for %s (%s)", path, address, properties.get("Type"))
+
+    def on_hfp_audio_card_removed(self, path):
+        """Handle the CardRemoved signal of the oFono hands-free audio manager."""
+        for address, card_path in list(self.hfp_audio_cards.items()):
+            if card_path == str(path):
+                del self.hfp_audio_cards[address]
+                self.disconnect_hfp_audio(address)
+
+    def on_sco_connection(self, card_path, file_descriptor, codec):
+        """Takes over the SCO socket of a new audio connection handed over by oFono.
+
+        Args:
+            card_path: oFono hands-free audio card path.
+            file_descriptor: File descriptor of the connected SCO socket.
+            codec: Negotiated codec id.
+        """
+        from libraries.bluetooth.hfp_audio import ScoStream, socket_from_fd
+        address = next((address for address, path in self.hfp_audio_cards.items() if path == card_path), card_path)
+        previous = self.sco_streams.pop(address, None)
+        if previous:
+            previous.close()
+        self.sco_streams[address] = ScoStream(socket_from_fd(file_descriptor), codec, log=self.log)
+        self.notify_waiters()
+        self.emit_callback(self.on_hfp_audio_connection, address, self.sco_streams[address].get_stats()["codec"])
+
+    def connect_hfp_audio(self, address, timeout=10):
+        """Opens the SCO/eSCO audio link of a hands-free connection.
+
+        Args:
+            address: Bluetooth address of remote device.
+            timeout: Time in seconds to wait for the audio connection.
 
-            self.log.info(f"VoiceCallManager initialized for {device_address}")
+        Returns:
+            The negotiated codec ('CVSD' or 'mSBC'), or None if no audio connection was made.
+        """
+        from libraries.bluetooth.hfp_audio import audio_card_interface
+        address = address.upper()
+        if not self.setup_hfp_audio():
+            return None
+        card_path = self.hfp_audio_cards.get(address)
+        if not card_path:
+            self.log.warning("No hands-free audio card for %s", address)
+            return None
+        if address not in self.sco_streams:
+            errors = []
+            card = dbus.Interface(self.bus.get_object(constants.ofono_bus, card_path), audio_card_interface)
+            card.Connect(reply_handler=lambda: None, error_handler=errors.append, timeout=timeout)
+            self.wait_for_condition(lambda: address in self.sco_streams or errors, timeout)
+            if errors:
+                self.log.error("Failed to connect audio on %s: %s", address, errors[0])
+                return None
+        stream = self.sco_streams.get(address)
+        if not stream:
+            self.log.warning("Timed out waiting for the audio connection of %s", address)
+            return None
+        return stream.get_stats()["codec"]
+
+    def get_hfp_audio_stats(self, address):
+        """Returns packet, loss and timing counters of the SCO audio link of a device.
+
+        Args:
+            address: Bluetooth address of remote device.
+
+        Returns:
+            A dictionary of link statistics, or None if there is no audio connection.
+        """
+        stream = self.sco_streams.get(address.upper())
+        return stream.get_stats() if stream else None
+
+    def disconnect_hfp_audio(self, address):
+        """Closes the SCO audio link of a device.
+
+        Args:
+            address: Bluetooth address of remote device.
+
+        Returns:
+            True if an audio connection was closed, False otherwise.
+        """
+        stream = self.sco_streams.pop(address.upper(), None)
+        if not stream:
+            return False
+        self.log.info("SCO link of %s closed: %s", address, stream.get_stats())
+        stream.close()
+        return True
+
+    def measure_hfp_audio(self, address, stimulus="chirp", duration=1.0, level_db=-6.0, frequency=1000.0):
+        """Measures latency, dropouts, THD and level of the HFP audio path to a device.
+
+        The stimulus is sent over the SCO link and the audio coming back is analysed, so the
+        remote end must loop its microphone path back to its speaker path (or be a loopback
+        stand-in). Only CVSD carries PCM on the socket; mSBC links report counters only.
+
+        Args:
+            address: Bluetooth address of remote device.
+            stimulus: 'chirp', 'mls' or 'tone'.
+            duration: Length of the stimulus in seconds.
+            level_db: Peak level of the stimulus in dBFS.
+            frequency: Tone frequency in Hz.
+
+        Returns:
+            A dictionary of measurement results merged with the link statistics, or None if
+            the measurement failed.
+        """
+        from libraries.bluetooth.audio_measure import measure_loopback
+        from libraries.bluetooth.hfp_audio import codec_cvsd
+        stream = self.sco_streams.get(address.upper())
+        if not stream:
+            self.log.warning("No audio connection for %s", address)
+            return None
+        if stream.codec != codec_cvsd:
+            self.log.warning("Audio of %s is not PCM (%s), only link counters are available", address,
+                             stream.get_stats()["codec"])
+            return None
+        try:
+            results = measure_loopback(stream, stream, stream.spec, stimulus, duration, level_db, frequency)
+            results.update(stream.get_stats())
+            self.log.info("HFP measurement on %s: latency %.1f ms, %d dropouts, %.2f%% packets lost", address,
+                          results["latency_ms"], results["dropouts"], results["loss_percent"])
+            return results
         except Exception as error:
-            self.log.error(f"Failed to setup VoiceCallManager for {device_address}: {error}")
+            self.log.error("HFP measurement failed on %s: %s", address, error)
+            return None
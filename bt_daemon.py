@@ -0,0 +1,570 @@
+"""Headless control daemon exposing BluetoothDeviceManager over a local JSON-RPC API.
+
+The daemon hosts one BluetoothDeviceManager, so every client shares its bus
+connection and object-tree cache, and serves JSON-RPC 2.0 on a Unix socket:
+one JSON object per line in each direction. Method names are those of the
+manager (pair, connect, connect_profile, start_a2dp_stream, send_file,
+dial_number, ...; see rpc_methods) and params are a list or an object of
+their arguments:
+
+    {"jsonrpc": "2.0", "id": 1, "method": "connect", "params": {"address": "00:11:22:33:44:55"}}
+    {"jsonrpc": "2.0", "id": 1, "result": true}
+
+daemon.subscribe starts the event stream of a client; events arrive as
+notifications {"jsonrpc": "2.0", "method": "event", "params": {"name": ...,
+"data": ...}} for the names in event_names. daemon.methods lists the methods
+and daemon.stats reports the clients and requests served.
+
+The sockets, the event stream and the manager's signal handlers run on the
+GLib main loop, which the manager's D-Bus thread (see dbus_thread) runs.
+Manager methods run on a pool of request threads and wait for BlueZ on a
+condition variable instead of in nested main loops, so every request
+completes as soon as its own work is done, whatever was sent before or
+after it, pipelined by the same client or by others. receive_file, which
+polls for the incoming file, only ties up its own request thread.
+
+Pairing requests are answered by the daemon itself: confirmations and
+authorizations according to --reject, PIN and passkey entry with --pin and
+--passkey, and every request is also streamed as a pairing_request event.
+With --no-agent a client registers the agent instead: arguments of the form
+{"$callback": <id>}, such as register_agent's ui_callback, become functions
+that send the client a "callback" request and wait for its reply.
+
+Usage:
+    python bt_daemon.py --interface hci0 --socket /tmp/bluetooth-test.sock
+"""
+import argparse
+import errno
+import functools
+import inspect
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from gi.repository import GLib
+
+from libraries.bluetooth import constants
+
+default_socket_path = "/tmp/bluetooth-test.sock"
+max_request_bytes = 1 << 20
+max_pending_bytes = 8 << 20
+default_request_threads = 8
+
+rpc_methods = [
+    # Adapter and discovery.
+    "get_adapter_details", "set_discoverable_mode", "set_pairable_mode", "start_discovery", "stop_discovery",
+    "get_discovered_devices", "get_paired_devices",
+    # Pairing and connections.
+    "register_agent", "unregister_agent", "setup_pairing_signal_listener", "find_device_path_on_any_adapter",
+    "pair", "unpair_device", "unpair_devices", "connect", "disconnect", "connect_profile", "is_device_paired",
+    "is_device_connected", "get_connected_profile_uuids", "get_connection_timing",
+    # A2DP and AVRCP.
+    "start_a2dp_stream", "start_a2dp_playlist", "start_a2dp_fanout", "stop_a2dp_stream", "measure_a2dp_audio", "get_a2dp_stream_stats", "inspect_a2dp_endpoints",
+    "get_a2dp_role_for_device", "get_transport_health", "media_control", "get_media_playback_info",
+    "get_media_volume", "set_media_volume",
+    # OPP.
+    "create_obex_session", "remove_obex_session", "send_file", "receive_file",
+    # HFP.
+    "setup_hfp_manager", "get_calls", "get_call_states", "answer_call", "dial_number", "dial_last", "dial_memory",
+    "hangup_active_call", "hangup_all_calls", "set_call_volume", "swap_calls", "transfer_calls",
+    "release_and_answer", "release_and_swap", "hold_and_answer", "private_chat", "create_multiparty",
+    "hangup_multiparty", "send_tones", "get_dtmf_stats", "run_hfp_call_flow", "connect_hfp_audio",
+    "disconnect_hfp_audio", "get_hfp_audio_stats", "measure_hfp_audio",
+]
+event_names = ["interfaces_added", "interfaces_removed", "properties_changed", "call_added", "call_removed",
+               "call_property_changed", "connection_timing", "transport_update", "hfp_audio_connection",
+               "device_update", "dtmf_sent", "dtmf_finished", "pairing_request"]
+
+# JSON-RPC 2.0 error codes.
+parse_error = -32700
+invalid_request = -32600
+method_not_found = -32601
+invalid_params = -32602
+internal_error = -32603
+
+
+def is_callback(value):
+    """Whether a request argument stands for a callable of the client, {"$callback": <id>}."""
+    return isinstance(value, dict) and len(value) == 1 and "$callback" in value
+
+
+def to_json(value):
+    """Converts D-Bus values (dbus.Boolean, dbus.Dictionary, dbus.ObjectPath, ...) to plain JSON types."""
+    if value is None or isinstance(value, (str, float)):
+        return str(value) if isinstance(value, str) else value
+    if isinstance(value, int):
+        # dbus.Boolean derives from int.
+        return bool(value) if isinstance(value, bool) or type(value).__name__ == "Boolean" else int(value)
+    if isinstance(value, dict):
+        return {str(key): to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [to_json(item) for item in value]
+    if isinstance(value, (bytes, bytearray)):
+        return list(value)
+    return str(value)
+
+
+class RpcError(Exception):
+    """A JSON-RPC error returned to the client."""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class DaemonClient:
+    """A connected client: its socket, partial input, pending output and event subscriptions."""
+
+    def __init__(self, connection, client_id):
+        self.connection = connection
+        self.client_id = client_id
+        self.input = b""
+        self.output = bytearray()
+        self.subscriptions = None
+        self.watches = []
+        self.write_watch = None
+        self.requests = 0
+
+    def wants(self, event):
+        return self.subscriptions is not None and (not self.subscriptions or event in self.subscriptions)
+
+
+class ControlDaemon:
+    """Serves a BluetoothDeviceManager to JSON-RPC clients on a Unix socket."""
+
+    def __init__(self, manager, socket_path, log, capability=None, accept=True, pin="0000", passkey=0,
+                 register_agent=True, callback_timeout=60.0, request_threads=default_request_threads):
+        """Initialize the daemon.
+
+        Args:
+            manager: BluetoothDeviceManager shared by all clients.
+            socket_path: Path of the Unix socket.
+            log: Logger instance.
+            capability: Agent capability registered with BlueZ, e.g. KeyboardDisplay.
+            accept: Whether pairing confirmations and service authorizations are accepted.
+            pin: PIN returned to PIN code requests.
+            passkey: Passkey returned to passkey requests.
+            register_agent: Whether the daemon registers its own pairing agent at startup; without it a
+                client registers one with register_agent and answers the requests itself.
+            callback_timeout: Maximum time in seconds a client may take to answer a callback.
+            request_threads: Number of manager methods that may run at the same time.
+        """
+        self.manager = manager
+        self.socket_path = socket_path
+        self.log = log
+        self.capability = capability
+        self.accept = accept
+        self.pin = pin
+        self.passkey = passkey
+        self.server = None
+        self.server_watch = None
+        self.clients = {}
+        self.next_client_id = 1
+        self.requests = 0
+        self.started = None
+        self.stopped = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=request_threads, thread_name_prefix="rpc-request")
+        self.register_own_agent = register_agent
+        self.callback_timeout = callback_timeout
+        self.callback_replies = {}
+        self.callback_condition = threading.Condition()
+        self.next_callback_id = 1
+        self.methods = {"daemon.subscribe": self.subscribe, "daemon.unsubscribe": self.unsubscribe,
+                        "daemon.methods": self.list_methods, "daemon.stats": self.get_stats}
+
+    def start(self):
+        """Opens the socket, loads the object tree, registers the agent and subscribes to the manager's events.
+
+        Raises:
+            RuntimeError: If the manager's D-Bus thread cannot be started.
+        """
+        if not self.manager.start_dbus_thread():
+            raise RuntimeError("Cannot start the D-Bus dispatch thread")
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        self.server.listen(16)
+        self.server.setblocking(False)
+        self.server_watch = GLib.io_add_watch(self.server.fileno(), GLib.PRIORITY_DEFAULT, GLib.IO_IN, self.on_accept)
+        self.manager.load_object_tree()
+        if self.register_own_agent:
+            self.manager.register_agent(capability=self.capability, ui_callback=self.on_pairing_request)
+        self.setup_event_sources()
+        self.started = time.monotonic()
+        self.log.info("Control daemon listening on %s", self.socket_path)
+
+    def run(self):
+        """Starts the daemon and serves clients until stop()."""
+        self.start()
+        try:
+            self.stopped.wait()
+        finally:
+            self.shutdown()
+
+    def stop(self):
+        self.stopped.set()
+
+    def shutdown(self):
+        # Stopping the D-Bus thread ends the main loop and releases the requests waiting for BlueZ.
+        self.manager.stop_dbus_thread()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for client in list(self.clients.values()):
+            self.close_client(client)
+        if self.server is not None:
+            GLib.source_remove(self.server_watch)
+            self.server.close()
+            self.server = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        if self.register_own_agent:
+            self.manager.unregister_agent()
+        self.log.info("Control daemon stopped")
+
+    def setup_event_sources(self):
+        """Streams the manager's callbacks and the BlueZ/oFono signals as events."""
+        manager = self.manager
+        manager.on_connection_timing = lambda timing: self.broadcast("connection_timing", timing)
+        manager.on_transport_update = lambda snapshot: self.broadcast("transport_update", snapshot)
+        manager.on_device_update = lambda address, changed: self.broadcast(
+            "device_update", {"address": address, "changed": changed})
+        manager.on_hfp_audio_connection = lambda address, codec: self.broadcast(
+            "hfp_audio_connection", {"address": address, "codec": codec})
+        manager.on_dtmf_sent = lambda record: self.broadcast("dtmf_sent", record)
+        manager.on_dtmf_finished = lambda sequence_id, success, records: self.broadcast(
+            "dtmf_finished", {"sequence_id": sequence_id, "success": success, "records": records})
+        bus = manager.system_bus
+        bus.add_signal_receiver(
+            lambda path, interfaces: self.broadcast("interfaces_added", {"path": path, "interfaces": interfaces}),
+            dbus_interface=constants.object_manager_interface, signal_name="InterfacesAdded",
+            bus_name=constants.bluez_service)
+        bus.add_signal_receiver(
+            lambda path, interfaces: self.broadcast("interfaces_removed", {"path": path, "interfaces": interfaces}),
+            dbus_interface=constants.object_manager_interface, signal_name="InterfacesRemoved",
+            bus_name=constants.bluez_service)
+        bus.add_signal_receiver(
+            lambda interface, changed, invalidated, path: self.broadcast(
+                "properties_changed", {"path": path, "interface": interface, "changed": changed,
+                                       "invalidated": invalidated}),
+            dbus_interface=constants.properties_interface, signal_name="PropertiesChanged",
+            bus_name=constants.bluez_service, path_keyword="path")
+        bus.add_signal_receiver(
+            lambda path, properties: self.broadcast("call_added", {"path": path, "properties": properties}),
+            dbus_interface="org.ofono.VoiceCallManager", signal_name="CallAdded", bus_name="org.ofono")
+        bus.add_signal_receiver(
+            lambda path: self.broadcast("call_removed", {"path": path}),
+            dbus_interface="org.ofono.VoiceCallManager", signal_name="CallRemoved", bus_name="org.ofono")
+        bus.add_signal_receiver(
+            lambda name, value, path: self.broadcast("call_property_changed",
+                                                     {"path": path, "name": name, "value": value}),
+            dbus_interface="org.ofono.VoiceCall", signal_name="PropertyChanged", bus_name="org.ofono",
+            path_keyword="path")
+
+    def on_pairing_request(self, request_type, device, uuid=None, passkey=None):
+        """Answers a pairing request of the agent without user interaction."""
+        device_address = device.split("dev_")[-1].replace("_", ":")
+        self.broadcast("pairing_request", {"type": request_type, "address": device_address, "uuid": uuid,
+                                           "passkey": passkey})
+        handler_name = constants.pairing_request_handlers.get(request_type)
+        self.log.info("Pairing request %s for %s", request_type, device_address)
+        if handler_name == "handle_pin_request":
+            return self.pin
+        if handler_name == "handle_passkey_request":
+            return self.passkey
+        if handler_name in ("handle_confirm_request", "handle_authorize_request"):
+            return self.accept
+        return None
+
+    def on_accept(self, fd, condition):
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except BlockingIOError:
+                return True
+            except OSError as error:
+                self.log.error("Failed to accept a client: %s", error)
+                return True
+            connection.setblocking(False)
+            client = DaemonClient(connection, self.next_client_id)
+            self.next_client_id += 1
+            client.watches.append(GLib.io_add_watch(connection.fileno(), GLib.PRIORITY_DEFAULT,
+                                                    GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR,
+                                                    self.on_client_readable, client))
+            self.clients[client.client_id] = client
+            self.log.info("Client %d connected", client.client_id)
+
+    def on_client_readable(self, fd, condition, client):
+        try:
+            data = client.connection.recv(65536)
+        except BlockingIOError:
+            return True
+        except OSError:
+            data = b""
+        if not data:
+            self.close_client(client)
+            return False
+        client.input += data
+        while client.client_id in self.clients:
+            line, separator, rest = client.input.partition(b"\n")
+            if not separator:
+                if len(client.input) > max_request_bytes:
+                    self.log.warning("Client %d sent an oversized request", client.client_id)
+                    self.close_client(client)
+                    return False
+                break
+            client.input = rest
+            if line.strip():
+                response = self.handle_line(client, line)
+                if response is not None:
+                    self.send(client, response)
+        return client.client_id in self.clients
+
+    def handle_line(self, client, line):
+        """Parses one request line and runs it, or hands it to a request thread.
+
+        Returns:
+            The response object, or None for notifications (requests without an id) and for
+            requests answered later by a request thread.
+        """
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": parse_error, "message": str(error)}}
+        request_id = request.get("id") if isinstance(request, dict) else None
+        if isinstance(request, dict) and "method" not in request and request_id in self.callback_replies:
+            with self.callback_condition:
+                self.callback_replies[request_id] = request
+                self.callback_condition.notify_all()
+            return None
+        try:
+            if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+                raise RpcError(invalid_request, "Invalid request")
+            function, args, kwargs = self.dispatch(client, request["method"], request.get("params", []))
+            if request["method"] not in self.methods:
+                self.executor.submit(self.run_request, client, request, function, args, kwargs)
+                return None
+            return self.make_response(request, function(*args, **kwargs))
+        except RpcError as error:
+            return self.make_response(request, error=error)
+
+    def run_request(self, client, request, function, args, kwargs):
+        """Runs a manager method on a request thread and hands its response to the main loop."""
+        try:
+            response = self.make_response(request, function(*args, **kwargs))
+        except Exception as error:
+            self.log.error("Request %s failed: %s", request.get("method"), error)
+            response = self.make_response(request, error=error)
+        if response is not None:
+            GLib.idle_add(lambda: self.send(client, response) or False)
+
+    def make_response(self, request, result=None, error=None):
+        """Builds the response to a request, None for notifications (requests without an id)."""
+        if isinstance(request, dict) and "id" not in request:
+            return None
+        response = {"jsonrpc": "2.0", "id": request.get("id") if isinstance(request, dict) else None}
+        if isinstance(error, RpcError):
+            response["error"] = {"code": error.code, "message": str(error)}
+        elif error is not None:
+            response["error"] = {"code": internal_error, "message": f"{type(error).__name__}: {error}"}
+        else:
+            response["result"] = to_json(result)
+        return response
+
+    def dispatch(self, client, method, params):
+        """Resolves a request to the function to call and its arguments.
+
+        Returns:
+            A tuple of the function, the positional and the keyword arguments.
+        """
+        if method in self.methods:
+            function = functools.partial(self.methods[method], client)
+        elif method in rpc_methods:
+            function = getattr(self.manager, method)
+        else:
+            raise RpcError(method_not_found, f"Method not found: {method}")
+        if isinstance(params, dict):
+            args, kwargs = [], params
+        elif isinstance(params, list):
+            args, kwargs = params, {}
+        else:
+            raise RpcError(invalid_params, "params must be a list or an object")
+        args = [self.client_callback(client, arg) if is_callback(arg) else arg for arg in args]
+        kwargs = {name: self.client_callback(client, arg) if is_callback(arg) else arg for name, arg in kwargs.items()}
+        try:
+            inspect.signature(function).bind(*args, **kwargs)
+        except TypeError as error:
+            raise RpcError(invalid_params, str(error))
+        client.requests += 1
+        self.requests += 1
+        return function, args, kwargs
+
+    def client_callback(self, client, marker):
+        """Returns a function that calls back into a client, for arguments such as ui_callback.
+
+        The function sends a "callback" request to the client and waits until the client replies or
+        callback_timeout expires, and returns the client's result (None on timeout, error or once
+        the client is gone). Called from the main loop, such as by the pairing agent, it runs the
+        main loop meanwhile so the reply can be read; on a request thread it blocks on a condition.
+        """
+        callback_id = marker["$callback"]
+
+        def call(*args):
+            if client.client_id not in self.clients:
+                return None
+            with self.callback_condition:
+                request_id = f"callback-{self.next_callback_id}"
+                self.next_callback_id += 1
+                self.callback_replies[request_id] = None
+            request = {"jsonrpc": "2.0", "id": request_id, "method": "callback",
+                       "params": {"callback": callback_id, "args": to_json(list(args))}}
+            deadline = time.monotonic() + self.callback_timeout
+
+            def answered():
+                return (self.callback_replies[request_id] is not None or client.client_id not in self.clients
+                        or time.monotonic() > deadline)
+
+            dbus_thread = self.manager.dbus_thread
+            if dbus_thread is not None and dbus_thread.is_current():
+                self.send(client, request)
+                loop = GLib.MainLoop()
+
+                def check():
+                    if answered():
+                        loop.quit()
+                        return False
+                    return True
+
+                GLib.timeout_add(10, check)
+                loop.run()
+            else:
+                GLib.idle_add(lambda: self.send(client, request) or False)
+                with self.callback_condition:
+                    self.callback_condition.wait_for(answered, self.callback_timeout)
+            with self.callback_condition:
+                reply = self.callback_replies.pop(request_id)
+            if reply is None:
+                self.log.warning("Client %d did not answer callback %s", client.client_id, callback_id)
+                return None
+            if "error" in reply:
+                self.log.warning("Callback %s of client %d failed: %s", callback_id, client.client_id,
+                                 reply["error"].get("message"))
+                return None
+            return reply.get("result")
+        return call
+
+    def subscribe(self, client, events=None):
+        """Starts streaming events to the client: those named, or all of them."""
+        unknown = set(events or []) - set(event_names)
+        if unknown:
+            raise RpcError(invalid_params, f"Unknown events: {', '.join(sorted(unknown))}")
+        client.subscriptions = set(events or [])
+        return sorted(client.subscriptions or event_names)
+
+    def unsubscribe(self, client):
+        client.subscriptions = None
+        return True
+
+    def list_methods(self, client):
+        return sorted(rpc_methods) + sorted(self.methods)
+
+    def get_stats(self, client):
+        return {"clients": len(self.clients), "requests": self.requests,
+                "uptime_s": time.monotonic() - self.started if self.started else 0.0,
+                "client_requests": {str(other.client_id): other.requests for other in self.clients.values()}}
+
+    def broadcast(self, event, data):
+        """Sends an event to every client subscribed to it."""
+        receivers = [client for client in self.clients.values() if client.wants(event)]
+        if not receivers:
+            return
+        message = {"jsonrpc": "2.0", "method": "event",
+                   "params": {"name": event, "time": time.time(), "data": to_json(data)}}
+        for client in receivers:
+            self.send(client, message)
+
+    def send(self, client, message):
+        """Queues a message for a client and writes as much as the socket accepts.
+
+        A client that stops reading is disconnected once max_pending_bytes are queued for it, so it
+        cannot stall the main loop or the other clients.
+        """
+        if client.client_id not in self.clients:
+            return
+        client.output += json.dumps(message, default=str, separators=(",", ":")).encode("utf-8") + b"\n"
+        if len(client.output) > max_pending_bytes:
+            self.log.warning("Client %d is not reading; disconnecting it", client.client_id)
+            self.close_client(client)
+            return
+        self.flush(client)
+
+    def flush(self, client):
+        try:
+            sent = client.connection.send(client.output)
+            del client.output[:sent]
+        except BlockingIOError:
+            pass
+        except OSError as error:
+            if error.errno != errno.EAGAIN:
+                self.close_client(client)
+                return False
+        if client.output and client.write_watch is None:
+            client.write_watch = GLib.io_add_watch(client.connection.fileno(), GLib.PRIORITY_DEFAULT, GLib.IO_OUT,
+                                                   self.on_client_writable, client)
+        return bool(client.output)
+
+    def on_client_writable(self, fd, condition, client):
+        if client.client_id not in self.clients:
+            return False
+        keep = self.flush(client)
+        if not keep:
+            client.write_watch = None
+        return keep
+
+    def close_client(self, client):
+        if self.clients.pop(client.client_id, None) is None:
+            return
+        for watch in client.watches + ([client.write_watch] if client.write_watch else []):
+            GLib.source_remove(watch)
+        client.watches = []
+        client.write_watch = None
+        client.connection.close()
+        self.log.info("Client %d disconnected", client.client_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interface", default="hci0", help="Bluetooth adapter interface.")
+    parser.add_argument("--socket", default=default_socket_path, help="Path of the Unix socket.")
+    parser.add_argument("--capability", default="KeyboardDisplay", help="Capability of the pairing agent.")
+    parser.add_argument("--reject", action="store_true",
+                        help="Reject pairing confirmations and service authorizations instead of accepting them.")
+    parser.add_argument("--pin", default="0000", help="PIN returned to PIN code requests.")
+    parser.add_argument("--passkey", type=int, default=0, help="Passkey returned to passkey requests.")
+    parser.add_argument("--no-agent", action="store_true",
+                        help="Do not register a pairing agent; a client registers one and answers the requests.")
+    parser.add_argument("--threads", type=int, default=default_request_threads,
+                        help="Number of requests that may run at the same time.")
+    parser.add_argument("--log-level", default="INFO", help="Logging level.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    log = logging.getLogger("bt_daemon")
+    from libraries.bluetooth.bluez import BluetoothDeviceManager
+
+    manager = BluetoothDeviceManager(log=log, interface=args.interface)
+    daemon = ControlDaemon(manager, args.socket, log, capability=args.capability, accept=not args.reject,
+                           pin=args.pin, passkey=args.passkey, register_agent=not args.no_agent,
+                           request_threads=args.threads)
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal_number, lambda: daemon.stop() or False)
+    daemon.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+"""Runs BluetoothDeviceManager in a worker process, out of the GUI's way.
+
+WorkerProcess starts the control daemon (see bt_daemon) in a child process,
+so D-Bus dispatch, the nested GLib loops of send_file() and friends and the
+paplay/obexpushd children all live there. RemoteDeviceManager is the GUI
+side: it has the methods and callbacks of BluetoothDeviceManager and
+forwards them over the daemon's JSON-RPC socket.
+
+Requests are pipelined: call_async() returns a Future right away, and any
+number of calls can be outstanding. The blocking methods, which keep the
+manager's interface, wait for their reply in a nested Qt event loop, the
+way the manager waits for BlueZ in a nested GLib loop, so the window keeps
+painting and the event loop never stalls behind a slow D-Bus call or a hung
+obexd. Events pushed by the worker reach the on_* callbacks on the GUI
+thread, and callables passed as arguments (ui_callback of register_agent(),
+user_confirm_callback of receive_file(), ...) are called back there too.
+
+Setting BLUETOOTH_WORKER makes TestApplication use a worker; its value may
+be the socket path of a daemon that is already running.
+"""
+import atexit
+import concurrent.futures
+import inspect
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from PyQt6.QtCore import QCoreApplication, QEventLoop, QObject, QThread, QTimer, pyqtSignal
+
+from libraries.bluetooth.bt_daemon import rpc_methods
+
+worker_environment_variable = "BLUETOOTH_WORKER"
+default_call_timeout = 120.0
+
+
+class RemoteError(Exception):
+    """A request failed in the worker, or the worker is gone."""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+class WorkerProcess:
+    """The control daemon running in a child process on a private socket."""
+
+    def __init__(self, interface, log, log_level="INFO"):
+        """Initialize the process.
+
+        Args:
+            interface: Bluetooth adapter interface (e.g., hci0).
+            log: Logger instance; the worker's log goes to bluetooth_worker.log in its log_path, if it has one.
+            log_level: Logging level of the worker.
+        """
+        self.interface = interface
+        self.log = log
+        self.log_level = log_level
+        self.directory = None
+        self.socket_path = None
+        self.process = None
+        self.log_file = None
+
+    def start(self, timeout=30.0):
+        """Starts the daemon and waits until its socket accepts connections.
+
+        Returns:
+            The socket path.
+        """
+        self.directory = tempfile.mkdtemp(prefix="bluetooth-worker-")
+        self.socket_path = os.path.join(self.directory, "control.sock")
+        log_path = getattr(self.log, "log_path", None)
+        if log_path:
+            self.log_file = open(os.path.join(log_path, "bluetooth_worker.log"), "a")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "libraries.bluetooth.bt_daemon", "--interface", self.interface,
+             "--socket", self.socket_path, "--no-agent", "--log-level", self.log_level],
+            stdout=self.log_file or subprocess.DEVNULL, stderr=self.log_file)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                    probe.connect(self.socket_path)
+                self.log.info("Bluetooth worker %d listening on %s", self.process.pid, self.socket_path)
+                return self.socket_path
+            except OSError:
+                time.sleep(0.05)
+        self.stop()
+        raise RemoteError("Bluetooth worker did not start")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            self.process = None
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+        if self.directory is not None:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            os.rmdir(self.directory)
+            self.directory = None
+
+
+class WorkerConnection:
+    """A JSON-RPC connection to the daemon with pipelined requests.
+
+    A reader thread resolves the Future of every reply and passes the other messages (events and
+    callback requests) to on_message.
+    """
+
+    def __init__(self, socket_path, on_message, log):
+        """Connect to the daemon.
+
+        Args:
+            socket_path: Path of the daemon's Unix socket.
+            on_message: Callable receiving every message that is not a reply, on the reader thread.
+            log: Logger instance.
+        """
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.connect(socket_path)
+        self.on_message = on_message
+        self.log = log
+        self.pending = {}
+        self.next_id = 1
+        self.lock = threading.Lock()
+        self.closed = False
+        self.reader = threading.Thread(target=self.read, name="bluetooth-worker-reader", daemon=True)
+        self.reader.start()
+
+    def request(self, method, params):
+        """Sends a request without waiting for its reply.
+
+        Returns:
+            A concurrent.futures.Future that receives the result, or a RemoteError.
+        """
+        future = concurrent.futures.Future()
+        with self.lock:
+            if self.closed:
+                future.set_exception(RemoteError("Bluetooth worker connection is closed"))
+                return future
+            request_id = self.next_id
+            self.next_id += 1
+            self.pending[request_id] = future
+            self.write({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params})
+        return future
+
+    def reply(self, request_id, result=None, error=None):
+        """Answers a request of the daemon (a callback)."""
+        message = {"jsonrpc": "2.0", "id": request_id}
+        if error is None:
+            message["result"] = result
+        else:
+            message["error"] = {"code": -32000, "message": error}
+        with self.lock:
+            if not self.closed:
+                self.write(message)
+
+    def write(self, message):
+        try:
+            self.connection.sendall(json.dumps(message, default=str, separators=(",", ":")).encode("utf-8") + b"\n")
+        except OSError as error:
+            self.log.error("Failed to write to the Bluetooth worker: %s", error)
+
+    def read(self):
+        buffer = b""
+        while True:
+            try:
+                data = self.connection.recv(65536)
+            except OSError:
+                data = b""
+            if not data:
+                break
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    self.dispatch(json.loads(line))
+        self.fail_pending("Bluetooth worker connection closed")
+
+    def dispatch(self, message):
+        if "method" in message:
+            self.on_message(message)
+            return
+        with self.lock:
+            future = self.pending.pop(message.get("id"), None)
+        if future is None:
+            return
+        if "error" in message:
+            future.set_exception(RemoteError(message["error"].get("message"), message["error"].get("code")))
+        else:
+            future.set_result(message.get("result"))
+
+    def fail_pending(self, reason):
+        with self.lock:
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(RemoteError(reason))
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.connection.close()
+        self.reader.join(timeout=5)
+
+
+class WorkerBridge(QObject):
+    """Hands the worker's messages and replies from the reader thread to the GUI thread."""
+
+    message_received = pyqtSignal(object)
+    reply_received = pyqtSignal()
+
+
+class RemoteDeviceManager:
+    """BluetoothDeviceManager running in a worker process, with the same methods and callbacks."""
+
+    def __init__(self, log=None, interface=None, socket_path=None, call_timeout=default_call_timeout):
+        """Start a worker, or connect to a running daemon, and subscribe to its events.
+
+        Args:
+            log: Logger instance.
+            interface: Bluetooth adapter interface (e.g., hci0).
+            socket_path: Socket of a daemon that is already running; a worker is started if None.
+            call_timeout: Maximum time in seconds a blocking method waits for its reply.
+        """
+        self.log = log
+        self.interface = interface
+        self.call_timeout = call_timeout
+        self.worker = None
+        self.metrics = None
+        self.dbus_tracer = None
+        self.active_call_path = None
+        self.on_connection_timing = None
+        self.on_transport_update = None
+        self.on_hfp_audio_connection = None
+        self.on_device_update = None
+        self.on_dtmf_sent = None
+        self.on_dtmf_finished = None
+        self.on_event = None
+        self.callbacks = {}
+        self.callback_ids = {}
+        self.bridge = None
+        if QCoreApplication.instance() is not None:
+            self.bridge = WorkerBridge()
+            self.bridge.message_received.connect(self.handle_message)
+        if socket_path is None:
+            self.worker = WorkerProcess(interface, log)
+            socket_path = self.worker.start()
+            atexit.register(self.close)
+        self.connection = WorkerConnection(socket_path, self.on_message, log)
+        self.call("daemon.subscribe")
+
+    def __getattr__(self, name):
+        if name not in rpc_methods:
+            raise AttributeError(name)
+
+        def method(*args, **kwargs):
+            return self.call(name, *args, **kwargs)
+        method.__name__ = name
+        return method
+
+    def params(self, method, args, kwargs):
+        """Converts the arguments of a call to JSON-RPC params, replacing callables with callback markers.
+
+        Positional arguments mixed with keyword arguments are mapped to their parameter names with the
+        manager method's signature and sent by name.
+
+        Raises:
+            TypeError: The arguments do not match the method's signature.
+        """
+        def convert(value):
+            if not callable(value):
+                return value
+            callback_id = self.callback_ids.get(value)
+            if callback_id is None:
+                callback_id = self.callback_ids[value] = str(len(self.callback_ids) + 1)
+                self.callbacks[callback_id] = value
+            return {"$callback": callback_id}
+
+        if kwargs:
+            if args:
+                from libraries.bluetooth.bluez import BluetoothDeviceManager
+
+                function = getattr(BluetoothDeviceManager, method, None)
+                if function is None:
+                    raise TypeError(f"{method} cannot mix positional and keyword arguments")
+                bound = inspect.signature(function).bind(None, *args, **kwargs)
+                kwargs = dict(list(bound.arguments.items())[1:])
+            return {name: convert(value) for name, value in kwargs.items()}
+        return [convert(value) for value in args]
+
+    def call_async(self, method, *args, callback=None, **kwargs):
+        """Sends a request without waiting for it.
+
+        Args:
+            method: Manager method name (see bt_daemon.rpc_methods).
+            *args: Positional arguments of the method.
+            callback: Optional callable receiving the Future once it is done, on the GUI thread.
+            **kwargs: Keyword arguments of the method.
+
+        Returns:
+            A concurrent.futures.Future of the result.
+        """
+        future = self.connection.request(method, self.params(method, args, kwargs))
+        if self.bridge is not None:
+            future.add_done_callback(lambda done: self.bridge.reply_received.emit())
+            if callback is not None:
+                future.add_done_callback(lambda done: self.bridge.message_received.emit({"future": done,
+                                                                                       "callback": callback}))
+        elif callback is not None:
+            future.add_done_callback(callback)
+        return future
+
+    def call(self, method, *args, **kwargs):
+        """Calls a manager method in the worker and returns its result.
+
+        On the GUI thread the reply is awaited in a nested event loop, so the UI stays responsive.
+
+        Raises:
+            RemoteError: The method raised in the worker, or the worker is gone.
+            TimeoutError: No reply within call_timeout.
+        """
+        future = self.call_async(method, *args, **kwargs)
+        application = QCoreApplication.instance()
+        if self.bridge is None or application is None or QThread.currentThread() is not application.thread():
+            try:
+                return future.result(self.call_timeout)
+            except concurrent.futures.TimeoutError:
+                raise TimeoutError(f"{method} did not complete in {self.call_timeout:.0f} s")
+        deadline = time.monotonic() + self.call_timeout
+        while not future.done():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"{method} did not complete in {self.call_timeout:.0f} s")
+            loop = QEventLoop()
+            timer = QTimer(loop)
+            timer.setSingleShot(True)
+            timer.timeout.connect(loop.quit)
+            timer.start(int(remaining * 1000) + 1)
+            self.bridge.reply_received.connect(loop.quit)
+            try:
+                if not future.done():
+                    loop.exec()
+            finally:
+                self.bridge.reply_received.disconnect(loop.quit)
+        return future.result()
+
+    def on_message(self, message):
+        """Receives events and callback requests on the reader thread and moves them to the GUI thread."""
+        if self.bridge is not None:
+            self.bridge.message_received.emit(message)
+        else:
+            self.handle_message(message)
+
+    def handle_message(self, message):
+        if "future" in message:
+            self.emit_callback(message["callback"], message["future"])
+        elif message.get("method") == "callback":
+            self.answer_callback(message)
+        elif message.get("method") == "event":
+            self.handle_event(message["params"]["name"], message["params"]["data"])
+
+    def answer_callback(self, message):
+        params = message.get("params", {})
+        function = self.callbacks.get(params.get("callback"))
+        if function is None:
+            self.connection.reply(message["id"], error=f"Unknown callback {params.get('callback')}")
+            return
+        try:
+            result = function(*params.get("args", []))
+        except Exception as error:
+            self.log.error("Callback %s failed: %s", getattr(function, "__name__", function), error)
+            self.connection.reply(message["id"], error=str(error))
+            return
+        self.connection.reply(message["id"], result=result)
+
+    def handle_event(self, name, data):
+        """Updates the mirrored state and invokes the callback of an event pushed by the worker."""
+        if name == "call_added":
+            self.active_call_path = data["path"]
+        elif name == "call_removed" and self.active_call_path == data["path"]:
+            self.active_call_path = None
+        elif name == "connection_timing":
+            self.emit_callback(self.on_connection_timing, data)
+        elif name == "transport_update":
+            self.emit_callback(self.on_transport_update, data)
+        elif name == "hfp_audio_connection":
+            self.emit_callback(self.on_hfp_audio_connection, data["address"], data["codec"])
+        elif name == "device_update":
+            self.emit_callback(self.on_device_update, data["address"], data["changed"])
+        elif name == "dtmf_sent":
+            self.emit_callback(self.on_dtmf_sent, data)
+        elif name == "dtmf_finished":
+            self.emit_callback(self.on_dtmf_finished, data["sequence_id"], data["success"], data["records"])
+        self.emit_callback(self.on_event, name, data)
+
+    def emit_callback(self, callback, *args):
+        """Invoke an optional event callback, logging instead of raising if it fails."""
+        if callable(callback):
+            try:
+                callback(*args)
+            except Exception as error:
+                self.log.error("Callback %s failed: %s", getattr(callback, "__name__", callback), error)
+
+    def close(self):
+        """Disconnects from the daemon and stops the worker this manager started."""
+        if self.connection.closed and self.worker is None:
+            return
+        self.connection.close()
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
@@ -1062,7 +1062,7 @@ class TestApplication(QWidget):
                 self.log.info("Disconnected from %s", device_address)
             else:
                 QMessageBox.warning(self, "Disconnection Failed", f"Could not disconnect from {device_address}")
-                self.log.warning(f"Disconnection failed: OPP={opp_success}, BT={bt_success}")
+                self.log.warning("Disconnection failed: OPP=%s, BT=%s", opp_success, bt_success)
 
             self.device_profiles.pop(device_address, None)
             self.device_states.pop(device_address, None)
@@ -1134,11 +1134,11 @@ class TestApplication(QWidget):
         Returns:
             PIN , Passkey, True, or None based on request type and user interaction.
         """
-        self.log.info(f"Handling pairing request: {request_type} for {device}")
+        self.log.info("Handling pairing request: %s for %s", request_type, device)
         device_address = device.split("dev_")[-1].replace("_", ":")
         handler_name = constants.pairing_request_handlers.get(request_type)
         if not handler_name:
-            self.log.warning(f"Unknown pairing request type: {request_type}")
+            self.log.warning("Unknown pairing request type: %s", request_type)
             return None
         handler = getattr(self, handler_name)
         return handler(device_address, uuid, passkey)
@@ -1224,7 +1224,7 @@ class TestApplication(QWidget):
             label: The label to display ('PIN' or 'Passkey').
         """
         if value is None:
-            self.log.warning(f"{label} requested but no value provided for device {device_address}.")
+            self.log.warning("%s requested but no value provided for device %s.", label, device_address)
             return
         QMessageBox.information(self, f"Display {label}", f"Enter this {label.lower()} on {device_address}: {value}")
 
@@ -1710,11 +1710,11 @@ class TestApplication(QWidget):
             paired: Indicates whether pairing was successful or pairing failed.
         """
         if paired:
-            self.log.info(f"Device paired: {device_address}")
+            self.log.info("Device paired: %s", device_address)
             self.add_paired_device_to_list(device_address)
             QMessageBox.information(self, "Pairing Successful", f"{device_address} was paired successfully.")
         else:
-            self.log.info(f"Pairing failed: {device_address}")
+            self.log.info("Pairing failed: %s", device_address)
             QMessageBox.warning(self, "Pairing Failed", f"Pairing with {device_address} failed.")
             self.remove_device_from_list(device_address)
 
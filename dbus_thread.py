@@ -0,0 +1,273 @@
+"""D-Bus dispatch on a thread of its own, with batched delivery to the Qt side.
+
+DBusDispatchThread runs the GLib main loop that dbus-python dispatches
+signals, method calls to exported objects and asynchronous replies on. The
+manager's signal handlers, and so its object-tree index updates, run there,
+off the GUI thread. Their callbacks for the UI (on_connection_timing,
+on_transport_update, ...) are queued with post() and reach the GUI thread as
+one queued Qt signal per flush interval; callbacks posted with a key replace
+or merge into the pending one with the same key, so a storm of updates of
+one object arrives as a single call.
+
+dbus-python only attaches connections to the default GMainContext, so the
+GUI must not iterate that context itself: Qt has to run its own event
+dispatcher, which QT_NO_GLIB=1 in the environment selects. start() refuses
+to run otherwise. Setting BLUETOOTH_DBUS_THREAD=1 starts the thread with
+the manager; prepare_qt_environment() then sets QT_NO_GLIB, and has to run
+before the QApplication is created.
+
+PyQt6 is only imported once a thread is created, so the manager can import
+this module without pulling in Qt. Without a Qt application (or without
+PyQt6), as in the control daemon, posted callbacks run on the dispatch
+thread itself and wait() always blocks on a condition variable.
+"""
+import os
+import threading
+import time
+
+thread_environment_variable = "BLUETOOTH_DBUS_THREAD"
+qt_no_glib_environment_variable = "QT_NO_GLIB"
+
+
+def prepare_qt_environment():
+    """Selects Qt's own event dispatcher if a D-Bus thread is requested; call before creating the QApplication."""
+    if os.environ.get(thread_environment_variable):
+        os.environ.setdefault(qt_no_glib_environment_variable, "1")
+
+
+def qt_application():
+    """Returns the QCoreApplication instance, or None without one or without PyQt6."""
+    try:
+        from PyQt6.QtCore import QCoreApplication
+    except ImportError:
+        return None
+    return QCoreApplication.instance()
+
+
+def create_gui_bridge():
+    """Returns a QObject carrying batches, blocking calls and wake-ups from the dispatch thread to the GUI thread."""
+    from PyQt6.QtCore import QObject, pyqtSignal
+
+    class GuiBridge(QObject):
+        batch_ready = pyqtSignal(list)
+        call_requested = pyqtSignal(object)
+        woken = pyqtSignal()
+
+    return GuiBridge()
+
+
+class DBusDispatchThread:
+    """Runs the default GLib main context on a dedicated thread and forwards events to the GUI thread."""
+
+    def __init__(self, log, flush_interval_ms=50):
+        """Initialize the thread; it must be created on the GUI thread.
+
+        Args:
+            log: Logger instance.
+            flush_interval_ms: Maximum time posted callbacks wait to be delivered, in one batch.
+        """
+        self.log = log
+        self.flush_interval_ms = flush_interval_ms
+        self.thread = None
+        self.loop = None
+        self.pending = {}
+        self.next_sequence = 0
+        self.flush_scheduled = False
+        self.lock = threading.Lock()
+        self.condition = threading.Condition()
+        self.gui_waiters = 0
+        self.batches = 0
+        self.posted = 0
+        self.delivered = 0
+        self.bridge = None
+        if qt_application() is not None:
+            self.bridge = create_gui_bridge()
+            self.bridge.batch_ready.connect(self.deliver)
+            self.bridge.call_requested.connect(self.run_call)
+
+    def start(self):
+        """Starts dispatching D-Bus messages on the thread.
+
+        Returns:
+            True if the thread is running, False if the GUI iterates the GLib default context itself.
+        """
+        if self.thread is not None:
+            return True
+        application = qt_application()
+        if application is not None:
+            dispatcher = application.thread().eventDispatcher()
+            if dispatcher is not None and "Glib" in dispatcher.metaObject().className():
+                self.log.error("Qt dispatches the GLib default context; set %s=1 to use a D-Bus thread",
+                               qt_no_glib_environment_variable)
+                return False
+        import dbus.mainloop.glib
+        from gi.repository import GLib
+
+        dbus.mainloop.glib.threads_init()
+        self.loop = GLib.MainLoop()
+        started = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(started,), name="dbus-dispatch", daemon=True)
+        self.thread.start()
+        started.wait()
+        self.log.info("D-Bus dispatch moved to thread %s", self.thread.name)
+        return True
+
+    def run(self, started):
+        from gi.repository import GLib
+
+        GLib.idle_add(lambda: started.set() or False)
+        self.loop.run()
+
+    def stop(self):
+        """Stops the thread after delivering the pending callbacks."""
+        if self.thread is None:
+            return
+        from gi.repository import GLib
+
+        GLib.idle_add(lambda: self.loop.quit() or False)
+        self.thread.join()
+        self.thread = None
+        self.flush()
+        # Blocked wait() calls return once the thread is gone.
+        self.wake()
+
+    def is_current(self):
+        """Whether the caller runs on the dispatch thread."""
+        return self.thread is not None and threading.get_ident() == self.thread.ident
+
+    def on_gui_thread(self):
+        if self.bridge is None:
+            return False
+        from PyQt6.QtCore import QCoreApplication, QThread
+
+        application = QCoreApplication.instance()
+        return application is not None and QThread.currentThread() is application.thread()
+
+    def post(self, callback, *args, key=None, merge=None):
+        """Queues a callback for the GUI thread.
+
+        Args:
+            callback: Callable to invoke; nothing is queued if it is not callable.
+            *args: Arguments of the callback.
+            key: Optional coalescing key; a pending callback with the same key is replaced.
+            merge: Optional callable (pending_args, args) returning the arguments that replace both.
+        """
+        if not callable(callback):
+            return
+        with self.lock:
+            self.posted += 1
+            if key is not None and (callback, key) in self.pending:
+                sequence, pending_args = self.pending[(callback, key)]
+                self.pending[(callback, key)] = (sequence, merge(pending_args, args) if merge else args)
+            else:
+                self.next_sequence += 1
+                slot = (callback, key) if key is not None else (callback, ("sequence", self.next_sequence))
+                self.pending[slot] = (self.next_sequence, args)
+            if self.flush_scheduled or self.thread is None:
+                return
+            self.flush_scheduled = True
+        from gi.repository import GLib
+
+        GLib.timeout_add(self.flush_interval_ms, self.flush)
+
+    def flush(self):
+        """Sends the pending callbacks to the GUI thread, in the order they were first posted."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flush_scheduled = False
+        if pending:
+            ordered = sorted(pending.items(), key=lambda item: item[1][0])
+            batch = [(callback, args) for (callback, _), (_, args) in ordered]
+            self.batches += 1
+            if self.bridge is not None:
+                self.bridge.batch_ready.emit(batch)
+            else:
+                self.deliver(batch)
+        return False
+
+    def deliver(self, batch):
+        for callback, args in batch:
+            try:
+                callback(*args)
+            except Exception as error:
+                self.log.error("Callback %s failed: %s", getattr(callback, "__name__", callback), error)
+        self.delivered += len(batch)
+
+    def call_in_gui(self, function, *args):
+        """Calls a function on the GUI thread and waits for its result, e.g. to show a pairing dialog.
+
+        Returns:
+            The function's result.
+        """
+        if self.bridge is None or self.on_gui_thread():
+            return function(*args)
+        request = {"function": function, "args": args, "done": threading.Event(), "result": None, "error": None}
+        self.bridge.call_requested.emit(request)
+        request["done"].wait()
+        if request["error"] is not None:
+            raise request["error"]
+        return request["result"]
+
+    def run_call(self, request):
+        try:
+            request["result"] = request["function"](*request["args"])
+        except Exception as error:
+            request["error"] = error
+        finally:
+            request["done"].set()
+
+    def wake(self):
+        """Wakes up the wait() calls so they re-evaluate their conditions."""
+        with self.condition:
+            self.condition.notify_all()
+        if self.gui_waiters and self.bridge is not None:
+            self.bridge.woken.emit()
+
+    def wait(self, condition, timeout=None):
+        """Waits until a condition holds, re-evaluating it on every wake().
+
+        On the GUI thread a nested Qt event loop keeps the UI running meanwhile, as the nested GLib
+        loops did when D-Bus was dispatched on the GUI thread.
+
+        Args:
+            condition: Callable returning True once the awaited state has been reached.
+            timeout: Maximum time to wait in seconds, or None to wait indefinitely.
+
+        Returns:
+            The final value of the condition.
+        """
+        if condition():
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self.on_gui_thread():
+            with self.condition:
+                self.condition.wait_for(lambda: condition() or self.thread is None, timeout)
+            return bool(condition())
+        from PyQt6.QtCore import QEventLoop, QTimer
+
+        self.gui_waiters += 1
+        try:
+            while not condition():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                loop = QEventLoop()
+                self.bridge.woken.connect(loop.quit)
+                if remaining is not None:
+                    timer = QTimer(loop)
+                    timer.setSingleShot(True)
+                    timer.timeout.connect(loop.quit)
+                    timer.start(int(remaining * 1000) + 1)
+                try:
+                    if not condition():
+                        loop.exec()
+                finally:
+                    self.bridge.woken.disconnect(loop.quit)
+        finally:
+            self.gui_waiters -= 1
+        return bool(condition())
+
+    def get_stats(self):
+        """Returns the number of callbacks posted and delivered, and of batches sent to the GUI thread."""
+        return {"posted": self.posted, "delivered": self.delivered, "batches": self.batches,
+                "pending": len(self.pending)}
@@ -0,0 +1,240 @@
+"""Opt-in tracing of the D-Bus calls made by BluetoothDeviceManager.
+
+TracingBus wraps a bus connection: proxies obtained through its get_object()
+send their method calls (including Properties Get/Set and introspection)
+through the wrapper, which times every call_blocking()/call_async() and
+records the service, path, interface, member, duration, approximate payload
+size and the UI action in progress. DBusTracer exports the records in the
+Chrome trace-event format, which chrome://tracing and Perfetto open, with
+every call nested under the action that issued it.
+
+When tracing is off the manager keeps the plain connection, so untraced
+calls cost nothing extra. Setting BLUETOOTH_DBUS_TRACE to a file path turns
+tracing on for a process and writes the trace there when it exits.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+trace_environment_variable = "BLUETOOTH_DBUS_TRACE"
+
+
+def payload_size(value):
+    """Returns the approximate marshalled size in bytes of a D-Bus value."""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8", errors="replace")) + 5
+    if isinstance(value, dict):
+        return sum(payload_size(key) + payload_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return 4 + sum(payload_size(item) for item in value)
+    if isinstance(value, (bool, int)):
+        return 4 if isinstance(value, bool) or -2 ** 31 <= value < 2 ** 31 else 8
+    if isinstance(value, float):
+        return 8
+    return 0
+
+
+class DBusTracer:
+    """Collects timed D-Bus call records and the UI actions they belong to."""
+
+    def __init__(self, max_events=100000):
+        """Initialize the tracer.
+
+        Args:
+            max_events: Number of records kept; the oldest are dropped first. With 0 nothing is
+                kept and the records only reach on_record.
+        """
+        self.events = deque(maxlen=max_events)
+        self.local = threading.local()
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        self.on_record = None
+
+    def now_us(self):
+        return (time.perf_counter() - self.origin) * 1e6
+
+    def current_action(self):
+        actions = getattr(self.local, "actions", None)
+        return actions[-1] if actions else None
+
+    @contextmanager
+    def action(self, name):
+        """Marks the calls made inside the block as issued by a UI action.
+
+        Args:
+            name: Description of the action, e.g. "connect 00:11:22:33:44:55".
+        """
+        actions = getattr(self.local, "actions", None)
+        if actions is None:
+            actions = self.local.actions = []
+        actions.append(name)
+        start = self.now_us()
+        try:
+            yield
+        finally:
+            actions.pop()
+            self.events.append({"name": name, "cat": "ui", "ph": "X", "ts": start, "dur": self.now_us() - start,
+                                "pid": self.pid, "tid": threading.get_ident(), "args": {"action": name}})
+
+    def record(self, member, start, end, **details):
+        """Adds a call record.
+
+        Args:
+            member: Interface member (method) name, or "get_object".
+            start: Start time in microseconds, from now_us().
+            end: End time in microseconds.
+            **details: service, path, interface, request_bytes, reply_bytes, error and async.
+        """
+        interface = details.get("interface")
+        details["member"] = member
+        details["action"] = self.current_action()
+        self.events.append({"name": f"{interface}.{member}" if interface else member, "cat": "dbus", "ph": "X",
+                            "ts": start, "dur": end - start, "pid": self.pid, "tid": threading.get_ident(),
+                            "args": details})
+        if self.on_record:
+            self.on_record(details)
+
+    def calls(self, action=None):
+        """Returns the D-Bus call records, of every action or of those whose name starts with action."""
+        return [event["args"] for event in list(self.events) if event["cat"] == "dbus"
+                and (action is None or (event["args"]["action"] or "").startswith(action))]
+
+    def get_summary(self, action=None):
+        """Returns per-member call counts and total/max durations, the most expensive first.
+
+        Args:
+            action: Optional prefix of the action names to include.
+        """
+        totals = {}
+        for event in list(self.events):
+            if event["cat"] != "dbus" or (action is not None
+                                          and not (event["args"]["action"] or "").startswith(action)):
+                continue
+            entry = totals.setdefault(event["name"], {"name": event["name"], "calls": 0, "total_ms": 0.0,
+                                                      "max_ms": 0.0, "bytes": 0})
+            entry["calls"] += 1
+            entry["total_ms"] += event["dur"] / 1000
+            entry["max_ms"] = max(entry["max_ms"], event["dur"] / 1000)
+            entry["bytes"] += event["args"].get("request_bytes", 0) + event["args"].get("reply_bytes", 0)
+        return sorted(totals.values(), key=lambda entry: entry["total_ms"], reverse=True)
+
+    def export_chrome_trace(self, file_path):
+        """Writes the records as Chrome trace-event JSON.
+
+        Args:
+            file_path: Path of the trace file.
+
+        Returns:
+            The number of events written.
+        """
+        events = [{"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": "bluetooth test host"}}]
+        events.extend(list(self.events))
+        with open(file_path, "w") as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+        return len(events) - 1
+
+    def clear(self):
+        self.events.clear()
+
+
+class TracingBus:
+    """A bus connection whose method calls are recorded by a DBusTracer.
+
+    Everything but get_object(), call_blocking() and call_async() is passed to the wrapped
+    connection, so signal receivers and name ownership behave as before.
+    """
+
+    def __init__(self, bus, tracer):
+        """Wrap a connection.
+
+        Args:
+            bus: dbus.SystemBus() or dbus.SessionBus() connection.
+            tracer: DBusTracer receiving the records.
+        """
+        self.bus = bus
+        self.tracer = tracer
+
+    def __getattr__(self, name):
+        return getattr(self.bus, name)
+
+    def get_object(self, bus_name=None, object_path=None, introspect=True, follow_name_owner_changes=False,
+                   **kwargs):
+        """Returns a proxy whose calls go through this wrapper."""
+        start = self.tracer.now_us()
+        proxy = self.bus.ProxyObjectClass(self, bus_name, object_path, introspect=introspect,
+                                          follow_name_owner_changes=follow_name_owner_changes, **kwargs)
+        self.tracer.record("get_object", start, self.tracer.now_us(), service=str(bus_name), path=str(object_path))
+        return proxy
+
+    def call_blocking(self, bus_name, object_path, dbus_interface, method, signature, args, timeout=-1.0,
+                      byte_arrays=False, **kwargs):
+        start = self.tracer.now_us()
+        error = None
+        reply = None
+        try:
+            reply = self.bus.call_blocking(bus_name, object_path, dbus_interface, method, signature, args,
+                                           timeout, byte_arrays, **kwargs)
+            return reply
+        except Exception as exception:
+            error = getattr(exception, "get_dbus_name", lambda: type(exception).__name__)()
+            raise
+        finally:
+            self.tracer.record(method, start, self.tracer.now_us(), service=str(bus_name), path=str(object_path),
+                               interface=dbus_interface, request_bytes=payload_size(list(args)),
+                               reply_bytes=payload_size(reply), error=error, asynchronous=False)
+
+    def call_async(self, bus_name, object_path, dbus_interface, method, signature, args, reply_handler,
+                   error_handler, timeout=-1.0, byte_arrays=False, require_main_loop=True, **kwargs):
+        start = self.tracer.now_us()
+        action = self.tracer.current_action()
+        details = {"service": str(bus_name), "path": str(object_path), "interface": dbus_interface,
+                   "request_bytes": payload_size(list(args)), "asynchronous": True}
+
+        def finish(reply_bytes, error):
+            # Replies arrive on the main loop, outside the action that sent the call.
+            actions = getattr(self.tracer.local, "actions", None)
+            if actions is None:
+                actions = self.tracer.local.actions = []
+            actions.append(action)
+            try:
+                self.tracer.record(method, start, self.tracer.now_us(), reply_bytes=reply_bytes, error=error,
+                                   **details)
+            finally:
+                actions.pop()
+
+        def on_reply(*reply):
+            finish(payload_size(list(reply)), None)
+            if reply_handler:
+                reply_handler(*reply)
+
+        def on_error(exception):
+            finish(0, getattr(exception, "get_dbus_name", lambda: type(exception).__name__)())
+            if error_handler:
+                error_handler(exception)
+
+        return self.bus.call_async(bus_name, object_path, dbus_interface, method, signature, args, on_reply,
+                                   on_error, timeout, byte_arrays, require_main_loop, **kwargs)
+
+
+def traced_action(describe):
+    """Decorates a TestApplication method so the D-Bus calls it makes are attributed to a UI action.
+
+    Args:
+        describe: Callable receiving the method's arguments (self included) and returning the action name.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            tracer = getattr(self.bluetooth_device_manager, "dbus_tracer", None)
+            if tracer is None:
+                return method(self, *args, **kwargs)
+            with tracer.action(describe(self, *args, **kwargs)):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,217 @@
+"""Paced DTMF sending over oFono with per-request timestamps.
+
+oFono's VoiceCallManager.SendTones() hands a tone string to the audio
+gateway, which plays the digits back to back at its own rate; HFP offers no
+way to set the tone duration. The scheduler therefore paces digits by
+issuing requests on time: every digit has a period (tone_ms + gap_ms) after
+which the next one may start. Digits whose period matches the gateway's own
+rate (native_period_ms) go out together in a single request, as do digits
+queued without explicit timing; any other digit gets a request of its own.
+A "," in a sequence inserts a pause.
+
+Every request is timestamped (due, sent, replied) so the response latency of
+the gateway and the scheduling lateness can be measured.
+
+Sequences may be queued from any thread while pump() runs on the D-Bus
+dispatch thread; the queues are guarded by a lock that is released while a
+request is being sent.
+"""
+import threading
+import time
+from collections import deque
+
+from libraries.bluetooth.transport_monitor import percentile
+
+valid_tones = "0123456789*#ABCD"
+pause_character = ","
+
+
+class DtmfScheduler:
+    """Queues DTMF sequences per call and sends them paced, coalescing digits where timing allows."""
+
+    def __init__(self, send, schedule, tone_ms=None, gap_ms=None, native_period_ms=200.0, tolerance_ms=10.0,
+                 pause_ms=500.0, max_batch=16, history=1024, on_sent=None, on_finished=None, log=None):
+        """Initialize the scheduler.
+
+        Args:
+            send: Callable (device address, tones) sending one SendTones request, returning True on success.
+            schedule: Callable (delay in seconds, callback) running the callback later on the main loop.
+            tone_ms: Default tone duration; None leaves the pacing to the audio gateway.
+            gap_ms: Default silence after each tone; None leaves the pacing to the audio gateway.
+            native_period_ms: Time the audio gateway takes per digit of a request.
+            tolerance_ms: Largest difference between a digit's period and the native period that still
+                allows coalescing.
+            pause_ms: Duration of a "," pause.
+            max_batch: Maximum number of digits per request.
+            history: Number of request records kept.
+            on_sent: Optional callable invoked with the record of every request.
+            on_finished: Optional callable (sequence id, success, records) invoked when a sequence is done.
+            log: Logger instance.
+        """
+        self.send = send
+        self.schedule = schedule
+        self.tone_ms = tone_ms
+        self.gap_ms = gap_ms
+        self.native_period = native_period_ms / 1000
+        self.tolerance = tolerance_ms / 1000
+        self.pause = pause_ms / 1000
+        self.max_batch = max_batch
+        self.on_sent = on_sent
+        self.on_finished = on_finished
+        self.log = log
+        self.queues = {}
+        self.sequences = {}
+        self.next_sequence = 1
+        self.records = deque(maxlen=history)
+        self.lock = threading.RLock()
+
+    def queue(self, call_path, device_address, tones, tone_ms=None, gap_ms=None):
+        """Queues a digit sequence for a call.
+
+        Args:
+            call_path: D-Bus object path of the call the tones belong to.
+            device_address: Bluetooth address of the device whose modem sends the tones.
+            tones: Digits (0-9, *, #, A-D), with "," for a pause.
+            tone_ms: Tone duration; the scheduler default if None.
+            gap_ms: Silence after each tone; the scheduler default if None.
+
+        Returns:
+            The id of the sequence.
+
+        Raises:
+            ValueError: If the sequence is empty or holds characters that are not DTMF tones.
+        """
+        tones = tones.upper().replace(" ", "")
+        invalid = sorted(set(tones) - set(valid_tones + pause_character))
+        if not tones or invalid:
+            raise ValueError(f"Invalid DTMF sequence {tones!r}")
+        tone_ms = self.tone_ms if tone_ms is None else tone_ms
+        gap_ms = self.gap_ms if gap_ms is None else gap_ms
+        if tone_ms is None and gap_ms is None:
+            period, coalesce = self.native_period, True
+        else:
+            period = ((tone_ms or 0) + (gap_ms or 0)) / 1000
+            coalesce = abs(period - self.native_period) <= self.tolerance
+        with self.lock:
+            sequence_id = self.next_sequence
+            self.next_sequence += 1
+            self.sequences[sequence_id] = {"remaining": len(tones), "records": []}
+            state = self.queues.get(call_path)
+            if state is None:
+                state = self.queues[call_path] = {"device": device_address, "items": deque(), "due": 0.0,
+                                                  "scheduled": False}
+            for tone in tones:
+                if tone == pause_character:
+                    state["items"].append((None, self.pause, False, sequence_id))
+                else:
+                    state["items"].append((tone, period, coalesce, sequence_id))
+            if not state["scheduled"]:
+                state["scheduled"] = True
+                self.schedule(max(0.0, state["due"] - time.monotonic()), lambda: self.pump(call_path, state))
+        return sequence_id
+
+    def pump(self, call_path, state):
+        """Sends the next request of a call once it is due, and schedules the one after."""
+        with self.lock:
+            if self.queues.get(call_path) is not state:
+                return
+            items = state["items"]
+            now = time.monotonic()
+            while items and items[0][0] is None:
+                _, pause, _, sequence_id = items.popleft()
+                state["due"] = max(state["due"], now) + pause
+                self.item_done(sequence_id, None)
+            if not items:
+                state["scheduled"] = False
+                return
+            if now < state["due"]:
+                self.schedule(state["due"] - now, lambda: self.pump(call_path, state))
+                return
+            batch = [items.popleft()]
+            while (batch[0][2] and items and items[0][0] is not None and items[0][2]
+                   and len(batch) < self.max_batch):
+                batch.append(items.popleft())
+        tones = "".join(item[0] for item in batch)
+        sent = time.monotonic()
+        success = bool(self.send(state["device"], tones))
+        replied = time.monotonic()
+        record = {"call": call_path, "device": state["device"], "tones": tones,
+                  "sequences": sorted({item[3] for item in batch}),
+                  "due": state["due"], "sent": sent, "replied": replied,
+                  "response_ms": (replied - sent) * 1000,
+                  "lateness_ms": max(0.0, sent - state["due"]) * 1000 if state["due"] else 0.0,
+                  "success": success}
+        with self.lock:
+            self.records.append(record)
+            if self.on_sent:
+                self.on_sent(record)
+            for item in batch:
+                self.item_done(item[3], record)
+            if not success:
+                self.cancel(call_path)
+                return
+            if self.queues.get(call_path) is not state:
+                return
+            state["due"] = sent + sum(item[1] for item in batch)
+            self.schedule(max(0.0, state["due"] - time.monotonic()), lambda: self.pump(call_path, state))
+
+    def item_done(self, sequence_id, record):
+        sequence = self.sequences.get(sequence_id)
+        if sequence is None:
+            return
+        sequence["remaining"] -= 1
+        if record is not None and (not sequence["records"] or sequence["records"][-1] is not record):
+            sequence["records"].append(record)
+        if record is not None and not record["success"]:
+            self.finish(sequence_id, False)
+        elif sequence["remaining"] == 0:
+            self.finish(sequence_id, True)
+
+    def finish(self, sequence_id, success):
+        sequence = self.sequences.pop(sequence_id, None)
+        if sequence is None:
+            return
+        if self.log:
+            self.log.info("DTMF sequence %d %s after %d requests", sequence_id,
+                          "sent" if success else "failed", len(sequence["records"]))
+        if self.on_finished:
+            self.on_finished(sequence_id, success, sequence["records"])
+
+    def cancel(self, call_path):
+        """Drops the queued digits of a call, e.g. when it has ended.
+
+        Returns:
+            The number of digits dropped.
+        """
+        with self.lock:
+            state = self.queues.pop(call_path, None)
+            if state is None:
+                return 0
+            for sequence_id in sorted({item[3] for item in state["items"]}):
+                self.finish(sequence_id, False)
+            return len(state["items"])
+
+    def pending(self, call_path=None):
+        """Returns the number of queued digits, of one call or of all calls."""
+        with self.lock:
+            return sum(len(state["items"]) for path, state in self.queues.items()
+                       if call_path is None or path == call_path)
+
+    def get_stats(self, call_path=None):
+        """Returns request counts and response/lateness percentiles, of one call or of all calls."""
+        with self.lock:
+            records = [record for record in self.records if call_path is None or record["call"] == call_path]
+        responses = [record["response_ms"] for record in records]
+        lateness = [record["lateness_ms"] for record in records]
+        tones = sum(len(record["tones"]) for record in records)
+        return {
+            "requests": len(records),
+            "tones": tones,
+            "failed": sum(1 for record in records if not record["success"]),
+            "pending": self.pending(call_path),
+            "tones_per_request": tones / len(records) if records else None,
+            "response_p50_ms": percentile(responses, 0.5),
+            "response_p95_ms": percentile(responses, 0.95),
+            "response_max_ms": max(responses) if responses else None,
+            "lateness_p95_ms": percentile(lateness, 0.95),
+        }
@@ -0,0 +1,367 @@
+"""HFP audio (SCO/eSCO) path through oFono.
+
+oFono owns the SCO link of a hands-free connection: a HandsfreeAudioAgent
+registered with org.ofono.HandsfreeAudioManager receives the connected SCO
+socket and the negotiated codec in NewConnection(). ScoStream then moves
+audio over that socket and measures it: the controller clocks SCO packets
+at a fixed interval, so every received packet paces one transmitted packet.
+With CVSD, packets missing from that clock count as lost: a packet that is
+merely late is followed by a burst that makes up for it, so only a deficit
+of received packets that persists over loss_window_packets counts. mSBC
+loss is taken from the gaps in the H2 sequence numbers instead.
+
+With CVSD the kernel converts to 16-bit linear PCM at 8 kHz. mSBC runs in
+transparent mode, so the socket carries 60-byte H2 frames of encoded audio
+at 16 kHz; the stream counts and sequence-checks them but does not decode.
+
+ScoLoopback is a socketpair stand-in for the controller and the remote
+device, for tests without a headset.
+"""
+import queue
+import random
+from collections import deque
+import socket
+import threading
+import time
+
+import dbus
+import dbus.service
+
+audio_manager_interface = "org.ofono.HandsfreeAudioManager"
+audio_card_interface = "org.ofono.HandsfreeAudioCard"
+audio_agent_interface = "org.ofono.HandsfreeAudioAgent"
+hfp_audio_agent_path = "/test/hfp_audio_agent"
+codec_cvsd = 1
+codec_msbc = 2
+codec_names = {codec_cvsd: "CVSD", codec_msbc: "mSBC"}
+codec_specs = {codec_cvsd: {"format": "s16le", "rate": 8000, "channels": 1},
+               codec_msbc: {"format": "s16le", "rate": 16000, "channels": 1}}
+msbc_frame_size = 60
+msbc_frame_duration = 0.0075
+h2_sequence_headers = (0x08, 0x38, 0xC8, 0xF8)
+default_packet_size = 48
+loss_window_packets = 16
+
+
+class HandsfreeAudioAgent(dbus.service.Object):
+    """oFono hands-free audio agent receiving the SCO socket of each new audio connection."""
+
+    def __init__(self, bus, path, on_new_connection, log=None):
+        """Export the agent on the bus.
+
+        Args:
+            bus: D-Bus connection.
+            path: Object path the agent is exported at.
+            on_new_connection: Callable invoked with (card path, socket file descriptor, codec id).
+            log: Logger instance.
+        """
+        super().__init__(bus, path)
+        self.on_new_connection = on_new_connection
+        self.log = log
+
+    @dbus.service.method(audio_agent_interface, in_signature="ohy", out_signature="")
+    def NewConnection(self, card, fd, codec):
+        file_descriptor = fd.take()
+        if self.log:
+            self.log.info("New SCO connection on %s with %s", card, codec_names.get(int(codec), codec))
+        self.on_new_connection(str(card), file_descriptor, int(codec))
+
+    @dbus.service.method(audio_agent_interface, in_signature="", out_signature="")
+    def Release(self):
+        if self.log:
+            self.log.info("Hands-free audio agent released")
+
+
+class ScoStream:
+    """Streams audio over a connected SCO socket and keeps latency and loss counters.
+
+    Provides write(data)/drain() and read_into(buffer), so it can be used as both the sink
+    and the capture stream of the audio measurement harness.
+    """
+
+    def __init__(self, sock, codec=codec_cvsd, packet_size=None, log=None, capture_limit=1 << 20):
+        """Start the receive/transmit thread.
+
+        Args:
+            sock: Connected SCO socket (or a stand-in such as ScoLoopback's).
+            codec: oFono codec id, codec_cvsd or codec_msbc.
+            packet_size: Size of SCO packets; the socket MTU is used when None.
+            log: Logger instance.
+            capture_limit: Maximum number of received bytes kept for read_into().
+        """
+        self.sock = sock
+        self.codec = codec
+        self.spec = codec_specs[codec]
+        self.log = log
+        if packet_size is None:
+            packet_size = msbc_frame_size if codec == codec_msbc else self.socket_mtu(default_packet_size)
+        self.packet_size = packet_size
+        self.packet_interval = (msbc_frame_duration if codec == codec_msbc
+                                else packet_size / (self.spec["rate"] * 2))
+        self.silence = bytes(packet_size)
+        self.pending = bytearray()
+        self.pending_lock = threading.Lock()
+        self.drained = threading.Condition(self.pending_lock)
+        self.captured = queue.Queue()
+        self.capture_buffer = bytearray()
+        self.capture_limit = capture_limit
+        self.capture_bytes = 0
+        self.capture_paused = False
+        self.stop_event = threading.Event()
+        self.started = time.monotonic()
+        self.stopped = None
+        self.error = None
+        self.packets_received = 0
+        self.packets_sent = 0
+        self.packets_lost = 0
+        self.sequence_errors = 0
+        self.late_packets = 0
+        self.underruns = 0
+        self.last_arrival = None
+        self.last_sequence = None
+        self.clock_offset = None
+        self.deficits = deque(maxlen=loss_window_packets)
+        self.max_interval = 0.0
+        self.jitter = 0.0
+        self.thread = threading.Thread(target=self.run, name="sco-stream", daemon=True)
+        self.thread.start()
+
+    def socket_mtu(self, default):
+        try:
+            sol_sco, sco_options = 17, 1
+            options = self.sock.getsockopt(sol_sco, sco_options, 4)
+            return int.from_bytes(options[:2], "little") or default
+        except OSError:
+            return default
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    packet = self.sock.recv(self.packet_size)
+                except socket.timeout:
+                    continue
+                if not packet:
+                    break
+                self.packet_received(packet, time.monotonic())
+                self.sock.send(self.next_packet())
+                self.packets_sent += 1
+        except OSError as error:
+            if not self.stop_event.is_set():
+                self.error = error
+                if self.log:
+                    self.log.error("SCO stream error: %s", error)
+        finally:
+            self.stopped = time.monotonic()
+            with self.drained:
+                self.drained.notify_all()
+            self.captured.put(None)
+
+    def packet_received(self, packet, now):
+        self.packets_received += 1
+        if self.last_arrival is not None:
+            interval = now - self.last_arrival
+            self.max_interval = max(self.max_interval, interval)
+            self.jitter += (abs(interval - self.packet_interval) - self.jitter) / 16
+            if round(interval / self.packet_interval) > 1:
+                self.late_packets += 1
+        self.last_arrival = now
+        if self.codec != codec_msbc:
+            # Arrival time minus the time the received packets take on the SCO clock: it only
+            # grows for good when packets are missing.
+            offset = now - (self.packets_received - 1) * self.packet_interval
+            self.clock_offset = offset if self.clock_offset is None else min(self.clock_offset, offset)
+            self.deficits.append((offset - self.clock_offset) / self.packet_interval)
+            if len(self.deficits) == self.deficits.maxlen:
+                self.packets_lost = max(self.packets_lost, round(min(self.deficits)))
+        if self.codec == codec_msbc and len(packet) >= 2 and packet[0] == 0x01:
+            if packet[1] in h2_sequence_headers:
+                sequence = h2_sequence_headers.index(packet[1])
+                if self.last_sequence is not None:
+                    missed = (sequence - self.last_sequence - 1) % len(h2_sequence_headers)
+                    self.packets_lost += missed
+                    self.sequence_errors += 1 if missed else 0
+                self.last_sequence = sequence
+        if self.capture_paused:
+            # The reply to this packet is the first one carrying written audio.
+            with self.pending_lock:
+                self.capture_paused = not self.pending
+        if self.capture_bytes < self.capture_limit and not self.capture_paused:
+            self.capture_bytes += len(packet)
+            self.captured.put(packet)
+
+    def next_packet(self):
+        with self.pending_lock:
+            if self.pending:
+                self.capture_paused = False
+            if len(self.pending) >= self.packet_size:
+                packet = bytes(self.pending[:self.packet_size])
+                del self.pending[:self.packet_size]
+            else:
+                if self.pending:
+                    self.underruns += 1
+                packet = bytes(self.pending) + self.silence[len(self.pending):]
+                self.pending.clear()
+            if not self.pending:
+                self.drained.notify_all()
+        return packet
+
+    def write(self, data):
+        """Queues audio to send; it goes out one packet per received packet."""
+        with self.pending_lock:
+            self.pending += data
+
+    def drain(self, timeout=None):
+        """Waits until every queued byte has been sent."""
+        with self.drained:
+            self.drained.wait_for(lambda: not self.pending or self.stopped is not None, timeout)
+
+    def read_into(self, buffer):
+        """Fills buffer with received audio, blocking until enough has arrived.
+
+        Returns:
+            The number of bytes copied, less than requested once the stream has ended.
+        """
+        while len(self.capture_buffer) < len(buffer):
+            packet = self.captured.get()
+            if packet is None:
+                self.captured.put(None)
+                break
+            self.capture_buffer += packet
+            self.capture_bytes -= len(packet)
+        size = min(len(buffer), len(self.capture_buffer))
+        buffer[:size] = self.capture_buffer[:size]
+        del self.capture_buffer[:size]
+        return size
+
+    def flush(self):
+        with self.pending_lock:
+            self.pending.clear()
+
+    def discard_captured(self):
+        """Drops received audio nobody has read yet and pauses the capture until written audio goes out.
+
+        The next read then starts with the packet the first packet of written audio is sent in
+        reply to, which is where a loopback measurement's latency is counted from.
+        """
+        with self.pending_lock:
+            self.capture_paused = not self.pending
+        while True:
+            try:
+                packet = self.captured.get_nowait()
+            except queue.Empty:
+                break
+            if packet is None:
+                self.captured.put(None)
+                break
+            self.capture_bytes -= len(packet)
+        self.capture_buffer.clear()
+
+    def get_stats(self):
+        """Returns packet, loss and timing counters of the stream."""
+        elapsed = (self.stopped or time.monotonic()) - self.started
+        expected = self.packets_received + self.packets_lost
+        return {
+            "codec": codec_names.get(self.codec, self.codec),
+            "packet_size": self.packet_size,
+            "packet_interval_ms": self.packet_interval * 1000,
+            "packets_received": self.packets_received,
+            "packets_sent": self.packets_sent,
+            "packets_lost": self.packets_lost,
+            "loss_percent": 100.0 * self.packets_lost / expected if expected else 0.0,
+            "late_packets": self.late_packets,
+            "sequence_errors": self.sequence_errors,
+            "underruns": self.underruns,
+            "jitter_ms": self.jitter * 1000,
+            "max_interval_ms": self.max_interval * 1000,
+            "elapsed_s": elapsed,
+            "error": str(self.error) if self.error is not None else None,
+        }
+
+    def close(self, timeout=2):
+        """Stops the stream and closes the socket, which drops the SCO link."""
+        self.stop_event.set()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        if self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+        self.sock.close()
+
+
+class ScoLoopback:
+    """Stand-in for a controller and remote device at the far end of a socketpair.
+
+    Sends a packet every packet interval, like a controller clocking SCO, and sends back
+    what it receives after a fixed delay, optionally dropping packets.
+    """
+
+    def __init__(self, codec=codec_cvsd, packet_size=None, delay_ms=30.0, loss_rate=0.0, seed=None):
+        """Create the socket pair and start the far end.
+
+        Args:
+            codec: oFono codec id, codec_cvsd or codec_msbc.
+            packet_size: Size of SCO packets.
+            delay_ms: Time audio takes to come back.
+            loss_rate: Probability for each packet of being dropped.
+            seed: Seed of the random generator used for losses.
+        """
+        self.codec = codec
+        self.packet_size = packet_size or (msbc_frame_size if codec == codec_msbc else default_packet_size)
+        self.interval = msbc_frame_duration if codec == codec_msbc else self.packet_size / (
+            codec_specs[codec]["rate"] * 2)
+        self.delay_packets = max(0, round(delay_ms / 1000 / self.interval))
+        self.loss_rate = loss_rate
+        self.random = random.Random(seed)
+        self.near, self.far = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.far.settimeout(0)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="sco-loopback", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        delay_line = [bytes(self.packet_size)] * self.delay_packets
+        sequence = 0
+        next_time = time.monotonic()
+        while not self.stop_event.is_set():
+            while True:
+                try:
+                    packet = self.far.recv(self.packet_size)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError:
+                    return
+                if not packet:
+                    return
+                delay_line.append(packet)
+            packet = delay_line.pop(0) if delay_line else bytes(self.packet_size)
+            if self.codec == codec_msbc:
+                packet = bytes((0x01, h2_sequence_headers[sequence % 4])) + packet[2:]
+            sequence += 1
+            if self.random.random() >= self.loss_rate:
+                try:
+                    self.far.send(packet)
+                except OSError:
+                    return
+            next_time += self.interval
+            time.sleep(max(0.0, next_time - time.monotonic()))
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join(1)
+        self.far.close()
+
+
+def open_loopback_stream(codec=codec_cvsd, delay_ms=30.0, loss_rate=0.0, log=None):
+    """Returns a ScoStream connected to a ScoLoopback, and the loopback."""
+    loopback = ScoLoopback(codec, delay_ms=delay_ms, loss_rate=loss_rate)
+    stream = ScoStream(loopback.near, codec, packet_size=loopback.packet_size, log=log)
+    return stream, loopback
+
+
+def socket_from_fd(file_descriptor):
+    """Wraps a SCO socket file descriptor received from oFono in a socket object."""
+    sock = socket.socket(fileno=file_descriptor)
+    sock.settimeout(1.0)
+    return sock
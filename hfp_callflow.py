@@ -0,0 +1,275 @@
+"""Scripted HFP call flows with per-step latency measurement.
+
+A flow is a list of steps. Each step runs one call-control action of the
+device manager (dial_number, answer_call, hold_and_answer, swap_calls,
+create_multiparty, release_and_answer, hangup_multiparty, ...) and names
+the oFono call states it must lead to, for example:
+
+    {"action": "dial", "number": "+15550100", "call": "a", "expect": {"a": "active"}}
+    {"action": "incoming", "call": "b", "expect": {"a": "active", "b": "waiting"}}
+    {"action": "hold_and_answer", "expect": {"a": "held", "b": "active"}}
+
+Calls are referred to by labels: a step with a "call" label binds it to the
+call that appears while the step runs. An expected state of "gone" means the
+call must have been removed. The runner waits for the expected states with
+the manager's wait_for_condition(), which the CallAdded, CallRemoved and
+VoiceCall PropertyChanged signals wake up, so no step sleeps; the time from
+issuing the action to reaching the states is the step latency. With a
+real phone an outgoing call only becomes active once the remote party
+answers, so flows for hardware usually expect "alerting" after a dial.
+"""
+import json
+import time
+
+from libraries.bluetooth.transport_monitor import percentile
+
+call_gone = "gone"
+actions = {
+    "dial": "dial_number",
+    "dial_last": "dial_last",
+    "dial_memory": "dial_memory",
+    "answer": "answer_call",
+    "hold_and_answer": "hold_and_answer",
+    "swap_calls": "swap_calls",
+    "release_and_answer": "release_and_answer",
+    "release_and_swap": "release_and_swap",
+    "create_multiparty": "create_multiparty",
+    "hangup_multiparty": "hangup_multiparty",
+    "transfer_calls": "transfer_calls",
+    "hangup_all": "hangup_all_calls",
+    "incoming": None,
+    "wait": None,
+}
+
+flows = {
+    "outgoing": [
+        {"action": "dial", "number": "+15550100", "call": "a", "expect": {"a": "active"}},
+        {"action": "hangup_all", "expect": {"a": call_gone}},
+    ],
+    "incoming": [
+        {"action": "incoming", "number": "+15550101", "call": "a", "expect": {"a": "incoming"}},
+        {"action": "answer", "expect": {"a": "active"}},
+        {"action": "hangup_all", "expect": {"a": call_gone}},
+    ],
+    "call_waiting": [
+        {"action": "dial", "number": "+15550100", "call": "a", "expect": {"a": "active"}},
+        {"action": "incoming", "number": "+15550101", "call": "b", "expect": {"a": "active", "b": "waiting"}},
+        {"action": "release_and_answer", "expect": {"a": call_gone, "b": "active"}},
+        {"action": "hangup_all", "expect": {"b": call_gone}},
+    ],
+    "three_way": [
+        {"action": "dial", "number": "+15550100", "call": "a", "expect": {"a": "active"}},
+        {"action": "incoming", "number": "+15550101", "call": "b", "expect": {"a": "active", "b": "waiting"}},
+        {"action": "hold_and_answer", "expect": {"a": "held", "b": "active"}},
+        {"action": "swap_calls", "expect": {"a": "active", "b": "held"}},
+        {"action": "create_multiparty", "expect": {"a": "active", "b": "active"}},
+        {"action": "hangup_multiparty", "expect": {"a": call_gone, "b": call_gone}},
+    ],
+}
+
+
+def load_flow(flow):
+    """Returns the steps of a flow, checking that every step can be run.
+
+    Args:
+        flow: Name of a built-in flow, path of a JSON file holding a list of steps, or a list of steps.
+
+    Raises:
+        ValueError: If the flow is unknown or a step is malformed.
+    """
+    if isinstance(flow, str):
+        if flow in flows:
+            flow = flows[flow]
+        else:
+            try:
+                with open(flow) as flow_file:
+                    flow = json.load(flow_file)
+            except (OSError, ValueError) as error:
+                raise ValueError(f"Unknown call flow {flow!r}: {error}") from None
+    steps = []
+    for index, step in enumerate(flow):
+        if step.get("action") not in actions:
+            raise ValueError(f"Step {index} has unknown action {step.get('action')!r}")
+        if not step.get("expect"):
+            raise ValueError(f"Step {index} ({step['action']}) expects no call state")
+        steps.append(dict(step, name=step.get("name", f"{index}:{step['action']}")))
+    return steps
+
+
+class StepFailed(Exception):
+    """Raised when a step's action fails or its call states are not reached in time."""
+
+
+class CallFlowRunner:
+    """Runs a call flow through a device manager and collects the latency of every step."""
+
+    def __init__(self, manager, device_address, flow, timeout=10.0, incoming_call=None, log=None):
+        """Initialize the runner.
+
+        Args:
+            manager: BluetoothDeviceManager whose HFP manager is set up for the device.
+            device_address: Bluetooth address of remote device.
+            flow: Name of a built-in flow, path of a JSON flow file, or a list of steps.
+            timeout: Maximum time in seconds a step may take to reach its expected call states.
+            incoming_call: Optional callable (number) making a call come in; without it, incoming
+                steps wait for a real call.
+            log: Logger instance.
+        """
+        self.manager = manager
+        self.device_address = device_address
+        self.flow_name = flow if isinstance(flow, str) else "custom"
+        self.steps = load_flow(flow)
+        self.timeout = timeout
+        self.incoming_call = incoming_call
+        self.log = log
+        self.latencies = {step["name"]: [] for step in self.steps}
+        self.action_latencies = {step["name"]: [] for step in self.steps}
+        self.step_failures = {step["name"]: 0 for step in self.steps}
+        self.failures = []
+
+    def run(self, iterations=1):
+        """Runs the flow a number of times, clearing the calls of the device between runs.
+
+        Returns:
+            The latency report, see report().
+        """
+        started = time.monotonic()
+        completed = 0
+        for iteration in range(iterations):
+            if not self.clear_calls():
+                self.failures.append({"iteration": iteration, "step": None, "reason": "calls left over"})
+                break
+            try:
+                self.run_once()
+                completed += 1
+            except StepFailed as error:
+                step_name, reason = error.args
+                self.step_failures[step_name] += 1
+                self.failures.append({"iteration": iteration, "step": step_name, "reason": reason})
+                if self.log:
+                    self.log.warning("Call flow %s failed at %s in iteration %d: %s",
+                                     self.flow_name, step_name, iteration, reason)
+        self.clear_calls()
+        return self.report(iterations, completed, time.monotonic() - started)
+
+    def run_once(self):
+        labels = {}
+        for step in self.steps:
+            known = set(self.manager.get_call_states(self.device_address))
+            if step["action"] != "wait" and not step.get("call") and self.states_reached(step["expect"], labels):
+                raise StepFailed(step["name"], f"expected {step['expect']} already holds before the action")
+            start = time.monotonic()
+            result = self.perform(step)
+            action_done = time.monotonic()
+            if result is False or result == []:
+                raise StepFailed(step["name"], f"{step['action']} failed")
+            if step.get("call") and step["action"] in ("dial", "dial_last", "dial_memory") and result:
+                labels[step["call"]] = str(result)
+
+            def reached():
+                if step.get("call") and step["call"] not in labels:
+                    new_calls = [path for path in self.manager.get_call_states(self.device_address)
+                                 if path not in known]
+                    if not new_calls:
+                        return False
+                    labels[step["call"]] = new_calls[0]
+                return self.states_reached(step["expect"], labels)
+
+            if not self.manager.wait_for_condition(reached, self.timeout):
+                raise StepFailed(step["name"], f"expected {step['expect']}, calls are {self.describe_calls(labels)}")
+            end = time.monotonic()
+            self.action_latencies[step["name"]].append((action_done - start) * 1000)
+            self.latencies[step["name"]].append((end - start) * 1000)
+
+    def perform(self, step):
+        action = step["action"]
+        if action == "wait":
+            return True
+        if action == "incoming":
+            if self.incoming_call:
+                self.incoming_call(step.get("number", "+15550101"))
+            elif self.log:
+                self.log.info("Waiting for an incoming call on %s", self.device_address)
+            return True
+        method = getattr(self.manager, actions[action])
+        if action == "dial":
+            return method(self.device_address, step["number"])
+        if action == "dial_memory":
+            return method(self.device_address, step["memory_position"])
+        return method(self.device_address)
+
+    def states_reached(self, expect, labels):
+        states = self.manager.get_call_states(self.device_address)
+        for label, state in expect.items():
+            path = labels.get(label)
+            if path is None:
+                return False
+            if states.get(path, call_gone) != state:
+                return False
+        return True
+
+    def describe_calls(self, labels):
+        states = self.manager.get_call_states(self.device_address)
+        names = {path: label for label, path in labels.items()}
+        return {names.get(path, path): state for path, state in states.items()}
+
+    def clear_calls(self):
+        """Hangs up every call of the device and waits until oFono has removed them."""
+        if not self.manager.get_call_states(self.device_address):
+            return True
+        self.manager.hangup_all_calls(self.device_address)
+        return self.manager.wait_for_condition(lambda: not self.manager.get_call_states(self.device_address),
+                                               self.timeout)
+
+    def report(self, iterations, completed, elapsed):
+        """Returns the latency percentiles of every step.
+
+        Returns:
+            A dictionary with the flow, the number of iterations run and completed, the failures,
+            and for every step the number of samples and p50/p95/p99/max/mean latency in milliseconds
+            from issuing the action to reaching the expected call states, plus the p50 of the
+            action's D-Bus method call alone.
+        """
+        steps = []
+        for step in self.steps:
+            values = self.latencies[step["name"]]
+            steps.append({
+                "name": step["name"],
+                "action": step["action"],
+                "samples": len(values),
+                "failures": self.step_failures[step["name"]],
+                "p50_ms": percentile(values, 0.5),
+                "p95_ms": percentile(values, 0.95),
+                "p99_ms": percentile(values, 0.99),
+                "max_ms": max(values) if values else None,
+                "mean_ms": sum(values) / len(values) if values else None,
+                "action_p50_ms": percentile(self.action_latencies[step["name"]], 0.5),
+            })
+        return {
+            "flow": self.flow_name,
+            "device": self.device_address,
+            "iterations": iterations,
+            "completed": completed,
+            "failure_count": len(self.failures),
+            "failures": self.failures[:20],
+            "elapsed_s": elapsed,
+            "steps": steps,
+        }
+
+
+def format_report(report):
+    """Formats a latency report as a text table."""
+    lines = [f"Flow {report['flow']} on {report['device']}: {report['completed']}/{report['iterations']} "
+             f"iterations completed in {report['elapsed_s']:.1f} s"]
+    lines.append(f"{'step':<24} {'n':>5} {'fail':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'call p50':>9}")
+
+    def ms(value):
+        return "-" if value is None else f"{value:.1f}"
+
+    for step in report["steps"]:
+        lines.append(f"{step['name']:<24} {step['samples']:>5} {step['failures']:>5} {ms(step['p50_ms']):>8} "
+                     f"{ms(step['p95_ms']):>8} {ms(step['p99_ms']):>8} {ms(step['max_ms']):>8} "
+                     f"{ms(step['action_p50_ms']):>9}")
+    for failure in report["failures"]:
+        lines.append(f"iteration {failure['iteration']}: {failure['step']}: {failure['reason']}")
+    return "\n".join(lines)
@@ -1,12 +1,18 @@
 import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from PyQt6.QtCore import QCoreApplication, QPropertyAnimation, QEasingCurve, QParallelAnimationGroup
+from PyQt6.QtCore import QObject
 from PyQt6.QtCore import Qt
+from PyQt6.QtCore import pyqtSignal
 from PyQt6.QtCore import QFileSystemWatcher
 from PyQt6.QtCore import QTimer
 from PyQt6.QtGui import QColor
 from PyQt6.QtGui import QFont
+from PyQt6.QtGui import QKeySequence
+from PyQt6.QtGui import QShortcut
 from PyQt6.QtWidgets import QCheckBox, QInputDialog, QToolButton, QGraphicsDropShadowEffect
 from PyQt6.QtWidgets import QComboBox
 from PyQt6.QtWidgets import QDialog
@@ -37,9 +43,69 @@ from PyQt6.QtWidgets import QWidget
 import style_sheet as styles
 from libraries.bluetooth import constants
 from libraries.bluetooth.bluez import BluetoothDeviceManager
-from Utils.utils import get_controller_interface_details
+from libraries.bluetooth.bt_worker import RemoteDeviceManager, worker_environment_variable
+from libraries.bluetooth.dbus_thread import prepare_qt_environment
+from libraries.bluetooth.dbus_trace import traced_action
+from libraries.bluetooth.ui_watchdog import EventLoopWatchdog, HandlerProfiler, watched_handler
+from libraries.bluetooth.ui_watchdog import profile_environment_variable, profile_modes, profile_shortcut
 from Utils.utils import validate_bluetooth_address
 
+log_tail_bytes = 256 * 1024
+
+# Importing the UI precedes creating the QApplication, which reads QT_NO_GLIB.
+prepare_qt_environment()
+
+
+def read_log_tail(file_path, max_bytes=log_tail_bytes):
+    """Reads the last part of a log file without loading the whole file.
+
+    Args:
+        file_path: Path to the log file.
+        max_bytes: Maximum number of bytes to read from the end of the file.
+
+    Returns:
+        A tuple of the tail content and the file position at which it ends.
+    """
+    with open(file_path, "rb") as log_file:
+        log_file.seek(0, os.SEEK_END)
+        end_position = log_file.tell()
+        start_position = max(0, end_position - max_bytes)
+        log_file.seek(start_position)
+        content = log_file.read(end_position - start_position)
+    if start_position > 0:
+        content = content.partition(b"\n")[2]
+    return content.decode("utf-8", errors="replace"), end_position
+
+
+class StartupLoader(QObject):
+    """Runs startup stages on a thread pool and hands their results back to the GUI thread."""
+
+    stage_finished = pyqtSignal(str, object)
+
+    def __init__(self, max_workers=4):
+        """Initialize the loader.
+
+        Args:
+            max_workers: Number of stages that may run in parallel.
+        """
+        super().__init__()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="startup")
+
+    def submit(self, stage, function, *args):
+        """Schedules a startup stage. stage_finished is emitted with its future once it completes.
+
+        Args:
+            stage: Name of the stage.
+            function: Callable that performs the stage off the GUI thread.
+            *args: Arguments passed to the callable.
+        """
+        future = self.executor.submit(function, *args)
+        future.add_done_callback(lambda done: self.stage_finished.emit(stage, done))
+
+    def shutdown(self):
+        """Stops accepting new stages once the pending ones are done."""
+        self.executor.shutdown(wait=False)
+
 
 class TestApplication(QWidget):
     """Main GUI class for the Bluetooth Test Host."""
@@ -67,7 +133,12 @@ class TestApplication(QWidget):
         self.ofonod_log_file_path = ofonod_log_file_path
         self.hcidump_log_name = hcidump_log_name
         self.back_callback = back_callback
-        self.bluetooth_device_manager = BluetoothDeviceManager(log=self.log, interface=self.interface)
+        worker = os.environ.get(worker_environment_variable)
+        if worker:
+            self.bluetooth_device_manager = RemoteDeviceManager(log=self.log, interface=self.interface,
+                                                                socket_path=worker if os.path.sep in worker else None)
+        else:
+            self.bluetooth_device_manager = BluetoothDeviceManager(log=self.log, interface=self.interface)
         self.paired_devices = {}
         self.main_grid_layout = None
         self.gap_button = None
@@ -83,13 +154,159 @@ class TestApplication(QWidget):
         self.selected_profiles = {}
         self.device_tabs_map = {}
         self.device_states = {}
+        self.startup_started = time.monotonic()
+        self.startup_timeline = []
+        self.pending_startup_stages = set()
+        self.controller_detail_labels = {}
+        self.startup_loader = StartupLoader()
+        self.startup_loader.stage_finished.connect(self.handle_startup_stage)
         self.setup_pairing_status_listener()
+        self.bluetooth_device_manager.on_connection_timing = self.handle_connection_timing
+        self.bluetooth_device_manager.on_transport_update = self.handle_transport_update
+        self.bluetooth_device_manager.on_device_update = self.handle_device_update
+        self.bluetooth_device_manager.on_dtmf_finished = self.handle_dtmf_finished
+        self.ui_watchdog = EventLoopWatchdog(self.log)
+        profile_mode = os.environ.get(profile_environment_variable)
+        if profile_mode and profile_mode not in profile_modes:
+            self.log.warning("Ignoring %s=%s, expected one of %s", profile_environment_variable, profile_mode,
+                             ", ".join(profile_modes))
+            profile_mode = None
+        self.handler_profiler = HandlerProfiler(self.log, os.path.join(self.log_path, "profiles"),
+                                                mode=profile_mode or "cprofile")
+        if profile_mode:
+            self.handler_profiler.toggle(True)
+        self.profiler_shortcut = QShortcut(QKeySequence(profile_shortcut), self)
+        self.profiler_shortcut.activated.connect(self.toggle_handler_profiling)
         self.initialize_host_ui()
+        self.mark_startup_stage("frame_built")
+        QTimer.singleShot(0, self.start_deferred_loading)
+        self.ui_watchdog.start()
+
+    def record_log_ingest(self, log_name, content):
+        """Counts text read from a followed daemon log in the manager's metrics, if they are on.
+
+        Args:
+            log_name: Name of the log (e.g. 'bluetoothd').
+            content: Text read from the log.
+        """
+        metrics = self.bluetooth_device_manager.metrics
+        if metrics:
+            metrics.observe_log(log_name, content)
+
+    def toggle_handler_profiling(self):
+        """Switches profiling of the watched handlers on or off and logs the event-loop latency so far."""
+        self.handler_profiler.toggle()
+        self.log.info("Event loop: %s", self.ui_watchdog.get_stats())
+
+    def mark_startup_stage(self, stage):
+        """Records a startup stage in the startup timeline.
+
+        Args:
+            stage: Name of the stage that has just completed.
+        """
+        elapsed_ms = (time.monotonic() - self.startup_started) * 1000
+        self.startup_timeline.append((stage, elapsed_ms))
+        self.log.debug("Startup stage %s reached at %.1f ms", stage, elapsed_ms)
+
+    def start_deferred_loading(self):
+        """Loads controller details, paired devices and log tails in parallel once the first frame is shown."""
+        self.mark_startup_stage("first_frame")
+        stages = {
+            "controller_details": (self.bluetooth_device_manager.get_adapter_details,),
+            "paired_devices": (self.bluetooth_device_manager.get_paired_devices,),
+            "bluetoothd_log": (read_log_tail, self.bluetoothd_log_file_path),
+            "pulseaudio_log": (read_log_tail, self.pulseaudio_log_file_path),
+            "hci_log": (read_log_tail, self.hcidump_log_name),
+            "obexd_log": (read_log_tail, self.obexd_log_file_path),
+            "ofonod_log": (read_log_tail, self.ofonod_log_file_path),
+        }
+        self.pending_startup_stages = set(stages)
+        for stage, (function, *args) in stages.items():
+            self.startup_loader.submit(stage, function, *args)
+
+    def handle_startup_stage(self, stage, future):
+        """Fills in the UI with the result of a background startup stage.
+
+        Args:
+            stage: Name of the completed stage.
+            future: Future holding the stage result.
+        """
+        try:
+            result = future.result()
+        except Exception as error:
+            self.log.error("Startup stage %s failed: %s", stage, error)
+            result = None
+        if result is not None:
+            if stage == "controller_details":
+                self.populate_controller_details(result)
+            elif stage == "paired_devices":
+                self.populate_paired_devices(result)
+            else:
+                self.populate_log_tail(stage, *result)
+        self.mark_startup_stage(stage)
+        self.pending_startup_stages.discard(stage)
+        if not self.pending_startup_stages:
+            self.startup_loader.shutdown()
+            self.log.info("Startup timeline: %s",
+                          ", ".join(f"{name}={elapsed:.1f}ms" for name, elapsed in self.startup_timeline))
+
+    def populate_controller_details(self, details):
+        """Updates the controller details panel.
+
+        Args:
+            details: Dictionary of controller details returned by the Bluetooth device manager.
+        """
+        values = {
+            "Controller Name": details.get("Name", "N/A"),
+            "Controller Address": details.get("BD_ADDR", "N/A"),
+            "Class": details.get("Class", "N/A"),
+            "Discoverable": str(details.get("Discoverable", "N/A")),
+            "Pairable": str(details.get("Pairable", "N/A")),
+            "HCI Version": details.get("HCI Version", "N/A"),
+            "Manufacturer": details.get("Manufacturer", "N/A"),
+        }
+        for label, value in values.items():
+            self.controller_detail_labels[label].setText(value)
+
+    def populate_log_tail(self, stage, content, position):
+        """Shows the tail of a log file and starts following it from where the tail ends.
+
+        Args:
+            stage: Name of the log stage (e.g. 'bluetoothd_log').
+            content: Tail content of the log file.
+            position: File position at which the tail ends.
+        """
+        prefix = stage[:-len("_log")]
+        text_browser = {
+            "bluetoothd": self.bluetoothd_log_text_browser,
+            "pulseaudio": self.pulseaudio_log_text_browser,
+            "hci": self.hci_dump_log_text_browser,
+            "obexd": self.obexd_log_text_browser,
+            "ofonod": self.ofonod_log_text_browser,
+        }[prefix]
+        file_path = {
+            "bluetoothd": self.bluetoothd_log_file_path,
+            "pulseaudio": self.pulseaudio_log_file_path,
+            "hci": self.hcidump_log_name,
+            "obexd": self.obexd_log_file_path,
+            "ofonod": self.ofonod_log_file_path,
+        }[prefix]
+        text_browser.append(content)
+        setattr(self, f"{prefix}_file_position", position)
+        setattr(self, f"{prefix}_log_file_fd", open(file_path, "r"))
 
     def load_paired_devices(self):
         """Loads and displays all paired Bluetooth devices into the profiles list widget."""
+        self.populate_paired_devices(self.bluetooth_device_manager.get_paired_devices())
+
+    def populate_paired_devices(self, paired_devices):
+        """Displays paired Bluetooth devices in the profiles list widget.
+
+        Args:
+            paired_devices: Dictionary of paired device addresses to names.
+        """
         list_index = self.profiles_list_widget.count() - 1
-        self.paired_devices = self.bluetooth_device_manager.get_paired_devices()
+        self.paired_devices = paired_devices
         unique_devices = set(self.paired_devices.keys())
         for device_address in unique_devices:
             device_item = QListWidgetItem(device_address)
@@ -105,6 +322,9 @@ class TestApplication(QWidget):
             row: The row index in the grid layout where this entry should be placed.
             label: The text label to describe the data.
             value: The corresponding value to display alongside the label.
+
+        Returns:
+            The value label, so it can be updated later.
         """
         label_widget = QLabel(label)
         label_widget.setFont(QFont("Arial", 10, QFont.Weight.Bold))
@@ -116,6 +336,7 @@ class TestApplication(QWidget):
         value_widget.setStyleSheet(styles.color_style_sheet)
         self.grid.addWidget(label_widget, row, 0)
         self.grid.addWidget(value_widget, row, 1)
+        return value_widget
 
     def set_discoverable_mode(self, enable):
         """Enable or disable discoverable mode on the Bluetooth adapter.
@@ -126,8 +347,8 @@ class TestApplication(QWidget):
         if enable:
             self.set_discoverable_on_button.setEnabled(False)
             self.set_discoverable_off_button.setEnabled(True)
-            self.bluetooth_device_manager.set_discoverable_mode(True)
             timeout = int(self.discoverable_timeout_input.text())
+            self.bluetooth_device_manager.set_discoverable_mode(True, timeout=timeout)
             if timeout > 0:
                 self.discoverable_timeout_timer = QTimer()
                 self.discoverable_timeout_timer.timeout.connect(lambda: self.set_discoverable_mode(False))
@@ -284,6 +505,8 @@ class TestApplication(QWidget):
                 widget.setParent(None)
                 widget.deleteLater()
 
+    @traced_action(lambda self, profile_name=None: f"select {(profile_name or 'list item').strip()}")
+    @watched_handler
     def handle_profile_selection(self, profile_name=None):
         """Handles profile selection from either the list or a button.
 
@@ -414,6 +637,9 @@ class TestApplication(QWidget):
         self.device_address_sink = device_address
         role = self.bluetooth_device_manager.get_a2dp_role_for_device(device_address)
         self.log.debug("A2DP role for %s:%s", device_address, role)
+        codec_label = QLabel(self.describe_a2dp_codecs(device_address))
+        codec_label.setWordWrap(True)
+        layout.addWidget(codec_label)
         if role in ["source"]:
             self.create_a2dp_sink_ui(layout, bold_font)
         if role in ["sink"]:
@@ -423,6 +649,28 @@ class TestApplication(QWidget):
         widget.setLayout(layout)
         return widget
 
+    def describe_a2dp_codecs(self, device_address):
+        """Returns a one-line summary of the negotiated and supported A2DP codecs of a device.
+
+        Args:
+             device_address: The Bluetooth address of the device.
+        """
+        inspection = self.bluetooth_device_manager.inspect_a2dp_endpoints(device_address)
+        if not inspection:
+            return "Codec: Unknown"
+        supported = ", ".join(dict.fromkeys(entry["capabilities"]["codec"] for entry in inspection["endpoints"]))
+        summary = "Codec: Not negotiated"
+        if inspection["transports"]:
+            configuration = inspection["transports"][0]["configuration"]
+            summary = f"Codec: {configuration['codec']}"
+            if configuration["rate"]:
+                summary += f" {configuration['rate'] / 1000:g} kHz"
+            if configuration["bitrate"]:
+                summary += f", {configuration['bitrate'] / 1000:.0f} kbps"
+        if supported:
+            summary += f" (supported: {supported})"
+        return summary
+
     def create_a2dp_sink_ui(self, layout, bold_font):
         """create and add the A2DP Sink UI elements to the give layout.
 
@@ -660,23 +908,29 @@ class TestApplication(QWidget):
         self.log.info("Media command %s sent to device %s.", command, self.device_address_sink)
 
     def start_a2dp_streaming(self):
-        """Start A2DP streaming to a selected Bluetooth sink device."""
+        """Start A2DP streaming to a selected Bluetooth sink device.
+
+        The selected file and every file after it in the playlist are streamed back to back.
+        """
         selected_items = self.audio_playlist.selectedItems()
         if not selected_items:
             QMessageBox.warning(self, "No File Selected", "Please select an audio file from the playlist.")
             return
-        audio_path = selected_items[0].text().strip()
-        if not os.path.exists(audio_path):
-            QMessageBox.warning(self, "Invalid Audio File", "Selected file does not exist.")
+        first_row = self.audio_playlist.row(selected_items[0])
+        audio_paths = [self.audio_playlist.item(row).text().strip() for row in range(first_row, self.audio_playlist.count())]
+        missing_paths = [audio_path for audio_path in audio_paths if not os.path.exists(audio_path)]
+        if missing_paths:
+            QMessageBox.warning(self, "Invalid Audio File", "Selected file does not exist:\n" + "\n".join(missing_paths))
             return
         if not self.device_address_source:
             QMessageBox.warning(self, "No Device", "Please select a Bluetooth sink device to stream.")
             return
-        self.log.info("A2DP streaming started with file: %s", audio_path)
+        self.log.info("A2DP streaming started with files: %s", audio_paths)
         self.start_streaming_button.setEnabled(False)
         self.stop_streaming_button.setEnabled(True)
-        self.source_status_label.setText("Status: Streaming")
-        status = self.bluetooth_device_manager.start_a2dp_stream(self.device_address_source, audio_path)
+        self.source_status_label.setText("Status: Starting")
+        status = self.bluetooth_device_manager.start_a2dp_playlist(self.device_address_source, audio_paths,
+                                                                     target_format="sink")
         if not status:
             QMessageBox.critical(self, "Streaming Failed", "Failed to start streaming.")
             self.start_streaming_button.setEnabled(True)
@@ -689,7 +943,7 @@ class TestApplication(QWidget):
         self.start_streaming_button.setEnabled(True)
         self.stop_streaming_button.setEnabled(False)
         self.source_status_label.setText("Status: Stopped")
-        self.bluetooth_device_manager.stop_a2dp_stream()
+        self.bluetooth_device_manager.stop_a2dp_stream(self.device_address_source)
         if hasattr(self, 'streaming_timer'):
             self.streaming_timer.stop()
 
@@ -718,6 +972,7 @@ class TestApplication(QWidget):
             self.opp_location_input.setText(file_path)
             self.log.info("File selected to send via OPP")
 
+    @watched_handler
     def send_file(self):
         """Send a selected file to a remote device using OPP."""
         file_path = self.opp_location_input.text()
@@ -743,6 +998,7 @@ class TestApplication(QWidget):
         else:
             QMessageBox.warning(None, "OPP", "File transfer failed or was rejected.")
 
+    @watched_handler
     def receive_file(self):
         """Start OPP receiver and handle file transfer."""
         try:
@@ -755,6 +1011,8 @@ class TestApplication(QWidget):
         except Exception as error:
             QMessageBox.critical(None, "Error", f"An error occurred during file reception:\n{str(error)}")
 
+    @traced_action(lambda self, index: f"tab {self.device_tab_widget.tabText(index) if self.device_tab_widget else index}")
+    @watched_handler
     def handle_profile_tab_change(self, index):
         """Handles actions when switching between profile tabs (e.g., A2DP, OPP), and refreshes the selected tab's UI.
 
@@ -887,6 +1145,8 @@ class TestApplication(QWidget):
         button_layout.addWidget(self.unpair_button)
         layout.addLayout(button_layout)
 
+    @traced_action(lambda self, action, device_address, *args, **kwargs: f"{action} {device_address}")
+    @watched_handler
     def perform_device_action(self, action, device_address, load_profiles, opp_success=None):
         """Performs a Bluetooth device action and updates the UI.
 
@@ -1059,7 +1319,7 @@ class TestApplication(QWidget):
                 self.log.info("Disconnected from %s", device_address)
             else:
                 QMessageBox.warning(self, "Disconnection Failed", f"Could not disconnect from {device_address}")
-                self.log.warning(f"Disconnection failed: OPP={opp_success}, BT={bt_success}")
+                self.log.warning("Disconnection failed: OPP=%s, BT=%s", opp_success, bt_success)
 
             self.device_profiles.pop(device_address, None)
             self.device_states.pop(device_address, None)
@@ -1133,11 +1393,11 @@ class TestApplication(QWidget):
         Returns:
             PIN , Passkey, True, or None based on request type and user interaction.
         """
-        self.log.info(f"Handling pairing request: {request_type} for {device}")
+        self.log.info("Handling pairing request: %s for %s", request_type, device)
         device_address = device.split("dev_")[-1].replace("_", ":")
         handler_name = constants.pairing_request_handlers.get(request_type)
         if not handler_name:
-            self.log.warning(f"Unknown pairing request type: {request_type}")
+            self.log.warning("Unknown pairing request type: %s", request_type)
             return None
         handler = getattr(self, handler_name)
         return handler(device_address, uuid, passkey)
@@ -1223,7 +1483,7 @@ class TestApplication(QWidget):
             label: The label to display ('PIN' or 'Passkey').
         """
         if value is None:
-            self.log.warning(f"{label} requested but no value provided for device {device_address}.")
+            self.log.warning("%s requested but no value provided for device %s.", label, device_address)
             return
         QMessageBox.information(self, f"Display {label}", f"Enter this {label.lower()} on {device_address}: {value}")
 
@@ -1299,19 +1559,14 @@ class TestApplication(QWidget):
         controller_label.setFont(QFont("Arial", 11, QFont.Weight.Bold))
         controller_label.setStyleSheet(styles.color_style_sheet)
         controller_layout.addWidget(controller_label)
-        details = get_controller_interface_details(self.log, interface=self.interface, detail_level='extended_info')
         self.grid = QGridLayout()
         self.grid.setHorizontalSpacing(10)
         self.grid.setVerticalSpacing(12)
         self.grid.setColumnStretch(0, 1)
         self.grid.setColumnStretch(1, 2)
-        self.add_controller_details_row(0, "Controller Name", details.get("Name", "N/A"))
-        self.add_controller_details_row(1, "Controller Address", details.get("BD_ADDR", "N/A"))
-        self.add_controller_details_row(2, "Link Mode", details.get("Link mode", "N/A"))
-        self.add_controller_details_row(3, "Link Policy", details.get("Link policy", "N/A"))
-        self.add_controller_details_row(4, "HCI Version", details.get("HCI Version", "N/A"))
-        self.add_controller_details_row(5, "LMP Version", details.get("LMP Version", "N/A"))
-        self.add_controller_details_row(6, "Manufacturer", details.get("Manufacturer", "N/A"))
+        for row, label in enumerate(["Controller Name", "Controller Address", "Class", "Discoverable",
+                                     "Pairable", "HCI Version", "Manufacturer"]):
+            self.controller_detail_labels[label] = self.add_controller_details_row(row, label, "Loading...")
         controller_layout.addLayout(self.grid)
         self.main_grid_layout.addWidget(controller_details_widget, 5, 0, 8, 2)
         # Grid2: Profile description
@@ -1340,7 +1595,6 @@ class TestApplication(QWidget):
         self.main_grid_layout.setColumnStretch(1, 0)
         self.main_grid_layout.setColumnStretch(2, 1)
         self.setLayout(self.main_grid_layout)
-        self.load_paired_devices()
         self.setup_logs_section()
 
     def setup_logs_section(self):
@@ -1378,11 +1632,7 @@ class TestApplication(QWidget):
 
         self.dump_logs_text_browser.addTab(self.bluetoothd_log_text_browser, "Bluetoothd_Logs")
 
-        self.bluetoothd_log_file_fd = open(self.bluetoothd_log_file_path, "r")
-        if self.bluetoothd_log_file_fd:
-            content = self.bluetoothd_log_file_fd.read()
-            self.bluetoothd_log_text_browser.append(content)
-            self.bluetoothd_file_position = self.bluetoothd_log_file_fd.tell()
+        self.bluetoothd_log_file_fd = None
 
         self.bluetoothd_file_watcher = QFileSystemWatcher()
         self.bluetoothd_file_watcher.addPath(self.bluetoothd_log_file_path)
@@ -1401,11 +1651,7 @@ class TestApplication(QWidget):
 
         self.dump_logs_text_browser.addTab(self.pulseaudio_log_text_browser, "Pulseaudio_Logs")
 
-        self.pulseaudio_log_file_fd = open(self.pulseaudio_log_file_path, "r")
-        if self.pulseaudio_log_file_fd:
-            content = self.pulseaudio_log_file_fd.read()
-            self.pulseaudio_log_text_browser.append(content)
-            self.pulseaudio_file_position = self.pulseaudio_log_file_fd.tell()
+        self.pulseaudio_log_file_fd = None
 
         self.pulseaudio_file_watcher = QFileSystemWatcher()
         self.pulseaudio_file_watcher.addPath(self.pulseaudio_log_file_path)
@@ -1424,11 +1670,7 @@ class TestApplication(QWidget):
 
         self.dump_logs_text_browser.addTab(self.hci_dump_log_text_browser, "HCI_Dump_Logs")
 
-        self.hci_log_file_fd = open(self.hcidump_log_name, "r")
-        if self.hci_log_file_fd:
-            content = self.hci_log_file_fd.read()
-            self.hci_dump_log_text_browser.append(content)
-            self.hci_file_position = self.hci_log_file_fd.tell()
+        self.hci_log_file_fd = None
 
         self.hci_file_watcher = QFileSystemWatcher()
         self.hci_file_watcher.addPath(self.hcidump_log_name)
@@ -1447,11 +1689,7 @@ class TestApplication(QWidget):
 
         self.dump_logs_text_browser.addTab(self.obexd_log_text_browser, "Obexd_Logs")
 
-        self.obexd_log_file_fd = open(self.obexd_log_file_path, "r")
-        if self.obexd_log_file_fd:
-            content = self.obexd_log_file_fd.read()
-            self.obexd_log_text_browser.append(content)
-            self.obexd_file_position = self.obexd_log_file_fd.tell()
+        self.obexd_log_file_fd = None
 
         self.obexd_file_watcher = QFileSystemWatcher()
         self.obexd_file_watcher.addPath(self.obexd_log_file_path)
@@ -1470,16 +1708,13 @@ class TestApplication(QWidget):
 
         self.dump_logs_text_browser.addTab(self.ofonod_log_text_browser, "Ofonod_Logs")
 
-        self.ofonod_log_file_fd = open(self.ofonod_log_file_path, "r")
-        if self.ofonod_log_file_fd:
-            content = self.ofonod_log_file_fd.read()
-            self.ofonod_log_text_browser.append(content)
-            self.ofonod_file_position = self.ofonod_log_file_fd.tell()
+        self.ofonod_log_file_fd = None
 
         self.ofonod_file_watcher = QFileSystemWatcher()
         self.ofonod_file_watcher.addPath(self.ofonod_log_file_path)
         self.ofonod_file_watcher.fileChanged.connect(self.update_ofonod_log)
 
+    @watched_handler
     def update_bluetoothd_log(self):
         """Updates the bluetoothd log display with new log entries.
         Reads the bluetoothd log file from the last known position and appends the new content to bluetoothd
@@ -1488,8 +1723,10 @@ class TestApplication(QWidget):
             self.bluetoothd_log_file_fd.seek(self.bluetoothd_file_position)
             content = self.bluetoothd_log_file_fd.read()
             self.bluetoothd_file_position = self.bluetoothd_log_file_fd.tell()
+            self.record_log_ingest("bluetoothd", content)
             self.bluetoothd_log_text_browser.append(content)
 
+    @watched_handler
     def update_pulseaudio_log(self):
         """Updates the pulseaudio log display with new log entries.
         Reads the pulseaudio log file from the last known position and appends the new content to pulseaudio
@@ -1498,8 +1735,10 @@ class TestApplication(QWidget):
             self.pulseaudio_log_file_fd.seek(self.pulseaudio_file_position)
             content = self.pulseaudio_log_file_fd.read()
             self.pulseaudio_file_position = self.pulseaudio_log_file_fd.tell()
+            self.record_log_ingest("pulseaudio", content)
             self.pulseaudio_log_text_browser.append(content)
 
+    @watched_handler
     def update_hci_log(self):
         """Updates the hcidump log display with new log entries.
         Reads the hci log file from the last known position and appends the new content to hci dump
@@ -1508,8 +1747,10 @@ class TestApplication(QWidget):
             self.hci_log_file_fd.seek(self.hci_file_position)
             content = self.hci_log_file_fd.read()
             self.hci_file_position = self.hci_log_file_fd.tell()
+            self.record_log_ingest("hci", content)
             self.hci_dump_log_text_browser.append(content)
 
+    @watched_handler
     def update_obexd_log(self):
         """Updates the obexd log display with new log entries.
         Reads the obexd log file from the last known position and appends the new content to obexd
@@ -1518,8 +1759,10 @@ class TestApplication(QWidget):
             self.obexd_log_file_fd.seek(self.obexd_file_position)
             content = self.obexd_log_file_fd.read()
             self.obexd_file_position = self.obexd_log_file_fd.tell()
+            self.record_log_ingest("obexd", content)
             self.obexd_log_text_browser.append(content)
 
+    @watched_handler
     def update_ofonod_log(self):
         """Updates the ofonod log display with new log entries.
         Reads the ofonod log file from the last known position and appends the new content to ofonod
@@ -1528,6 +1771,7 @@ class TestApplication(QWidget):
             self.ofonod_log_file_fd.seek(self.ofonod_file_position)
             content = self.ofonod_log_file_fd.read()
             self.ofonod_file_position = self.ofonod_log_file_fd.tell()
+            self.record_log_ingest("ofonod", content)
             self.ofonod_log_text_browser.append(content)
 
     def prompt_file_transfer_confirmation(self, file_path):
@@ -1672,6 +1916,7 @@ class TestApplication(QWidget):
         """
         self.bluetooth_device_manager.set_media_volume(self.device_address_source, value)
 
+    @watched_handler
     def refresh_tab(self, placeholder: QWidget, panel: QWidget):
         """Replaces the contents of a placeholder widget with the given panel.
         Clears existing layout and widgets, sets a new layout with the panel, and updates the UI.
@@ -1709,14 +1954,59 @@ class TestApplication(QWidget):
             paired: Indicates whether pairing was successful or pairing failed.
         """
         if paired:
-            self.log.info(f"Device paired: {device_address}")
+            self.log.info("Device paired: %s", device_address)
             self.add_paired_device_to_list(device_address)
             QMessageBox.information(self, "Pairing Successful", f"{device_address} was paired successfully.")
         else:
-            self.log.info(f"Pairing failed: {device_address}")
+            self.log.info("Pairing failed: %s", device_address)
             QMessageBox.warning(self, "Pairing Failed", f"Pairing with {device_address} failed.")
             self.remove_device_from_list(device_address)
 
+    def handle_connection_timing(self, timing):
+        """Logs the timing breakdown of a completed pair or connect operation.
+
+        Args:
+            timing: Timing dictionary reported by the Bluetooth device manager.
+        """
+        self.log.info("Connection timing for %s (%s): %s", timing["address"], timing["operation"], timing)
+
+    def handle_transport_update(self, snapshot):
+        """Shows the state and health of the selected sink's A2DP transport in the streaming status label.
+
+        Args:
+            snapshot: Transport snapshot reported by the Bluetooth device manager, with the device's address.
+        """
+        if not self.device_address_source or not hasattr(self, "source_status_label"):
+            return
+        if snapshot["address"].upper() != self.device_address_source.upper():
+            return
+        details = [f"Status: {str(snapshot['state']).capitalize()}"]
+        audio_format = snapshot["audio_format"]
+        if audio_format and audio_format["rate"]:
+            details.append(f"{audio_format['codec']} {audio_format['rate'] / 1000:g} kHz")
+        if snapshot["delay_ms"] is not None:
+            details.append(f"delay {snapshot['delay_ms']:.1f} ms")
+        if snapshot["time_to_active_ms"] is not None:
+            details.append(f"active after {snapshot['time_to_active_ms']:.0f} ms")
+        details.append(f"{snapshot['suspends']} suspends, {snapshot['active_ratio']:.0%} active in {snapshot['window_s']:.0f} s")
+        self.source_status_label.setText(" | ".join(details))
+
+    def handle_device_update(self, device_address, changed):
+        """Updates the discovery table row of a device whose properties changed.
+
+        Args:
+            device_address: Bluetooth address of the device.
+            changed: Dictionary of the changed Device1 properties.
+        """
+        table_widget = getattr(self, "table_widget", None)
+        if not table_widget or not ("Alias" in changed or "Name" in changed):
+            return
+        for row in range(table_widget.rowCount()):
+            item = table_widget.item(row, 1)
+            if item is not None and item.text() == device_address:
+                table_widget.item(row, 0).setText(str(changed.get("Alias", changed.get("Name"))))
+                return
+
     '''def create_hfp_profile_ui(self, device_address):
         """Builds and returns the HFP (Hands-Free Profile) panel for call control."""
         bold_font = QFont("Segoe UI", 10, QFont.Weight.Bold)
@@ -2071,15 +2361,32 @@ class TestApplication(QWidget):
         audio_group = self.create_hfp_sections("Audio Settings", audio_layout, parent=widget)
 
         # DTMF controls
-        dtmf_layout = QHBoxLayout()
+        dtmf_layout = QVBoxLayout()
+        dtmf_input_layout = QHBoxLayout()
         self.dtmf_input = QLineEdit(widget)
-        self.dtmf_input.setPlaceholderText("Enter DTMF tone (0–9, #, *)")
+        self.dtmf_input.setPlaceholderText("Enter DTMF tone (0–9, #, *, ',' to pause)")
         self.dtmf_send_btn = QPushButton("Send", widget)
-        dtmf_layout.addWidget(self.dtmf_input)
-        dtmf_layout.addWidget(self.dtmf_send_btn)
+        dtmf_input_layout.addWidget(self.dtmf_input)
+        dtmf_input_layout.addWidget(self.dtmf_send_btn)
+        dtmf_layout.addLayout(dtmf_input_layout)
+        self.dtmf_status_label = QLabel("DTMF: Idle", widget)
+        dtmf_layout.addWidget(self.dtmf_status_label)
         dtmf_group = self.create_hfp_sections("DTMF Controls", dtmf_layout, parent=widget)
 
-        for group in [basic_group, adv_group, audio_group, dtmf_group]:
+        link_layout = QVBoxLayout()
+        link_buttons = QHBoxLayout()
+        self.connect_audio_btn = QPushButton("Connect Audio", widget)
+        self.disconnect_audio_btn = QPushButton("Disconnect Audio", widget)
+        self.measure_audio_btn = QPushButton("Measure Loopback", widget)
+        for b in [self.connect_audio_btn, self.disconnect_audio_btn, self.measure_audio_btn]:
+            link_buttons.addWidget(b)
+        link_layout.addLayout(link_buttons)
+        self.sco_status_label = QLabel("SCO: Not connected", widget)
+        self.sco_status_label.setWordWrap(True)
+        link_layout.addWidget(self.sco_status_label)
+        link_group = self.create_hfp_sections("Audio Link (SCO)", link_layout, parent=widget)
+
+        for group in [basic_group, adv_group, audio_group, dtmf_group, link_group]:
             layout.addWidget(group)
 
         self.bluetooth_device_manager.setup_hfp_manager(device_address)
@@ -2107,11 +2414,90 @@ class TestApplication(QWidget):
         self.volume_slider.valueChanged.connect(
             lambda v: self.bluetooth_device_manager.set_call_volume(device_address, v))
 
-        self.dtmf_send_btn.clicked.connect(
-            lambda: self.bluetooth_device_manager.send_tones(device_address, self.dtmf_input.text()))
+        self.dtmf_send_btn.clicked.connect(lambda: self.send_dtmf_tones(device_address))
+
+        self.connect_audio_btn.clicked.connect(lambda: self.connect_hfp_audio(device_address))
+        self.disconnect_audio_btn.clicked.connect(
+            lambda: self.bluetooth_device_manager.disconnect_hfp_audio(device_address))
+        self.measure_audio_btn.clicked.connect(lambda: self.measure_hfp_audio(device_address))
+        self.sco_status_timer = QTimer(widget)
+        self.sco_status_timer.timeout.connect(lambda: self.refresh_sco_status(device_address))
+        self.sco_status_timer.start(1000)
 
         return widget
 
+    def send_dtmf_tones(self, device_address):
+        """Queues the typed DTMF tones for the active call of the device.
+
+        Args:
+            device_address: The Bluetooth address of the device.
+        """
+        tones = self.dtmf_input.text()
+        if not self.bluetooth_device_manager.send_tones(device_address, tones):
+            self.dtmf_status_label.setText("DTMF: No active call or invalid tones")
+            return
+        self.dtmf_status_label.setText(f"DTMF: Sending {tones}")
+
+    def handle_dtmf_finished(self, sequence_id, success, records):
+        """Shows how a DTMF sequence was sent and how fast the audio gateway answered.
+
+        Args:
+            sequence_id: Id of the finished sequence.
+            success: Whether every tone of the sequence was sent.
+            records: Timestamped records of the SendTones requests of the sequence.
+        """
+        if not hasattr(self, "dtmf_status_label"):
+            return
+        if not success:
+            self.dtmf_status_label.setText(f"DTMF: Sequence {sequence_id} failed")
+            return
+        tones = sum(len(record["tones"]) for record in records)
+        slowest = max((record["response_ms"] for record in records), default=0.0)
+        self.dtmf_status_label.setText(f"DTMF: Sent {tones} tones in {len(records)} requests, "
+                                       f"slowest AG response {slowest:.0f} ms")
+
+    def connect_hfp_audio(self, device_address):
+        """Opens the SCO audio link of the device and shows the negotiated codec.
+
+        Args:
+            device_address: The Bluetooth address of the device.
+        """
+        codec = self.bluetooth_device_manager.connect_hfp_audio(device_address)
+        if not codec:
+            QMessageBox.warning(self, "Audio Connection Failed", f"Could not open the SCO link of {device_address}.")
+            return
+        self.refresh_sco_status(device_address)
+
+    def refresh_sco_status(self, device_address):
+        """Shows the codec and packet counters of the device's SCO link.
+
+        Args:
+            device_address: The Bluetooth address of the device.
+        """
+        stats = self.bluetooth_device_manager.get_hfp_audio_stats(device_address)
+        if not stats:
+            self.sco_status_label.setText("SCO: Not connected")
+            return
+        self.sco_status_label.setText(
+            f"SCO: {stats['codec']} | {stats['packets_received']} packets, {stats['packets_lost']} lost "
+            f"({stats['loss_percent']:.2f}%) | jitter {stats['jitter_ms']:.2f} ms, max gap {stats['max_interval_ms']:.1f} ms")
+
+    def measure_hfp_audio(self, device_address):
+        """Runs a loopback measurement over the device's SCO link and shows the result.
+
+        Args:
+            device_address: The Bluetooth address of the device.
+        """
+        results = self.bluetooth_device_manager.measure_hfp_audio(device_address)
+        if not results:
+            QMessageBox.warning(self, "Measurement Failed", "The SCO link is not connected or does not carry PCM.")
+            return
+        QMessageBox.information(self, "Loopback Measurement",
+                                f"Latency: {results['latency_ms']:.1f} ms\n"
+                                f"Dropouts: {results['dropouts']} ({results['dropout_ms']:.0f} ms)\n"
+                                f"Level: {results['level_dbfs']:.1f} dBFS\n"
+                                f"Packet loss: {results['loss_percent']:.2f}%")
+
     def create_hfp_sections(self, title, inner_layout, parent=None):
         """Create collapsible HFP section with seamless light blue theme."""
         container = QWidget(parent)
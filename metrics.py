@@ -0,0 +1,312 @@
+"""Counters and histograms of the test host, exported as OpenMetrics text.
+
+Recording is lock-free: every metric keeps one shard per thread that only
+that thread writes, and readers sum the shards, so hot paths never wait for
+each other or for an exporter. MetricsServer serves the registry on a local
+HTTP endpoint for Prometheus to scrape; MetricsFileExporter rewrites a file
+periodically, for the node_exporter textfile collector or for copying off a
+rig.
+
+BluetoothMetrics declares the metrics BluetoothDeviceManager and
+TestApplication record: pair/connect/profile latency, OBEX throughput, AVRCP
+command latency, HFP call setup time, D-Bus call counts and log ingest.
+Setting BLUETOOTH_METRICS_PORT and/or BLUETOOTH_METRICS_FILE turns them on.
+"""
+import bisect
+import http.server
+import math
+import os
+import threading
+
+port_environment_variable = "BLUETOOTH_METRICS_PORT"
+file_environment_variable = "BLUETOOTH_METRICS_FILE"
+content_type = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+throughput_buckets = (8e3, 16e3, 32e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 4e6)
+
+
+class CounterValue:
+    """One labelled counter."""
+
+    def __init__(self):
+        self.shards = {}
+
+    def inc(self, amount=1):
+        shard = self.shards.get(threading.get_ident())
+        if shard is None:
+            shard = self.shards.setdefault(threading.get_ident(), [0])
+        shard[0] += amount
+
+    def value(self):
+        return sum(shard[0] for shard in list(self.shards.values()))
+
+
+class HistogramValue:
+    """One labelled histogram; a shard holds the count of every bucket, the +Inf count and the sum."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.shards = {}
+
+    def observe(self, value):
+        shard = self.shards.get(threading.get_ident())
+        if shard is None:
+            shard = self.shards.setdefault(threading.get_ident(), [0] * (len(self.buckets) + 2))
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def snapshot(self):
+        """Returns the cumulative bucket counts (the last one is +Inf), the count and the sum."""
+        totals = [0] * (len(self.buckets) + 2)
+        for shard in list(self.shards.values()):
+            for index, value in enumerate(list(shard)):
+                totals[index] += value
+        cumulative = []
+        running = 0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, running, totals[-1]
+
+
+class Metric:
+    """A metric family with optional labels."""
+
+    type_name = None
+
+    def __init__(self, name, documentation, label_names=(), unit=None):
+        """Declare the family.
+
+        Args:
+            name: Family name, e.g. bluetooth_pair_seconds.
+            documentation: One-line description.
+            label_names: Names of the labels every value carries.
+            unit: Optional unit; the name must end with it.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.unit = unit
+        self.values = {}
+
+    def labels(self, **labels):
+        """Returns the value of one label combination, creating it on first use."""
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        value = self.values.get(key)
+        if value is None:
+            value = self.values.setdefault(key, self.new_value())
+        return value
+
+    def new_value(self):
+        raise NotImplementedError
+
+    def exposition(self):
+        lines = [f"# TYPE {self.name} {self.type_name}", f"# HELP {self.name} {escape(self.documentation)}"]
+        if self.unit:
+            lines.append(f"# UNIT {self.name} {self.unit}")
+        for key, value in sorted(list(self.values.items())):
+            lines.extend(self.samples(dict(zip(self.label_names, key)), value))
+        return lines
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def new_value(self):
+        return CounterValue()
+
+    def inc(self, amount=1, **labels):
+        self.labels(**labels).inc(amount)
+
+    def samples(self, labels, value):
+        return [f"{self.name}_total{format_labels(labels)} {format_value(value.value())}"]
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), unit=None, buckets=latency_buckets):
+        super().__init__(name, documentation, label_names, unit)
+        self.buckets = tuple(sorted(buckets))
+
+    def new_value(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value, **labels):
+        self.labels(**labels).observe(value)
+
+    def samples(self, labels, value):
+        cumulative, count, total = value.snapshot()
+        lines = []
+        for bound, bucket_count in zip(list(self.buckets) + [math.inf], cumulative):
+            bucket_labels = dict(labels, le="+Inf" if bound == math.inf else format_value(bound))
+            lines.append(f"{self.name}_bucket{format_labels(bucket_labels)} {bucket_count}")
+        lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(total)}")
+        return lines
+
+
+class MetricsRegistry:
+    """The metric families of a process."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, label_names=(), unit=None):
+        return self.register(Counter(name, documentation, label_names, unit))
+
+    def histogram(self, name, documentation, label_names=(), unit=None, buckets=latency_buckets):
+        return self.register(Histogram(name, documentation, label_names, unit, buckets))
+
+    def exposition(self):
+        """Returns every family in the OpenMetrics text format."""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.exposition())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves a registry at http://host:port/metrics from a background thread."""
+
+    def __init__(self, registry, port, host="127.0.0.1"):
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.exposition().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsFileExporter:
+    """Rewrites a file with the exposition of a registry at a fixed interval."""
+
+    def __init__(self, registry, file_path, interval=15.0):
+        self.registry = registry
+        self.file_path = file_path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def write(self):
+        """Writes the file atomically, so readers never see a partial exposition."""
+        temporary_path = f"{self.file_path}.tmp"
+        with open(temporary_path, "w") as metrics_file:
+            metrics_file.write(self.registry.exposition())
+        os.replace(temporary_path, self.file_path)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.write()
+            except OSError:
+                pass
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="metrics-file", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.write()
+
+
+class BluetoothMetrics:
+    """The metrics recorded by BluetoothDeviceManager and TestApplication."""
+
+    def __init__(self, registry=None):
+        self.registry = registry or MetricsRegistry()
+        registry = self.registry
+        self.pair_seconds = registry.histogram(
+            "bluetooth_pair_seconds", "Time from Pair() to the device being bonded.", ["adapter", "result"],
+            "seconds")
+        self.connect_seconds = registry.histogram(
+            "bluetooth_connect_seconds", "Time of Connect() and ConnectProfile() until the profiles are up.",
+            ["adapter", "operation", "result"], "seconds")
+        self.obex_bytes = registry.counter(
+            "bluetooth_obex_sent_bytes", "Bytes pushed over OBEX, by final transfer status.", ["status"], "bytes")
+        self.obex_throughput = registry.histogram(
+            "bluetooth_obex_throughput_bytes_per_second", "Throughput of completed OBEX pushes.", [],
+            buckets=throughput_buckets)
+        self.avrcp_seconds = registry.histogram(
+            "bluetooth_avrcp_command_seconds", "Time of an AVRCP MediaControl1 command.", ["command", "result"],
+            "seconds")
+        self.call_setup_seconds = registry.histogram(
+            "bluetooth_hfp_call_setup_seconds", "Time from a call appearing in oFono to it being active.",
+            ["direction"], "seconds")
+        self.dbus_calls = registry.counter(
+            "bluetooth_dbus_calls", "D-Bus method calls made by the manager.", ["interface", "member", "result"])
+        self.log_bytes = registry.counter(
+            "bluetooth_log_ingest_bytes", "Bytes read from the followed daemon logs.", ["log"], "bytes")
+        self.log_lines = registry.counter(
+            "bluetooth_log_ingest_lines", "Lines read from the followed daemon logs.", ["log"])
+
+    def observe_connection(self, timing):
+        """Records a completed pair/connect timing of BluetoothDeviceManager.finish_connection_timing()."""
+        result = "success" if timing["result"] else "failure"
+        if timing["operation"] == "pair":
+            self.pair_seconds.observe(timing["total_ms"] / 1000, adapter=timing["adapter"], result=result)
+        else:
+            self.connect_seconds.observe(timing["total_ms"] / 1000, adapter=timing["adapter"],
+                                         operation=timing["operation"], result=result)
+
+    def observe_dbus_call(self, details):
+        """Counts a D-Bus call recorded by a DBusTracer."""
+        if details["member"] == "get_object":
+            return
+        self.dbus_calls.inc(interface=details.get("interface") or "", member=details["member"],
+                            result="error" if details.get("error") else "success")
+
+    def observe_log(self, log, content):
+        """Counts text read from a followed log."""
+        self.log_bytes.inc(len(content), log=log)
+        self.log_lines.inc(content.count("\n"), log=log)
+
+
+def escape(text):
+    return text.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def format_value(value):
+    if isinstance(value, float):
+        if value == math.inf:
+            return "+Inf"
+        return repr(value) if not value.is_integer() else f"{value:.1f}"
+    return str(value)
@@ -0,0 +1,12 @@
+"""Fake BlueZ, oFono and obexd D-Bus services for running the test tools without hardware.
+
+The services run in their own process on a private dbus-daemon whose address
+is handed to clients as DBUS_SYSTEM_BUS_ADDRESS and DBUS_SESSION_BUS_ADDRESS,
+so BluetoothDeviceManager talks to them through dbus.SystemBus() and
+dbus.SessionBus() exactly as it would to the real daemons. Every method
+replies after a scripted, jittered delay, and thousands of synthetic devices
+can be generated to measure how the manager and the UI scale. Start the
+services from Python with PrivateBus and SimulatorProcess, or from a shell:
+
+    python -m libraries.bluetooth.simulator --phone 00:11:22:33:44:55 --devices 2000 --paired 20
+"""
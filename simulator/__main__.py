@@ -0,0 +1,99 @@
+"""Runs the fake BlueZ and oFono services on the bus in DBUS_SYSTEM_BUS_ADDRESS
+and the fake obexd client on the bus in DBUS_SESSION_BUS_ADDRESS.
+
+Prints "ready" once every service owns its bus name.
+
+Usage:
+    python -m libraries.bluetooth.simulator --phone 00:11:22:33:44:55 --latency answer_ms=80
+    python -m libraries.bluetooth.simulator --devices 5000 --paired 50 --config simulator.json
+
+A --config file is a JSON object with any of the keys "adapter", "phones",
+"devices", "paired", "connected", "latency", "jitter" and "seed"; options
+given on the command line take precedence.
+"""
+import argparse
+import json
+
+phone_address = "00:11:22:33:44:55"
+
+
+def parse_latency(values):
+    latency = {}
+    for value in values:
+        name, _, milliseconds = value.partition("=")
+        latency[name] = float(milliseconds)
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", help="JSON file describing the simulated environment.")
+    parser.add_argument("--adapter", default=None, help="Name of the simulated adapter.")
+    parser.add_argument("--phone", action="append", help="Address of a simulated phone (repeatable).")
+    parser.add_argument("--devices", type=int, default=None, help="Number of synthetic devices in range.")
+    parser.add_argument("--paired", type=int, default=None, help="How many synthetic devices start paired.")
+    parser.add_argument("--connected", type=int, default=None, help="How many paired devices start connected.")
+    parser.add_argument("--latency", nargs="*", default=[], metavar="NAME=MS",
+                        help="Overrides of the scripted delays, e.g. hold_ms=50 pair_ms=800.")
+    parser.add_argument("--jitter", type=float, default=None, help="Relative random variation of every delay.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the jitter.")
+    parser.add_argument("--no-obex", action="store_true", help="Do not run the obexd client on the session bus.")
+    args = parser.parse_args()
+
+    config = {}
+    if args.config:
+        with open(args.config) as config_file:
+            config = json.load(config_file)
+
+    def option(name, default):
+        value = getattr(args, name)
+        return config.get(name, default) if value is None else value
+
+    import dbus
+    import dbus.service
+    from dbus.mainloop.glib import DBusGMainLoop
+    from gi.repository import GLib
+    from libraries.bluetooth.simulator import bluez, obex, ofono
+
+    latency = dict(config.get("latency", {}), **parse_latency(args.latency))
+    unknown = sorted(set(latency) - set(bluez.default_latency) - set(ofono.default_latency)
+                     - set(obex.default_latency))
+    if unknown:
+        parser.error("unknown latency names: " + ", ".join(unknown))
+    adapter = option("adapter", "hci0")
+    phones = args.phone or config.get("phones") or [phone_address]
+    jitter = option("jitter", 0.1)
+    seed = option("seed", None)
+
+    def schedule(delay, callback):
+        def run():
+            callback()
+            return False
+
+        GLib.timeout_add(max(0, round(delay * 1000)), run)
+
+    DBusGMainLoop(set_as_default=True)
+    # Each daemon gets its own connection, as both export an object at /.
+    bluez_bus = dbus.SystemBus(private=True)
+    ofono_bus = dbus.SystemBus(private=True)
+    root = bluez.BluezRoot(bluez_bus, schedule, latency, jitter, seed)
+    bluez.export_adapter(root, adapter, phones=phones, devices=option("devices", 0),
+                         paired=option("paired", 0), connected=option("connected", 0))
+    modem_paths = ["/hfp" + bluez.device_path(f"/org/bluez/{adapter}", phone) for phone in phones]
+    manager = ofono.OfonoManager(ofono_bus, schedule, modem_paths, latency, jitter, seed)
+    services = [root, manager, ofono.SimulatorControl(ofono_bus, manager),
+                dbus.service.BusName("org.bluez", bluez_bus), dbus.service.BusName("org.ofono", ofono_bus)]
+    if not args.no_obex:
+        obex_bus = dbus.SessionBus(private=True)
+        services += [obex.ObexClient(obex_bus, schedule, latency, jitter, seed),
+                     dbus.service.BusName(obex.obex_service, obex_bus)]
+    print("ready", flush=True)
+    try:
+        GLib.MainLoop().run()
+    except KeyboardInterrupt:
+        pass
+    return services
+
+
+if __name__ == "__main__":
+    main()
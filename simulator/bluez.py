@@ -0,0 +1,666 @@
+"""Fake BlueZ: adapter, devices, media transports, players and the agent manager.
+
+Objects are exported under the same paths and interfaces bluetoothd uses
+(Adapter1, Device1, MediaEndpoint1, MediaTransport1, MediaControl1,
+MediaPlayer1, AgentManager1) and announced through the ObjectManager at /.
+Device methods reply after scripted delays and change properties in the
+order bluetoothd does (Connected, then ServicesResolved, then the profile
+objects), so code waiting on PropertiesChanged sees realistic sequences.
+
+Synthetic devices are generated in bulk: the paired ones are exported from
+the start, the others appear one by one while discovery runs.
+"""
+import socket
+
+import dbus
+import dbus.service
+
+from libraries.bluetooth.simulator.latency import ScriptedLatency
+
+object_manager_interface = "org.freedesktop.DBus.ObjectManager"
+properties_interface = "org.freedesktop.DBus.Properties"
+adapter_interface = "org.bluez.Adapter1"
+device_interface = "org.bluez.Device1"
+agent_manager_interface = "org.bluez.AgentManager1"
+media_endpoint_interface = "org.bluez.MediaEndpoint1"
+media_transport_interface = "org.bluez.MediaTransport1"
+media_control_interface = "org.bluez.MediaControl1"
+media_player_interface = "org.bluez.MediaPlayer1"
+
+a2dp_source_uuid = "0000110a-0000-1000-8000-00805f9b34fb"
+a2dp_sink_uuid = "0000110b-0000-1000-8000-00805f9b34fb"
+avrcp_target_uuid = "0000110c-0000-1000-8000-00805f9b34fb"
+avrcp_uuid = "0000110e-0000-1000-8000-00805f9b34fb"
+hsp_hs_uuid = "00001108-0000-1000-8000-00805f9b34fb"
+hfp_hf_uuid = "0000111e-0000-1000-8000-00805f9b34fb"
+hfp_ag_uuid = "0000111f-0000-1000-8000-00805f9b34fb"
+opp_uuid = "00001105-0000-1000-8000-00805f9b34fb"
+pbap_pse_uuid = "0000112f-0000-1000-8000-00805f9b34fb"
+hid_uuid = "00001124-0000-1000-8000-00805f9b34fb"
+
+device_kinds = {
+    "headset": {"class": 0x240404, "icon": "audio-headset",
+                "uuids": [a2dp_sink_uuid, avrcp_target_uuid, avrcp_uuid, hfp_hf_uuid, hsp_hs_uuid]},
+    "phone": {"class": 0x5a020c, "icon": "phone",
+              "uuids": [a2dp_source_uuid, avrcp_target_uuid, avrcp_uuid, hfp_ag_uuid, opp_uuid, pbap_pse_uuid]},
+    "speaker": {"class": 0x240414, "icon": "audio-card", "uuids": [a2dp_sink_uuid, avrcp_target_uuid, avrcp_uuid]},
+    "keyboard": {"class": 0x002540, "icon": "input-keyboard", "uuids": [hid_uuid]},
+}
+
+sbc_capabilities = [0xFF, 0xFF, 2, 53]
+sbc_configuration = [0x21, 0x15, 2, 53]
+tracks = [{"Title": f"Simulated track {number}", "Artist": "Simulator", "Album": "Test content",
+           "TrackNumber": number, "Duration": 180000 + 1000 * number} for number in range(1, 6)]
+
+default_latency = {
+    "pair_ms": 400.0,
+    "connect_ms": 250.0,
+    "resolve_ms": 150.0,
+    "profile_ms": 200.0,
+    "disconnect_ms": 100.0,
+    "remove_ms": 50.0,
+    "transport_ms": 80.0,
+    "avrcp_ms": 20.0,
+    "discovery_interval_ms": 5.0,
+}
+
+
+class PropertyObject(dbus.service.Object):
+    """D-Bus object holding the properties of one or more interfaces."""
+
+    def __init__(self, bus, path, interfaces):
+        """Export the object.
+
+        Args:
+            bus: D-Bus connection.
+            path: Object path.
+            interfaces: Dictionary of interface names to their property dictionaries.
+        """
+        super().__init__(bus, path)
+        self.path = path
+        self.interfaces = interfaces
+
+    def set_properties(self, interface, changed):
+        """Updates properties and emits PropertiesChanged for the ones whose value changed."""
+        properties = self.interfaces[interface]
+        changed = {name: value for name, value in changed.items() if properties.get(name) != value}
+        if changed:
+            properties.update(changed)
+            self.PropertiesChanged(interface, dbus.Dictionary(changed, signature="sv"), dbus.Array([], signature="s"))
+
+    def property_set(self, interface, name, value):
+        """Applies a Set() call; subclasses restrict which properties are writable."""
+        self.set_properties(interface, {name: value})
+
+    @dbus.service.method(properties_interface, in_signature="ss", out_signature="v")
+    def Get(self, interface, name):
+        try:
+            return self.interfaces[str(interface)][str(name)]
+        except KeyError:
+            raise dbus.exceptions.DBusException(f"No such property {name}",
+                                                name="org.freedesktop.DBus.Error.InvalidArgs") from None
+
+    @dbus.service.method(properties_interface, in_signature="s", out_signature="a{sv}")
+    def GetAll(self, interface):
+        return dbus.Dictionary(self.interfaces.get(str(interface), {}), signature="sv")
+
+    @dbus.service.method(properties_interface, in_signature="ssv", out_signature="")
+    def Set(self, interface, name, value):
+        if str(name) not in self.interfaces.get(str(interface), {}):
+            raise dbus.exceptions.DBusException(f"No such property {name}",
+                                                name="org.freedesktop.DBus.Error.InvalidArgs")
+        self.property_set(str(interface), str(name), value)
+
+    @dbus.service.signal(properties_interface, signature="sa{sv}as")
+    def PropertiesChanged(self, interface, changed, invalidated):
+        pass
+
+
+class BluezRoot(dbus.service.Object):
+    """ObjectManager at / listing every exported BlueZ object."""
+
+    def __init__(self, bus, schedule, latency=None, jitter=0.1, seed=None):
+        """Export the root.
+
+        Args:
+            bus: D-Bus connection.
+            schedule: Callable (delay in seconds, callback) running the callback later.
+            latency: Dictionary overriding entries of default_latency, in milliseconds.
+            jitter: Relative random variation applied to every delay.
+            seed: Seed of the random generator used for the jitter.
+        """
+        super().__init__(bus, "/")
+        self.bus = bus
+        self.schedule = schedule
+        self.timing = ScriptedLatency(default_latency, latency, jitter, seed)
+        self.objects = {}
+
+    def later(self, name, callback, *args):
+        """Runs a callback after the scripted delay of a named step."""
+        self.schedule(self.timing.delay(name), lambda: callback(*args))
+
+    def add_object(self, obj):
+        self.objects[obj.path] = obj
+        self.InterfacesAdded(dbus.ObjectPath(obj.path), managed_interfaces(obj))
+        return obj
+
+    def remove_object(self, path):
+        obj = self.objects.pop(path, None)
+        if obj is not None:
+            self.InterfacesRemoved(dbus.ObjectPath(path), dbus.Array(list(obj.interfaces), signature="s"))
+            obj.remove_from_connection()
+
+    def add_interface(self, obj, interface, properties):
+        """Adds an interface to an exported object."""
+        obj.interfaces[interface] = properties
+        self.InterfacesAdded(dbus.ObjectPath(obj.path), dbus.Dictionary(
+            {interface: dbus.Dictionary(properties, signature="sv")}, signature="sa{sv}"))
+
+    def remove_interface(self, obj, interface):
+        """Removes an interface from an exported object."""
+        if obj.interfaces.pop(interface, None) is not None:
+            self.InterfacesRemoved(dbus.ObjectPath(obj.path), dbus.Array([interface], signature="s"))
+
+    @dbus.service.method(object_manager_interface, in_signature="", out_signature="a{oa{sa{sv}}}")
+    def GetManagedObjects(self):
+        return {dbus.ObjectPath(path): managed_interfaces(obj) for path, obj in self.objects.items()}
+
+    @dbus.service.signal(object_manager_interface, signature="oa{sa{sv}}")
+    def InterfacesAdded(self, path, interfaces):
+        pass
+
+    @dbus.service.signal(object_manager_interface, signature="oas")
+    def InterfacesRemoved(self, path, interfaces):
+        pass
+
+
+class AgentManager(PropertyObject):
+    """AgentManager1 at /org/bluez; pairing in the simulator never needs the agent."""
+
+    def __init__(self, bus):
+        super().__init__(bus, "/org/bluez", {agent_manager_interface: {}})
+        self.agents = {}
+        self.default_agent = None
+
+    @dbus.service.method(agent_manager_interface, in_signature="os", out_signature="")
+    def RegisterAgent(self, agent, capability):
+        self.agents[str(agent)] = str(capability)
+
+    @dbus.service.method(agent_manager_interface, in_signature="o", out_signature="")
+    def UnregisterAgent(self, agent):
+        if self.agents.pop(str(agent), None) is None:
+            raise dbus.exceptions.DBusException("Agent not registered", name="org.bluez.Error.DoesNotExist")
+        if self.default_agent == str(agent):
+            self.default_agent = None
+
+    @dbus.service.method(agent_manager_interface, in_signature="o", out_signature="")
+    def RequestDefaultAgent(self, agent):
+        if str(agent) not in self.agents:
+            raise dbus.exceptions.DBusException("Agent not registered", name="org.bluez.Error.DoesNotExist")
+        self.default_agent = str(agent)
+
+
+class SimulatedAdapter(PropertyObject):
+    """Adapter1 with discovery of the synthetic devices that are not known yet."""
+
+    def __init__(self, root, name, address):
+        self.root = root
+        self.name = name
+        super().__init__(root.bus, f"/org/bluez/{name}", {adapter_interface: {
+            "Address": address, "AddressType": "public", "Name": f"simulated-{name}",
+            "Alias": f"simulated-{name}", "Class": dbus.UInt32(0x6c010c), "Powered": dbus.Boolean(True),
+            "Discoverable": dbus.Boolean(False), "DiscoverableTimeout": dbus.UInt32(180),
+            "Pairable": dbus.Boolean(True), "PairableTimeout": dbus.UInt32(0),
+            "Discovering": dbus.Boolean(False), "Modalias": "usb:v1D6Bp0246d0537",
+            "UUIDs": dbus.Array([a2dp_source_uuid, a2dp_sink_uuid, avrcp_uuid, hfp_hf_uuid], signature="s")}})
+        self.devices = {}
+        self.undiscovered = []
+
+    def add_device(self, address, kind, name, paired=False, connected=False, rssi=-60):
+        """Exports a device on the adapter.
+
+        Args:
+            address: Bluetooth address of the device.
+            kind: Key of device_kinds, which sets the class, icon and UUIDs.
+            name: Name of the device.
+            paired: Whether the device starts paired (and trusted).
+            connected: Whether the device starts connected, with its profile objects.
+            rssi: Signal strength reported while discovering.
+
+        Returns:
+            The device object.
+        """
+        device = SimulatedDevice(self, address, kind, name, paired, rssi)
+        self.devices[device.path] = device
+        self.root.add_object(device)
+        if connected:
+            device.set_properties(device_interface, {"Connected": dbus.Boolean(True),
+                                                     "ServicesResolved": dbus.Boolean(True)})
+            device.connect_profiles(device.interfaces[device_interface]["UUIDs"])
+        return device
+
+    def property_set(self, interface, name, value):
+        if name not in ("Alias", "Powered", "Discoverable", "DiscoverableTimeout", "Pairable", "PairableTimeout"):
+            raise dbus.exceptions.DBusException(f"Property {name} is read-only",
+                                                name="org.freedesktop.DBus.Error.PropertyReadOnly")
+        self.set_properties(interface, {name: value})
+
+    def discover_next(self):
+        if not self.interfaces[adapter_interface]["Discovering"]:
+            return
+        if self.undiscovered:
+            address, kind, name, rssi = self.undiscovered.pop(0)
+            self.add_device(address, kind, name, rssi=rssi)
+        self.root.later("discovery_interval_ms", self.discover_next)
+
+    @dbus.service.method(adapter_interface, in_signature="", out_signature="")
+    def StartDiscovery(self):
+        if self.interfaces[adapter_interface]["Discovering"]:
+            raise dbus.exceptions.DBusException("Operation already in progress", name="org.bluez.Error.InProgress")
+        self.set_properties(adapter_interface, {"Discovering": dbus.Boolean(True)})
+        self.root.later("discovery_interval_ms", self.discover_next)
+
+    @dbus.service.method(adapter_interface, in_signature="", out_signature="")
+    def StopDiscovery(self):
+        if not self.interfaces[adapter_interface]["Discovering"]:
+            raise dbus.exceptions.DBusException("No discovery started", name="org.bluez.Error.Failed")
+        self.set_properties(adapter_interface, {"Discovering": dbus.Boolean(False)})
+
+    @dbus.service.method(adapter_interface, in_signature="a{sv}", out_signature="")
+    def SetDiscoveryFilter(self, properties):
+        pass
+
+    @dbus.service.method(adapter_interface, in_signature="", out_signature="as")
+    def GetDiscoveryFilters(self):
+        return dbus.Array(["UUIDs", "RSSI", "Pathloss", "Transport", "DuplicateData", "Discoverable"], signature="s")
+
+    @dbus.service.method(adapter_interface, in_signature="o", out_signature="",
+                         async_callbacks=("reply", "error"))
+    def RemoveDevice(self, device, reply, error):
+        device = self.devices.get(str(device))
+        if device is None:
+            error(dbus.exceptions.DBusException("Does Not Exist", name="org.bluez.Error.DoesNotExist"))
+            return
+
+        def remove():
+            device.disconnect_profiles()
+            for path in sorted(self.root.objects, reverse=True):
+                if path.startswith(device.path + "/"):
+                    self.root.remove_object(path)
+            self.devices.pop(device.path, None)
+            self.root.remove_object(device.path)
+            device_properties = device.interfaces.get(device_interface, {})
+            self.undiscovered.append((str(device_properties.get("Address")), device.kind,
+                                      str(device_properties.get("Name")), int(device_properties.get("RSSI", -60))))
+            reply()
+
+        self.root.later("remove_ms", remove)
+
+
+class SimulatedDevice(PropertyObject):
+    """Device1 and, once its AVRCP target is connected, MediaControl1 of a synthetic device."""
+
+    def __init__(self, adapter, address, kind, name, paired, rssi):
+        self.adapter = adapter
+        self.root = adapter.root
+        self.kind = kind
+        self.transport = None
+        self.player = None
+        self.pairing = False
+        details = device_kinds[kind]
+        super().__init__(adapter.root.bus, f"{adapter.path}/dev_{address.upper().replace(':', '_')}", {
+            device_interface: {
+                "Address": address.upper(), "AddressType": "public", "Name": name, "Alias": name,
+                "Class": dbus.UInt32(details["class"]), "Icon": details["icon"],
+                "Paired": dbus.Boolean(paired), "Bonded": dbus.Boolean(paired), "Trusted": dbus.Boolean(paired),
+                "Blocked": dbus.Boolean(False), "LegacyPairing": dbus.Boolean(False),
+                "Connected": dbus.Boolean(False), "ServicesResolved": dbus.Boolean(False),
+                "RSSI": dbus.Int16(rssi), "Adapter": dbus.ObjectPath(adapter.path),
+                "Modalias": "bluetooth:v004Cp0001d0001",
+                "UUIDs": dbus.Array(details["uuids"], signature="s")}})
+
+    @property
+    def properties(self):
+        return self.interfaces[device_interface]
+
+    def property_set(self, interface, name, value):
+        if name not in ("Alias", "Trusted", "Blocked"):
+            raise dbus.exceptions.DBusException(f"Property {name} is read-only",
+                                                name="org.freedesktop.DBus.Error.PropertyReadOnly")
+        self.set_properties(interface, {name: value})
+
+    def connect_profiles(self, uuids):
+        """Creates the endpoint, transport, control and player objects of the connected profiles."""
+        uuids = {str(uuid) for uuid in uuids}
+        if self.transport is None and uuids & {a2dp_sink_uuid, a2dp_source_uuid}:
+            remote_role = a2dp_sink_uuid if a2dp_sink_uuid in self.properties["UUIDs"] else a2dp_source_uuid
+            local_role = a2dp_source_uuid if remote_role == a2dp_sink_uuid else a2dp_sink_uuid
+            self.root.add_object(PropertyObject(self.root.bus, f"{self.path}/sep1", {media_endpoint_interface: {
+                "UUID": remote_role, "Codec": dbus.Byte(0), "Device": dbus.ObjectPath(self.path),
+                "Capabilities": dbus.Array(sbc_capabilities, signature="y")}}))
+            self.transport = self.root.add_object(SimulatedTransport(self, local_role))
+        if self.player is None and avrcp_target_uuid in uuids and avrcp_target_uuid in self.properties["UUIDs"]:
+            self.player = self.root.add_object(SimulatedPlayer(self))
+            self.root.add_interface(self, media_control_interface, {
+                "Connected": dbus.Boolean(True), "Player": dbus.ObjectPath(self.player.path)})
+
+    def disconnect_profiles(self, uuids=None):
+        """Removes the objects of the given profiles, of every profile if uuids is None."""
+        uuids = None if uuids is None else {str(uuid) for uuid in uuids}
+        if self.player is not None and (uuids is None or avrcp_target_uuid in uuids or avrcp_uuid in uuids):
+            self.root.remove_interface(self, media_control_interface)
+            self.root.remove_object(self.player.path)
+            self.player = None
+        if self.transport is not None and (uuids is None or uuids & {a2dp_sink_uuid, a2dp_source_uuid}):
+            self.transport.close()
+            self.root.remove_object(self.transport.path)
+            self.root.remove_object(f"{self.path}/sep1")
+            self.transport = None
+
+    def set_stream_state(self, state):
+        if self.transport is not None:
+            self.root.later("transport_ms", self.transport.set_properties, media_transport_interface,
+                            {"State": state})
+
+    @dbus.service.method(device_interface, in_signature="", out_signature="",
+                         async_callbacks=("reply", "error"))
+    def Pair(self, reply, error):
+        if self.properties["Paired"]:
+            error(dbus.exceptions.DBusException("Already Exists", name="org.bluez.Error.AlreadyExists"))
+            return
+        if self.pairing:
+            error(dbus.exceptions.DBusException("In Progress", name="org.bluez.Error.InProgress"))
+            return
+        self.pairing = True
+
+        def paired():
+            if not self.pairing:
+                error(dbus.exceptions.DBusException("Authentication Canceled",
+                                                    name="org.bluez.Error.AuthenticationCanceled"))
+                return
+            self.pairing = False
+            self.set_properties(device_interface, {"Paired": dbus.Boolean(True), "Bonded": dbus.Boolean(True)})
+            reply()
+
+        self.root.later("pair_ms", paired)
+
+    @dbus.service.method(device_interface, in_signature="", out_signature="")
+    def CancelPairing(self):
+        if not self.pairing:
+            raise dbus.exceptions.DBusException("Does Not Exist", name="org.bluez.Error.DoesNotExist")
+        self.pairing = False
+
+    @dbus.service.method(device_interface, in_signature="", out_signature="",
+                         async_callbacks=("reply", "error"))
+    def Connect(self, reply, error):
+        if self.properties["Connected"] and self.properties["ServicesResolved"]:
+            error(dbus.exceptions.DBusException("Already Connected", name="org.bluez.Error.AlreadyConnected"))
+            return
+
+        def resolved():
+            self.set_properties(device_interface, {"ServicesResolved": dbus.Boolean(True)})
+            self.connect_profiles(self.properties["UUIDs"])
+            reply()
+
+        def connected():
+            self.set_properties(device_interface, {"Connected": dbus.Boolean(True)})
+            self.root.later("resolve_ms", resolved)
+
+        self.root.later("connect_ms", connected)
+
+    @dbus.service.method(device_interface, in_signature="", out_signature="",
+                         async_callbacks=("reply", "error"))
+    def Disconnect(self, reply, error):
+        def disconnected():
+            self.disconnect_profiles()
+            self.set_properties(device_interface, {"ServicesResolved": dbus.Boolean(False),
+                                                   "Connected": dbus.Boolean(False)})
+            reply()
+
+        self.root.later("disconnect_ms", disconnected)
+
+    @dbus.service.method(device_interface, in_signature="s", out_signature="",
+                         async_callbacks=("reply", "error"))
+    def ConnectProfile(self, uuid, reply, error):
+        uuid = str(uuid).lower()
+        if uuid not in self.properties["UUIDs"]:
+            error(dbus.exceptions.DBusException("Protocol not available", name="org.bluez.Error.NotAvailable"))
+            return
+
+        def connected():
+            self.set_properties(device_interface, {"Connected": dbus.Boolean(True),
+                                                   "ServicesResolved": dbus.Boolean(True)})
+            self.connect_profiles([uuid, avrcp_target_uuid] if uuid in (a2dp_sink_uuid, a2dp_source_uuid) else [uuid])
+            reply()
+
+        self.root.later("profile_ms", connected)
+
+    @dbus.service.method(device_interface, in_signature="s", out_signature="",
+                         async_callbacks=("reply", "error"))
+    def DisconnectProfile(self, uuid, reply, error):
+        def disconnected():
+            self.disconnect_profiles([str(uuid).lower()])
+            reply()
+
+        self.root.later("disconnect_ms", disconnected)
+
+    def avrcp(self, reply, command):
+        def run():
+            if self.player is not None:
+                self.player.command(command)
+            reply()
+
+        self.root.later("avrcp_ms", run)
+
+    @dbus.service.method(media_control_interface, in_signature="", out_signature="", async_callbacks=("reply", "error"))
+    def Play(self, reply, error):
+        self.avrcp(reply, "play")
+
+    @dbus.service.method(media_control_interface, in_signature="", out_signature="", async_callbacks=("reply", "error"))
+    def Pause(self, reply, error):
+        self.avrcp(reply, "pause")
+
+    @dbus.service.method(media_control_interface, in_signature="", out_signature="", async_callbacks=("reply", "error"))
+    def Stop(self, reply, error):
+        self.avrcp(reply, "stop")
+
+    @dbus.service.method(media_control_interface, in_signature="", out_signature="", async_callbacks=("reply", "error"))
+    def Next(self, reply, error):
+        self.avrcp(reply, "next")
+
+    @dbus.service.method(media_control_interface, in_signature="", out_signature="", async_callbacks=("reply", "error"))
+    def Previous(self, reply, error):
+        self.avrcp(reply, "previous")
+
+    @dbus.service.method(media_control_interface, in_signature="", out_signature="", async_callbacks=("reply", "error"))
+    def Rewind(self, reply, error):
+        self.avrcp(reply, "rewind")
+
+    @dbus.service.method(media_control_interface, in_signature="", out_signature="", async_callbacks=("reply", "error"))
+    def FastForward(self, reply, error):
+        self.avrcp(reply, "fast-forward")
+
+    @dbus.service.method(media_control_interface, in_signature="", out_signature="", async_callbacks=("reply", "error"))
+    def VolumeUp(self, reply, error):
+        self.avrcp(reply, "volume-up")
+
+    @dbus.service.method(media_control_interface, in_signature="", out_signature="", async_callbacks=("reply", "error"))
+    def VolumeDown(self, reply, error):
+        self.avrcp(reply, "volume-down")
+
+
+class SimulatedTransport(PropertyObject):
+    """MediaTransport1 of a connected A2DP stream; Acquire hands out one end of a socket pair."""
+
+    def __init__(self, device, uuid):
+        self.device = device
+        self.sockets = None
+        super().__init__(device.root.bus, f"{device.path}/sep1/fd0", {media_transport_interface: {
+            "Device": dbus.ObjectPath(device.path), "UUID": uuid, "Codec": dbus.Byte(0),
+            "Configuration": dbus.Array(sbc_configuration, signature="y"), "State": "idle",
+            "Delay": dbus.UInt16(1500), "Volume": dbus.UInt16(100),
+            "Endpoint": dbus.ObjectPath(f"{device.path}/sep1")}})
+
+    def property_set(self, interface, name, value):
+        if name not in ("Volume", "Delay"):
+            raise dbus.exceptions.DBusException(f"Property {name} is read-only",
+                                                name="org.freedesktop.DBus.Error.PropertyReadOnly")
+        if name == "Volume" and not 0 <= int(value) <= 127:
+            raise dbus.exceptions.DBusException("Invalid volume", name="org.freedesktop.DBus.Error.InvalidArgs")
+        self.set_properties(interface, {name: dbus.UInt16(value)})
+
+    def close(self):
+        if self.sockets:
+            for sock in self.sockets:
+                sock.close()
+            self.sockets = None
+
+    def acquire(self, reply, error, try_only):
+        state = self.interfaces[media_transport_interface]["State"]
+        if try_only and state != "pending":
+            error(dbus.exceptions.DBusException("Not Available", name="org.bluez.Error.NotAvailable"))
+            return
+        if self.sockets:
+            error(dbus.exceptions.DBusException("Not Authorized", name="org.bluez.Error.NotAuthorized"))
+            return
+        self.sockets = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.set_properties(media_transport_interface, {"State": "pending"})
+
+        def acquired():
+            self.set_properties(media_transport_interface, {"State": "active"})
+            reply(dbus.types.UnixFd(self.sockets[0]), dbus.UInt16(895), dbus.UInt16(895))
+
+        self.device.root.later("transport_ms", acquired)
+
+    @dbus.service.method(media_transport_interface, in_signature="", out_signature="hqq",
+                         async_callbacks=("reply", "error"))
+    def Acquire(self, reply, error):
+        self.acquire(reply, error, False)
+
+    @dbus.service.method(media_transport_interface, in_signature="", out_signature="hqq",
+                         async_callbacks=("reply", "error"))
+    def TryAcquire(self, reply, error):
+        self.acquire(reply, error, True)
+
+    @dbus.service.method(media_transport_interface, in_signature="", out_signature="")
+    def Release(self):
+        self.close()
+        self.set_properties(media_transport_interface, {"State": "idle"})
+
+
+class SimulatedPlayer(PropertyObject):
+    """MediaPlayer1 going through a fixed list of tracks; playing makes the A2DP transport active."""
+
+    def __init__(self, device):
+        self.device = device
+        self.track = 0
+        super().__init__(device.root.bus, f"{device.path}/player0", {media_player_interface: {
+            "Name": "Simulated player", "Type": "Audio", "Subtype": "Audio Book", "Status": "stopped",
+            "Position": dbus.UInt32(0), "Repeat": "off", "Shuffle": "off",
+            "Device": dbus.ObjectPath(device.path), "Track": track_properties(0)}})
+
+    def property_set(self, interface, name, value):
+        if name not in ("Repeat", "Shuffle"):
+            raise dbus.exceptions.DBusException(f"Property {name} is read-only",
+                                                name="org.freedesktop.DBus.Error.PropertyReadOnly")
+        self.set_properties(interface, {name: value})
+
+    def command(self, command):
+        """Applies an AVRCP pass-through command."""
+        changed = {}
+        if command in ("next", "previous"):
+            self.track = (self.track + (1 if command == "next" else -1)) % len(tracks)
+            changed.update(Track=track_properties(self.track), Position=dbus.UInt32(0))
+        elif command in ("play", "pause", "stop"):
+            changed["Status"] = {"play": "playing", "pause": "paused", "stop": "stopped"}[command]
+            if command == "stop":
+                changed["Position"] = dbus.UInt32(0)
+            self.device.set_stream_state("active" if command == "play" else "idle")
+        elif command in ("rewind", "fast-forward"):
+            changed["Status"] = "reverse-seek" if command == "rewind" else "forward-seek"
+        if changed:
+            self.set_properties(media_player_interface, changed)
+
+    @dbus.service.method(media_player_interface, in_signature="", out_signature="")
+    def Play(self):
+        self.command("play")
+
+    @dbus.service.method(media_player_interface, in_signature="", out_signature="")
+    def Pause(self):
+        self.command("pause")
+
+    @dbus.service.method(media_player_interface, in_signature="", out_signature="")
+    def Stop(self):
+        self.command("stop")
+
+    @dbus.service.method(media_player_interface, in_signature="", out_signature="")
+    def Next(self):
+        self.command("next")
+
+    @dbus.service.method(media_player_interface, in_signature="", out_signature="")
+    def Previous(self):
+        self.command("previous")
+
+    @dbus.service.method(media_player_interface, in_signature="", out_signature="")
+    def FastForward(self):
+        self.command("fast-forward")
+
+    @dbus.service.method(media_player_interface, in_signature="", out_signature="")
+    def Rewind(self):
+        self.command("rewind")
+
+
+def track_properties(index):
+    track = tracks[index]
+    return dbus.Dictionary({"Title": track["Title"], "Artist": track["Artist"], "Album": track["Album"],
+                            "TrackNumber": dbus.UInt32(track["TrackNumber"]),
+                            "Duration": dbus.UInt32(track["Duration"])}, signature="sv")
+
+
+def managed_interfaces(obj):
+    return dbus.Dictionary({interface: dbus.Dictionary(properties, signature="sv")
+                            for interface, properties in obj.interfaces.items()}, signature="sa{sv}")
+
+
+def device_path(adapter_path, address):
+    """Returns the BlueZ object path of a device, e.g. /org/bluez/hci0/dev_00_11_22_33_44_55."""
+    return f"{adapter_path}/dev_{address.upper().replace(':', '_')}"
+
+
+def synthetic_address(index):
+    """Returns the address of the synthetic device with the given index."""
+    return "10:00:00:{:02X}:{:02X}:{:02X}".format((index >> 16) & 0xFF, (index >> 8) & 0xFF, index & 0xFF)
+
+
+def export_adapter(root, adapter="hci0", address="00:1A:7D:DA:71:00", phones=(), devices=0, paired=0,
+                   connected=0, kinds=("headset", "phone", "speaker", "keyboard")):
+    """Exports an adapter with its simulated phones and synthetic devices.
+
+    Args:
+        root: BluezRoot the objects are added to.
+        adapter: Adapter name.
+        address: Bluetooth address of the adapter.
+        phones: Bluetooth addresses of phones (HFP audio gateways) that start paired and connected.
+        devices: Number of synthetic devices in range.
+        paired: How many of the synthetic devices start paired (and are exported from the start).
+        connected: How many of the paired synthetic devices start connected.
+        kinds: Device kinds the synthetic devices cycle through.
+
+    Returns:
+        The adapter object.
+    """
+    adapter_object = root.add_object(SimulatedAdapter(root, adapter, address))
+    if "/org/bluez" not in root.objects:
+        root.add_object(AgentManager(root.bus))
+    for index, phone in enumerate(phones):
+        adapter_object.add_device(phone, "phone", f"Phone {index + 1}", paired=True, connected=True)
+    for index in range(devices):
+        kind = kinds[index % len(kinds)]
+        name = f"{kind.capitalize()} {index + 1}"
+        rssi = -40 - index % 50
+        if index < paired:
+            adapter_object.add_device(synthetic_address(index), kind, name, paired=True,
+                                      connected=index < connected, rssi=rssi)
+        else:
+            adapter_object.undiscovered.append((synthetic_address(index), kind, name, rssi))
+    return adapter_object
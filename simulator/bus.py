@@ -0,0 +1,104 @@
+"""Private dbus-daemon and simulator process management."""
+import os
+import select
+import subprocess
+import sys
+import time
+
+bus_variables = ("DBUS_SYSTEM_BUS_ADDRESS", "DBUS_SESSION_BUS_ADDRESS")
+
+
+class PrivateBus:
+    """A dbus-daemon of our own, used as the system and session bus of this process while it runs."""
+
+    def __init__(self):
+        self.process = None
+        self.address = None
+        self.previous_addresses = {}
+
+    def start(self, timeout=5.0):
+        """Starts the daemon and points DBUS_SYSTEM_BUS_ADDRESS and DBUS_SESSION_BUS_ADDRESS at it.
+
+        Returns:
+            The address of the bus.
+        """
+        self.process = subprocess.Popen(["dbus-daemon", "--session", "--nofork", "--print-address"],
+                                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        self.address = read_line(self.process, timeout)
+        if not self.address:
+            self.stop()
+            raise RuntimeError("dbus-daemon did not report its address")
+        for variable in bus_variables:
+            self.previous_addresses[variable] = os.environ.get(variable)
+            os.environ[variable] = self.address
+        return self.address
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+        if self.address is not None:
+            for variable, previous in self.previous_addresses.items():
+                if previous is None:
+                    os.environ.pop(variable, None)
+                else:
+                    os.environ[variable] = previous
+            self.previous_addresses = {}
+            self.address = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class SimulatorProcess:
+    """The fake BlueZ, oFono and obexd services, running in a child process on a given bus."""
+
+    def __init__(self, address, arguments=()):
+        """Initialize the process.
+
+        Args:
+            address: Address of the bus the services register on.
+            arguments: Command-line arguments of the simulator (see python -m libraries.bluetooth.simulator -h).
+        """
+        self.address = address
+        self.arguments = list(arguments)
+        self.process = None
+
+    def start(self, timeout=10.0):
+        """Starts the services and waits until they own their bus names."""
+        environment = dict(os.environ, **{variable: self.address for variable in bus_variables})
+        self.process = subprocess.Popen([sys.executable, "-m", "libraries.bluetooth.simulator", *self.arguments],
+                                        stdout=subprocess.PIPE, env=environment, text=True)
+        if read_line(self.process, timeout) != "ready":
+            self.stop()
+            raise RuntimeError("Simulator did not start")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def read_line(process, timeout):
+    """Reads one line of a child process's output, or returns None after the timeout."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        ready, _, _ = select.select([process.stdout], [], [], deadline - time.monotonic())
+        if ready:
+            return process.stdout.readline().strip() or None
+        if process.poll() is not None:
+            break
+    return None
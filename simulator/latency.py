@@ -0,0 +1,25 @@
+"""Scripted delays of the simulated services."""
+import random
+
+
+class ScriptedLatency:
+    """Named delays in milliseconds, each varied by a random jitter when it is used."""
+
+    def __init__(self, defaults, overrides=None, jitter=0.1, seed=None):
+        """Initialize the delays.
+
+        Args:
+            defaults: Dictionary of every delay name to its default in milliseconds.
+            overrides: Dictionary overriding some of the defaults.
+            jitter: Relative random variation applied to every delay.
+            seed: Seed of the random generator used for the jitter.
+        """
+        self.values = dict(defaults)
+        self.values.update({name: value for name, value in (overrides or {}).items() if name in defaults})
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+    def delay(self, name):
+        """Returns the delay of a named step in seconds."""
+        value = self.values[name] / 1000
+        return max(0.0, value * (1 + self.jitter * (2 * self.random.random() - 1)))
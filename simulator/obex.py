@@ -0,0 +1,152 @@
+"""Fake obexd client: sessions and Object Push transfers on the session bus.
+
+Client1.CreateSession() opens a session after a scripted delay and
+ObjectPush1.SendFile() starts a Transfer1 object that goes from "queued"
+through "active" to "complete", updating Transferred chunk by chunk at a
+scripted rate, as obexd reports a push to a real device.
+"""
+import os
+
+import dbus
+import dbus.service
+
+from libraries.bluetooth.simulator.bluez import PropertyObject
+from libraries.bluetooth.simulator.latency import ScriptedLatency
+
+obex_service = "org.bluez.obex"
+obex_path = "/org/bluez/obex"
+client_interface = "org.bluez.obex.Client1"
+session_interface = "org.bluez.obex.Session1"
+object_push_interface = "org.bluez.obex.ObjectPush1"
+transfer_interface = "org.bluez.obex.Transfer1"
+
+default_latency = {
+    "obex_session_ms": 150.0,
+    "obex_chunk_ms": 10.0,
+}
+chunk_size = 32768
+
+
+class ObexClient(dbus.service.Object):
+    """Client1 at /org/bluez/obex, creating and removing sessions."""
+
+    def __init__(self, bus, schedule, latency=None, jitter=0.1, seed=None, fail_targets=()):
+        """Export the client.
+
+        Args:
+            bus: D-Bus connection.
+            schedule: Callable (delay in seconds, callback) running the callback later.
+            latency: Dictionary overriding entries of default_latency, in milliseconds.
+            jitter: Relative random variation applied to every delay.
+            seed: Seed of the random generator used for the jitter.
+            fail_targets: Bluetooth addresses whose sessions fail to connect.
+        """
+        super().__init__(bus, obex_path)
+        self.bus = bus
+        self.schedule = schedule
+        self.timing = ScriptedLatency(default_latency, latency, jitter, seed)
+        self.fail_targets = {address.upper() for address in fail_targets}
+        self.sessions = {}
+        self.next_session = 0
+
+    def later(self, name, callback, *args):
+        self.schedule(self.timing.delay(name), lambda: callback(*args))
+
+    @dbus.service.method(client_interface, in_signature="sa{sv}", out_signature="o",
+                         async_callbacks=("reply", "error"))
+    def CreateSession(self, destination, arguments, reply, error):
+        destination = str(destination).upper()
+        target = str(arguments.get("Target", "opp")).lower()
+
+        def created():
+            if destination in self.fail_targets:
+                error(dbus.exceptions.DBusException("Connection refused", name="org.bluez.obex.Error.Failed"))
+                return
+            path = f"{obex_path}/client/session{self.next_session}"
+            self.next_session += 1
+            self.sessions[path] = ObexSession(self, path, destination, target)
+            reply(dbus.ObjectPath(path))
+
+        self.later("obex_session_ms", created)
+
+    @dbus.service.method(client_interface, in_signature="o", out_signature="")
+    def RemoveSession(self, session):
+        session = self.sessions.pop(str(session), None)
+        if session is None:
+            raise dbus.exceptions.DBusException("Invalid arguments", name="org.bluez.obex.Error.InvalidArguments")
+        session.close()
+
+
+class ObexSession(PropertyObject):
+    """Session1 and ObjectPush1 of a session to one device."""
+
+    def __init__(self, client, path, destination, target):
+        super().__init__(client.bus, path, {
+            session_interface: {"Source": "00:1A:7D:DA:71:00", "Destination": destination,
+                                "Channel": dbus.Byte(12), "Target": target},
+            object_push_interface: {}})
+        self.client = client
+        self.transfers = {}
+        self.next_transfer = 0
+
+    def close(self):
+        for transfer in list(self.transfers.values()):
+            transfer.finish("error")
+            transfer.remove_from_connection()
+        self.transfers.clear()
+        self.remove_from_connection()
+
+    @dbus.service.method(object_push_interface, in_signature="s", out_signature="oa{sv}")
+    def SendFile(self, source_file):
+        source_file = str(source_file)
+        if not os.path.isfile(source_file):
+            raise dbus.exceptions.DBusException(f"No such file {source_file}", name="org.bluez.obex.Error.Failed")
+        path = f"{self.path}/transfer{self.next_transfer}"
+        self.next_transfer += 1
+        transfer = self.transfers[path] = ObexTransfer(self, path, source_file)
+        self.client.later("obex_chunk_ms", transfer.advance)
+        return dbus.ObjectPath(path), dbus.Dictionary(transfer.interfaces[transfer_interface], signature="sv")
+
+
+class ObexTransfer(PropertyObject):
+    """Transfer1 whose progress advances one chunk per scripted delay."""
+
+    def __init__(self, session, path, source_file):
+        self.session = session
+        self.size = os.path.getsize(source_file)
+        super().__init__(session.client.bus, path, {transfer_interface: {
+            "Status": "queued", "Name": os.path.basename(source_file), "Filename": source_file,
+            "Size": dbus.UInt64(self.size), "Transferred": dbus.UInt64(0),
+            "Session": dbus.ObjectPath(session.path)}})
+
+    @property
+    def status(self):
+        return self.interfaces[transfer_interface]["Status"]
+
+    def advance(self):
+        if self.status not in ("queued", "active"):
+            return
+        transferred = min(self.size, int(self.interfaces[transfer_interface]["Transferred"]) + chunk_size)
+        self.set_properties(transfer_interface, {"Status": "active", "Transferred": dbus.UInt64(transferred)})
+        if transferred >= self.size:
+            self.finish("complete")
+        else:
+            self.session.client.later("obex_chunk_ms", self.advance)
+
+    def finish(self, status):
+        if self.status in ("queued", "active"):
+            self.set_properties(transfer_interface, {"Status": status})
+
+    @dbus.service.method(transfer_interface, in_signature="", out_signature="")
+    def Cancel(self):
+        if self.status not in ("queued", "active"):
+            raise dbus.exceptions.DBusException("Not in progress", name="org.bluez.obex.Error.NotInProgress")
+        self.finish("error")
+
+    @dbus.service.method(transfer_interface, in_signature="", out_signature="")
+    def Suspend(self):
+        raise dbus.exceptions.DBusException("Not supported", name="org.bluez.obex.Error.NotSupported")
+
+    @dbus.service.method(transfer_interface, in_signature="", out_signature="")
+    def Resume(self):
+        raise dbus.exceptions.DBusException("Not supported", name="org.bluez.obex.Error.NotSupported")
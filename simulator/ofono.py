@@ -0,0 +1,453 @@
+"""Fake oFono: Manager, VoiceCallManager and VoiceCall objects of hands-free modems.
+
+CallModel is the call state machine of one modem. It follows the 3GPP
+call-hold semantics oFono exposes (SwapCalls, HoldAndAnswer, ReleaseAndAnswer,
+CreateMultiparty, ...) and applies every transition after a scripted delay,
+so a client sees the same CallAdded / PropertyChanged / CallRemoved sequence
+and roughly the same timing as with a real phone. The model itself does not
+depend on D-Bus; the dbus.service objects below export it.
+"""
+import dbus
+import dbus.service
+
+from libraries.bluetooth.simulator.latency import ScriptedLatency
+
+manager_interface = "org.ofono.Manager"
+voice_call_manager_interface = "org.ofono.VoiceCallManager"
+voice_call_interface = "org.ofono.VoiceCall"
+simulator_interface = "org.ofono.test.Simulator"
+simulator_path = "/simulator"
+
+default_latency = {
+    "response_ms": 5.0,
+    "dial_alerting_ms": 40.0,
+    "alerting_active_ms": 120.0,
+    "answer_ms": 30.0,
+    "hold_ms": 30.0,
+    "hangup_ms": 20.0,
+}
+
+
+class CallError(Exception):
+    """A call-control request the modem rejects; carries the oFono D-Bus error name."""
+
+    def __init__(self, name, message):
+        super().__init__(message)
+        self.name = name
+
+
+class CallModel:
+    """Calls of one hands-free modem and the transitions between their states."""
+
+    def __init__(self, modem_path, schedule, latency=None, jitter=0.1, seed=None,
+                 on_added=None, on_removed=None, on_changed=None):
+        """Initialize the model.
+
+        Args:
+            modem_path: D-Bus object path of the modem; call paths are created below it.
+            schedule: Callable (delay in seconds, callback) running the callback later.
+            latency: Dictionary overriding entries of default_latency, in milliseconds.
+            jitter: Relative random variation applied to every delay.
+            seed: Seed of the random generator used for the jitter.
+            on_added: Callable (path, properties) invoked when a call appears.
+            on_removed: Callable (path) invoked when a call is gone.
+            on_changed: Callable (path, name, value) invoked when a call property changes.
+        """
+        self.modem_path = modem_path
+        self.schedule = schedule
+        self.timing = ScriptedLatency(default_latency, latency, jitter, seed)
+        self.latency = self.timing.values
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self.on_changed = on_changed
+        self.calls = {}
+        self.next_call = 1
+        self.last_number = None
+        self.tones = []
+
+    def delay(self, name):
+        """Returns the scripted delay of a transition in seconds."""
+        return self.timing.delay(name)
+
+    def later(self, name, callback, *args):
+        self.schedule(self.delay(name), lambda: callback(*args))
+
+    def with_state(self, *states):
+        return [path for path, call in self.calls.items() if call["State"] in states]
+
+    def add_call(self, number, state):
+        path = f"{self.modem_path}/voicecall{self.next_call:02d}"
+        self.next_call += 1
+        properties = {"LineIdentification": number, "Name": "", "State": state,
+                      "Multiparty": False, "Emergency": False}
+        self.calls[path] = properties
+        if self.on_added:
+            self.on_added(path, dict(properties))
+        return path
+
+    def set_property(self, path, name, value):
+        call = self.calls.get(path)
+        if call is None or call[name] == value:
+            return
+        call[name] = value
+        if self.on_changed:
+            self.on_changed(path, name, value)
+
+    def set_state(self, path, state, expected=None):
+        """Moves a call to a state, unless it has left the expected state in the meantime."""
+        call = self.calls.get(path)
+        if call is not None and (expected is None or call["State"] == expected):
+            self.set_property(path, "State", state)
+
+    def remove_call(self, path, promote_waiting=True):
+        """Removes a call; a waiting call left alone becomes an incoming call."""
+        if self.calls.pop(path, None) is not None and self.on_removed:
+            self.on_removed(path)
+        remaining = self.with_state("active", "held", "dialing", "alerting")
+        multiparty = [call_path for call_path in remaining if self.calls[call_path]["Multiparty"]]
+        if len(multiparty) == 1:
+            self.set_property(multiparty[0], "Multiparty", False)
+        waiting = self.with_state("waiting")
+        if promote_waiting and waiting and not remaining:
+            self.set_state(waiting[0], "incoming")
+
+    def dial(self, number):
+        """Places an outgoing call; the remote party answers after the scripted delays."""
+        if self.with_state("dialing", "alerting", "incoming"):
+            raise CallError("org.ofono.Error.InProgress", "Operation already in progress")
+        if self.with_state("held") and self.with_state("active"):
+            raise CallError("org.ofono.Error.Failed", "Active and held calls already exist")
+        for path in self.with_state("active"):
+            self.set_state(path, "held")
+        self.last_number = number
+        path = self.add_call(number, "dialing")
+        self.later("dial_alerting_ms", self.set_state, path, "alerting", "dialing")
+        self.schedule(self.delay("dial_alerting_ms") + self.delay("alerting_active_ms"),
+                      lambda: self.set_state(path, "active", "alerting"))
+        return path
+
+    def dial_last(self):
+        if not self.last_number:
+            raise CallError("org.ofono.Error.NotAvailable", "No number was dialled before")
+        return self.dial(self.last_number)
+
+    def incoming(self, number):
+        """Makes a call come in, as incoming or as waiting if there already are calls."""
+        state = "waiting" if self.calls else "incoming"
+        return self.add_call(number, state)
+
+    def answer(self, path):
+        if path not in self.calls or self.calls[path]["State"] != "incoming":
+            raise CallError("org.ofono.Error.Failed", "Call is not incoming")
+        self.later("answer_ms", self.set_state, path, "active", "incoming")
+
+    def hangup(self, path):
+        if path not in self.calls:
+            raise CallError("org.ofono.Error.NotFound", "No such call")
+        self.later("hangup_ms", self.remove_call, path)
+
+    def hangup_all(self):
+        for path in list(self.calls):
+            self.later("hangup_ms", self.remove_call, path)
+
+    def swap_calls(self):
+        active, held = self.with_state("active"), self.with_state("held")
+        if not active and not held:
+            raise CallError("org.ofono.Error.Failed", "No calls to swap")
+        self.later("hold_ms", self.apply_states, {**{path: "held" for path in active},
+                                                  **{path: "active" for path in held}})
+
+    def hold_and_answer(self):
+        waiting = self.with_state("waiting")
+        if not waiting:
+            return self.swap_calls()
+        if self.with_state("held") and self.with_state("active"):
+            raise CallError("org.ofono.Error.Failed", "Active and held calls already exist")
+        states = {path: "held" for path in self.with_state("active")}
+        states[waiting[0]] = "active"
+        self.later("answer_ms", self.apply_states, states)
+
+    def release_and_answer(self):
+        active, waiting, held = self.with_state("active"), self.with_state("waiting"), self.with_state("held")
+        if not active and not waiting:
+            raise CallError("org.ofono.Error.Failed", "No active or waiting call")
+        target = waiting[:1] or held
+        self.later("answer_ms", self.release_and_activate, active, target)
+
+    def release_and_swap(self):
+        active, held = self.with_state("active"), self.with_state("held")
+        if not active:
+            raise CallError("org.ofono.Error.Failed", "No active call")
+        self.later("hold_ms", self.release_and_activate, active, held)
+
+    def release_and_activate(self, released, activated):
+        for path in released:
+            self.remove_call(path, promote_waiting=False)
+        self.apply_states({path: "active" for path in activated})
+
+    def create_multiparty(self):
+        active, held = self.with_state("active"), self.with_state("held")
+        if not active or not held:
+            raise CallError("org.ofono.Error.Failed", "Multiparty needs an active and a held call")
+        members = active + held
+        self.later("hold_ms", self.join, members)
+        return members
+
+    def join(self, members):
+        self.apply_states({path: "active" for path in members})
+        for path in members:
+            self.set_property(path, "Multiparty", True)
+
+    def hangup_multiparty(self):
+        members = [path for path, call in self.calls.items() if call["Multiparty"]]
+        if not members:
+            raise CallError("org.ofono.Error.Failed", "No multiparty call")
+        for path in members:
+            self.later("hangup_ms", self.remove_call, path)
+
+    def private_chat(self, path):
+        members = [call_path for call_path, call in self.calls.items() if call["Multiparty"]]
+        if path not in members:
+            raise CallError("org.ofono.Error.InvalidArgs", "Call is not part of the multiparty call")
+        remaining = [call_path for call_path in members if call_path != path]
+
+        def split():
+            self.set_property(path, "Multiparty", False)
+            self.apply_states({call_path: "held" for call_path in remaining})
+            if len(remaining) == 1:
+                self.set_property(remaining[0], "Multiparty", False)
+
+        self.schedule(self.delay("hold_ms"), split)
+        return remaining
+
+    def transfer(self):
+        active, held = self.with_state("active", "alerting"), self.with_state("held")
+        if not active or not held:
+            raise CallError("org.ofono.Error.Failed", "Transfer needs an active and a held call")
+        for path in active + held:
+            self.later("hangup_ms", self.remove_call, path)
+
+    def send_tones(self, tones):
+        if not self.with_state("active"):
+            raise CallError("org.ofono.Error.Failed", "No active call")
+        self.tones.append(tones)
+
+    def apply_states(self, states):
+        for path, state in states.items():
+            self.set_state(path, state)
+
+
+class VoiceCall(dbus.service.Object):
+    """org.ofono.VoiceCall object of one simulated call."""
+
+    def __init__(self, bus, path, model):
+        super().__init__(bus, path)
+        self.path = path
+        self.model = model
+
+    @dbus.service.method(voice_call_interface, in_signature="", out_signature="a{sv}")
+    def GetProperties(self):
+        return dbus.Dictionary(self.model.calls.get(self.path, {}), signature="sv")
+
+    @dbus.service.method(voice_call_interface, in_signature="", out_signature="")
+    def Answer(self):
+        run_model_call(self.model.answer, self.path)
+
+    @dbus.service.method(voice_call_interface, in_signature="", out_signature="")
+    def Hangup(self):
+        run_model_call(self.model.hangup, self.path)
+
+    @dbus.service.signal(voice_call_interface, signature="sv")
+    def PropertyChanged(self, name, value):
+        pass
+
+
+class VoiceCallManager(dbus.service.Object):
+    """org.ofono.VoiceCallManager object of a simulated modem.
+
+    Every method replies after the scripted response delay, like oFono waiting for the
+    phone to acknowledge the AT command, and call objects come and go with the model.
+    """
+
+    def __init__(self, bus, modem_path, schedule, latency=None, jitter=0.1, seed=None):
+        super().__init__(bus, modem_path)
+        self.bus = bus
+        self.schedule = schedule
+        self.call_objects = {}
+        self.model = CallModel(modem_path, schedule, latency, jitter, seed,
+                               on_added=self.call_added, on_removed=self.call_removed,
+                               on_changed=self.call_changed)
+
+    def call_added(self, path, properties):
+        self.call_objects[path] = VoiceCall(self.bus, path, self.model)
+        self.CallAdded(dbus.ObjectPath(path), dbus.Dictionary(properties, signature="sv"))
+
+    def call_removed(self, path):
+        call = self.call_objects.pop(path, None)
+        if call is not None:
+            call.PropertyChanged("State", "disconnected")
+            call.remove_from_connection()
+        self.CallRemoved(dbus.ObjectPath(path))
+
+    def call_changed(self, path, name, value):
+        call = self.call_objects.get(path)
+        if call is not None:
+            call.PropertyChanged(name, dbus.Boolean(value) if isinstance(value, bool) else value)
+
+    def respond(self, reply, error, operation, *args, convert=None):
+        """Runs a model operation and replies after the scripted response delay."""
+        def finish():
+            try:
+                result = operation(*args)
+            except CallError as call_error:
+                error(dbus.exceptions.DBusException(str(call_error), name=call_error.name))
+                return
+            if convert is None:
+                reply()
+            else:
+                reply(convert(result))
+
+        self.schedule(self.model.delay("response_ms"), finish)
+
+    @dbus.service.method(voice_call_manager_interface, in_signature="", out_signature="a{sv}")
+    def GetProperties(self):
+        return dbus.Dictionary({"EmergencyNumbers": dbus.Array(["112", "911"], signature="s")}, signature="sv")
+
+    @dbus.service.method(voice_call_manager_interface, in_signature="", out_signature="a(oa{sv})")
+    def GetCalls(self):
+        return [(dbus.ObjectPath(path), dbus.Dictionary(properties, signature="sv"))
+                for path, properties in self.model.calls.items()]
+
+    @dbus.service.method(voice_call_manager_interface, in_signature="ss", out_signature="o",
+                         async_callbacks=("reply", "error"))
+    def Dial(self, number, hide_callerid, reply, error):
+        self.respond(reply, error, self.model.dial, str(number), convert=dbus.ObjectPath)
+
+    @dbus.service.method(voice_call_manager_interface, in_signature="", out_signature="o",
+                         async_callbacks=("reply", "error"))
+    def DialLast(self, reply, error):
+        self.respond(reply, error, self.model.dial_last, convert=dbus.ObjectPath)
+
+    @dbus.service.method(voice_call_manager_interface, in_signature="us", out_signature="o",
+                         async_callbacks=("reply", "error"))
+    def DialMemory(self, memory_position, hide_callerid, reply, error):
+        self.respond(reply, error, self.model.dial, f"memory{int(memory_position)}", convert=dbus.ObjectPath)
+
+    @dbus.service.method(voice_call_manager_interface, in_signature="", out_signature="",
+                         async_callbacks=("reply", "error"))
+    def Transfer(self, reply, error):
+        self.respond(reply, error, self.model.transfer)
+
+    @dbus.service.method(voice_call_manager_interface, in_signature="", out_signature="",
+                         async_callbacks=("reply", "error"))
+    def SwapCalls(self, reply, error):
+        self.respond(reply, error, self.model.swap_calls)
+
+    @dbus.service.method(voice_call_manager_interface, in_signature="", out_signature="",
+                         async_callbacks=("reply", "error"))
+    def ReleaseAndAnswer(self, reply, error):
+        self.respond(reply, error, self.model.release_and_answer)
+
+    @dbus.service.method(voice_call_manager_interface, in_signature="", out_signature="",
+                         async_callbacks=("reply", "error"))
+    def ReleaseAndSwap(self, reply, error):
+        self.respond(reply, error, self.model.release_and_swap)
+
+    @dbus.service.method(voice_call_manager_interface, in_signature="", out_signature="",
+                         async_callbacks=("reply", "error"))
+    def HoldAndAnswer(self, reply, error):
+        self.respond(reply, error, self.model.hold_and_answer)
+
+    @dbus.service.method(voice_call_manager_interface, in_signature="", out_signature="",
+                         async_callbacks=("reply", "error"))
+    def HangupAll(self, reply, error):
+        self.respond(reply, error, self.model.hangup_all)
+
+    @dbus.service.method(voice_call_manager_interface, in_signature="o", out_signature="ao",
+                         async_callbacks=("reply", "error"))
+    def PrivateChat(self, call, reply, error):
+        self.respond(reply, error, self.model.private_chat, str(call), convert=object_paths)
+
+    @dbus.service.method(voice_call_manager_interface, in_signature="", out_signature="ao",
+                         async_callbacks=("reply", "error"))
+    def CreateMultiparty(self, reply, error):
+        self.respond(reply, error, self.model.create_multiparty, convert=object_paths)
+
+    @dbus.service.method(voice_call_manager_interface, in_signature="", out_signature="",
+                         async_callbacks=("reply", "error"))
+    def HangupMultiparty(self, reply, error):
+        self.respond(reply, error, self.model.hangup_multiparty)
+
+    @dbus.service.method(voice_call_manager_interface, in_signature="s", out_signature="",
+                         async_callbacks=("reply", "error"))
+    def SendTones(self, tones, reply, error):
+        self.respond(reply, error, self.model.send_tones, str(tones))
+
+    @dbus.service.signal(voice_call_manager_interface, signature="oa{sv}")
+    def CallAdded(self, path, properties):
+        pass
+
+    @dbus.service.signal(voice_call_manager_interface, signature="o")
+    def CallRemoved(self, path):
+        pass
+
+
+class OfonoManager(dbus.service.Object):
+    """org.ofono.Manager listing one hands-free modem per simulated phone."""
+
+    def __init__(self, bus, schedule, modem_paths, latency=None, jitter=0.1, seed=None):
+        """Export the manager and a VoiceCallManager for every modem.
+
+        Args:
+            bus: D-Bus connection.
+            schedule: Callable (delay in seconds, callback) running the callback later.
+            modem_paths: Object paths of the modems, e.g. /hfp/org/bluez/hci0/dev_00_11_22_33_44_55.
+            latency: Dictionary overriding entries of default_latency, in milliseconds.
+            jitter: Relative random variation applied to every delay.
+            seed: Seed of the random generator used for the jitter.
+        """
+        super().__init__(bus, "/")
+        self.modems = {path: VoiceCallManager(bus, path, schedule, latency, jitter,
+                                              None if seed is None else seed + index)
+                       for index, path in enumerate(modem_paths)}
+
+    @dbus.service.method(manager_interface, in_signature="", out_signature="a(oa{sv})")
+    def GetModems(self):
+        return [(dbus.ObjectPath(path), dbus.Dictionary({
+            "Powered": dbus.Boolean(True), "Online": dbus.Boolean(True), "Type": "hfp",
+            "Name": path.rsplit("/", 1)[-1],
+            "Interfaces": dbus.Array([voice_call_manager_interface], signature="s")}, signature="sv"))
+            for path in self.modems]
+
+
+class SimulatorControl(dbus.service.Object):
+    """Test hooks of the fake oFono: incoming calls and latency changes."""
+
+    def __init__(self, bus, ofono_manager):
+        super().__init__(bus, simulator_path)
+        self.ofono_manager = ofono_manager
+
+    @dbus.service.method(simulator_interface, in_signature="os", out_signature="o")
+    def IncomingCall(self, modem, number):
+        modem = self.ofono_manager.modems.get(str(modem))
+        if modem is None:
+            raise dbus.exceptions.DBusException("No such modem", name="org.ofono.Error.NotFound")
+        return dbus.ObjectPath(modem.model.incoming(str(number)))
+
+    @dbus.service.method(simulator_interface, in_signature="a{sd}", out_signature="")
+    def SetLatency(self, latency):
+        for modem in self.ofono_manager.modems.values():
+            modem.model.latency.update({str(name): float(value) for name, value in latency.items()
+                                        if str(name) in modem.model.latency})
+
+
+def object_paths(paths):
+    return dbus.Array([dbus.ObjectPath(path) for path in paths], signature="o")
+
+
+def run_model_call(operation, *args):
+    """Runs a model operation from a synchronous D-Bus method, turning CallError into a D-Bus error."""
+    try:
+        return operation(*args)
+    except CallError as error:
+        raise dbus.exceptions.DBusException(str(error), name=error.name) from None
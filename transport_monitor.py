@@ -0,0 +1,214 @@
+"""Watcher of BlueZ MediaTransport1 objects with stream health metrics.
+
+The device manager feeds the monitor from the ObjectManager and
+PropertiesChanged signals it already receives. For every transport the
+monitor tracks State (idle/pending/active), Codec, Configuration, Delay and
+Volume, records every state transition with the time spent in the previous
+state, and measures how long a transport takes to reach a state after an
+operation such as starting a stream. Health metrics are computed over a
+rolling time window.
+
+The signals arrive on the D-Bus dispatch thread while operations register
+their expectations from the thread that started them, so the state is
+guarded by a lock; on_update is invoked outside of it.
+"""
+import threading
+import time
+from collections import deque
+
+
+def percentile(values, fraction):
+    """Returns the value at a fraction (0 to 1) of the sorted values, None if there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class TransportMonitor:
+    """Tracks the state of every media transport and derives rolling health metrics."""
+
+    def __init__(self, window_s=60.0, history=256, on_update=None, describe_configuration=None):
+        """Initialize the monitor.
+
+        Args:
+            window_s: Length in seconds of the window the health metrics are computed over.
+            history: Number of transitions, delay samples and operation timings kept per transport.
+            on_update: Optional callable invoked with a transport snapshot whenever it changes.
+            describe_configuration: Optional callable turning (codec, configuration) into a dictionary.
+        """
+        self.window = window_s
+        self.history = history
+        self.on_update = on_update
+        self.describe_configuration = describe_configuration
+        self.transports = {}
+        self.expectations = []
+        self.operation_timings = deque(maxlen=history)
+        self.lock = threading.RLock()
+
+    def transport_added(self, path, properties, now=None):
+        """Starts tracking a transport.
+
+        Args:
+            path: D-Bus object path of the transport.
+            properties: MediaTransport1 properties of the transport.
+            now: Monotonic timestamp of the event, the current time if None.
+        """
+        now = time.monotonic() if now is None else now
+        path = str(path)
+        transport = {
+            "path": path,
+            "device": str(properties.get("Device", "")),
+            "uuid": str(properties.get("UUID", "")),
+            "state": None,
+            "state_since": now,
+            "added": now,
+            "codec": None,
+            "configuration": None,
+            "audio_format": None,
+            "delay_ms": None,
+            "volume": None,
+            "time_in_state": {},
+            "transitions": deque(maxlen=self.history),
+            "delays": deque(maxlen=self.history),
+        }
+        with self.lock:
+            self.transports[path] = transport
+        self.transport_changed(path, properties, now)
+
+    def transport_changed(self, path, changed, now=None):
+        """Applies changed MediaTransport1 properties of a transport.
+
+        Args:
+            path: D-Bus object path of the transport.
+            changed: Dictionary of the changed properties.
+            now: Monotonic timestamp of the event, the current time if None.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            transport = self.transports.get(str(path))
+            if transport is None:
+                return
+            if "Codec" in changed or "Configuration" in changed:
+                if "Codec" in changed:
+                    transport["codec"] = int(changed["Codec"])
+                if "Configuration" in changed:
+                    transport["configuration"] = bytes(int(value) for value in changed["Configuration"])
+                if self.describe_configuration and transport["codec"] is not None and transport["configuration"]:
+                    transport["audio_format"] = self.describe_configuration(transport["codec"],
+                                                                            transport["configuration"])
+            if "Delay" in changed:
+                transport["delay_ms"] = int(changed["Delay"]) / 10
+                transport["delays"].append((now, transport["delay_ms"]))
+            if "Volume" in changed:
+                transport["volume"] = int(changed["Volume"])
+            if "State" in changed and str(changed["State"]) != transport["state"]:
+                self.record_transition(transport, str(changed["State"]), now)
+            snapshot = self.snapshot(transport, now) if self.on_update else None
+        if snapshot is not None:
+            snapshot["changed"] = sorted(str(name) for name in changed)
+            self.on_update(snapshot)
+
+    def record_transition(self, transport, state, now):
+        previous = transport["state"]
+        duration = now - transport["state_since"]
+        if previous is not None:
+            transport["time_in_state"][previous] = transport["time_in_state"].get(previous, 0.0) + duration
+        transport["transitions"].append((now, previous, state, duration * 1000))
+        transport["state"] = state
+        transport["state_since"] = now
+        for expectation in list(self.expectations):
+            device_path, expected_state, label, started = expectation
+            if transport["device"] == device_path and state == expected_state:
+                self.expectations.remove(expectation)
+                self.operation_timings.append((now, label, device_path, (now - started) * 1000))
+
+    def transport_removed(self, path, now=None):
+        """Stops tracking a transport."""
+        with self.lock:
+            transport = self.transports.pop(str(path), None)
+            if transport is None or not self.on_update:
+                return
+            now = time.monotonic() if now is None else now
+            snapshot = self.snapshot(transport, now)
+        snapshot["state"] = "removed"
+        snapshot["changed"] = ["State"]
+        self.on_update(snapshot)
+
+    def expect_state(self, device_path, state, label, now=None):
+        """Measures how long it takes for a transport of a device to reach a state.
+
+        Args:
+            device_path: D-Bus object path of the device.
+            state: Transport state to wait for, e.g. 'active'.
+            label: Name of the operation the timing is recorded under, e.g. 'start_a2dp_stream'.
+            now: Monotonic timestamp of the start of the operation, the current time if None.
+
+        Returns:
+            False if a transport of the device already is in that state (nothing is measured), True otherwise.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if any(transport["device"] == device_path and transport["state"] == state
+                   for transport in self.transports.values()):
+                return False
+            self.expectations = [expectation for expectation in self.expectations
+                                 if expectation[:3] != (device_path, state, label)]
+            self.expectations.append((device_path, state, label, now))
+        return True
+
+    def get_transports(self, device_path=None):
+        """Returns snapshots of the tracked transports, optionally only those of a device."""
+        now = time.monotonic()
+        with self.lock:
+            return [self.snapshot(transport, now) for transport in self.transports.values()
+                    if device_path is None or transport["device"] == device_path]
+
+    def snapshot(self, transport, now):
+        """Returns the current properties and rolling health metrics of a transport."""
+        since = now - self.window
+        transitions = [item for item in transport["transitions"] if item[0] >= since]
+        delays = [delay for timestamp, delay in transport["delays"] if timestamp >= since]
+        timings = [duration for timestamp, _, device_path, duration in self.operation_timings
+                   if timestamp >= since and device_path == transport["device"]]
+        return {
+            "path": transport["path"],
+            "device": transport["device"],
+            "uuid": transport["uuid"],
+            "state": transport["state"],
+            "state_for_s": now - transport["state_since"],
+            "codec": transport["codec"],
+            "audio_format": transport["audio_format"],
+            "delay_ms": transport["delay_ms"],
+            "volume": transport["volume"],
+            "window_s": self.window,
+            "transitions": len(transitions),
+            "activations": sum(1 for item in transitions if item[2] == "active"),
+            "suspends": sum(1 for item in transitions if item[1] == "active"),
+            "active_ratio": self.active_ratio(transport, since, now),
+            "delay_min_ms": min(delays) if delays else None,
+            "delay_max_ms": max(delays) if delays else None,
+            "time_to_active_ms": timings[-1] if timings else None,
+            "time_to_active_p50_ms": percentile(timings, 0.5),
+            "time_to_active_p95_ms": percentile(timings, 0.95),
+        }
+
+    def active_ratio(self, transport, since, now):
+        """Returns the fraction of the window (or of the transport's lifetime) it spent active."""
+        start = max(since, transport["added"])
+        if now <= start:
+            return 1.0 if transport["state"] == "active" else 0.0
+        active = 0.0
+        segment_end = now
+        state = transport["state"]
+        for timestamp, previous, _, _ in reversed(transport["transitions"]):
+            if state == "active":
+                active += segment_end - max(timestamp, start)
+            if timestamp <= start:
+                break
+            segment_end = timestamp
+            state = previous
+        else:
+            if state == "active":
+                active += segment_end - start
+        return active / (now - start)
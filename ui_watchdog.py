@@ -0,0 +1,276 @@
+"""Event-loop stall detection and on-demand profiling of GUI handlers.
+
+EventLoopWatchdog runs a heartbeat timer on the GUI thread and measures how
+late every beat fires, which is the event-loop latency users feel. A monitor
+thread watches the heartbeat; once it has been silent for longer than the
+stall threshold, the monitor captures the Python stack of the GUI thread and
+logs it together with the handler that was running.
+
+HandlerProfiler wraps the handlers decorated with @watched_handler in
+cProfile, or in a stack sampler, while it is switched on, and writes one
+profile per call: .prof files for pstats/snakeviz, or .folded collapsed
+stacks for flame graph tools. Profiling is toggled at runtime with
+Ctrl+Shift+P in the test host, or switched on from the start by setting
+BLUETOOTH_UI_PROFILE to "cprofile" or "sampling".
+"""
+import cProfile
+import functools
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from PyQt6.QtCore import QObject, Qt, QTimer
+
+from libraries.bluetooth.transport_monitor import percentile
+
+profile_modes = ("cprofile", "sampling")
+profile_environment_variable = "BLUETOOTH_UI_PROFILE"
+profile_shortcut = "Ctrl+Shift+P"
+
+
+class EventLoopWatchdog(QObject):
+    """Measures event-loop latency and reports stalls of the GUI thread with its stack."""
+
+    def __init__(self, log, interval_ms=50, stall_threshold_ms=250, history=4096, max_stalls=100):
+        """Initialize the watchdog; it must be created on the GUI thread.
+
+        Args:
+            log: Logger instance.
+            interval_ms: Heartbeat interval.
+            stall_threshold_ms: Time without a heartbeat after which the event loop counts as stalled.
+            history: Number of latency samples kept.
+            max_stalls: Number of stall records kept.
+        """
+        super().__init__()
+        self.log = log
+        self.interval = interval_ms / 1000
+        self.stall_threshold = stall_threshold_ms / 1000
+        self.gui_thread_id = threading.get_ident()
+        self.latencies = deque(maxlen=history)
+        self.stalls = deque(maxlen=max_stalls)
+        self.handlers = []
+        self.lock = threading.Lock()
+        self.last_beat = None
+        self.current_stall = None
+        self.stop_event = threading.Event()
+        self.monitor_thread = None
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.timer.timeout.connect(self.heartbeat)
+
+    def start(self):
+        """Starts the heartbeat and the monitor thread."""
+        if self.monitor_thread is not None:
+            return
+        self.last_beat = time.monotonic()
+        self.stop_event.clear()
+        self.timer.start(round(self.interval * 1000))
+        self.monitor_thread = threading.Thread(target=self.monitor, name="ui-watchdog", daemon=True)
+        self.monitor_thread.start()
+
+    def stop(self):
+        self.timer.stop()
+        self.stop_event.set()
+        if self.monitor_thread is not None:
+            self.monitor_thread.join()
+            self.monitor_thread = None
+
+    def current_handler(self):
+        try:
+            return self.handlers[-1]
+        except IndexError:
+            return None
+
+    def heartbeat(self):
+        now = time.monotonic()
+        with self.lock:
+            late = now - self.last_beat - self.interval
+            self.last_beat = now
+            stall, self.current_stall = self.current_stall, None
+        self.latencies.append(max(0.0, late) * 1000)
+        if stall is not None:
+            stall["duration_ms"] = (now - stall["started"]) * 1000
+            self.log.warning("Event loop was stalled for %.0f ms in %s", stall["duration_ms"],
+                             stall["handler"] or "an unwatched handler")
+
+    def monitor(self):
+        while not self.stop_event.wait(self.interval):
+            with self.lock:
+                blocked = time.monotonic() - self.last_beat
+                if blocked < self.stall_threshold or self.current_stall is not None:
+                    continue
+                frame = sys._current_frames().get(self.gui_thread_id)
+                stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+                stall = {"started": self.last_beat, "handler": self.current_handler(),
+                         "detected_ms": blocked * 1000, "duration_ms": None, "stack": stack}
+                self.current_stall = stall
+                self.stalls.append(stall)
+            self.log.warning("Event loop blocked for %.0f ms in %s, GUI thread stack:\n%s", blocked * 1000,
+                             stall["handler"] or "an unwatched handler", stack)
+
+    def get_stats(self):
+        """Returns event-loop latency percentiles and the recent stalls.
+
+        Returns:
+            A dictionary with p50/p95/p99/max latency in milliseconds, the number of stalls and
+            the handler, detection time and duration of the last ten.
+        """
+        latencies = list(self.latencies)
+        stalls = list(self.stalls)
+        return {
+            "samples": len(latencies),
+            "latency_p50_ms": percentile(latencies, 0.5),
+            "latency_p95_ms": percentile(latencies, 0.95),
+            "latency_p99_ms": percentile(latencies, 0.99),
+            "latency_max_ms": max(latencies) if latencies else None,
+            "stalls": len(stalls),
+            "recent_stalls": [{key: stall[key] for key in ("handler", "detected_ms", "duration_ms")}
+                              for stall in stalls[-10:]],
+        }
+
+
+class HandlerProfiler:
+    """Profiles watched handlers while switched on and writes one profile file per call."""
+
+    def __init__(self, log, output_directory, mode="cprofile", handlers=None, sample_interval_ms=5.0):
+        """Initialize the profiler, switched off.
+
+        Args:
+            log: Logger instance.
+            output_directory: Directory the profiles are written to.
+            mode: "cprofile" for deterministic profiles, "sampling" for periodic stack samples.
+            handlers: Names of the handlers to profile; every watched handler if None.
+            sample_interval_ms: Interval between stack samples in sampling mode.
+        """
+        if mode not in profile_modes:
+            raise ValueError(f"Unknown profiling mode {mode!r}")
+        self.log = log
+        self.output_directory = output_directory
+        self.mode = mode
+        self.handlers = set(handlers) if handlers else None
+        self.sample_interval = sample_interval_ms / 1000
+        self.enabled = False
+        self.active = False
+
+    def toggle(self, enabled=None):
+        """Switches profiling on or off.
+
+        Args:
+            enabled: New state; the opposite of the current one if None.
+
+        Returns:
+            The new state.
+        """
+        self.enabled = not self.enabled if enabled is None else bool(enabled)
+        self.log.info("Handler profiling %s (%s mode, output in %s)", "on" if self.enabled else "off",
+                      self.mode, self.output_directory)
+        return self.enabled
+
+    def wants(self, name):
+        return self.enabled and not self.active and (self.handlers is None or name in self.handlers)
+
+    @contextmanager
+    def profile(self, name):
+        """Profiles the block as one call of a handler, unless profiling is off for it.
+
+        Nested watched handlers are part of the outer profile rather than getting their own.
+        """
+        if not self.wants(name):
+            yield
+            return
+        self.active = True
+        started = time.monotonic()
+        try:
+            if self.mode == "cprofile":
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    yield
+                finally:
+                    profiler.disable()
+                    self.write_cprofile(name, profiler, time.monotonic() - started)
+            else:
+                samples = Counter()
+                stop_event = threading.Event()
+                sampler = threading.Thread(target=self.sample, args=(threading.get_ident(), samples, stop_event),
+                                           name="ui-sampler", daemon=True)
+                sampler.start()
+                try:
+                    yield
+                finally:
+                    stop_event.set()
+                    sampler.join()
+                    self.write_samples(name, samples, time.monotonic() - started)
+        finally:
+            self.active = False
+
+    def sample(self, thread_id, samples, stop_event):
+        while not stop_event.wait(self.sample_interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            samples[";".join(reversed(stack))] += 1
+
+    def profile_path(self, name, extension):
+        os.makedirs(self.output_directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        return os.path.join(self.output_directory, f"{name}-{stamp}-{int(time.monotonic() * 1000) % 1000:03d}"
+                                                   f".{extension}")
+
+    def write_cprofile(self, name, profiler, elapsed):
+        try:
+            path = self.profile_path(name, "prof")
+            profiler.dump_stats(path)
+        except OSError as error:
+            self.log.error("Failed to write profile of %s: %s", name, error)
+            return
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(10)
+        self.log.info("Profiled %s (%.0f ms) to %s", name, elapsed * 1000, path)
+        self.log.debug("Profile of %s:\n%s", name, summary.getvalue())
+
+    def write_samples(self, name, samples, elapsed):
+        try:
+            path = self.profile_path(name, "folded")
+            with open(path, "w") as samples_file:
+                for stack, count in samples.most_common():
+                    samples_file.write(f"{stack} {count}\n")
+        except OSError as error:
+            self.log.error("Failed to write samples of %s: %s", name, error)
+            return
+        self.log.info("Sampled %s (%.0f ms, %d samples) to %s", name, elapsed * 1000, sum(samples.values()), path)
+
+
+def watched_handler(method):
+    """Decorates a GUI handler so stalls are attributed to it and it can be profiled.
+
+    The handler's object provides the EventLoopWatchdog as ui_watchdog and the HandlerProfiler
+    as handler_profiler; either may be missing or None.
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        watchdog = getattr(self, "ui_watchdog", None)
+        profiler = getattr(self, "handler_profiler", None)
+        if watchdog is not None:
+            watchdog.handlers.append(name)
+        try:
+            if profiler is not None and profiler.wants(name):
+                with profiler.profile(name):
+                    return method(self, *args, **kwargs)
+            return method(self, *args, **kwargs)
+        finally:
+            if watchdog is not None:
+                watchdog.handlers.pop()
+    return wrapper